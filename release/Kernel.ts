@@ -4,10 +4,32 @@ import KernelWorker from "./worker/kernel-worker?worker";
 import { HostBridge } from "./worker/bridge";
 import type { Patience } from "./worker/channel";
 import type { Kernel } from "./worker/kernel-worker";
-import { contents, type Contents } from "./contents";
-import { base64, flatPromise, type Awaitable, type Expand } from "./utils";
+import {
+  implementedMethods,
+  type CachePolicy,
+  type CacheStats,
+} from "./worker/emscripten-fs";
+import { memory } from "./memory-fs";
+import { cached } from "./cached-fs";
+import { http } from "./http-fs";
+import { indexedDBFileSystem } from "./indexeddb-fs";
+import { zip } from "./zip-fs";
+import { pool, type KernelPool } from "./kernel-pool";
+import { prefetchRuntime } from "./prefetch";
+import { contents, streamed, type Contents } from "./contents";
+import {
+  awaited,
+  base64,
+  flatPromise,
+  type Awaitable,
+  type Expand,
+} from "./utils";
 import { type Output, make } from "./output";
-import fs, { type HostFileSystem } from "./fs";
+import fs, {
+  sanitizePath,
+  type FileSystem,
+  type HostFileSystem,
+} from "./fs";
 
 export type Environment = {
   /**
@@ -19,13 +41,19 @@ export type Environment = {
      * The root path that the filesystem is mounted at in the Python environment.
      */
     root: string;
+    /**
+     * Hear of changes made through the filesystem, so that one shared by
+     * several kernels keeps each of them told of the others' writes.
+     */
+    subscribe?: FileSystem.Subscribe;
   };
   /** Prompt handler used when Python requests user input. */
   input: (prompt: string) => Awaitable<string>;
   /**
-   * Where Pyodide's own runtime files are served from. Defaults to the CDN copy
-   * matching the pinned Pyodide version; point it at a same-origin directory to
-   * run without reaching the network.
+   * Where Pyodide's own runtime files are served from. Defaults to the site's
+   * own copy when it is built with `applyConfig`'s `selfHost` option, and
+   * otherwise to the CDN copy matching the pinned Pyodide version; point it at
+   * a same-origin directory to run without reaching the network.
    */
   indexURL?: string;
   /**
@@ -37,6 +65,80 @@ export type Environment = {
    * that is never coming, so this is the only thing that distinguishes them.
    */
   patience?: Patience;
+  /**
+   * Whether every change to the filesystem that does not come from this
+   * kernel's Python is reported to it, through `changed`, `invalidateAll` or
+   * the filesystem's `subscribe`.
+   *
+   * The worker then keeps what it has learnt about the files from one run to
+   * the next, rather than asking again at the start of each. Leave it unset
+   * if anything can change the files behind the kernel's back.
+   */
+  reportsChanges?: boolean;
+  /**
+   * The name of a directory in the page's Origin Private File System to mount
+   * at the root in place of `fs`.
+   *
+   * The worker opens its files itself, so Python reads and writes them in
+   * place without a round trip to the page. Files and directories Python
+   * makes, renames or removes are carried out once each run finishes; `fs`
+   * then only supplies the root.
+   */
+  opfs?: string;
+  /**
+   * Paths whose files are kept in the worker and never written to `fs` or a
+   * mount: compiled bytecode, temporary output, whatever nobody reads again.
+   * A pattern without a slash, like `*.tmp`, matches a name at any depth; one
+   * with a slash, like `output/*`, matches from the root. Python still sees
+   * them, until the kernel is disposed. Pass `[]` to write everything.
+   * @default ["__pycache__"]
+   */
+  scratch?: string[];
+  /**
+   * Start Python from a snapshot of its memory, taken the first time once
+   * Python had started and imported matplotlib, and kept in Cache Storage.
+   * Later kernels, in this page or the next, restore it rather than doing
+   * that work again, and so does `restart`. A snapshot that cannot be made or
+   * restored is skipped, and Python started as usual.
+   */
+  snapshot?: boolean;
+  /**
+   * Packages to load while the kernel starts, as `loadPackage` names them.
+   * Their files are fetched while Python itself is still being fetched and
+   * compiled, rather than once a run imports them.
+   */
+  preload?: string[];
+  /**
+   * Whether the files of the packages Pyodide loads, and of the wheels
+   * `micropip` installs, are kept in Cache Storage. Every kernel of the
+   * origin, in every tab, then downloads each once per Pyodide version, and
+   * checks it against the lock file when it is read back.
+   * @default true
+   */
+  packageCache?: boolean;
+  /**
+   * More filesystems, each mounted at its own `root` beside `fs`, and each
+   * cached by the worker as its `policy` allows.
+   */
+  mounts?: Mount[];
+};
+
+/** A filesystem mounted beside the main one. */
+export type Mount = {
+  /** The filesystem, mounted at its `root`. */
+  fs: Environment["fs"];
+  /**
+   * How long the worker trusts what it learns of these files. Read-mostly
+   * data costs next to nothing after it is first read as `immutable`, or as
+   * `revalidate` when its filesystem reports a `version` in `stat`.
+   * @default "live"
+   */
+  policy?: CachePolicy;
+  /**
+   * The most file contents the worker keeps for this mount, in bytes.
+   * @default 64 MiB
+   */
+  maxBytes?: number;
 };
 
 export namespace Run {
@@ -64,22 +166,112 @@ const fromRoot = ({ fs: { root } }: Environment, path: string) =>
     ? root + path.replace(/^\/+/, "")
     : root + "/" + path.replace(/^\/+/, "");
 
+/** Name a path the way the worker's change notices do: within the root. */
+const withinRoot = ({ fs: { root } }: Pick<Environment, "fs">, path: string) =>
+  sanitizePath(path, { root, removeRoot: true, removeLeadingSlash: true });
+
+const isUnder = (root: string, path: string) =>
+  path === root || path.startsWith(root.endsWith("/") ? root : `${root}/`);
+
+/** The mount an absolute path falls under, the innermost if several do. */
+const mountOf = ({ mounts = [] }: Environment, path: string) =>
+  mounts
+    .filter(({ fs: { root } }) => isUnder(root, path))
+    .sort((a, b) => b.fs.root.length - a.fs.root.length)[0];
+
+/** What a mount's filesystem is called on the bridge. */
+const mountTarget = (root: string) => `mount:${root}`;
+
+const writeMethods = ["put", "delete", "move", "write", "truncate"] as const;
+
+/**
+ * A filesystem as the kernel's own worker calls it, keeping count of the
+ * paths it is part way through writing: the worker already knows of those
+ * changes, and being told of them again would only make it forget what it
+ * knows.
+ */
+const countingWrites = (
+  environment: Pick<Environment, "fs">,
+  writing: Map<string, number>,
+): Environment["fs"] => {
+  const { fs } = environment;
+  const counted = { ...fs };
+  for (const method of writeMethods) {
+    const write = fs[method] as
+      | ((opts: { path: string; newPath?: string }) => Awaitable<unknown>)
+      | undefined;
+    if (typeof write !== "function") continue;
+    (counted as any)[method] = (opts: { path: string; newPath?: string }) => {
+      const paths = [opts.path, opts.newPath ?? []]
+        .flat()
+        .map((path) => withinRoot(environment, path));
+      for (const path of paths) writing.set(path, (writing.get(path) ?? 0) + 1);
+      const finish = () => {
+        for (const path of paths) {
+          const count = writing.get(path)! - 1;
+          if (count > 0) writing.set(path, count);
+          else writing.delete(path);
+        }
+      };
+      let result: Awaitable<unknown>;
+      try {
+        result = write.call(fs, opts);
+      } catch (error) {
+        finish();
+        throw error;
+      }
+      if (awaited.is(result)) return result.finally(finish);
+      finish();
+      return result;
+    };
+  }
+  return counted;
+};
+
+/**
+ * Where the site serves its own copy of Pyodide, when built with the
+ * `selfHost` option of `applyConfig`. Taken from the page, since a relative
+ * base would otherwise be read from the worker's script.
+ */
+const selfHosted: string | undefined =
+  import.meta.env.PYTHON_WEB_KERNEL_INDEX_URL;
+const selfHostedIndexURL =
+  selfHosted && new URL(selfHosted, globalThis.document?.baseURI).href;
+
+const prefetched = new Set<string>();
+
+/**
+ * Pyodide served from the page's own `indexURL` is fetched, once per page,
+ * while the worker is still starting, rather than once it asks. The CDN copy
+ * is left to the worker, which is all that knows the version to ask for.
+ */
+const prefetchOnce = ({ indexURL }: Environment) => {
+  if (!indexURL || prefetched.has(indexURL)) return;
+  prefetched.add(indexURL);
+  void prefetchRuntime(indexURL);
+};
+
 /** Default filename used when code is executed without an explicit path. */
 const defaultPath = (env: Environment) => fromRoot(env, "temp.py");
 
 /** Attach worker message handling for bridge traffic and kernel lifecycle events. */
-const handleMessages = ({ worker, bridge, callbacks }: PythonKernel) =>
-  worker.addEventListener("message", (ev: MessageEvent) => {
+const handleMessages = (kernel: PythonKernel) =>
+  kernel.worker.addEventListener("message", (ev: MessageEvent) => {
     if (!ev.data) {
       console.warn("Unexpected message from kernel manager", ev);
       return;
     }
     const data = ev.data as Kernel.Response;
+    const { bridge, callbacks } = kernel;
 
     if (bridge.handle(data)) return;
+    if (data.type === "finished" && data.mounts)
+      kernel.mountStats = data.mounts;
+    if (data.type === "loaded" && data.reloaded)
+      kernel.reloaded = data.reloaded;
     if (data.type === "output") callbacks.output?.(data);
-    else if (data.type === "finished" || data.type === "loaded")
-      callbacks[data.type]?.();
+    else if (data.type === "finished") callbacks.finished?.(data);
+    else if (data.type === "loaded") callbacks.loaded?.();
   });
 
 export default class PythonKernel {
@@ -90,13 +282,41 @@ export default class PythonKernel {
   readonly callbacks = {
     loaded: undefined as (() => void) | undefined,
     output: undefined as ((output: Output.Specific) => void) | undefined,
-    finished: undefined as (() => void) | undefined,
+    finished: undefined as
+      | ((finished: Kernel.Responses["finished"]) => void)
+      | undefined,
   };
 
   readonly ready: Promise<void>;
 
+  /**
+   * How often each mount, keyed by its root, answered Python from what the
+   * worker already knew rather than asking its filesystem, and how many bytes
+   * it did ask for. Updated as each run finishes.
+   */
+  mountStats: Record<string, CacheStats> = {};
+
+  /**
+   * The local modules the last run with `unloadLocalModules` imported afresh:
+   * those that changed since they were imported, and those importing them.
+   */
+  reloaded: string[] = [];
+
+  /**
+   * How long each phase of starting took, in milliseconds, once `ready`:
+   * `worker` until the worker began, `pyodide` to start or restore Python,
+   * `preload` to load the `preload` packages, `mount` to mount the
+   * filesystems, and `total` from construction.
+   */
+  startup: Record<string, number> = {};
+
   private operationChain = Promise.resolve();
 
+  /** Paths this kernel's worker is writing, counted by the writes under way. */
+  private readonly writing = new Map<string, number>();
+
+  private readonly unsubscribes: (() => void)[] = [];
+
   /**
    * Reserve a turn in the serialized operation queue and return both the
    * previous operation and the completion handle for this operation.
@@ -109,8 +329,11 @@ export default class PythonKernel {
   }
 
   /** Wait for a one-shot worker lifecycle signal. */
-  private signal(signal: "loaded" | "finished") {
-    return new Promise<void>((resolve) => (this.callbacks[signal] = resolve));
+  private signal<T extends "loaded" | "finished">(signal: T) {
+    return new Promise<Kernel.Responses[T]>(
+      (resolve) =>
+        (this.callbacks[signal] = resolve as PythonKernel["callbacks"][T]),
+    );
   }
 
   /** Post a typed kernel request to the worker. */
@@ -118,30 +341,101 @@ export default class PythonKernel {
     this.worker.postMessage(request);
   }
 
+  /**
+   * Ask the worker for something that finishes like a run, in turn, failing
+   * if it did.
+   */
+  private async queued(type: "reset" | "restart") {
+    const { previous, done } = this.queueOperation();
+    try {
+      await this.ready;
+      await previous;
+      const finished = this.signal("finished");
+      this.post({ type });
+      const { failure } = await finished;
+      if (failure) throw new Error(`The ${type} failed: ${failure}`);
+    } finally {
+      done.resolve();
+    }
+  }
+
   /** Create a kernel instance and initialize worker wiring. */
   constructor(environment: Environment) {
+    const constructed = performance.timeOrigin + performance.now();
+    environment = {
+      ...environment,
+      indexURL: environment.indexURL ?? selfHostedIndexURL,
+    };
     this.environment = environment;
-    const { fs, input } = environment;
-
-    this.bridge = new HostBridge({ fs, input: { prompt: input } });
+    prefetchOnce(environment);
+    const { fs, input, mounts = [] } = environment;
+
+    /** What `writing` is to `fs`, for each mount. */
+    const mountWrites = mounts.map(() => new Map<string, number>());
+    this.bridge = new HostBridge({
+      fs: countingWrites(environment, this.writing),
+      input: { prompt: input },
+      ...Object.fromEntries(
+        mounts.map((mount, index) => [
+          mountTarget(mount.fs.root),
+          countingWrites(mount, mountWrites[index]),
+        ]),
+      ),
+    });
+    const unsubscribe = fs.subscribe?.((paths) => {
+      const others = paths.filter(
+        (path) => !this.writing.has(withinRoot(environment, path)),
+      );
+      if (others.length > 0) this.changed(others);
+    });
+    if (unsubscribe) this.unsubscribes.push(unsubscribe);
+    mounts.forEach((mount, index) => {
+      const unsubscribe = mount.fs.subscribe?.((paths) => {
+        const others = paths
+          .map((path) => withinRoot(mount, path))
+          .filter((path) => !mountWrites[index].has(path));
+        if (others.length > 0) this.notify(others, mount.fs.root);
+      });
+      if (unsubscribe) this.unsubscribes.push(unsubscribe);
+    });
     handleMessages(this);
     const { worker, bridge } = this;
 
     const payload: Kernel.Request = {
       type: "initialize",
       root: fs.root,
+      fsMethods: implementedMethods(fs),
       buffers: bridge.buffers,
       globalThisId: bridge.objects.registerRootObject(globalThis),
       indexURL: environment.indexURL,
       patience: environment.patience,
+      reportsChanges: environment.reportsChanges,
+      opfs: environment.opfs,
+      scratch: environment.scratch,
+      snapshot: environment.snapshot,
+      preload: environment.preload,
+      packageCache: environment.packageCache,
+      mounts: mounts.map(({ fs, policy, maxBytes }) => ({
+        root: fs.root,
+        target: mountTarget(fs.root),
+        fsMethods: implementedMethods(fs),
+        caching: { policy, maxBytes },
+      })),
     };
 
-    this.ready = new Promise((resolve) => {
+    this.ready = new Promise((resolve, reject) => {
       const onInitialized = (ev: MessageEvent) => {
         if (!ev.data) return;
         const data = ev.data as Kernel.Response;
         if (data.type === "initialized") {
           worker.removeEventListener("message", onInitialized);
+          if (data.failure)
+            return reject(new Error(`Python could not start: ${data.failure}`));
+          this.startup = {
+            worker: data.began - constructed,
+            ...data.timings,
+            total: performance.timeOrigin + performance.now() - constructed,
+          };
           resolve();
         }
       };
@@ -182,6 +476,26 @@ export default class PythonKernel {
     });
   }
 
+  /**
+   * Forget what earlier runs did, without starting Python again: names they
+   * defined are gone, the working directory, `sys.path`, `sys.argv` and
+   * `os.environ` are put back, and local modules are imported afresh, while
+   * packages stay loaded. Queued behind any run still under way.
+   */
+  reset(): Promise<void> {
+    return this.queued("reset");
+  }
+
+  /**
+   * Start Python again, in the same worker: everything runs left behind is
+   * gone, packages included, while the files and mounts stay as they are.
+   * Restores the `snapshot` when the environment asks for one. Queued behind
+   * any run still under way.
+   */
+  restart(): Promise<void> {
+    return this.queued("restart");
+  }
+
   /**
    * Execute Python code, optionally with lifecycle and output callbacks.
    */
@@ -194,7 +508,9 @@ export default class PythonKernel {
     path?: string;
     on?: Run.On;
     /**
-     * Whether to unload local modules before executing the code.
+     * Whether to unload local modules before executing the code. Only those
+     * whose files changed since they were imported are unloaded, along with
+     * the local modules that import them; `kernel.reloaded` names them.
      *
      * This can allow using the kernel to execute local files in a 'fresh' state without having to restart the kernel and/or reload external modules.
      *
@@ -288,8 +604,44 @@ export default class PythonKernel {
     return { interrupt, result };
   }
 
+  /**
+   * Tell the worker that files changed outside of Python, so that it stops
+   * relying on what it knew about them. Paths may be absolute, or relative to
+   * the filesystem root.
+   *
+   * Notices are not queued behind runs: the worker takes them in between runs,
+   * or while a run is waiting on something. An absolute path under one of the
+   * `mounts` is passed on to that mount.
+   */
+  changed(paths: string[]) {
+    const byMount = new Map<Mount | undefined, string[]>();
+    for (const path of paths) {
+      const mount = mountOf(this.environment, path);
+      byMount.set(mount, [...(byMount.get(mount) ?? []), path]);
+    }
+    for (const [mount, paths] of byMount)
+      this.notify(
+        paths.map((path) => withinRoot(mount ?? this.environment, path)),
+        mount?.fs.root,
+      );
+  }
+
+  /**
+   * Tell the worker that any of the files may have changed, in every mount
+   * but those it was told are immutable.
+   */
+  invalidateAll() {
+    this.notify(undefined);
+  }
+
+  private async notify(paths?: string[], root?: string) {
+    await this.ready;
+    this.post({ type: "changed", paths, root });
+  }
+
   /** Terminate worker resources and shared memory handles. */
   dispose() {
+    for (const unsubscribe of this.unsubscribes) unsubscribe();
     this.worker.terminate();
     this.bridge.dispose();
   }
@@ -314,7 +666,9 @@ export default class PythonKernel {
       console.warn(`Asset at path "${path}" not found or is a directory`);
       return null;
     }
-    return PythonKernel.AssetUrl({ value: result.data, path });
+    const { data } = result;
+    const value = streamed.is(data) ? await streamed.collect(data) : data;
+    return PythonKernel.AssetUrl({ value, path });
   }
 
   static readonly DefaultFileSystemRoot = fs.defaultRoot;
@@ -344,6 +698,37 @@ export default class PythonKernel {
   /** Create a read-write filesystem facade by composing read-only and write-only adapters. */
   static readonly ReadWriteFileSystem = fs.readWrite;
 
+  /**
+   * Create a filesystem kept in the page, indexed as a tree so that it stays
+   * quick with tens of thousands of files. Its `files` can be read and changed
+   * directly.
+   */
+  static readonly MemoryFileSystem = memory;
+
+  /**
+   * Wrap a filesystem so that contents, stats and listings it answered are
+   * remembered, within a budget, rather than asked for again.
+   */
+  static readonly CachedFileSystem = cached;
+
+  /**
+   * Create a read-only filesystem served over HTTP, described by a JSON
+   * manifest and read in ranges as Python reads it.
+   */
+  static readonly HttpFileSystem = http;
+
+  /**
+   * Create a filesystem kept in IndexedDB, so a workspace survives reloads.
+   * Calls made together share a transaction.
+   */
+  static readonly IndexedDBFileSystem = indexedDBFileSystem;
+
+  /**
+   * Create a read-only filesystem over a zip archive, described by its central
+   * directory and inflated a file at a time as Python reads it.
+   */
+  static readonly ZipFileSystem = zip;
+
   static AssetUrl({
     value,
     ...rest
@@ -366,4 +751,21 @@ export default class PythonKernel {
 
   /** Construct a kernel with the default environment configuration. */
   static readonly Default = () => new PythonKernel(PythonKernel.Environment());
+
+  /**
+   * Keep kernels started ahead of time, so that acquiring one does not wait on
+   * Python starting. Each is made with the environment, or with a fresh one
+   * from calling it.
+   */
+  static readonly Pool = (
+    environment: Environment | (() => Environment),
+    options?: KernelPool.Options,
+  ): KernelPool =>
+    pool(
+      () =>
+        new PythonKernel(
+          typeof environment === "function" ? environment() : environment,
+        ),
+      options,
+    );
 }
@@ -0,0 +1,305 @@
+import { contents, streamed, type Contents } from "./contents";
+import {
+  measuredByReading,
+  measuresByReading,
+  type FileSystem,
+  type HostFileSystem,
+} from "./fs";
+import { awaited, type Awaitable, type SyncResult } from "./utils";
+import type { Entry, Listing } from "./worker/emscripten-fs";
+
+export namespace CachedFileSystem {
+  export type Options = {
+    /**
+     * The most file contents held at once, in bytes.
+     * @default 64 MiB
+     */
+    maxBytes?: number;
+    /**
+     * The most answers held at once, counting contents, stats and listings.
+     * @default 10000
+     */
+    maxEntries?: number;
+    /**
+     * How long an answer is trusted, in milliseconds.
+     * @default Infinity
+     */
+    ttl?: number;
+    /**
+     * How long being told a path does not exist is trusted, in milliseconds.
+     * @default ttl
+     */
+    negativeTtl?: number;
+    /** The clock, for tests. */
+    now?: () => number;
+  };
+
+  export type Stats = {
+    /** Answered from the cache. */
+    hits: number;
+    /** Passed on to the filesystem underneath. */
+    misses: number;
+    /** Joined a request for the same thing that was already under way. */
+    shared: number;
+    /** Dropped to stay within budget. */
+    evictions: number;
+    entries: number;
+    bytes: number;
+    /** Hits over hits and misses, or 0 before anything was asked. */
+    hitRate: number;
+  };
+}
+
+type Filesystem = HostFileSystem & {
+  root: string;
+  subscribe?: FileSystem.Subscribe;
+};
+
+export type CachedFileSystem = Filesystem & {
+  cache: {
+    stats(): CachedFileSystem.Stats;
+    /** Forgets everything, or everything at and under a path. */
+    clear(path?: string): void;
+    /** Stops hearing of changes from the filesystem underneath. */
+    dispose(): void;
+  };
+};
+
+type Cached = {
+  path: string;
+  result: SyncResult<unknown>;
+  bytes: number;
+  expires: number;
+};
+
+type ReadMethod = "get" | "stat" | "listDirectory" | "listDirectoryWithStats";
+
+const writeMethods = ["put", "delete", "move", "write", "truncate"] as const;
+
+const parentOf = (path: string) =>
+  path.slice(0, Math.max(path.lastIndexOf("/"), 0));
+
+const weightOf = (value: Contents | null) =>
+  value === null ? 0 : contents.byteLength(value);
+
+/**
+ * Wraps a filesystem so that what it answered is remembered: contents, stats
+ * and listings, within a budget, least recently used first out.
+ *
+ * Missing paths are remembered too, and identical requests made while one is
+ * under way share its answer. Writes made through the wrapper, and changes
+ * the filesystem underneath reports through `subscribe`, forget what they
+ * touch. Anything else that changes the files is only noticed once `ttl` has
+ * passed.
+ */
+export const cached = (
+  fs: Filesystem,
+  {
+    maxBytes = 64 * 1024 * 1024,
+    maxEntries = 10_000,
+    ttl = Infinity,
+    negativeTtl = ttl,
+    now = Date.now,
+  }: CachedFileSystem.Options = {},
+): CachedFileSystem => {
+  /** In least recently used order: a hit moves an answer to the end. */
+  const entries = new Map<string, Cached>();
+  const inFlight = new Map<string, Promise<SyncResult<unknown>>>();
+  const counts = { hits: 0, misses: 0, shared: 0, evictions: 0 };
+  let bytes = 0;
+  /** Moves on with every write, so answers fetched before one are dropped. */
+  let epoch = 0;
+
+  /**
+   * The keys held for each path, and the paths below each directory that have
+   * keys held at or under them, so forgetting a path only visits what is
+   * under it.
+   */
+  const keysAt = new Map<string, Set<string>>();
+  const childrenOf = new Map<string, Set<string>>();
+
+  const index = (key: string, path: string) => {
+    const keys = keysAt.get(path);
+    if (keys) return void keys.add(key);
+    keysAt.set(path, new Set([key]));
+    for (let child = path; parentOf(child) !== child; child = parentOf(child)) {
+      const children = childrenOf.get(parentOf(child));
+      if (children) return void children.add(child);
+      childrenOf.set(parentOf(child), new Set([child]));
+    }
+  };
+
+  const unindex = (key: string, path: string) => {
+    const keys = keysAt.get(path);
+    keys?.delete(key);
+    if (keys?.size === 0) keysAt.delete(path);
+    for (let child = path; parentOf(child) !== child; child = parentOf(child)) {
+      if (keysAt.has(child) || childrenOf.has(child)) return;
+      const children = childrenOf.get(parentOf(child));
+      children?.delete(child);
+      if (children?.size !== 0) return;
+      childrenOf.delete(parentOf(child));
+    }
+  };
+
+  const drop = (key: string) => {
+    const entry = entries.get(key);
+    if (!entry) return;
+    bytes -= entry.bytes;
+    entries.delete(key);
+    unindex(key, entry.path);
+  };
+
+  const recall = (key: string) => {
+    const entry = entries.get(key);
+    if (!entry) return undefined;
+    if (entry.expires <= now()) return void drop(key);
+    entries.delete(key);
+    entries.set(key, entry);
+    return entry.result;
+  };
+
+  /**
+   * Failures other than not-found say nothing lasting about the path, and a
+   * stream can only be read once.
+   */
+  const remember = (key: string, path: string, result: SyncResult<any>) => {
+    if (!result.ok && result.status !== 404) return;
+    if (result.ok && streamed.is(result.data)) return;
+    const lifetime = result.ok ? ttl : negativeTtl;
+    const weight =
+      result.ok && key.startsWith("get:") ? weightOf(result.data) : 0;
+    if (lifetime <= 0 || weight > maxBytes) return;
+    drop(key);
+    const expires = now() + lifetime;
+    entries.set(key, { path, result, bytes: weight, expires });
+    index(key, path);
+    bytes += weight;
+    for (const oldest of entries.keys()) {
+      if (entries.size <= maxEntries && bytes <= maxBytes) break;
+      drop(oldest);
+      counts.evictions++;
+    }
+  };
+
+  const readThrough =
+    <T>(
+      method: ReadMethod,
+      read: (opts: { path: string }) => Awaitable<SyncResult<T>>,
+    ) =>
+    (opts: { path: string }): Awaitable<SyncResult<T>> => {
+      const key = `${method}:${opts.path}`;
+      const hit = recall(key);
+      if (hit) {
+        counts.hits++;
+        return hit as SyncResult<T>;
+      }
+      const pending = inFlight.get(key);
+      if (pending) {
+        counts.shared++;
+        /** Whoever asked first is reading the stream, so ask again. */
+        return pending.then((result) =>
+          result.ok && streamed.is(result.data) ? read(opts) : result,
+        ) as Promise<SyncResult<T>>;
+      }
+      counts.misses++;
+      const started = epoch;
+      const answer = awaited.map(read(opts), (result) => {
+        if (epoch === started) remember(key, opts.path, result);
+        return result;
+      });
+      if (!awaited.is(answer)) return answer;
+      const shared = answer.finally(() => inFlight.delete(key));
+      inFlight.set(key, shared);
+      return shared;
+    };
+
+  const forgetUnder = (path: string) => {
+    for (const child of [...(childrenOf.get(path) ?? [])]) forgetUnder(child);
+    for (const key of [...(keysAt.get(path) ?? [])]) drop(key);
+  };
+
+  /** Forgets a path, what is under it, and the listing of its directory. */
+  const forget = (path: string) => {
+    epoch++;
+    forgetUnder(path);
+    for (const key of [...(keysAt.get(parentOf(path)) ?? [])])
+      if (key.startsWith("list")) drop(key);
+  };
+
+  const clear = (path?: string) => {
+    if (path !== undefined) return forget(path);
+    epoch++;
+    entries.clear();
+    keysAt.clear();
+    childrenOf.clear();
+    bytes = 0;
+  };
+
+  const get = readThrough("get", (opts) => fs.get(opts));
+  /** A filesystem that reads a file to describe it reads it from here. */
+  const statThrough = readThrough(
+    "stat",
+    measuresByReading(fs.stat)
+      ? measuredByReading(get)
+      : (opts) => fs.stat(opts),
+  );
+
+  /** Contents already in hand say how big a file is. */
+  const stat = (opts: { path: string }): Awaitable<SyncResult<Entry>> => {
+    const held = entries.get(`get:${opts.path}`);
+    if (held?.result.ok && held.expires > now()) {
+      counts.hits++;
+      const value = held.result.data as Contents | null;
+      return {
+        ok: true,
+        data: { size: weightOf(value), directory: value === null },
+      };
+    }
+    return statThrough(opts);
+  };
+
+  const wrapped: Filesystem = {
+    ...fs,
+    get,
+    stat,
+    listDirectory: readThrough("listDirectory", (opts) =>
+      fs.listDirectory(opts),
+    ),
+    listDirectoryWithStats:
+      fs.listDirectoryWithStats &&
+      readThrough<Listing[]>("listDirectoryWithStats", (opts) =>
+        fs.listDirectoryWithStats!(opts),
+      ),
+  };
+
+  for (const method of writeMethods) {
+    const write = fs[method] as
+      | ((opts: { path: string; newPath?: string }) => Awaitable<unknown>)
+      | undefined;
+    if (typeof write !== "function") continue;
+    (wrapped as any)[method] = (opts: { path: string; newPath?: string }) => {
+      const touched = [opts.path, opts.newPath ?? []].flat();
+      touched.forEach(forget);
+      return awaited.map(write.call(fs, opts), (result) => {
+        touched.forEach(forget);
+        return result;
+      });
+    };
+  }
+
+  const unsubscribe = fs.subscribe?.((paths) => paths.forEach(forget));
+  const dispose = () => unsubscribe?.();
+
+  const stats = (): CachedFileSystem.Stats => ({
+    ...counts,
+    entries: entries.size,
+    bytes,
+    hitRate:
+      counts.hits + counts.misses === 0
+        ? 0
+        : counts.hits / (counts.hits + counts.misses),
+  });
+
+  return { ...wrapped, cache: { stats, clear, dispose } };
+};
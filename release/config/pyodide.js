@@ -0,0 +1,182 @@
+/// <reference types="node" />
+
+import { createHash } from "node:crypto";
+import { readFile } from "node:fs/promises";
+import { createRequire } from "node:module";
+import { dirname, extname, join, resolve } from "node:path";
+import { brotliCompressSync, gzipSync } from "node:zlib";
+
+/** The files Pyodide fetches whenever it starts, beside its lock file. */
+const RUNTIME = ["pyodide.asm.js", "pyodide.asm.wasm", "python_stdlib.zip"];
+
+const LOCKFILE = "pyodide-lock.json";
+
+/** Wheels and zips are compressed already. */
+const COMPRESSIBLE = new Set([".js", ".mjs", ".json", ".wasm"]);
+
+/** `application/wasm` above all, or it cannot be compiled as it arrives. */
+const CONTENT_TYPES = {
+  ".js": "text/javascript",
+  ".mjs": "text/javascript",
+  ".json": "application/json",
+  ".wasm": "application/wasm",
+};
+
+/** Where kernels find the copy, read by `Kernel` as it is bundled. */
+export const INDEX_URL_KEY = "import.meta.env.PYTHON_WEB_KERNEL_INDEX_URL";
+
+/**
+ * The lock file's names for the packages and everything they depend on.
+ *
+ * @param {{ packages: Record<string, { depends?: string[] }> }} lockfile
+ * @param {string[]} names
+ * @returns {string[]}
+ */
+export const dependencyClosure = (lockfile, names) => {
+  const needed = new Set();
+  const visit = (/** @type {string} */ name) => {
+    const key = name.toLowerCase();
+    if (needed.has(key)) return;
+    if (!(key in lockfile.packages))
+      throw new Error(`Pyodide has no package named "${name}"`);
+    needed.add(key);
+    for (const dependency of lockfile.packages[key].depends ?? [])
+      visit(dependency);
+  };
+  for (const name of names) visit(name);
+  return [...needed];
+};
+
+/**
+ * The lock file with only the packages shipped, so that asking for any other
+ * fails at once rather than after a request for a file that is not there.
+ *
+ * @template {{ packages: Record<string, unknown> }} Lockfile
+ * @param {Lockfile} lockfile
+ * @param {string[]} names
+ * @returns {Lockfile}
+ */
+export const trimmedLockfile = (lockfile, names) => ({
+  ...lockfile,
+  packages: Object.fromEntries(
+    dependencyClosure(lockfile, names).map((key) => [
+      key,
+      lockfile.packages[key],
+    ]),
+  ),
+});
+
+/**
+ * @param {string} from A directory, or a URL
+ * @param {string} file
+ * @returns {Promise<Uint8Array>}
+ */
+const readFrom = async (from, file) => {
+  if (!/^https?:\/\//.test(from)) return readFile(join(from, file));
+  const url = new URL(file, from.endsWith("/") ? from : `${from}/`);
+  const response = await fetch(url);
+  if (!response.ok) throw new Error(`${response.status} fetching ${url}`);
+  return new Uint8Array(await response.arrayBuffer());
+};
+
+/**
+ * @typedef {object} SelfHostOptions
+ * @property {string} [path] Where Pyodide is served, under the site's `base`. Defaults to `pyodide/`
+ * @property {string[]} [packages] Packages to ship, as `loadPackage` names them; whatever they depend on comes too
+ * @property {string} [packagesFrom] A directory or URL holding the full Pyodide distribution the packages are taken from. Defaults to jsDelivr's copy of the installed version
+ * @property {boolean} [precompress] Whether to write `.br` and `.gz` copies beside each file worth compressing. Defaults to true
+ */
+
+/**
+ * Serves Pyodide from the site itself: its runtime, out of the installed
+ * `pyodide` package, and the chosen packages, each checked against the lock
+ * file. Kernels use the copy unless given an `indexURL` of their own.
+ *
+ * Built, the files are written under `path` with a lock file listing only the
+ * packages shipped, and with precompressed copies for a server that serves
+ * them, such as nginx's `gzip_static` and `brotli_static`.
+ *
+ * @param {SelfHostOptions} [options]
+ * @return {import('vite').Plugin}
+ */
+export const selfHostPyodide = ({
+  path = "pyodide/",
+  packages = [],
+  packagesFrom,
+  precompress = true,
+} = {}) => {
+  const directory = path.replace(/^\/+/, "").replace(/\/*$/, "/");
+  let root = process.cwd();
+  let served = `/${directory}`;
+
+  /** @type {Promise<Map<string, Uint8Array>> | undefined} */
+  let files;
+
+  const collect = async () => {
+    const require = createRequire(resolve(root, "package.json"));
+    const installed = dirname(require.resolve("pyodide"));
+    const read = async (/** @type {string} */ file) =>
+      JSON.parse(await readFile(join(installed, file), "utf8"));
+    const { version } = await read("package.json");
+    const lockfile = await read(LOCKFILE);
+    const from =
+      packagesFrom ?? `https://cdn.jsdelivr.net/pyodide/v${version}/full/`;
+
+    const collected = new Map();
+    for (const file of RUNTIME)
+      collected.set(file, await readFile(join(installed, file)));
+    const trimmed = trimmedLockfile(lockfile, packages);
+    collected.set(LOCKFILE, Buffer.from(JSON.stringify(trimmed)));
+    await Promise.all(
+      Object.values(trimmed.packages).map(async ({ file_name, sha256 }) => {
+        const bytes = await readFrom(from, file_name);
+        const digest = createHash("sha256").update(bytes).digest("hex");
+        if (sha256 && digest !== sha256)
+          throw new Error(`${file_name} does not match its sha256`);
+        collected.set(file_name, bytes);
+      }),
+    );
+    return collected;
+  };
+
+  const filesOnce = () => (files ??= collect());
+
+  return {
+    name: "python-web-kernel-suede:self-host-pyodide",
+    config(config) {
+      root = resolve(config.root ?? process.cwd());
+      const base = config.base ?? "/";
+      served = `${base.endsWith("/") ? base : `${base}/`}${directory}`;
+      return { define: { [INDEX_URL_KEY]: JSON.stringify(served) } };
+    },
+    configureServer({ middlewares }) {
+      middlewares.use(async (request, response, next) => {
+        const url = request.url?.split("?")[0] ?? "";
+        if (!url.startsWith(served)) return next();
+        const file = decodeURIComponent(url.slice(served.length));
+        const body = (await filesOnce()).get(file);
+        if (!body) return next();
+        const type = CONTENT_TYPES[extname(file)] ?? "application/zip";
+        response.setHeader("Content-Type", type);
+        response.end(body);
+      });
+    },
+    async generateBundle() {
+      for (const [file, source] of await filesOnce()) {
+        const fileName = directory + file;
+        this.emitFile({ type: "asset", fileName, source });
+        if (!precompress || !COMPRESSIBLE.has(extname(file))) continue;
+        this.emitFile({
+          type: "asset",
+          fileName: `${fileName}.br`,
+          source: brotliCompressSync(source),
+        });
+        this.emitFile({
+          type: "asset",
+          fileName: `${fileName}.gz`,
+          source: gzipSync(source, { level: 9 }),
+        });
+      }
+    },
+  };
+};
@@ -2,6 +2,7 @@
 
 import { viteStaticCopy } from "vite-plugin-static-copy";
 import { suederoot } from "./dirname";
+import { selfHostPyodide } from "./pyodide";
 import { resolve } from "node:path";
 
 /** SharedArrayBuffer, and so the kernel, only exists on a cross-origin isolated page. */
@@ -36,6 +37,7 @@ const crossOriginIsolation = () => ({
 /**
  * @typedef {object} ApplyOptions
  * @property {boolean} [patchCrossOriginIsolation] Whether to ship the service worker that isolates pages served without the headers
+ * @property {import('./pyodide').SelfHostOptions | boolean} [selfHost] Whether the site serves Pyodide, and which packages, itself rather than kernels fetching it from the CDN
  */
 
 /**
@@ -46,7 +48,7 @@ const crossOriginIsolation = () => ({
  */
 export const applyConfig = (
   current,
-  { patchCrossOriginIsolation = true } = {},
+  { patchCrossOriginIsolation = true, selfHost = false } = {},
 ) => {
   current.server ??= {};
   current.server.host ??= "0.0.0.0";
@@ -63,6 +65,9 @@ export const applyConfig = (
   current.plugins ??= [];
   current.plugins.push(crossOriginIsolation());
 
+  if (selfHost)
+    current.plugins.push(selfHostPyodide(selfHost === true ? {} : selfHost));
+
   if (patchCrossOriginIsolation) {
     const coi = resolve(suederoot, "config/static/coi-serviceworker.js");
 
@@ -1,5 +1,6 @@
 const encoder = new TextEncoder();
-const strictDecoder = new TextDecoder("utf-8", { fatal: true });
+/** A leading byte order mark is kept, as the bytes remembered keep it too. */
+const decoder = new TextDecoder("utf-8", { ignoreBOM: true });
 
 /**
  * The contents of a file as they cross the kernel bridge.
@@ -10,32 +11,148 @@ export type Contents = string | Uint8Array;
 
 const isText = (value: Contents): value is string => typeof value === "string";
 
-const decodeText = (bytes: Uint8Array): string | undefined => {
-  try {
-    return strictDecoder.decode(bytes);
-  } catch {
-    return undefined;
+/** What `TextEncoder` would produce, counted without producing it. */
+const utf8Length = (text: string) => {
+  let length = text.length;
+  for (let index = 0; index < text.length; index++) {
+    const code = text.charCodeAt(index);
+    if (code < 0x80) continue;
+    if (code < 0x800) length += 1;
+    else if (
+      code >= 0xd800 &&
+      code <= 0xdbff &&
+      (text.charCodeAt(index + 1) & 0xfc00) === 0xdc00
+    ) {
+      /** A surrogate pair is two units and four bytes. */
+      length += 2;
+      index++;
+    } else length += 2;
+  }
+  return length;
+};
+
+/**
+ * How many continuation bytes follow a lead byte, and the range the first of
+ * them must fall in, which is what rules out overlong forms and surrogates.
+ */
+const sequenceAfter = (
+  lead: number,
+): [count: number, low: number, high: number] => {
+  if (lead >= 0xc2 && lead <= 0xdf) return [1, 0x80, 0xbf];
+  if (lead === 0xe0) return [2, 0xa0, 0xbf];
+  if (lead === 0xed) return [2, 0x80, 0x9f];
+  if (lead >= 0xe1 && lead <= 0xef) return [2, 0x80, 0xbf];
+  if (lead === 0xf0) return [3, 0x90, 0xbf];
+  if (lead >= 0xf1 && lead <= 0xf3) return [3, 0x80, 0xbf];
+  if (lead === 0xf4) return [3, 0x80, 0x8f];
+  return [0, 0, 0];
+};
+
+/** Whether bytes are well-formed UTF-8, checked in place without decoding. */
+const isUtf8 = (bytes: Uint8Array) => {
+  for (let index = 0; index < bytes.length; ) {
+    const lead = bytes[index];
+    if (lead < 0x80) {
+      index++;
+      continue;
+    }
+    const [count, low, high] = sequenceAfter(lead);
+    if (count === 0 || index + count >= bytes.length) return false;
+    const second = bytes[index + 1];
+    if (second < low || second > high) return false;
+    for (let next = 2; next <= count; next++)
+      if ((bytes[index + next] & 0xc0) !== 0x80) return false;
+    index += count + 1;
+  }
+  return true;
+};
+
+/** Converting is only worth remembering for contents at least this large. */
+const REMEMBERED_FROM = 4 * 1024;
+const REMEMBERED_BYTES = 16 * 1024 * 1024;
+
+/**
+ * Text recently converted from bytes or to them, with the other form. A file
+ * Python wrote arrives as bytes, is handed on as text and is asked for as
+ * bytes again when it is read back, or crosses the bridge as text and is
+ * wanted as bytes on the other side; each time, the bytes are already known.
+ *
+ * Bytes are handed out once and then forgotten, so whoever takes them may
+ * change them.
+ */
+const converted = new Map<string, Uint8Array>();
+let convertedBytes = 0;
+
+const remember = (text: string, bytes: Uint8Array) => {
+  if (bytes.byteLength < REMEMBERED_FROM) return;
+  if (bytes.byteLength > REMEMBERED_BYTES) return;
+  forget(text);
+  /** A view into a larger payload is copied, so the rest can be let go. */
+  if (bytes.byteLength !== bytes.buffer.byteLength) bytes = bytes.slice();
+  converted.set(text, bytes);
+  convertedBytes += bytes.byteLength;
+  for (const [oldest] of converted) {
+    if (convertedBytes <= REMEMBERED_BYTES) break;
+    forget(oldest);
   }
 };
 
+const forget = (text: string) => {
+  const bytes = converted.get(text);
+  if (!bytes) return undefined;
+  converted.delete(text);
+  convertedBytes -= bytes.byteLength;
+  return bytes;
+};
+
+/** Short strings are cheaper to encode than to look up. */
+const isShort = (text: string) => text.length * 3 < REMEMBERED_FROM;
+
 export const contents = {
   isText,
 
+  utf8Length,
+
+  isUtf8,
+
   toBytes: (value: Contents): Uint8Array =>
-    isText(value) ? encoder.encode(value) : value,
+    isText(value)
+      ? ((!isShort(value) && forget(value)) || encoder.encode(value))
+      : value,
 
   /**
    * Bytes become text whenever they are valid UTF-8, so text written by Python
-   * arrives as text and anything else arrives untouched.
+   * arrives as text and anything else arrives untouched. Bytes that are not
+   * text are never decoded.
    */
-  fromBytes: (bytes: Uint8Array): Contents => decodeText(bytes) ?? bytes,
+  fromBytes: (bytes: Uint8Array): Contents =>
+    isUtf8(bytes) ? decoder.decode(bytes) : bytes,
 
-  byteLength: (value: Contents): number =>
-    isText(value) ? encoder.encode(value).byteLength : value.byteLength,
+  /**
+   * Like {@link contents.fromBytes}, but the bytes are kept and handed back the
+   * next time the text is turned into bytes, so nothing else may change them.
+   */
+  adopt: (bytes: Uint8Array): Contents => {
+    if (!isUtf8(bytes)) return bytes;
+    const text = decoder.decode(bytes);
+    remember(text, bytes);
+    return text;
+  },
+
+  /** Bytes already known to be UTF-8, as text. */
+  text: (bytes: Uint8Array): string => decoder.decode(bytes),
+
+  byteLength: (value: Contents): number => {
+    if (!isText(value)) return value.byteLength;
+    if (isShort(value)) return utf8Length(value);
+    return converted.get(value)?.byteLength ?? utf8Length(value);
+  },
 
   equal: (left: Contents, right: Contents): boolean => {
+    if (isText(left) && isText(right)) return left === right;
+    if (contents.byteLength(left) !== contents.byteLength(right)) return false;
     const [a, b] = [contents.toBytes(left), contents.toBytes(right)];
-    return a.byteLength === b.byteLength && a.every((byte, i) => byte === b[i]);
+    return a.every((byte, i) => byte === b[i]);
   },
 };
 
@@ -46,3 +163,73 @@ export const resizeBytes = (bytes: Uint8Array, size: number): Uint8Array => {
   resized.set(bytes);
   return resized;
 };
+
+/**
+ * Contents that arrive a chunk at a time, such as a fetch response's `body`.
+ * They are copied across to the worker as they arrive, so the page never has
+ * to hold the whole file.
+ */
+export type Streamed = ReadableStream<Uint8Array> | AsyncIterable<Uint8Array>;
+
+const isStreamed = (value: unknown): value is Streamed =>
+  (typeof ReadableStream !== "undefined" && value instanceof ReadableStream) ||
+  (typeof value === "object" &&
+    value !== null &&
+    !(value instanceof Uint8Array) &&
+    Symbol.asyncIterator in value);
+
+async function* chunksOf(value: Streamed): AsyncGenerator<Uint8Array> {
+  if (!(value instanceof ReadableStream)) return yield* value;
+  const reader = value.getReader();
+  let done = false;
+  try {
+    for (let read = await reader.read(); !read.done; read = await reader.read())
+      yield read.value;
+    done = true;
+  } finally {
+    /** Stopped early: whatever is feeding the stream can stop too. */
+    if (!done) await reader.cancel();
+    reader.releaseLock();
+  }
+}
+
+export const streamed = {
+  is: isStreamed,
+
+  chunks: chunksOf,
+
+  /** Every chunk joined, for when the whole file is wanted after all. */
+  collect: async (value: Streamed): Promise<Uint8Array> => {
+    const chunks: Uint8Array[] = [];
+    for await (const chunk of chunksOf(value)) chunks.push(chunk);
+    const whole = new Uint8Array(chunks.reduce((sum, c) => sum + c.length, 0));
+    chunks.reduce((at, chunk) => (whole.set(chunk, at), at + chunk.length), 0);
+    return whole;
+  },
+
+  /** How many bytes there are, counted as they pass rather than kept. */
+  measure: async (value: Streamed): Promise<number> => {
+    let size = 0;
+    for await (const chunk of chunksOf(value)) size += chunk.length;
+    return size;
+  },
+
+  /** A range, read up to and no further than its end. */
+  slice: async (
+    value: Streamed,
+    offset: number,
+    length: number,
+  ): Promise<Uint8Array> => {
+    const range = new Uint8Array(length);
+    let [at, filled] = [0, 0];
+    for await (const chunk of chunksOf(value)) {
+      const from = Math.max(offset - at, 0);
+      const taken = chunk.subarray(from, from + length - filled);
+      range.set(taken, filled);
+      filled += taken.length;
+      at += chunk.length;
+      if (filled === length) break;
+    }
+    return range.slice(0, filled);
+  },
+};
@@ -1,5 +1,15 @@
-import { contents, type Contents } from "./contents";
-import type { Entry, SyncFileSystem } from "./worker/emscripten-fs";
+import {
+  contents,
+  streamed,
+  type Contents,
+  type Streamed,
+} from "./contents";
+import type {
+  Entry,
+  Listing,
+  ManifestEntry,
+  SyncFileSystem,
+} from "./worker/emscripten-fs";
 import { awaited, type Awaitable, type SyncResult } from "./utils";
 
 export namespace FileSystem {
@@ -33,9 +43,13 @@ export namespace FileSystem {
     binary?: boolean;
   };
 
+  /**
+   * Contents may be streamed, say a fetch response's `body`, so that a large
+   * file is passed on to Python as it arrives instead of held whole first.
+   */
   export type Get = (
     path: string,
-  ) => Awaitable<Contents | undefined | null | { directory: true }>;
+  ) => Awaitable<Contents | Streamed | undefined | null | { directory: true }>;
 
   export type Put = (path: string, value: Contents | null) => Awaitable<void>;
 
@@ -45,6 +59,21 @@ export namespace FileSystem {
 
   export type Stat = (path: string) => Awaitable<Entry | undefined | null>;
 
+  export type ListDirectoryWithStats = (
+    path: string,
+  ) => Awaitable<Listing[] | undefined | null>;
+
+  export type ReadAt = (request: {
+    /** File to read from. */
+    path: string;
+    /** Where in the file to start. */
+    offset: number;
+    /** The most bytes wanted; fewer at the end of the file. */
+    length: number;
+  }) => Awaitable<Uint8Array | Streamed | undefined | null>;
+
+  export type Manifest = () => Awaitable<ManifestEntry[] | undefined | null>;
+
   export type Move = (request: {
     /** Source path to move from. */
     from: string;
@@ -54,6 +83,23 @@ export namespace FileSystem {
 
   export type Delete = (path: string) => Awaitable<void>;
 
+  export type WriteAt = (request: {
+    /** File to write into. */
+    path: string;
+    /** Where in the file the bytes go. */
+    offset: number;
+    /** Always bytes: a range can start or end part way through a character. */
+    value: Uint8Array;
+  }) => Awaitable<void>;
+
+  export type Truncate = (path: string, size: number) => Awaitable<void>;
+
+  /** Told which paths were changed, as the kernel's worker names them. */
+  export type Listener = (paths: string[]) => void;
+
+  /** Registers a listener, returning what unregisters it. */
+  export type Subscribe = (listener: Listener) => () => void;
+
   export type Read = {
     /** Read file contents or directory marker for a path. */
     get: Get;
@@ -66,6 +112,30 @@ export namespace FileSystem {
      * without it, sizes are measured by reading the file.
      */
     stat?: Stat;
+    /**
+     * List a directory and describe each entry in one go.
+     *
+     * Without it, a listing is put together from `listDirectory` and `stat`.
+     * Either way Python walks a tree with one call per directory.
+     */
+    listDirectoryWithStats?: ListDirectoryWithStats;
+    /**
+     * Describe every file and directory at once, with paths relative to the
+     * root as the other callbacks receive them.
+     *
+     * Python then learns the shape of the workspace in one call per run, and
+     * never asks about a single path. Provide it when the whole tree is
+     * already in hand, as in an editor's file list.
+     */
+    manifest?: Manifest;
+    /**
+     * Read part of a file.
+     *
+     * With it, a file Python opens for reading alone is fetched as it is read
+     * rather than whole when it is opened, so a large file costs only what is
+     * read of it.
+     */
+    read?: ReadAt;
   };
 
   export type Write = {
@@ -75,6 +145,15 @@ export namespace FileSystem {
     move?: Move;
     /** Delete a path from the filesystem. */
     delete?: Delete;
+    /**
+     * Write bytes into an existing file at an offset, zero-filling any gap.
+     *
+     * Provide it together with `truncate` and a file Python changes is sent
+     * only the ranges that changed, instead of whole to `put`.
+     */
+    write?: WriteAt;
+    /** Cut a file down, or pad it with zeroes, to a size. */
+    truncate?: Truncate;
   };
 
   export type CreateReadWrite = FileSystem.Read &
@@ -82,18 +161,32 @@ export namespace FileSystem {
     FileSystem.CreationOptions;
 }
 
+/** Bytes the worker is sent may be sent as a stream instead. */
+type MayStream<T> =
+  [T] extends [SyncResult<infer Data>]
+    ? SyncResult<Data extends Uint8Array ? Data | Streamed : Data>
+    : T;
+
 /**
  * The filesystem the kernel is given. It answers the same questions the worker
  * asks, except that every answer may arrive in a promise: Python stays blocked
- * until it does.
+ * until it does. File contents may also arrive as a stream.
  */
 export type HostFileSystem = {
   [K in keyof SyncFileSystem]: (
-    ...args: Parameters<SyncFileSystem[K]>
-  ) => Awaitable<ReturnType<SyncFileSystem[K]>>;
+    ...args: Parameters<NonNullable<SyncFileSystem[K]>>
+  ) => Awaitable<MayStream<ReturnType<NonNullable<SyncFileSystem[K]>>>>;
 };
 
-type RootedFileSystem = HostFileSystem & { root: string };
+type RootedFileSystem = HostFileSystem & {
+  root: string;
+  /**
+   * Hear of every change made through this filesystem. A kernel given one
+   * subscribes, so that kernels sharing a filesystem learn of each other's
+   * writes.
+   */
+  subscribe?: FileSystem.Subscribe;
+};
 
 export const defaultRoot = "/home/pyodide";
 
@@ -121,6 +214,9 @@ export const empty = (root = defaultRoot, log = false): RootedFileSystem => {
     delete: (opts) => (trace("delete", opts), ok(undefined)),
     move: (opts) => (trace("move", opts), ok(undefined)),
     listDirectory: (opts) => (trace("listDirectory", opts), ok([])),
+    listDirectoryWithStats: (opts) => (
+      trace("listDirectoryWithStats", opts), ok([])
+    ),
   };
 };
 
@@ -149,11 +245,14 @@ const isDirectoryMarker = (value: unknown): value is { directory: true } =>
 const isContents = (value: unknown): value is Contents =>
   typeof value === "string" || value instanceof Uint8Array;
 
+const isBytes = (value: unknown): value is Uint8Array | Streamed =>
+  value instanceof Uint8Array || streamed.is(value);
+
 /** Reads only count as answered when they produced contents or a directory. */
 const answered = (
   value: Awaited<ReturnType<FileSystem.Get>>,
-): SyncResult<Contents | null> | undefined => {
-  if (isContents(value)) return ok(value);
+): SyncResult<Contents | Streamed | null> | undefined => {
+  if (isContents(value) || streamed.is(value)) return ok(value);
   if (isDirectoryMarker(value)) return ok(null);
   return undefined;
 };
@@ -163,12 +262,76 @@ const entryOf = (value: Contents | null): Entry =>
     ? { size: 0, directory: true }
     : { size: contents.byteLength(value), directory: false };
 
-const measuredByReading =
-  (get: HostFileSystem["get"]): HostFileSystem["stat"] =>
+/** Stats that read the file, which whoever holds its contents can answer. */
+const measuring = new WeakSet<HostFileSystem["stat"]>();
+
+export const measuresByReading = (stat: HostFileSystem["stat"]) =>
+  measuring.has(stat);
+
+/** A stream is counted as it passes, so it is never held whole. */
+export const measuredByReading = (
+  get: HostFileSystem["get"],
+): HostFileSystem["stat"] => {
+  const stat: HostFileSystem["stat"] = (opts) =>
+    awaited.map(get(opts), (result) => {
+      if (!result.ok) return result;
+      if (!streamed.is(result.data)) return ok(entryOf(result.data));
+      return streamed
+        .measure(result.data)
+        .then((size) => ok({ size, directory: false }));
+    });
+  measuring.add(stat);
+  return stat;
+};
+
+/**
+ * A listing put together on this side of the bridge, where asking about each
+ * entry costs a callback rather than a round trip from the worker. Entries that
+ * cannot be described are left out, as looking them up would fail anyway.
+ */
+const listedWithStats =
+  (
+    listDirectory: HostFileSystem["listDirectory"],
+    stat: HostFileSystem["stat"],
+  ): NonNullable<HostFileSystem["listDirectoryWithStats"]> =>
   (opts) =>
-    awaited.map(get(opts), (result) =>
-      result.ok ? ok(entryOf(result.data)) : result,
-    );
+    awaited.map(listDirectory(opts), (result) => {
+      if (!result.ok) return result;
+      const directory = opts.path.replace(/\/$/, "");
+      const entries = result.data.map((name) =>
+        awaited.map(stat({ path: `${directory}/${name}` }), (entry) =>
+          entry.ok ? [{ name, ...entry.data }] : [],
+        ),
+      );
+      return awaited.map(awaited.all(entries), (found) => ok(found.flat()));
+    });
+
+/**
+ * Reads a range from what this layer holds, and only asks the layer beneath
+ * for files it does not hold: the worker reads ranges whenever the bottom
+ * layer can, whatever layer a file is in.
+ */
+const slicedOrRead =
+  (
+    get: FileSystem.Get,
+    at: (opts: { path: string }) => string,
+    read: NonNullable<HostFileSystem["read"]>,
+  ): HostFileSystem["read"] =>
+  (opts) =>
+    awaited.map(get(at(opts)), (value) => {
+      const { offset, length } = opts;
+      if (streamed.is(value))
+        return streamed.slice(value, offset, length).then(ok);
+      return isContents(value)
+        ? ok(contents.toBytes(value).slice(offset, offset + length))
+        : read(opts);
+    });
+
+const noManifest: SyncResult<never> = {
+  ok: false,
+  status: 404,
+  error: new Error("No manifest was given"),
+};
 
 const sanitizer =
   (options: FileSystem.SanitizeOptions) => (opts: { path: string }) =>
@@ -183,7 +346,8 @@ export const readOnly = (
   base?: RootedFileSystem,
 ): RootedFileSystem => {
   setDefaults(options);
-  const { get, listDirectory, stat } = options;
+  const { get, listDirectory, stat, listDirectoryWithStats, manifest, read } =
+    options;
   const fallback = base ?? empty(options.root, options.log);
   const at = sanitizer(options);
 
@@ -201,14 +365,38 @@ export const readOnly = (
   };
 
   const measured = measuredByReading(reader.get);
+  const described: HostFileSystem["stat"] = stat
+    ? (opts) =>
+        awaited.map(stat(at(opts)), (entry) =>
+          entry ? ok(entry) : measured(opts),
+        )
+    : measured;
+  const synthesised = listedWithStats(reader.listDirectory, described);
   return {
     ...reader,
-    stat: stat
+    stat: described,
+    listDirectoryWithStats: listDirectoryWithStats
+      ? (opts) =>
+          awaited.map(listDirectoryWithStats(at(opts)), (listing) =>
+            Array.isArray(listing) ? ok(listing) : synthesised(opts),
+          )
+      : synthesised,
+    manifest: manifest
+      ? () =>
+          awaited.map(manifest(), (entries) =>
+            Array.isArray(entries)
+              ? ok(entries)
+              : (fallback.manifest?.() ?? noManifest),
+          )
+      : fallback.manifest,
+    read: read
       ? (opts) =>
-          awaited.map(stat(at(opts)), (entry) =>
-            entry ? ok(entry) : measured(opts),
+          awaited.map(read({ ...opts, path: at(opts) }), (bytes) =>
+            isBytes(bytes)
+              ? ok(bytes)
+              : (fallback.read?.(opts) ?? notFound(opts.path)),
           )
-      : measured,
+      : fallback.read && slicedOrRead(get, at, fallback.read),
   };
 };
 
@@ -221,17 +409,28 @@ export const writeOnly = (
   base?: RootedFileSystem,
 ): RootedFileSystem => {
   setDefaults(options);
-  const { put, move, delete: remove, binary = false } = options;
+  const {
+    put,
+    move,
+    delete: remove,
+    write,
+    truncate,
+    binary = false,
+  } = options;
   const fallback = base ?? empty(options.root, options.log);
   const at = sanitizer(options);
-  const done = (value: Awaitable<void>) =>
-    awaited.map(value, () => ok(undefined));
+  const listeners = new Set<FileSystem.Listener>();
+  const done = (value: Awaitable<void>, ...paths: string[]) =>
+    awaited.map(value, () => {
+      for (const listener of listeners) listener(paths);
+      return ok(undefined);
+    });
 
   /** Text written by Python stays text unless raw bytes were asked for. */
   const written = (value: Contents | null) =>
     value === null || binary || contents.isText(value)
       ? value
-      : contents.fromBytes(value);
+      : contents.adopt(value);
 
   return {
     ...fallback,
@@ -239,10 +438,29 @@ export const writeOnly = (
       ? (opts) =>
           done(
             move({ from: at(opts), to: sanitizePath(opts.newPath, options) }),
+            opts.path,
+            opts.newPath,
           )
       : fallback.move,
-    delete: remove ? (opts) => done(remove(at(opts))) : fallback.delete,
-    put: (opts) => done(put(at(opts), written(opts.value))),
+    delete: remove
+      ? (opts) => done(remove(at(opts)), opts.path)
+      : fallback.delete,
+    put: (opts) => done(put(at(opts), written(opts.value)), opts.path),
+    write: write
+      ? ({ offset, value, ...opts }) =>
+          done(write({ path: at(opts), offset, value }), opts.path)
+      : fallback.write,
+    truncate: truncate
+      ? (opts) => done(truncate(at(opts), opts.size), opts.path)
+      : fallback.truncate,
+    subscribe: (listener) => {
+      listeners.add(listener);
+      const fromBase = fallback.subscribe?.(listener);
+      return () => {
+        listeners.delete(listener);
+        fromBase?.();
+      };
+    },
   };
 };
 
@@ -0,0 +1,269 @@
+import { readOnly, type FileSystem, type HostFileSystem } from "./fs";
+import {
+  indexOf,
+  type Index,
+  type ManifestEntry,
+} from "./worker/emscripten-fs";
+
+export namespace HttpFileSystem {
+  export type Options = FileSystem.CreationOptions & {
+    /** Where the files are served from; a path is fetched relative to it. */
+    baseURL: string | URL;
+    /**
+     * A JSON array describing every file, as `{ path, size }` with paths
+     * relative to `baseURL`, and optionally `directory` and `version`.
+     * Resolved against `baseURL`.
+     *
+     * Without one, paths are described with `HEAD` requests and directories
+     * cannot be listed.
+     */
+    manifestURL?: string | URL;
+    /**
+     * The most requests in flight at once.
+     * @default 6
+     */
+    concurrency?: number;
+    /**
+     * The most fetched-whole contents held to ask again whether they changed,
+     * in bytes. Beyond it, the least recently used is dropped and fetched
+     * afresh when next asked for.
+     * @default 64 MiB
+     */
+    maxBytes?: number;
+    /** Sent with every request, for headers or credentials. */
+    init?: RequestInit;
+    /** What makes the requests, for tests or a proxy. */
+    fetch?: typeof fetch;
+  };
+}
+
+export type HttpFileSystem = HostFileSystem & { root: string };
+
+/** Runs at most `concurrency` tasks at once, and the rest in turn. */
+const pool = (concurrency: number) => {
+  let running = 0;
+  const waiting: (() => void)[] = [];
+  return async <T>(task: () => Promise<T>): Promise<T> => {
+    if (running < concurrency) running++;
+    else await new Promise<void>((resolve) => waiting.push(resolve));
+    try {
+      return await task();
+    } finally {
+      /** The place is handed straight on, so no newcomer can take it first. */
+      const next = waiting.shift();
+      if (next) next();
+      else running--;
+    }
+  };
+};
+
+/** What a response said about its version, to ask whether it has changed. */
+type Validated<T> = {
+  etag?: string;
+  lastModified?: string;
+  value: T;
+  size: number;
+};
+
+const validatorsOf = (response: Response) => ({
+  etag: response.headers.get("ETag") ?? undefined,
+  lastModified: response.headers.get("Last-Modified") ?? undefined,
+});
+
+const conditionalHeaders = (held?: Validated<unknown>) => {
+  const headers: Record<string, string> = {};
+  if (held?.etag) headers["If-None-Match"] = held.etag;
+  if (held?.lastModified) headers["If-Modified-Since"] = held.lastModified;
+  return headers;
+};
+
+/**
+ * What `If-Range` can name a version by: a strong `ETag`, since a weak one
+ * never matches there, or else `Last-Modified`.
+ */
+const rangeValidatorOf = (response: Response) => {
+  const { etag, lastModified } = validatorsOf(response);
+  return etag && !etag.startsWith("W/") ? etag : lastModified;
+};
+
+const failure = (response: Response, url: URL) =>
+  new Error(`${response.status} ${response.statusText} fetching ${url}`);
+
+const bytesOf = async (response: Response) =>
+  new Uint8Array(await response.arrayBuffer());
+
+const decoder = new TextDecoder();
+
+/**
+ * A read-only filesystem served over HTTP, from a static server or a bucket.
+ *
+ * Its shape comes from a manifest fetched once per run, so Python never waits
+ * on the network to look a path up. A file Python opens for reading alone is
+ * fetched with `Range` requests as it is read, so a large dataset costs only
+ * what is read of it. Whatever is fetched whole, the manifest included, is
+ * asked for again with its `ETag` or `Last-Modified`, and kept when the server
+ * says it has not changed, for as much as fits in `maxBytes`. Ranges of a file
+ * are asked for with `If-Range`, so pieces of two versions are never mixed.
+ */
+export const http = ({
+  baseURL,
+  manifestURL,
+  concurrency = 6,
+  maxBytes = 64 * 1024 * 1024,
+  init = {},
+  fetch: request = (input, init) => fetch(input, init),
+  ...creation
+}: HttpFileSystem.Options): HttpFileSystem => {
+  const base = new URL(baseURL);
+  if (!base.pathname.endsWith("/")) base.pathname += "/";
+  const urlOf = (path: string) =>
+    new URL(path.split("/").map(encodeURIComponent).join("/"), base);
+  const limited = pool(concurrency);
+  /** In least recently used order, so the first entry is the first out. */
+  const held = new Map<string, Validated<unknown>>();
+  let heldBytes = 0;
+  /**
+   * The version of each file its ranges are read from, as `If-Range` names
+   * it. Set by the first answer about a file in a run.
+   */
+  const ranged = new Map<string, string>();
+
+  const forget = (href: string) => {
+    const known = held.get(href);
+    if (!known) return;
+    held.delete(href);
+    heldBytes -= known.size;
+  };
+
+  const hold = (href: string, validated: Validated<unknown>) => {
+    forget(href);
+    if (validated.size > maxBytes) return;
+    held.set(href, validated);
+    heldBytes += validated.size;
+    for (const [oldest, evicted] of held) {
+      if (heldBytes <= maxBytes) break;
+      held.delete(oldest);
+      heldBytes -= evicted.size;
+    }
+  };
+
+  const send = (url: URL, headers: Record<string, string>, method = "GET") =>
+    request(url, {
+      ...init,
+      method,
+      headers: { ...Object.fromEntries(new Headers(init.headers)), ...headers },
+    });
+
+  /** Fetches a whole resource, or `undefined` when there is none. */
+  const fetchWhole = <T>(url: URL, parse: (bytes: Uint8Array) => T) =>
+    limited(async (): Promise<T | undefined> => {
+      const known = held.get(url.href) as Validated<T> | undefined;
+      const response = await send(url, conditionalHeaders(known));
+      if (response.status === 304 && known) {
+        hold(url.href, known);
+        return known.value;
+      }
+      forget(url.href);
+      if (response.status === 404) return undefined;
+      if (!response.ok) throw failure(response, url);
+      const bytes = await bytesOf(response);
+      const value = parse(bytes);
+      const validators = validatorsOf(response);
+      if (validators.etag || validators.lastModified)
+        hold(url.href, { ...validators, value, size: bytes.byteLength });
+      return value;
+    });
+
+  /** The last manifest fetched, asked for again at the start of each run. */
+  let index: Promise<Index | undefined> | undefined;
+
+  const fetchManifest = () => {
+    if (!manifestURL) return Promise.resolve(undefined);
+    const url = new URL(manifestURL, base);
+    const fetched = fetchWhole(url, (bytes) => {
+      const entries = JSON.parse(
+        decoder.decode(bytes),
+      ) as Partial<ManifestEntry>[];
+      return entries.map(
+        ({ path = "", size = 0, directory = false, version }) => ({
+          path,
+          size,
+          directory,
+          ...(version === undefined ? {} : { version }),
+        }),
+      );
+    });
+    ranged.clear();
+    index = fetched.then((entries) => entries && indexOf(entries));
+    index.catch(() => (index = undefined));
+    return fetched;
+  };
+
+  const indexed = () => index ?? (fetchManifest(), index!);
+
+  return readOnly({
+    ...creation,
+    get: async (path) => {
+      const entry = (await indexed())?.entries.get(path);
+      if (entry?.directory) return { directory: true };
+      if (manifestURL && !entry) return undefined;
+      return fetchWhole(urlOf(path), (bytes) => bytes);
+    },
+    stat: async (path) => {
+      const at = await indexed();
+      if (at) return at.entries.get(path);
+      const url = urlOf(path);
+      const response = await limited(() => send(url, {}, "HEAD"));
+      if (response.status === 404) return undefined;
+      if (!response.ok) throw failure(response, url);
+      const version = rangeValidatorOf(response);
+      if (version) ranged.set(url.href, version);
+      const size = Number(response.headers.get("Content-Length") ?? NaN);
+      return Number.isNaN(size) ? undefined : { size, directory: false };
+    },
+    listDirectory: async (path) => {
+      const at = await indexed();
+      if (!at?.entries.get(path)?.directory) return undefined;
+      return [...(at.children.get(path) ?? [])];
+    },
+    manifest: manifestURL ? fetchManifest : undefined,
+    read: ({ path, offset, length }) => {
+      if (length <= 0) return new Uint8Array();
+      const url = urlOf(path);
+      const range = `bytes=${offset}-${offset + length - 1}`;
+      return limited(async () => {
+        const version = ranged.get(url.href);
+        const response = await send(
+          url,
+          version ? { Range: range, "If-Range": version } : { Range: range },
+        );
+        if (response.status === 404) return undefined;
+        if (response.status === 416) return new Uint8Array();
+        if (!response.ok) throw failure(response, url);
+        const answered = rangeValidatorOf(response);
+        /**
+         * Another version, or a whole file in answer to `If-Range` from a
+         * server that names none, means the file changed since its first piece
+         * was read. What was read of it cannot be mended with bytes of the new
+         * one, so the read fails and the new version is read from next time.
+         */
+        const changed = answered
+          ? answered !== version
+          : response.status !== 206;
+        if (version && changed) {
+          await response.body?.cancel();
+          forget(url.href);
+          if (answered) ranged.set(url.href, answered);
+          else ranged.delete(url.href);
+          throw new Error(`${url} changed while it was being read`);
+        }
+        if (answered) ranged.set(url.href, answered);
+        const bytes = await bytesOf(response);
+        /** A server that ignores `Range` sends the whole file instead. */
+        return response.status === 206
+          ? bytes
+          : bytes.slice(offset, offset + length);
+      });
+    },
+  });
+};
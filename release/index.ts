@@ -1,8 +1,20 @@
-export { default as Kernel, type Environment, type Run } from "./Kernel";
+export {
+  default as Kernel,
+  type Environment,
+  type Mount,
+  type Run,
+} from "./Kernel";
 export { Output } from "./output";
-export { contents, type Contents } from "./contents";
+export { contents, type Contents, type Streamed } from "./contents";
 export { base64, type Awaitable } from "./utils";
 export type { FileSystem, HostFileSystem } from "./fs";
+export { MemoryFiles, type MemoryFileSystem } from "./memory-fs";
+export type { CachedFileSystem } from "./cached-fs";
+export type { HttpFileSystem } from "./http-fs";
+export type { IndexedDBFileSystem } from "./indexeddb-fs";
+export type { ZipFileSystem } from "./zip-fs";
+export type { KernelPool } from "./kernel-pool";
+export type { CachePolicy, CacheStats } from "./worker/emscripten-fs";
 import { output } from "./Snippets.svelte";
 
 export const snippets = { output };
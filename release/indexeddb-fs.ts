@@ -0,0 +1,446 @@
+import { contents, type Contents } from "./contents";
+import { readWrite, type FileSystem, type HostFileSystem } from "./fs";
+import type { Entry, Listing, ManifestEntry } from "./worker/emscripten-fs";
+
+export namespace IndexedDBFileSystem {
+  export type Options = FileSystem.CreationOptions & {
+    /**
+     * The database the files are kept in. Kernels given the same name share
+     * the same files.
+     * @default "python-web-kernel"
+     */
+    name?: string;
+    /**
+     * Files are stored in pieces of this many bytes, so that reading or
+     * changing part of a large file touches only the pieces it covers.
+     * @default 1 MiB
+     */
+    chunkSize?: number;
+    /** Where databases are opened, for tests or a worker. */
+    indexedDB?: IDBFactory;
+  };
+}
+
+export type IndexedDBFileSystem = HostFileSystem & {
+  root: string;
+  subscribe?: FileSystem.Subscribe;
+  /** Closes the database once what was asked of it is done. */
+  close(): Promise<void>;
+};
+
+/** What is kept about a path, apart from the contents of a file. */
+type Stored = ManifestEntry & {
+  /** Names the file's pieces, so a move leaves them where they are. */
+  id?: string;
+  /** The directory it is in, indexed so that a listing is a single read. */
+  parent?: string;
+};
+
+type Stores = {
+  /**
+   * Every path and what `stat` says about it, so `stat` never loads bytes,
+   * with an index by the directory each is in.
+   */
+  entries: IDBObjectStore;
+  /** The pieces of every file, keyed by the file's id and their position. */
+  chunks: IDBObjectStore;
+};
+
+const storeNames = ["entries", "chunks"] as const;
+
+const VERSION = 1;
+
+const parentOf = (path: string) =>
+  path.slice(0, Math.max(path.lastIndexOf("/"), 0));
+
+const nameOf = (path: string) => path.slice(path.lastIndexOf("/") + 1);
+
+const root: Stored = { path: "", size: 0, directory: true };
+
+let clock = 0;
+
+/** Unique across reloads as well as within one, for ids and versions. */
+const token = () => `${Date.now().toString(36)}.${(clock++).toString(36)}`;
+
+const requested = <T>(request: IDBRequest<T>) =>
+  new Promise<T>((resolve, reject) => {
+    request.onsuccess = () => resolve(request.result);
+    request.onerror = () => reject(request.error);
+  });
+
+const opened = (factory: IDBFactory, name: string) =>
+  new Promise<IDBDatabase>((resolve, reject) => {
+    const request = factory.open(name, VERSION);
+    request.onupgradeneeded = () => {
+      const db = request.result;
+      if (!db.objectStoreNames.contains("entries"))
+        db.createObjectStore("entries").createIndex("parent", "parent");
+      if (!db.objectStoreNames.contains("chunks"))
+        db.createObjectStore("chunks");
+    };
+    request.onsuccess = () => resolve(request.result);
+    request.onerror = () => reject(request.error);
+  });
+
+const entryOf = ({ size, directory, version }: Stored): Entry =>
+  version === undefined ? { size, directory } : { size, directory, version };
+
+/**
+ * The filesystem's operations, each run inside a transaction it is handed, so
+ * that many of them can share one.
+ */
+const operations = (chunkSize: number) => {
+  const entryAt = async ({ entries }: Stores, path: string) =>
+    path === ""
+      ? root
+      : await requested<Stored | undefined>(entries.get(path));
+
+  /** What is in a directory, in order of name. */
+  const entriesIn = async ({ entries }: Stores, path: string) =>
+    await requested<Stored[]>(entries.index("parent").getAll(path));
+
+  const namesIn = async (stores: Stores, path: string) =>
+    (await entriesIn(stores, path)).map((entry) => nameOf(entry.path));
+
+  const chunkAt = async ({ chunks }: Stores, id: string, index: number) =>
+    await requested<Uint8Array | undefined>(chunks.get([id, index]));
+
+  /** Pieces never written, or cut short, read as zeroes. */
+  const readRange = async (
+    stores: Stores,
+    file: Stored,
+    offset: number,
+    length: number,
+  ) => {
+    const end = Math.min(file.size, offset + length);
+    if (end <= offset) return new Uint8Array();
+    const bytes = new Uint8Array(end - offset);
+    if (file.id === undefined) return bytes;
+    const first = Math.floor(offset / chunkSize);
+    const last = Math.floor((end - 1) / chunkSize);
+    const indices = Array.from(
+      { length: last - first + 1 },
+      (_, index) => first + index,
+    );
+    const pieces = await Promise.all(
+      indices.map((index) => chunkAt(stores, file.id!, index)),
+    );
+    pieces.forEach((piece, position) => {
+      if (!piece) return;
+      const start = (first + position) * chunkSize;
+      const from = Math.max(offset - start, 0);
+      const to = Math.min(end - start, piece.length);
+      if (to > from) bytes.set(piece.subarray(from, to), start + from - offset);
+    });
+    return bytes;
+  };
+
+  const dropChunks = (stores: Stores, file: Stored, from = 0) => {
+    const count = Math.ceil(file.size / chunkSize);
+    for (let index = from; index < count; index++)
+      stores.chunks.delete([file.id!, index]);
+  };
+
+  /** Storing an entry lists it in its directory: nothing else is written. */
+  const setEntry = (stores: Stores, entry: Stored) =>
+    stores.entries.put({ ...entry, parent: parentOf(entry.path) }, entry.path);
+
+  /** Makes the directories above a path. */
+  const link = async (stores: Stores, path: string) => {
+    const parent = parentOf(path);
+    const above = await entryAt(stores, parent);
+    if (!above) {
+      setEntry(stores, { path: parent, size: 0, directory: true });
+      await link(stores, parent);
+    } else if (!above.directory)
+      throw new Error(`${parent} is a file, not a directory`);
+  };
+
+  /** Every path at and under a path, parents before what is in them. */
+  const subtree = async (stores: Stores, path: string): Promise<Stored[]> => {
+    const entry = await entryAt(stores, path);
+    if (!entry) return [];
+    return entry.directory ? [entry, ...(await under(stores, path))] : [entry];
+  };
+
+  const under = async (stores: Stores, path: string): Promise<Stored[]> => {
+    const inside = await entriesIn(stores, path);
+    const deeper = await Promise.all(
+      inside.map((entry) => (entry.directory ? under(stores, entry.path) : [])),
+    );
+    return inside.flatMap((entry, index) => [entry, ...deeper[index]]);
+  };
+
+  /** Forgets a path and what is under it, and their contents unless kept. */
+  const remove = async (stores: Stores, path: string, keepChunks = false) => {
+    for (const entry of await subtree(stores, path)) {
+      if (!entry.directory && !keepChunks) dropChunks(stores, entry);
+      stores.entries.delete(entry.path);
+    }
+  };
+
+  return {
+    get: async (stores: Stores, path: string) => {
+      const entry = await entryAt(stores, path);
+      if (!entry) return undefined;
+      if (entry.directory) return { directory: true } as const;
+      return readRange(stores, entry, 0, entry.size);
+    },
+
+    stat: async (stores: Stores, path: string) => {
+      const entry = await entryAt(stores, path);
+      return entry && entryOf(entry);
+    },
+
+    listDirectory: async (stores: Stores, path: string) => {
+      const entry = await entryAt(stores, path);
+      return entry?.directory ? namesIn(stores, path) : undefined;
+    },
+
+    listDirectoryWithStats: async (stores: Stores, path: string) => {
+      const entry = await entryAt(stores, path);
+      if (!entry?.directory) return undefined;
+      return (await entriesIn(stores, path)).map(
+        (entry): Listing => ({ name: nameOf(entry.path), ...entryOf(entry) }),
+      );
+    },
+
+    manifest: async ({ entries }: Stores) =>
+      (await requested<Stored[]>(entries.getAll())).map(
+        (entry): ManifestEntry => ({ path: entry.path, ...entryOf(entry) }),
+      ),
+
+    read: async (
+      stores: Stores,
+      { path, offset, length }: Parameters<FileSystem.ReadAt>[0],
+    ) => {
+      const entry = await entryAt(stores, path);
+      if (!entry || entry.directory) return undefined;
+      return readRange(stores, entry, offset, length);
+    },
+
+    put: async (stores: Stores, path: string, value: Contents | null) => {
+      const existing = await entryAt(stores, path);
+      if (existing?.directory && value === null) return;
+      if (existing) await remove(stores, path);
+      await link(stores, path);
+      if (value === null) {
+        setEntry(stores, { path, size: 0, directory: true, version: token() });
+        return;
+      }
+      const bytes = contents.toBytes(value);
+      const id = token();
+      for (let start = 0; start < bytes.length; start += chunkSize)
+        stores.chunks.put(bytes.slice(start, start + chunkSize), [
+          id,
+          start / chunkSize,
+        ]);
+      setEntry(stores, {
+        path,
+        size: bytes.length,
+        directory: false,
+        version: token(),
+        id,
+      });
+    },
+
+    delete: (stores: Stores, path: string) => remove(stores, path),
+
+    move: async (
+      stores: Stores,
+      { from, to }: Parameters<FileSystem.Move>[0],
+    ) => {
+      const moving = await subtree(stores, from);
+      if (moving.length === 0) return;
+      if (to.startsWith(`${from}/`))
+        throw new Error(`${from} cannot be moved into itself`);
+      await remove(stores, from, true);
+      await remove(stores, to);
+      await link(stores, to);
+      for (const entry of moving) {
+        const path = to + entry.path.slice(from.length);
+        setEntry(stores, { ...entry, path, version: token() });
+      }
+    },
+
+    /** Only the pieces the bytes land in are read and written again. */
+    write: async (
+      stores: Stores,
+      { path, offset, value }: Parameters<FileSystem.WriteAt>[0],
+    ) => {
+      let entry = await entryAt(stores, path);
+      if (entry?.directory) throw new Error(`${path} is a directory`);
+      if (!entry) {
+        await link(stores, path);
+        entry = { path, size: 0, directory: false };
+      }
+      const id = entry.id ?? token();
+      const end = offset + value.length;
+      const first = Math.floor(offset / chunkSize);
+      for (let index = first; index * chunkSize < end; index++) {
+        const start = index * chunkSize;
+        const held = (await chunkAt(stores, id, index)) ?? new Uint8Array();
+        const piece = new Uint8Array(
+          Math.max(held.length, Math.min(end - start, chunkSize)),
+        );
+        piece.set(held);
+        const from = Math.max(offset - start, 0);
+        const to = Math.min(end - start, chunkSize);
+        const at = start - offset;
+        piece.set(value.subarray(at + from, at + to), from);
+        stores.chunks.put(piece, [id, index]);
+      }
+      setEntry(stores, {
+        ...entry,
+        size: Math.max(entry.size, end),
+        version: token(),
+        id,
+      });
+    },
+
+    /** Growing a file stores nothing: what was never written reads as zero. */
+    truncate: async (stores: Stores, path: string, size: number) => {
+      const entry = await entryAt(stores, path);
+      if (!entry || entry.directory) throw new Error(`${path} is not a file`);
+      if (entry.id !== undefined && size < entry.size) {
+        const kept = Math.ceil(size / chunkSize);
+        dropChunks(stores, entry, kept);
+        const cut = size % chunkSize;
+        const last = cut > 0 ? await chunkAt(stores, entry.id, kept - 1) : null;
+        if (last && last.length > cut)
+          stores.chunks.put(last.slice(0, cut), [entry.id, kept - 1]);
+      }
+      setEntry(stores, { ...entry, size, version: token() });
+    },
+  };
+};
+
+type Operation = {
+  writes: boolean;
+  run: (stores: Stores) => Promise<unknown>;
+  resolve: (value: any) => void;
+  reject: (error: unknown) => void;
+};
+
+/**
+ * A filesystem kept in IndexedDB, so a workspace survives the page being
+ * reloaded.
+ *
+ * Calls made together share a transaction: Python blocked on one call at a
+ * time still makes many at once through a listing, and the page often does
+ * too. What each call asked is done in the order it was asked, and a call
+ * that fails leaves nothing of itself behind.
+ */
+export const indexedDBFileSystem = ({
+  name = "python-web-kernel",
+  chunkSize = 1024 * 1024,
+  indexedDB: factory = globalThis.indexedDB,
+  ...creation
+}: IndexedDBFileSystem.Options = {}): IndexedDBFileSystem => {
+  const database = opened(factory, name);
+  const ops = operations(chunkSize);
+  let queue: Operation[] = [];
+
+  /**
+   * Runs a batch in one transaction. A write that fails part way aborts it, so
+   * that none of what it did is kept, and the rest of the batch runs again in
+   * a transaction of its own.
+   */
+  const runBatch = async (batch: Operation[]): Promise<void> => {
+    if (batch.length === 0) return;
+    const results = new Map<Operation, { value?: unknown; error?: unknown }>();
+    let failed: Operation | undefined;
+    try {
+      const db = await database;
+      const writes = batch.some((operation) => operation.writes);
+      const transaction = db.transaction(
+        [...storeNames],
+        writes ? "readwrite" : "readonly",
+      );
+      const done = new Promise<void>((resolve, reject) => {
+        transaction.oncomplete = () => resolve();
+        transaction.onabort = () => reject(transaction.error);
+      });
+      const stores = Object.fromEntries(
+        storeNames.map((store) => [store, transaction.objectStore(store)]),
+      ) as Stores;
+      for (const operation of batch) {
+        const result = await operation.run(stores).then(
+          (value) => ({ value }),
+          (error) => ({ error }),
+        );
+        results.set(operation, result);
+        if (operation.writes && "error" in result) {
+          failed = operation;
+          break;
+        }
+      }
+      if (failed) {
+        try {
+          transaction.abort();
+        } catch {
+          // A request that failed has aborted it already.
+        }
+        await done.catch(() => undefined);
+      } else await done;
+    } catch (error) {
+      for (const operation of batch) operation.reject(error);
+      return;
+    }
+    if (failed) {
+      failed.reject(results.get(failed)!.error);
+      return runBatch(batch.filter((operation) => operation !== failed));
+    }
+    for (const operation of batch) {
+      const { value, error } = results.get(operation)!;
+      if (error === undefined) operation.resolve(value);
+      else operation.reject(error);
+    }
+  };
+
+  const runQueued = () => {
+    const batch = queue;
+    queue = [];
+    return runBatch(batch);
+  };
+
+  /** Queues a call for the transaction that starts once this task is done. */
+  const enqueue =
+    <A extends unknown[], T>(
+      writes: boolean,
+      run: (stores: Stores, ...args: A) => Promise<T>,
+    ) =>
+    (...args: A) =>
+      new Promise<T>((resolve, reject) => {
+        queue.push({
+          writes,
+          run: (stores) => run(stores, ...args),
+          resolve,
+          reject,
+        });
+        if (queue.length === 1) queueMicrotask(runQueued);
+      });
+
+  const fs = readWrite({
+    ...creation,
+    get: enqueue(false, ops.get),
+    stat: enqueue(false, ops.stat),
+    listDirectory: enqueue(false, ops.listDirectory),
+    listDirectoryWithStats: enqueue(false, ops.listDirectoryWithStats),
+    manifest: enqueue(false, ops.manifest),
+    read: enqueue(false, ops.read),
+    put: enqueue(true, ops.put),
+    delete: enqueue(true, ops.delete),
+    move: enqueue(true, ops.move),
+    write: enqueue(true, ops.write),
+    truncate: enqueue(true, ops.truncate),
+  });
+
+  return {
+    ...fs,
+    close: async () => {
+      await enqueue(false, async () => undefined)();
+      (await database).close();
+    },
+  };
+};
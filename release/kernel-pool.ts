@@ -0,0 +1,199 @@
+import type PythonKernel from "./Kernel";
+import { flatPromise, type FlatPromise } from "./utils";
+
+export namespace KernelPool {
+  export type Options = {
+    /**
+     * How many started kernels are kept waiting to be acquired.
+     * @default 1
+     */
+    min?: number;
+    /**
+     * The most kernels the pool has at once, acquired or not. Acquiring when
+     * all of them are out waits for one to be released.
+     * @default Math.max(min, 4)
+     */
+    max?: number;
+    /**
+     * How many times a kernel is handed out before it is disposed of rather
+     * than reset, since packages and files it loaded stay with it.
+     * @default 10
+     */
+    uses?: number;
+    /** The clock, for tests. */
+    now?: () => number;
+  };
+
+  export type Stats = {
+    /** Handed out by `acquire`. */
+    acquired: number;
+    /** Handed out already started, without waiting. */
+    warmHits: number;
+    /** Disposed of on release, to be replaced by a fresh kernel. */
+    recycled: number;
+    /** Started by the pool, including those still starting. */
+    created: number;
+    /** Time spent in `acquire` altogether, in milliseconds. */
+    waited: number;
+    /** The longest any one `acquire` took, in milliseconds. */
+    longestWait: number;
+    /** Started and waiting to be acquired. */
+    idle: number;
+    /** Still starting. */
+    starting: number;
+    /** Acquired and not yet released. */
+    busy: number;
+    /** Calls to `acquire` waiting on a kernel. */
+    waiting: number;
+  };
+}
+
+/** What the pool needs of a kernel. */
+type Pooled = Pick<PythonKernel, "ready" | "reset" | "dispose">;
+
+export type KernelPool<Kernel extends Pooled = PythonKernel> = {
+  /** A started kernel, as soon as one is free. */
+  acquire(): Promise<Kernel>;
+  /**
+   * Hand a kernel back. It is reset and kept for the next `acquire`, or
+   * disposed of and replaced when asked to `recycle` it, or once it has been
+   * used `uses` times.
+   */
+  release(kernel: Kernel, options?: { recycle?: boolean }): Promise<void>;
+  stats(): KernelPool.Stats;
+  /** Dispose of every kernel, acquired or not; waiting acquires reject. */
+  dispose(): void;
+};
+
+/**
+ * Kernels started ahead of time, so that acquiring one costs nothing more than
+ * a reset. Whenever fewer than `min` are waiting, more are started in the
+ * background.
+ */
+export const pool = <Kernel extends Pooled>(
+  create: () => Kernel,
+  {
+    min = 1,
+    max = Math.max(min, 4),
+    uses = 10,
+    now = () => performance.now(),
+  }: KernelPool.Options = {},
+): KernelPool<Kernel> => {
+  if (min < 0 || max < 1 || min > max)
+    throw new RangeError(`A pool of ${min} to ${max} kernels cannot be kept`);
+
+  const idle: Kernel[] = [];
+  const busy = new Set<Kernel>();
+  const used = new Map<Kernel, number>();
+  const waiters: FlatPromise<Kernel>[] = [];
+  let starting = 0;
+  let disposed = false;
+
+  const stats = {
+    acquired: 0,
+    warmHits: 0,
+    recycled: 0,
+    created: 0,
+    waited: 0,
+    longestWait: 0,
+  };
+
+  const total = () => idle.length + starting + busy.size;
+
+  /** A kernel ready for use goes to whoever has waited longest, if anyone. */
+  const offer = (kernel: Kernel) => {
+    if (disposed) return kernel.dispose();
+    const waiter = waiters.shift();
+    if (!waiter) return void idle.push(kernel);
+    busy.add(kernel);
+    waiter.resolve(kernel);
+  };
+
+  const start = async () => {
+    starting++;
+    stats.created++;
+    const kernel = create();
+    used.set(kernel, 0);
+    try {
+      await kernel.ready;
+    } catch (error) {
+      used.delete(kernel);
+      kernel.dispose();
+      return waiters.shift()?.reject(error);
+    } finally {
+      starting--;
+    }
+    offer(kernel);
+  };
+
+  /** Enough starting for everyone waiting, and `min` left over. */
+  const refill = () => {
+    const wanted = () => waiters.length + min - idle.length;
+    while (!disposed && starting < wanted() && total() < max) void start();
+  };
+
+  const retire = (kernel: Kernel) => {
+    used.delete(kernel);
+    kernel.dispose();
+    stats.recycled++;
+  };
+
+  refill();
+
+  return {
+    async acquire() {
+      if (disposed) throw new Error("The kernel pool has been disposed of");
+      const began = now();
+      let kernel = idle.shift();
+      if (kernel) {
+        busy.add(kernel);
+        stats.warmHits++;
+      } else {
+        const waiter = flatPromise<Kernel>();
+        waiters.push(waiter);
+        refill();
+        kernel = await waiter.promise;
+      }
+      refill();
+      const waited = now() - began;
+      stats.acquired++;
+      stats.waited += waited;
+      stats.longestWait = Math.max(stats.longestWait, waited);
+      return kernel;
+    },
+    async release(kernel, { recycle = false } = {}) {
+      if (disposed) return;
+      if (!busy.has(kernel))
+        throw new Error("Only a kernel acquired from the pool can be released");
+      const times = used.get(kernel)! + 1;
+      used.set(kernel, times);
+      const kept =
+        !recycle &&
+        times < uses &&
+        (await kernel.reset().then(
+          () => true,
+          () => false,
+        ));
+      busy.delete(kernel);
+      if (kept) return offer(kernel);
+      retire(kernel);
+      refill();
+    },
+    stats: () => ({
+      ...stats,
+      idle: idle.length,
+      starting,
+      busy: busy.size,
+      waiting: waiters.length,
+    }),
+    dispose() {
+      disposed = true;
+      for (const kernel of [...idle, ...busy]) kernel.dispose();
+      idle.length = 0;
+      busy.clear();
+      used.clear();
+      for (const waiter of waiters.splice(0))
+        waiter.reject(new Error("The kernel pool has been disposed of"));
+    },
+  };
+};
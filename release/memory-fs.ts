@@ -0,0 +1,280 @@
+import { contents, type Contents } from "./contents";
+import { readWrite, type FileSystem, type HostFileSystem } from "./fs";
+import type {
+  Entry,
+  Listing,
+  ManifestEntry,
+} from "./worker/emscripten-fs";
+
+type FileNode = {
+  directory: false;
+  contents: Contents;
+  /** Measured once when the contents are set, as text has to be encoded. */
+  size: number;
+  version: number;
+};
+
+type DirectoryNode = {
+  directory: true;
+  children: Map<string, Node>;
+  version: number;
+};
+
+type Node = FileNode | DirectoryNode;
+
+/** Paths are relative to the root; `a//b/`, `/a/b` and `a/./b` are `a/b`. */
+const segmentsOf = (path: string) =>
+  path.split("/").filter((segment) => segment !== "" && segment !== ".");
+
+const entryOf = (node: Node): Entry => ({
+  size: node.directory ? 0 : node.size,
+  directory: node.directory,
+  version: String(node.version),
+});
+
+/**
+ * Files kept in the page, as a tree: finding a path costs one step per
+ * directory in it, however many files there are, and moving a directory moves
+ * one node rather than every path under it.
+ *
+ * It reads like a `Map` of paths to contents, with directories implied by the
+ * files under them, so tests can set up and inspect a workspace directly.
+ */
+export class MemoryFiles {
+  private readonly root: DirectoryNode;
+  /** Counts every change, so no two versions of anything share a token. */
+  private clock = 0;
+  private totalBytes = 0;
+  private fileCount = 0;
+
+  constructor(initial: Iterable<[string, Contents]> = []) {
+    this.root = { directory: true, children: new Map(), version: 0 };
+    for (const [path, value] of initial) this.set(path, value);
+  }
+
+  /** Total bytes held across every file. */
+  get bytes() {
+    return this.totalBytes;
+  }
+
+  /** The number of files, not counting directories. */
+  get size() {
+    return this.fileCount;
+  }
+
+  private find(path: string): Node | undefined {
+    let node: Node | undefined = this.root;
+    for (const segment of segmentsOf(path)) {
+      if (!node.directory) return undefined;
+      node = node.children.get(segment);
+      if (!node) return undefined;
+    }
+    return node;
+  }
+
+  /** The directory at a path, made along with any missing above it. */
+  private directoryAt(segments: string[]) {
+    let node = this.root;
+    for (const segment of segments) {
+      let child = node.children.get(segment);
+      if (!child) {
+        child = { directory: true, children: new Map(), version: 0 };
+        child.version = ++this.clock;
+        node.children.set(segment, child);
+      }
+      if (!child.directory)
+        throw new Error(`${segments.join("/")} is under a file`);
+      node = child;
+    }
+    return node;
+  }
+
+  /** Where a path would go: its directory, made if missing, and its name. */
+  private placeOf(path: string) {
+    const segments = segmentsOf(path);
+    const name = segments.pop();
+    if (name === undefined) throw new Error("The root cannot be replaced");
+    return { parent: this.directoryAt(segments), name };
+  }
+
+  /** A path's directory and name, and what is there if anything. */
+  private locate(path: string) {
+    const segments = segmentsOf(path);
+    const name = segments.pop();
+    if (name === undefined) return undefined;
+    const parent = this.find(segments.join("/"));
+    if (!parent?.directory) return undefined;
+    return { parent, name, node: parent.children.get(name) };
+  }
+
+  private account(node: Node | undefined, sign: 1 | -1) {
+    if (!node) return;
+    if (node.directory)
+      for (const child of node.children.values()) this.account(child, sign);
+    else {
+      this.totalBytes += sign * node.size;
+      this.fileCount += sign;
+    }
+  }
+
+  /** The contents of a file, or `undefined` for a directory or nothing. */
+  get(path: string): Contents | undefined {
+    const node = this.find(path);
+    return node && !node.directory ? node.contents : undefined;
+  }
+
+  has(path: string) {
+    return this.find(path) !== undefined;
+  }
+
+  isDirectory(path: string) {
+    return this.find(path)?.directory === true;
+  }
+
+  /** Creates or replaces a file, along with the directories above it. */
+  set(path: string, value: Contents) {
+    const { parent, name } = this.placeOf(path);
+    this.account(parent.children.get(name), -1);
+    const node: FileNode = {
+      directory: false,
+      contents: value,
+      size: contents.byteLength(value),
+      version: ++this.clock,
+    };
+    parent.children.set(name, node);
+    this.account(node, 1);
+    return this;
+  }
+
+  /** Creates a directory, and any above it, unless it is already there. */
+  mkdir(path: string) {
+    this.directoryAt(segmentsOf(path));
+    return this;
+  }
+
+  /** Removes a file, or a directory and everything under it. */
+  delete(path: string) {
+    const found = this.locate(path);
+    if (!found?.node) return false;
+    this.account(found.node, -1);
+    return found.parent.children.delete(found.name);
+  }
+
+  /** Moves a file or a whole directory, replacing whatever was at `to`. */
+  move(from: string, to: string) {
+    const found = this.locate(from);
+    if (!found?.node) return false;
+    const [source, target] = [segmentsOf(from), segmentsOf(to)];
+    const onto = source.every((segment, index) => target[index] === segment);
+    if (onto && target.length > source.length)
+      throw new Error(`${from} cannot be moved into itself`);
+    if (onto) return true;
+    const { node } = found;
+    // Throws when `to` lies under a file, which must leave `from` in place.
+    const destination = this.placeOf(to);
+    found.parent.children.delete(found.name);
+    this.account(destination.parent.children.get(destination.name), -1);
+    destination.parent.children.set(destination.name, node);
+    node.version = ++this.clock;
+    return true;
+  }
+
+  stat(path: string): Entry | undefined {
+    const node = this.find(path);
+    return node && entryOf(node);
+  }
+
+  /** The names in a directory, or `undefined` if it is not one. */
+  list(path: string): string[] | undefined {
+    const node = this.find(path);
+    return node?.directory ? [...node.children.keys()] : undefined;
+  }
+
+  listWithStats(path: string): Listing[] | undefined {
+    const node = this.find(path);
+    if (!node?.directory) return undefined;
+    return [...node.children].map(([name, child]) => ({
+      name,
+      ...entryOf(child),
+    }));
+  }
+
+  /** Every path, directories included, described at once. */
+  manifest(): ManifestEntry[] {
+    const entries: ManifestEntry[] = [];
+    const visit = (directory: DirectoryNode, prefix: string) => {
+      for (const [name, child] of directory.children) {
+        const path = prefix + name;
+        entries.push({ path, ...entryOf(child) });
+        if (child.directory) visit(child, `${path}/`);
+      }
+    };
+    visit(this.root, "");
+    return entries;
+  }
+
+  /** Every file and its contents. */
+  *entries(): IterableIterator<[string, Contents]> {
+    const stack: [DirectoryNode, string][] = [[this.root, ""]];
+    while (stack.length > 0) {
+      const [directory, prefix] = stack.pop()!;
+      for (const [name, child] of directory.children)
+        if (child.directory) stack.push([child, `${prefix}${name}/`]);
+        else yield [prefix + name, child.contents];
+    }
+  }
+
+  keys() {
+    return [...this.entries()].map(([path]) => path).values();
+  }
+
+  [Symbol.iterator]() {
+    return this.entries();
+  }
+}
+
+export type MemoryFileSystem = HostFileSystem & {
+  root: string;
+  subscribe?: FileSystem.Subscribe;
+  /** The files themselves, for the page to read and change directly. */
+  files: MemoryFiles;
+};
+
+/**
+ * A filesystem kept entirely in the page, answering every question without
+ * waiting — including `stat`, listings and a manifest, so Python never has to
+ * ask about one path at a time.
+ */
+export const memory = (
+  options: FileSystem.CreationOptions & {
+    /** The files to start with, or a set of files to share. */
+    files?: MemoryFiles | Record<string, Contents>;
+  } = {},
+): MemoryFileSystem => {
+  const { files: initial = {}, ...creation } = options;
+  const files =
+    initial instanceof MemoryFiles
+      ? initial
+      : new MemoryFiles(Object.entries(initial));
+  const fs = readWrite({
+    ...creation,
+    get: (path) =>
+      files.get(path) ??
+      (files.isDirectory(path) ? { directory: true } : undefined),
+    listDirectory: (path) => files.list(path),
+    stat: (path) => files.stat(path),
+    listDirectoryWithStats: (path) => files.listWithStats(path),
+    manifest: () => files.manifest(),
+    put: (path, value) => {
+      if (value === null) files.mkdir(path);
+      else files.set(path, value);
+    },
+    move: ({ from, to }) => {
+      files.move(from, to);
+    },
+    delete: (path) => {
+      files.delete(path);
+    },
+  });
+  return { ...fs, files };
+};
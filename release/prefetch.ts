@@ -0,0 +1,89 @@
+const lockfileName = "pyodide-lock.json";
+
+/** The files Pyodide fetches whenever it starts, relative to its index. */
+export const runtimeFiles = [
+  "pyodide.asm.js",
+  "pyodide.asm.wasm",
+  "python_stdlib.zip",
+  lockfileName,
+];
+
+export type Lockfile = {
+  packages: Record<
+    string,
+    {
+      file_name: string;
+      depends?: string[];
+      imports?: string[];
+      sha256?: string;
+    }
+  >;
+};
+
+/** A relative index is taken from where this code runs. */
+export const absolute = (indexURL: string) =>
+  new URL(
+    indexURL.endsWith("/") ? indexURL : `${indexURL}/`,
+    globalThis.location?.href,
+  );
+
+/**
+ * Reads the files through, so that they are in the HTTP cache by the time
+ * whoever needs them asks, and so fetched alongside whatever else is under way
+ * rather than after it. A file that fails is left for that caller to fail on.
+ */
+export const prefetch = (urls: string[]) =>
+  Promise.all(
+    urls.map((url) =>
+      fetch(url)
+        .then((response) => response.arrayBuffer())
+        .catch(() => undefined),
+    ),
+  );
+
+/** Pyodide's lock file, which describes every package it can load. */
+export const lockfileOf = async (
+  indexURL: string,
+  request: typeof fetch = fetch,
+): Promise<Lockfile> => {
+  const response = await request(new URL(lockfileName, absolute(indexURL)));
+  if (!response.ok) throw new Error(`${response.status} fetching lock file`);
+  return response.json();
+};
+
+/**
+ * Where the files for the packages, and everything they depend on, are
+ * served, as Pyodide's lock file says. None if it cannot be read.
+ */
+export const packageURLs = async (
+  indexURL: string,
+  names: string[],
+  read: Promise<Lockfile | undefined> = lockfileOf(indexURL).catch(
+    () => undefined,
+  ),
+) => {
+  const index = absolute(indexURL);
+  const lockfile = await read;
+  if (!lockfile) return [];
+  const needed = new Set<string>();
+  const visit = (name: string) => {
+    const key = name.toLowerCase();
+    if (needed.has(key) || !(key in lockfile.packages)) return;
+    needed.add(key);
+    for (const dependency of lockfile.packages[key].depends ?? [])
+      visit(dependency);
+  };
+  for (const name of names) visit(name);
+  return [...needed].map(
+    (key) => new URL(lockfile.packages[key].file_name, index).href,
+  );
+};
+
+/**
+ * Fetches Pyodide's own files. Packages are left to the worker, whose copies
+ * reach the package cache.
+ */
+export const prefetchRuntime = (indexURL: string) => {
+  const index = absolute(indexURL);
+  return prefetch(runtimeFiles.map((file) => new URL(file, index).href));
+};
@@ -1,15 +1,33 @@
 import type { Kernel } from "../worker/kernel-worker";
-import { EMFS } from "../worker/emscripten-fs";
+import {
+  DIR_MODE,
+  EMFS,
+  type Caching,
+  type CacheStats,
+  type SyncFileSystem,
+} from "../worker/emscripten-fs";
+import { OPFS } from "../worker/opfs-fs";
 import {
   patchMatplotlib,
+  importMatplotlib,
+  emitMatplotlib,
   unloadLocalModules,
   asImage,
-  tryResolveProblematicDependencies,
-  loadMsgFilterAndCollectPackages,
   tryLoadImportsOfLocallyImportedModules,
-  addToSysPath,
+  importIndex,
+  localModules,
+  sysPathAdder,
+  processState,
 } from "./modules";
+import { snapshots, snapshotPackages } from "./snapshot";
+import {
+  lockfileOf,
+  packageURLs,
+  prefetch,
+  type Lockfile,
+} from "../prefetch";
 import { loadPyodide, version, type PyodideAPI } from "pyodide";
+import type { PyProxy } from "pyodide/ffi";
 import { make, type Output } from "../output";
 import { dirname } from "../utils";
 
@@ -113,80 +131,335 @@ export class PyodideInstance {
   readonly globalThisId: string;
   readonly interruptBuffer: Uint8Array<ArrayBufferLike>;
   readonly indexURL: string;
+  readonly reportsChanges: boolean;
+  /** Whether Python is restored from a snapshot rather than started afresh. */
+  readonly snapshot: boolean;
+  /** Packages loaded while starting, fetched while Python itself is. */
+  readonly preload: string[];
+  /** Filesystems to mount beside the main one. */
+  readonly mounts: { root: string; fs: SyncFileSystem; caching?: Caching }[];
 
   proxiedGlobalThis: undefined | any;
 
   pyodide?: PyodideAPI;
   root?: string;
+  fs?: EMFS;
+  opfs?: OPFS;
+  /** The mounts' own filesystems, once mounted, by their roots. */
+  readonly mounted = new Map<string, EMFS>();
+  /** How long each phase of starting took, in milliseconds. */
+  readonly timings: Record<string, number> = {};
+  /** What `__main__` held once started, which a reset leaves in place. */
+  private pristine = new Set<string>();
+  /**
+   * Puts the working directory, `sys.path`, `sys.argv` and `os.environ` back as
+   * they were once started.
+   */
+  private restoreProcess?: PyProxy;
+  /** Read the first time a run imports anything, and kept. */
+  private lockfile?: Promise<Lockfile | undefined>;
+  /** What the local modules import, kept between runs. */
+  private imports?: PyProxy;
+  /** The local modules runs imported, and what imported each. */
+  private localModules?: PyProxy;
+  /** Defined once Python has started, and called before every run. */
+  private addToSysPath?: PyProxy;
+  /** The run last loaded, until a file may have changed. */
+  private loaded?: string;
 
   constructor(options: {
     globalThisId: string;
     interruptBuffer: Uint8Array<ArrayBufferLike>;
     indexURL?: string;
+    reportsChanges?: boolean;
+    snapshot?: boolean;
+    preload?: string[];
+    mounts?: PyodideInstance["mounts"];
   }) {
     this.globalThisId = options.globalThisId;
     this.interruptBuffer = options.interruptBuffer;
     this.indexURL = options.indexURL ?? defaultIndexURL;
+    this.reportsChanges = options.reportsChanges ?? false;
+    this.snapshot = options.snapshot ?? false;
+    this.preload = options.preload ?? [];
+    this.mounts = options.mounts ?? [];
   }
 
-  async init(manager: Kernel, root: string): Promise<any> {
+  async init(manager: Kernel, root: string, opfs?: string): Promise<any> {
     this.root = root;
     this.proxiedGlobalThis = this.proxyGlobalThis(manager, this.globalThisId);
 
-    this.pyodide = await loadPyodide({
-      indexURL: this.indexURL,
-      fullStdLib: false,
-    });
+    this.lockfile ??= lockfileOf(this.indexURL).catch(() => undefined);
+    const fetching =
+      this.preload.length > 0
+        ? packageURLs(this.indexURL, this.preload, this.lockfile).then(prefetch)
+        : undefined;
+
+    this.pyodide = await this.timed("pyodide", () =>
+      this.snapshot ? this.restoreOrStart() : this.start(),
+    );
+    const pyodide = this.pyodide;
 
     const { stdin, stdout, stderr } = io(manager);
 
-    this.pyodide.setStdin(stdin);
-    this.pyodide.setStdout(stdout);
-    this.pyodide.setStderr(stderr);
+    pyodide.setStdin(stdin);
+    pyodide.setStdout(stdout);
+    pyodide.setStderr(stderr);
 
-    await this.tryPatchMatplotlib(manager);
+    emitMatplotlib(pyodide, (payload) =>
+      manager.output(make("display_data", "image", payload)),
+    );
 
-    this.pyodide.setInterruptBuffer(this.interruptBuffer);
+    if (fetching)
+      await this.timed("preload", async () => {
+        await fetching;
+        await this.tryPreload(pyodide);
+      });
+
+    pyodide.setInterruptBuffer(this.interruptBuffer);
+
+    await this.timed("mount", async () => {
+      try {
+        pyodide.FS.mkdirTree(root);
+      } catch (e) {
+        console.error("Error creating mount directory in FS", e, root);
+      }
+
+      if (opfs) {
+        this.opfs = await OPFS.named(pyodide, opfs);
+        pyodide.FS.mount(this.opfs, {}, root);
+      } else {
+        this.fs = new EMFS(pyodide, manager.syncFs);
+        pyodide.FS.mount(this.fs, {}, root);
+      }
+      for (const { root: at, fs, caching } of this.mounts) {
+        const mount = new EMFS(pyodide, fs, false, caching);
+        this.mountPoint(at);
+        pyodide.FS.mount(mount, {}, at);
+        this.mounted.set(at, mount);
+      }
+    });
+    this.pyodide.registerJsModule("js", this.proxiedGlobalThis);
+    this.addToSysPath = sysPathAdder(this.pyodide);
+    this.imports = importIndex(this.pyodide, root);
+    this.localModules = localModules(this.pyodide, root, this.imports);
+    this.pristine = new Set(this.globalNames());
+    this.restoreProcess = processState(this.pyodide);
+  }
 
+  /**
+   * Makes the directories a mount is mounted on. Those missing under another
+   * mount are made in the worker alone, so that mounting writes nothing to the
+   * host; they are not listed in their parent.
+   */
+  private mountPoint(at: string) {
+    const { FS } = this.pyodide!;
+    const mounts = [this.fs, ...this.mounted.values()];
+    let path = "";
+    for (const name of at.split("/").filter(Boolean)) {
+      const parent = FS.lookupPath(path || "/", {}).node;
+      path += `/${name}`;
+      try {
+        FS.lookupPath(path, {});
+      } catch {
+        const { type } = (parent as FS.FSNode & { mount: FS.Mount }).mount;
+        const mount = mounts.find((mount) => mount && mount === type);
+        if (mount) mount.methods.createNode(parent, name, DIR_MODE);
+        else FS.mkdir(path);
+      }
+    }
+  }
+
+  private globalNames() {
+    const names = this.pyodide!.runPython("list(globals())");
     try {
-      this.pyodide.FS.mkdirTree(root);
-    } catch (e) {
-      console.error("Error creating mount directory in FS", e, root);
+      return names.toJs() as string[];
+    } finally {
+      names.destroy();
     }
+  }
 
-    this.pyodide.FS.mount(new EMFS(this.pyodide, manager.syncFs), {}, root);
-    this.pyodide.registerJsModule("js", this.proxiedGlobalThis);
+  /**
+   * Back to how the kernel started, as far as the next run can tell: names
+   * earlier runs defined are gone, the working directory, `sys.path`,
+   * `sys.argv` and `os.environ` are as they were, local modules will be
+   * imported afresh and the files will be asked for again. Packages stay
+   * loaded.
+   */
+  async reset() {
+    if (!this.pyodide)
+      return console.warn("Worker has not yet been initialized");
+    for (const name of this.globalNames())
+      if (!this.pristine.has(name)) this.pyodide.globals.delete(name);
+    this.restoreProcess!();
+    this.changed();
+    this.unloadLocalModules(true);
+  }
+
+  private async timed<T>(phase: string, work: () => Promise<T>) {
+    const began = performance.now();
+    try {
+      return await work();
+    } finally {
+      this.timings[phase] = performance.now() - began;
+    }
+  }
+
+  /** A package that fails to load now is tried again when a run imports it. */
+  private async tryPreload(pyodide: PyodideAPI) {
+    try {
+      await pyodide.loadPackage(this.preload, { messageCallback: () => {} });
+    } catch (error) {
+      console.warn("Could not preload packages", this.preload, error);
+    }
+  }
+
+  private async start(options: { makeSnapshot?: boolean } = {}) {
+    const pyodide = await loadPyodide({
+      indexURL: this.indexURL,
+      fullStdLib: false,
+      _makeSnapshot: options.makeSnapshot,
+    });
+    patchMatplotlib(pyodide);
+    return pyodide;
   }
 
   /**
    * Plotting is an extra: a kernel whose page cannot fetch matplotlib still has
    * to finish starting, or every later call would wait on it forever.
    */
-  private async tryPatchMatplotlib(manager: Kernel) {
+  private async tryImportMatplotlib(pyodide: PyodideAPI) {
     try {
-      await patchMatplotlib(this.pyodide!, (payload) =>
-        manager.output(make("display_data", "image", payload)),
-      );
+      await importMatplotlib(pyodide);
+      return true;
     } catch (error) {
       console.warn("Matplotlib is unavailable in this kernel", error);
+      return false;
     }
   }
 
-  async unloadLocalModules() {
-    console.log(
-      "Unloaded modules:",
-      await unloadLocalModules(this.pyodide!, this.root!),
-    );
+  /**
+   * Restores the interpreter from a snapshot, or starts it and takes one for
+   * next time, with matplotlib imported so that it is in the snapshot. The
+   * snapshot holds memory, not files, so the packages in it are installed
+   * again — without being imported again, which is what costs.
+   */
+  private async restoreOrStart() {
+    const key = await snapshots.key(this.indexURL);
+    const saved = await snapshots.load(key);
+    if (saved)
+      try {
+        const pyodide = await loadPyodide({
+          indexURL: this.indexURL,
+          fullStdLib: false,
+          _loadSnapshot: saved,
+        });
+        await pyodide.loadPackage(snapshotPackages, {
+          messageCallback: () => {},
+        });
+        return pyodide;
+      } catch (error) {
+        console.warn("Could not restore the interpreter snapshot", error);
+        await snapshots.forget(key);
+      }
+    const pyodide = await this.start({ makeSnapshot: true });
+    if (await this.tryImportMatplotlib(pyodide))
+      try {
+        await snapshots.save(key, pyodide.makeMemorySnapshot());
+      } catch (error) {
+        console.warn("Could not snapshot the interpreter", error);
+      }
+    return pyodide;
+  }
+
+  /**
+   * The host changed files under the root, or under a mount's when it names
+   * one. Messages are handled between runs or while one awaits, never part way
+   * through a filesystem call.
+   */
+  changed(paths?: string[], root?: string) {
+    this.loaded = undefined;
+    if (root !== undefined) return this.mounted.get(root)?.invalidate(paths);
+    this.fs?.invalidate(paths);
+    this.opfs?.changed(paths);
+    this.imports?.invalidate(paths);
+    if (paths === undefined)
+      for (const mount of this.mounted.values()) mount.invalidate();
+  }
+
+  /**
+   * What earlier runs made, changed or removed under the root, which nobody
+   * reports: the local modules among it, and any directory, which may hold
+   * them, have to be looked at again.
+   */
+  private changedByRuns() {
+    const changes = this.fs?.takeChanges() ?? [];
+    for (const [at, mount] of this.mounted) {
+      const taken = mount.takeChanges();
+      if (!at.startsWith(`${this.root}/`)) continue;
+      const within = at.slice(this.root!.length + 1);
+      for (const [path, directory] of taken)
+        changes.push([path ? `${within}/${path}` : within, directory]);
+    }
+    const paths = changes
+      .filter(([path, directory]) => directory || path.endsWith(".py"))
+      .map(([path]) => path);
+    if (paths.length === 0) return;
+    this.loaded = undefined;
+    this.imports?.invalidate(paths);
+  }
+
+  /** How each mount's cache has fared so far, by the mount's root. */
+  mountStats() {
+    const stats: Record<string, CacheStats> = {};
+    if (this.fs) stats[this.root!] = this.fs.stats();
+    for (const [root, mount] of this.mounted) stats[root] = mount.stats();
+    return stats;
+  }
+
+  /** Carries out what the last run did to the tree of an OPFS mount. */
+  async persist() {
+    await this.opfs?.persist();
+  }
+
+  /**
+   * Carries out what the last run did to the tree of an OPFS mount and closes
+   * its files, leaving them to the instance that replaces this one.
+   */
+  async close() {
+    await this.opfs?.close();
+  }
+
+  /**
+   * Has the next run import afresh the local modules that changed since they
+   * were imported, and those that depend on them, or every local module.
+   * Returns the names of those it dropped.
+   */
+  unloadLocalModules(everything = false) {
+    const unloaded = unloadLocalModules(this.localModules!, everything);
+    if (unloaded.length > 0) console.log("Unloaded modules:", unloaded);
+    return unloaded;
   }
 
-  async addAncestryToSysPath(path: string, recursive = true) {
+  /**
+   * The directories from the one holding `path` up to the root, in the order
+   * they are added to `sys.path`, which leaves the root searched first. Only
+   * the nearest, unless `recursive`.
+   */
+  private ancestry(path: string, recursive = true) {
+    const dirs: string[] = [];
     let dir = dirname(path);
     while (dir !== this.root) {
-      await addToSysPath(this.pyodide!, dir);
-      if (!recursive) return;
+      dirs.push(dir);
+      if (!recursive) return dirs;
       dir = dirname(dir);
     }
-    await addToSysPath(this.pyodide!, this.root!);
+    dirs.push(this.root!);
+    return dirs;
+  }
+
+  addAncestryToSysPath(path: string, recursive = true) {
+    this.addToSysPath!(this.ancestry(path, recursive));
   }
 
   /**
@@ -207,20 +480,39 @@ export class PyodideInstance {
     if (!this.pyodide)
       return console.warn("Worker has not yet been initialized");
 
-    await this.whileUninterruptible(async () => {
-      const { loadedPackages, messageCallback } =
-        loadMsgFilterAndCollectPackages();
-      await this.pyodide!.loadPackagesFromImports(code, { messageCallback });
-      await tryResolveProblematicDependencies(this.pyodide!, loadedPackages);
-      const { discoveredDirs } = await tryLoadImportsOfLocallyImportedModules(
-        this.pyodide!,
-        code,
-        filename,
+    // Unless it says otherwise, the host may have changed any of its files
+    // since the last run.
+    if (!this.reportsChanges) this.changed();
+    this.changedByRuns();
+
+    await this.opfs?.prepare();
+
+    // Nothing it or the modules it imports could need has changed since.
+    const run = JSON.stringify([filename, code]);
+    if (run === this.loaded) return;
+
+    this.lockfile ??= lockfileOf(this.indexURL).catch(() => undefined);
+    const lockfile = await this.lockfile;
+    const index = this.imports!;
+
+    const loaded = await this.whileUninterruptible(async () => {
+      const { discoveredDirs, loaded } =
+        await tryLoadImportsOfLocallyImportedModules(
+          this.pyodide!,
+          index,
+          lockfile,
+          code,
+          filename,
+        );
+      this.addToSysPath!(
+        [...discoveredDirs, filename].flatMap((path) =>
+          this.ancestry(path, false),
+        ),
       );
-      for (const dir of discoveredDirs)
-        await this.addAncestryToSysPath(dir, false);
-      await this.addAncestryToSysPath(filename, false);
+      return loaded;
     });
+    // A package that failed to load is tried again by the next run.
+    if (loaded) this.loaded = run;
   }
 
   async run(
@@ -230,7 +522,7 @@ export class PyodideInstance {
     if (!this.pyodide)
       return console.warn("Worker has not yet been initialized");
 
-    await this.addAncestryToSysPath(filename);
+    this.addAncestryToSysPath(filename);
 
     let result = await this.pyodide
       .runPythonAsync(code, { filename })
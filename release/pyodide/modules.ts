@@ -1,6 +1,8 @@
 import type { PyodideAPI } from "pyodide";
+import type { PyProxy } from "pyodide/ffi";
 import { code } from "./python";
-import supported from "./supported-packages";
+import type { Lockfile } from "../prefetch";
+import { resolvePackages } from "./packages";
 
 const Key = {
   MatplotLibEmit: "__python_web_kernel_emit_matplotlib",
@@ -27,24 +29,46 @@ export const asImage = (payload: any) => {
   return image;
 };
 
-export const patchMatplotlib = async (
+/**
+ * Names `__main__` has offered since matplotlib was loaded at start-up, which
+ * scripts use without importing, by the module and attribute each stands for.
+ */
+const mainNames: Record<string, string[]> = {
+  plt: ["matplotlib.pyplot"],
+  FuncAnimation: ["matplotlib.animation", "FuncAnimation"],
+};
+
+/**
+ * Patches matplotlib the first time it is imported, rather than loading it at
+ * start-up for runs that never plot. `plt` and `FuncAnimation` import it the
+ * first time a run uses them.
+ */
+export const patchMatplotlib = (pyodide: PyodideAPI) => {
+  pyodide.runPython(code.patchMatplotlib);
+  resident(pyodide, code.lazyNames(mainNames));
+};
+
+/** The packages behind the names in `__main__` that the source mentions. */
+const mainNameImports = (source: string) =>
+  Object.entries(mainNames)
+    .filter(([name]) => new RegExp(`\\b${name}\\b`).test(source))
+    .map(([, [module]]) => module.split(".")[0]);
+
+/** Loads and imports matplotlib now, which patches it. */
+export const importMatplotlib = async (pyodide: PyodideAPI) => {
+  await pyodide.loadPackage("matplotlib");
+  pyodide.pyimport("matplotlib.pyplot").destroy();
+};
+
+/** Sends the figures the patched matplotlib shows to `onImage`. */
+export const emitMatplotlib = (
   pyodide: PyodideAPI,
   onImage: (payload: ImagePayload) => void,
-) => {
+) =>
   pyodide.globals.set(Key.MatplotLibEmit, (payload: unknown) => {
     const image = asImage(payload);
     if (image) onImage(image);
   });
-  await pyodide.loadPackage("matplotlib");
-  await pyodide.runPythonAsync(code.patchMatplotlib);
-};
-
-export const unloadLocalModules = async (pyodide: PyodideAPI, root: string) => {
-  const unloaded = await pyodide.runPythonAsync(code.unloadLocalModules(root));
-  const report: string = unloaded.__str__();
-  if (unloaded instanceof pyodide.ffi.PyProxy) unloaded.destroy();
-  return report;
-};
 
 export const loadMsgFilter = (
   callback?: (msg: string) => void,
@@ -77,75 +101,121 @@ export const loadMsgFilter = (
   };
 };
 
-export const loadMsgFilterAndCollectPackages = () => {
-  const loadedPackages = new Set<string>();
-  const loadedPrefix = "Loaded ";
-
-  const messageCallback = loadMsgFilter((msg) =>
-    msg
-      .slice(loadedPrefix.length)
-      .split(",")
-      .map((p) => p.trim())
-      .filter(Boolean)
-      .forEach((p) => loadedPackages.add(p)),
-  );
+/**
+ * Installing packages needs an index to fetch them from. A kernel served
+ * without one still runs code that only needs the standard library.
+ *
+ * `loadPackage` reports a package it could not fetch without rejecting, so
+ * whether each one loaded is read from `loadedPackages` afterwards.
+ */
+const tryLoadPackage = async (pyodide: PyodideAPI, names: string[]) => {
+  try {
+    await pyodide.loadPackage(names, { messageCallback: loadMsgFilter() });
+    return names.every((name) => name in pyodide.loadedPackages);
+  } catch (error) {
+    console.warn(`Could not load the packages ${names.join(", ")}`, error);
+    return false;
+  }
+};
 
-  return { messageCallback, loadedPackages };
+const tryMicropipInstall = async (pyodide: PyodideAPI, names: string[]) => {
+  if (!(await tryLoadPackage(pyodide, ["micropip"]))) return false;
+  try {
+    await pyodide.runPythonAsync(code.micropipInstall(names));
+    return true;
+  } catch (error) {
+    console.warn(`Could not install ${names.join(", ")}`, error);
+    return false;
+  }
 };
 
-export const tryResolveProblematicDependencies = async (
-  pyodide: PyodideAPI,
-  loadedPackages: Set<string>,
-) => {
-  if (loadedPackages.has("networkx"))
-    await pyodide.loadPackage("scipy", {
-      messageCallback: loadMsgFilter(),
-    });
+/**
+ * Runs Python in a namespace of its own, leaving `__main__` as runs expect it,
+ * and hands back the object it ends in, if any.
+ */
+const resident = (pyodide: PyodideAPI, source: string) => {
+  const namespace = pyodide.globals.get("dict")();
+  try {
+    return pyodide.runPython(source, { globals: namespace }) as PyProxy;
+  } finally {
+    namespace.destroy();
+  }
 };
 
-const autoInstallableExternalPackages = new Map<string, string>([
-  ["pycountry_convert", "pycountry_convert"],
-  ["pymannkendall", "pymannkendall"],
-  ["sklearn", "scikit-learn"],
-]);
+/**
+ * What the local modules under `root` import, kept for as long as the
+ * interpreter and told of the host's changes, so that a run only reads again
+ * what may have changed.
+ */
+export const importIndex = (pyodide: PyodideAPI, root: string) =>
+  resident(pyodide, code.importIndex(root));
+
+/**
+ * Takes the working directory, `sys.path`, `sys.argv` and `os.environ` as they
+ * are now, and hands back what puts them back.
+ */
+export const processState = (pyodide: PyodideAPI) =>
+  resident(pyodide, code.captureProcessState);
 
 /**
- * Installing packages needs an index to fetch them from. A kernel served
- * without one still runs code that only needs the standard library.
+ * Tracks the local modules runs import under `root`, and what imported each,
+ * as each is executed, so that only those that changed and whatever
+ * depends on them need be imported afresh.
  */
-const tryLoadPackage = async (pyodide: PyodideAPI, name: string) => {
+export const localModules = (
+  pyodide: PyodideAPI,
+  root: string,
+  index: PyProxy,
+) => {
+  const make = resident(pyodide, code.localModules(root));
   try {
-    await pyodide.loadPackage(name, { messageCallback: loadMsgFilter() });
-    return true;
-  } catch (error) {
-    console.warn(`Could not load the "${name}" package`, error);
-    return false;
+    return make(index) as PyProxy;
+  } finally {
+    make.destroy();
+  }
+};
+
+/** Drops the stale local modules, or all of them, and names those dropped. */
+export const unloadLocalModules = (modules: PyProxy, everything = false) => {
+  const unloaded = modules.unload(everything);
+  try {
+    return unloaded.toJs() as string[];
+  } finally {
+    unloaded.destroy();
   }
 };
 
+/** Puts directories at the front of `sys.path`, all of them in one call. */
+export const sysPathAdder = (pyodide: PyodideAPI) =>
+  resident(pyodide, code.addToSysPath);
+
+/**
+ * Loads what a run needs, including what the local modules it imports need,
+ * all at once: the lock file's packages in one `loadPackage`, which fetches
+ * them in parallel, while micropip fetches what only PyPI has. So the first
+ * run takes as long as its slowest package rather than all of them together.
+ * `loaded` says whether every one of them was.
+ */
 export const tryLoadImportsOfLocallyImportedModules = async (
   pyodide: PyodideAPI,
+  index: PyProxy,
+  lockfile: Lockfile | undefined,
   source: string,
   filename: string,
 ) => {
-  await tryLoadPackage(pyodide, "micropip");
-  const modules = await pyodide.runPythonAsync(
-    code.recursivelyFindExternalImports(source, filename),
-  );
-  const result = modules.toJs() as [string[], string[]];
-  const toInstall = new Set(result[0]);
-  const discoveredDirs = result[1];
-
+  const modules = index.find(source, filename);
+  const [imports, discoveredDirs] = modules.toJs() as [string[], string[]];
   if (modules instanceof pyodide.ffi.PyProxy) modules.destroy();
-  for (const mod of toInstall)
-    if (autoInstallableExternalPackages.has(mod))
-      await pyodide.runPythonAsync(
-        code.micropipInstall(autoInstallableExternalPackages.get(mod)!),
-      );
-    else if (supported.has(mod)) await tryLoadPackage(pyodide, mod);
-  tryResolveProblematicDependencies(pyodide, toInstall);
-  return { toInstall, discoveredDirs };
-};
 
-export const addToSysPath = async (pyodide: PyodideAPI, path: string) =>
-  pyodide.runPythonAsync(code.addToSysPath(path));
+  const { packages, installs } = resolvePackages(
+    lockfile,
+    [...imports, ...mainNameImports(source)],
+    pyodide.loadedPackages,
+  );
+  const results = await Promise.all([
+    packages.length === 0 || tryLoadPackage(pyodide, packages),
+    installs.length === 0 || tryMicropipInstall(pyodide, installs),
+  ]);
+  const loaded = results.every(Boolean);
+  return { toInstall: new Set(imports), discoveredDirs, loaded };
+};
@@ -0,0 +1,60 @@
+import type { Lockfile } from "../prefetch";
+import supported from "./supported-packages";
+
+/** Packages that are needed at runtime without their lock entry saying so. */
+const extraDependencies: Record<string, string[]> = {
+  networkx: ["scipy"],
+};
+
+/** Packages Pyodide does not build, installed from PyPI by the module name. */
+const autoInstallableExternalPackages = new Map<string, string>([
+  ["pycountry_convert", "pycountry_convert"],
+  ["pymannkendall", "pymannkendall"],
+  ["sklearn", "scikit-learn"],
+]);
+
+/**
+ * The packages behind the modules a run imports, and everything they depend
+ * on, worked out before any is loaded so that they can all be loaded at once.
+ * Those already loaded are left out. A module the lock file does not know is
+ * installed with micropip when it is one of the few known to work, and
+ * otherwise left for its import to fail on.
+ *
+ * Without a lock file, a module is taken to be a package of the same name.
+ */
+export const resolvePackages = (
+  lockfile: Lockfile | undefined,
+  modules: Iterable<string>,
+  loaded: Record<string, unknown> = {},
+) => {
+  const byImport = new Map<string, string>();
+  for (const [name, { imports = [] }] of Object.entries(
+    lockfile?.packages ?? {},
+  ))
+    for (const module of imports) byImport.set(module, name);
+
+  const packages = new Set<string>();
+  const visit = (name: string) => {
+    const key = lockfile ? name.toLowerCase() : name;
+    if (packages.has(key) || key in loaded) return;
+    packages.add(key);
+    for (const dependency of lockfile?.packages[key]?.depends ?? [])
+      visit(dependency);
+    for (const dependency of extraDependencies[key] ?? []) visit(dependency);
+  };
+
+  const installs = new Set<string>();
+  for (const module of modules) {
+    const name = lockfile
+      ? byImport.get(module)
+      : supported.has(module)
+        ? module
+        : undefined;
+    if (name) visit(name);
+    else if (autoInstallableExternalPackages.has(module)) {
+      const install = autoInstallableExternalPackages.get(module)!;
+      if (!(install in loaded)) installs.add(install);
+    }
+  }
+  return { packages: [...packages], installs: [...installs] };
+};
@@ -1,15 +1,11 @@
 import sys
-import os
 
-def add_to_sys_path(path: str):
-  if path not in sys.path:
-      sys.path.insert(0, path)
-  else:
-      # Move the existing path to the front
-      sys.path.remove(path)
-      sys.path.insert(0, path)
 
-  init = os.path.join(path, "__init__.py")
-  if not os.path.exists(init):
-    with open(init, "w") as _f:
-        pass
+def add_to_sys_path(paths):
+    """Moves each path to the front of sys.path in turn, so the last is searched
+    first. Directories need no __init__.py to be imported from: without one,
+    a directory is a namespace package."""
+    for path in list(paths):
+        if path in sys.path:
+            sys.path.remove(path)
+        sys.path.insert(0, path)
@@ -6,209 +6,156 @@ module, which imports another local module, which imports pandas, would reach
 that import at runtime with nothing installed. This walks the local modules
 first and reports what they need, along with the directories to put on sys.path.
 
+The index lives as long as the interpreter, so each run only re-reads the
+modules the host or an earlier run may have changed, and only re-parses those
+whose contents did change. The walk for directories holding modules is kept
+until files are said to have changed, except when all that changed were modules
+already known.
+
 Being a walker over local files, it has to be kept working against the Pyodide
 release in use.
 """
 
-import pyodide.code
+import hashlib
 import os
 import sys
 
-try:
-    import micropip
-except ImportError:  # no package index is reachable; only the stdlib is here
-    micropip = None
-
-
-def find_external_imports_of_local_modules(
-    source: str,
-    path: str,
-    root: str = "/home/pyodide",
-    recursive=True,
-):
-    external_imports: set[str] = set()
-    discovered_dirs: set[str] = set()
-    visited: set[str] = set()
-    stdlib = set(sys.stdlib_module_names)
-    installed = {pkg.name for pkg in micropip.list().values()} if micropip else set()
-
-    root = os.path.realpath(root)
-
-    def is_under_root(p: str) -> bool:
-        return os.path.realpath(p).startswith(root)
-
-    base_dir = os.path.dirname(path)
-    if is_under_root(base_dir):
-        discovered_dirs.add(base_dir)
-    discovered_dirs.add(root)
-
-    for dirpath, dirnames, filenames in os.walk(root):
-        if "__pycache__" in dirpath:
-            continue
-        if any(f.endswith(".py") for f in filenames):
-            rp = os.path.realpath(dirpath)
-            if is_under_root(rp):
-                discovered_dirs.add(rp)
-
-    search_paths = list(discovered_dirs)
-
-    def is_installed(name: str) -> bool:
-        return (
-            name in installed
-            or name.replace("_", "-") in installed
-            or name.replace("-", "_") in installed
-        )
-
-    def resolve_local_module(name: str, context_dir: str):
-        parts = name.split(".")
-        dirs_to_check = [context_dir] if is_under_root(context_dir) else []
-        dirs_to_check += [p for p in search_paths if p != context_dir]
-
-        for d in dirs_to_check:
-            result_path, result_dir = _resolve_in_dir(parts, d)
-            if result_path and is_under_root(result_dir):
-                discovered_dirs.add(result_dir)
-                return result_path, result_dir
-
-        return None, None
-
-    def _resolve_in_dir(parts: list[str], d: str):
-        current = d
-        for i, part in enumerate(parts):
-            is_last = i == len(parts) - 1
-            if is_last:
-                candidate = os.path.join(current, part + ".py")
-                if os.path.isfile(candidate):
-                    return candidate, current
-                candidate_pkg = os.path.join(current, part, "__init__.py")
-                if os.path.isfile(candidate_pkg):
-                    return candidate_pkg, os.path.join(current, part)
-            else:
-                next_dir = os.path.join(current, part)
-                if os.path.isdir(next_dir):
-                    current = next_dir
-                else:
-                    return None, None
-        return None, None
-
-    def visit_local_module(module_path: str, module_base_dir: str):
-        if module_path in visited:
-            return
-        visited.add(module_path)
-        if is_under_root(module_base_dir):
-            discovered_dirs.add(module_base_dir)
-        try:
-            with open(module_path) as f:
-                src = f.read()
-        except Exception:
-            return
+import pyodide.code
 
-        for imp in pyodide.code.find_imports(src):
-            top = imp.split(".")[0]
-            next_module_path, next_base_dir = resolve_local_module(imp, module_base_dir)
-            if next_module_path:
-                if recursive:
-                    visit_local_module(next_module_path, next_base_dir)
-                continue
-            if top not in stdlib and not is_installed(top):
-                external_imports.add(top)
-
-    for imp in pyodide.code.find_imports(source):
-        top = imp.split(".")[0]
-        module_path, module_base_dir = resolve_local_module(imp, base_dir)
-        if module_path:
-            visit_local_module(module_path, module_base_dir)
-        else:
-            if top not in stdlib and not is_installed(top):
-                external_imports.add(top)
-
-    return sorted(external_imports), sorted(discovered_dirs)
-    external_imports: set[str] = set()
-    discovered_dirs: set[str] = set()  # NEW: directories containing local modules
-    visited: set[str] = set()
-    stdlib = set(sys.stdlib_module_names)
-    installed = {pkg.name for pkg in micropip.list().values()} if micropip else set()
-
-    base_dir = os.path.dirname(path)
-    discovered_dirs.add(base_dir)
-    discovered_dirs.add(root)
-
-    # Also pre-discover all subdirectories of root that contain .py files
-    for dirpath, dirnames, filenames in os.walk(root):
-        if "__pycache__" in dirpath:
-            continue
-        if any(f.endswith(".py") for f in filenames):
-            discovered_dirs.add(os.path.realpath(dirpath))
-
-    search_paths = list(discovered_dirs)
-
-    def is_installed(name: str) -> bool:
-        return (
-            name in installed
-            or name.replace("_", "-") in installed
-            or name.replace("-", "_") in installed
-        )
-
-    def resolve_local_module(name: str, context_dir: str):
-        parts = name.split(".")
-        dirs_to_check = [context_dir]
-        dirs_to_check += [p for p in search_paths if p != context_dir]
-
-        for d in dirs_to_check:
-            result_path, result_dir = _resolve_in_dir(parts, d)
-            if result_path:
-                discovered_dirs.add(result_dir)
-                return result_path, result_dir
-
-        return None, None
-
-    def _resolve_in_dir(parts: list[str], d: str):
-        current = d
-        for i, part in enumerate(parts):
-            is_last = i == len(parts) - 1
-            if is_last:
-                candidate = os.path.join(current, part + ".py")
-                if os.path.isfile(candidate):
-                    return candidate, current
-                candidate_pkg = os.path.join(current, part, "__init__.py")
-                if os.path.isfile(candidate_pkg):
-                    return candidate_pkg, os.path.join(current, part)
-            else:
-                next_dir = os.path.join(current, part)
-                if os.path.isdir(next_dir):
-                    current = next_dir
-                else:
-                    return None, None
-        return None, None
 
-    def visit_local_module(module_path: str, module_base_dir: str):
-        if module_path in visited:
+class ImportIndex:
+    def __init__(self, root: str):
+        self.root = os.path.realpath(root)
+        self.stdlib = set(sys.stdlib_module_names)
+        # path -> ((size, mtime), sha256 of the contents, imports)
+        self.modules: dict[str, tuple[tuple[int, int], str, tuple[str, ...]]] = {}
+        # modules read since the host last said they might have changed
+        self.fresh: set[str] = set()
+        self.module_dirs: set[str] | None = None
+
+    def invalidate(self, paths: list[str] | None = None):
+        """These paths changed, relative to the root, or any path may have."""
+        if paths is None:
+            self.fresh.clear()
+            self.module_dirs = None
             return
-        visited.add(module_path)
-        discovered_dirs.add(module_base_dir)
+        for path in paths:
+            full = os.path.realpath(os.path.join(self.root, path))
+            self.fresh.discard(full)
+            if full not in self.modules:
+                self.module_dirs = None
+
+    def is_under_root(self, p: str) -> bool:
+        return os.path.realpath(p).startswith(self.root)
+
+    def directories_with_modules(self) -> set[str]:
+        if self.module_dirs is None:
+            self.module_dirs = set()
+            for dirpath, dirnames, filenames in os.walk(self.root):
+                if "__pycache__" in dirpath:
+                    continue
+                if any(f.endswith(".py") for f in filenames):
+                    rp = os.path.realpath(dirpath)
+                    if self.is_under_root(rp):
+                        self.module_dirs.add(rp)
+        return self.module_dirs
+
+    def entry(self, module_path: str):
+        """Read again unless known current; parsed again only if it changed."""
         try:
-            with open(module_path) as f:
-                src = f.read()
+            st = os.stat(module_path)
+            token = (st.st_size, st.st_mtime_ns)
+            known = self.modules.get(module_path)
+            if known and module_path in self.fresh and known[0] == token:
+                return known
+            with open(module_path, "rb") as f:
+                contents = f.read()
         except Exception:
-            return
-
-        for imp in pyodide.code.find_imports(src):
-            top = imp.split(".")[0]
-            next_module_path, next_base_dir = resolve_local_module(imp, module_base_dir)
-            if next_module_path:
-                if recursive:
-                    visit_local_module(next_module_path, next_base_dir)
-                continue
-            if top not in stdlib and not is_installed(top):
-                external_imports.add(top)
-
-    for imp in pyodide.code.find_imports(source):
-        top = imp.split(".")[0]
-        module_path, module_base_dir = resolve_local_module(imp, base_dir)
-        if module_path:
-            visit_local_module(module_path, module_base_dir)
+            self.modules.pop(module_path, None)
+            return None
+        digest = hashlib.sha256(contents).hexdigest()
+        if known and known[1] == digest:
+            imports = known[2]
         else:
-            if top not in stdlib and not is_installed(top):
-                external_imports.add(top)
-
-    return sorted(external_imports), sorted(discovered_dirs)
\ No newline at end of file
+            try:
+                imports = tuple(pyodide.code.find_imports(contents.decode()))
+            except Exception:
+                imports = ()
+        self.modules[module_path] = (token, digest, imports)
+        self.fresh.add(module_path)
+        return self.modules[module_path]
+
+    def digest_of(self, module_path: str) -> str | None:
+        entry = self.entry(module_path)
+        return entry[1] if entry else None
+
+    def imports_of(self, module_path: str) -> tuple[str, ...]:
+        entry = self.entry(module_path)
+        return entry[2] if entry else ()
+
+    def find(self, source: str, path: str, recursive=True):
+        external_imports: set[str] = set()
+        discovered_dirs: set[str] = set()
+        visited: set[str] = set()
+
+        base_dir = os.path.dirname(path)
+        if self.is_under_root(base_dir):
+            discovered_dirs.add(base_dir)
+        discovered_dirs.add(self.root)
+        discovered_dirs |= self.directories_with_modules()
+
+        search_paths = list(discovered_dirs)
+
+        def resolve_local_module(name: str, context_dir: str):
+            parts = name.split(".")
+            dirs_to_check = [context_dir] if self.is_under_root(context_dir) else []
+            dirs_to_check += [p for p in search_paths if p != context_dir]
+
+            for d in dirs_to_check:
+                result_path, result_dir = _resolve_in_dir(parts, d)
+                if result_path and self.is_under_root(result_dir):
+                    discovered_dirs.add(result_dir)
+                    return result_path, result_dir
+
+            return None, None
+
+        def _resolve_in_dir(parts: list[str], d: str):
+            current = d
+            for i, part in enumerate(parts):
+                is_last = i == len(parts) - 1
+                if is_last:
+                    candidate = os.path.join(current, part + ".py")
+                    if os.path.isfile(candidate):
+                        return candidate, current
+                    candidate_pkg = os.path.join(current, part, "__init__.py")
+                    if os.path.isfile(candidate_pkg):
+                        return candidate_pkg, os.path.join(current, part)
+                else:
+                    next_dir = os.path.join(current, part)
+                    if os.path.isdir(next_dir):
+                        current = next_dir
+                    else:
+                        return None, None
+            return None, None
+
+        def visit_imports(imports, context_dir: str, entry_point=False):
+            for imp in imports:
+                top = imp.split(".")[0]
+                module_path, module_base_dir = resolve_local_module(imp, context_dir)
+                if module_path:
+                    if recursive or entry_point:
+                        visit_local_module(module_path, module_base_dir)
+                elif top not in self.stdlib:
+                    external_imports.add(top)
+
+        def visit_local_module(module_path: str, module_base_dir: str):
+            if module_path in visited:
+                return
+            visited.add(module_path)
+            if self.is_under_root(module_base_dir):
+                discovered_dirs.add(module_base_dir)
+            visit_imports(self.imports_of(module_path), module_base_dir)
+
+        visit_imports(pyodide.code.find_imports(source), base_dir, entry_point=True)
+
+        return sorted(external_imports), sorted(discovered_dirs)
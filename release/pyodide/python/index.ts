@@ -4,18 +4,29 @@ import patchMatplotlib from "./patch_matplotlib.py?raw";
 import unloadLocalModules from "./unload_local_modules.py?raw";
 import findImports from "./find_imports.py?raw";
 import addToSysPath from "./add_to_sys_path.py?raw";
+import patchOnImport from "./patch_on_import.py?raw";
+import lazyNames from "./lazy_names.py?raw";
+import processState from "./process_state.py?raw";
+
+const onImport = (name: string, patch: string) => `${patchOnImport}
+patch_on_import(${JSON.stringify(name)}, ${JSON.stringify(patch)})`;
 
 export const code = {
-  patchMatplotlib,
-  unloadLocalModules: (root: string) => `${unloadLocalModules}
-unload_local_modules(local_roots=("${root}",))`,
-  recursivelyFindExternalImports: (
-    source: string,
-    path: string,
-  ) => `${findImports}
-find_external_imports_of_local_modules(source=${JSON.stringify(source)}, path="${path}", recursive=True)`,
-  micropipInstall: (packageName: string) => `import micropip
-await micropip.install("${packageName}")`,
-  addToSysPath: (path: string) => `${addToSysPath}
-add_to_sys_path("${path}")`,
+  /**
+   * Importing any part of matplotlib patches it first, so that nothing is
+   * taken from it before `plt.show` and `FuncAnimation` are replaced.
+   */
+  patchMatplotlib: onImport("matplotlib", patchMatplotlib),
+  lazyNames: (names: Record<string, string[]>) => `${lazyNames}
+lazy_names(${JSON.stringify(names)})`,
+  localModules: (root: string) => `${unloadLocalModules}
+lambda index: LocalModules(index, local_roots=(${JSON.stringify(root)},))`,
+  importIndex: (root: string) => `${findImports}
+ImportIndex(${JSON.stringify(root)})`,
+  micropipInstall: (packageNames: string[]) => `import micropip
+await micropip.install(${JSON.stringify(packageNames)})`,
+  addToSysPath: `${addToSysPath}
+add_to_sys_path`,
+  captureProcessState: `${processState}
+capture_process_state()`,
 };
@@ -0,0 +1,39 @@
+import importlib
+
+import __main__
+
+class _LazyName:
+    """
+    Stands in `__main__` for an object in a module that is not imported yet,
+    and puts the object in its place the first time a run uses it.
+    """
+
+    def __init__(self, name, module, attribute=None):
+        self._name = name
+        self._module = module
+        self._attribute = attribute
+
+    def _resolve(self):
+        value = importlib.import_module(self._module)
+        if self._attribute is not None:
+            value = getattr(value, self._attribute)
+        if vars(__main__).get(self._name) is self:
+            setattr(__main__, self._name, value)
+        return value
+
+    def __getattr__(self, attribute):
+        if attribute in ("_name", "_module", "_attribute"):
+            raise AttributeError(attribute)
+        return getattr(self._resolve(), attribute)
+
+    def __call__(self, *args, **kwargs):
+        return self._resolve()(*args, **kwargs)
+
+    def __repr__(self):
+        return f"<{self._name}, imported from {self._module} when first used>"
+
+def lazy_names(names):
+    """Defines each name in `__main__`, unless a run already did."""
+    for name, (module, *attribute) in names.items():
+        if name not in vars(__main__):
+            setattr(__main__, name, _LazyName(name, module, *attribute))
@@ -1,3 +1,4 @@
+import __main__
 import base64
 import io
 from PIL import Image
@@ -14,7 +15,7 @@ FuncAnimation = animation.FuncAnimation
 _animation_ref = None
 
 def _emit_to_js(payload):
-    emit = globals().get('__python_web_kernel_emit_matplotlib', None)
+    emit = getattr(__main__, '__python_web_kernel_emit_matplotlib', None)
     if emit is None:
         return False
     emit(payload)
@@ -0,0 +1,47 @@
+import sys
+import importlib.abc
+import importlib.util
+
+class _PatchOnImport(importlib.abc.MetaPathFinder):
+    """Patches a module the first time it is imported, once it has run."""
+
+    def __init__(self, name, patch):
+        self.name = name
+        self.patch = patch
+
+    def find_spec(self, fullname, path=None, target=None):
+        if fullname != self.name:
+            return None
+        sys.meta_path.remove(self)
+        spec = importlib.util.find_spec(fullname)
+        if spec is None or spec.loader is None:
+            return spec
+        loader, patch = spec.loader, self.patch
+
+        def exec_module(module):
+            del loader.exec_module
+            loader.exec_module(module)
+            patch()
+
+        loader.exec_module = exec_module
+        return spec
+
+def patch_on_import(name, source):
+    """
+    Runs `source` once `name` is imported, in a namespace of its own, so that
+    nothing a run defines or removes in `__main__` can break it.
+    """
+    def patch():
+        try:
+            exec(compile(source, f"<patch for {name}>", "exec"), {})
+        except Exception as error:
+            import warnings
+            warnings.warn(f"{name} could not be patched: {error!r}")
+
+    if name in sys.modules:
+        patch()
+    elif not any(
+        isinstance(finder, _PatchOnImport) and finder.name == name
+        for finder in sys.meta_path
+    ):
+        sys.meta_path.insert(0, _PatchOnImport(name, patch))
@@ -0,0 +1,25 @@
+import os
+import sys
+
+
+def capture_process_state():
+    """Takes what a run may change of the process outside `__main__`: the
+    working directory, sys.path, sys.argv and os.environ. Returns what puts
+    them back as they were taken, in place, so that whatever holds sys.path
+    or os.environ sees them restored."""
+    cwd = os.getcwd()
+    path = list(sys.path)
+    argv = list(sys.argv)
+    environ = dict(os.environ)
+
+    def restore():
+        try:
+            os.chdir(cwd)
+        except OSError:
+            pass
+        sys.path[:] = path
+        sys.argv[:] = argv
+        os.environ.clear()
+        os.environ.update(environ)
+
+    return restore
@@ -1,5 +1,8 @@
 import sys
 import importlib
+import importlib.abc
+import importlib.machinery
+import types
 from pathlib import PurePosixPath
 
 def _module_paths(mod):
@@ -26,37 +29,176 @@ def _module_paths(mod):
 
     return out
 
-def unload_local_modules(
-    local_roots=("/home/pyodide",),
-    external_roots=("/lib/python", "/usr/lib", "/usr/local/lib"),
-    extra_keep=(),
-):
+def _is_under(path, roots):
+    return any(path.startswith(r.rstrip("/") + "/") or path == r for r in roots)
+
+
+class LocalModules:
     """
-    Remove modules considered 'local' from sys.modules.
-    Heuristic: module path is under a local_root and NOT under any external_root.
+    Tracks the local modules runs import, and which local modules imported
+    each, so that a run only imports again what changed and what depends on it.
+
+    Local, by heuristic: the module's path is under a local root and NOT under
+    any external root. What each was imported from is checked against the
+    import index, which only reads a file again when the host may have changed
+    it. Only local modules are seen, as they are executed, so every other
+    import keeps to Python's own path.
     """
-    local_roots = tuple(str(PurePosixPath(p)) for p in local_roots)
-    external_roots = tuple(str(PurePosixPath(p)) for p in external_roots)
-    keep = set(extra_keep)
 
-    to_delete = []
-    for name, mod in list(sys.modules.items()):
-        if mod is None or name in keep:
-            continue
+    def __init__(
+        self,
+        index,
+        local_roots=("/home/pyodide",),
+        external_roots=("/lib/python", "/usr/lib", "/usr/local/lib"),
+    ):
+        self.index = index
+        self.local_roots = tuple(str(PurePosixPath(p)) for p in local_roots)
+        self.external_roots = tuple(str(PurePosixPath(p)) for p in external_roots)
+        # module name -> (the file it was imported from, its sha256 then)
+        self.imported: dict[str, tuple[str, str | None]] = {}
+        # module name -> names of the local modules that imported it
+        self.importers: dict[str, set[str]] = {}
+        # module name -> (id of the module, the file it is local to, or None)
+        self.verdicts: dict[str, tuple[int, str | None]] = {}
+        # the local modules being executed, innermost last
+        self.executing: list[str] = []
+        finder = _LocalFinder(self)
+        at = sys.meta_path.index(importlib.machinery.PathFinder)
+        sys.meta_path.insert(at, finder)
+
+    def is_local(self, path):
+        return _is_under(path, self.local_roots) and not _is_under(
+            path, self.external_roots
+        )
 
+    def file_of(self, mod):
+        """The file a local module was imported from, if it is local."""
         paths = _module_paths(mod)
         if not paths:
-            continue  # built-in/frozen/no-file modules -> skip
+            return None  # built-in/frozen/no-file modules -> skip
+        if any(_is_under(p, self.external_roots) for p in paths):
+            return None
+        local = [p for p in paths if _is_under(p, self.local_roots)]
+        if not local:
+            return None
+        return getattr(mod, "__file__", None) or local[0]
+
+    def local_file(self, name, mod=None):
+        """`file_of` for the module loaded under a name, worked out once."""
+        mod = mod if mod is not None else sys.modules.get(name) if name else None
+        if mod is None:
+            return None
+        verdict = self.verdicts.get(name)
+        if verdict is None or verdict[0] != id(mod):
+            verdict = (id(mod), self.file_of(mod))
+            self.verdicts[name] = verdict
+        return verdict[1]
+
+    def execute(self, loader_exec, module):
+        """Executes a local module, noting who imported it and what it uses."""
+        name = module.__name__
+        importer = self.executing[-1] if self.executing else None
+        self.executing.append(name)
+        try:
+            loader_exec(module)
+        finally:
+            self.executing.pop()
+        try:
+            self.record(name, module, importer)
+        except Exception:
+            pass  # tracking must never break an import
+
+    def depends(self, name, on):
+        if on != name and on in self.imported:
+            self.importers.setdefault(on, set()).add(name)
 
-        # "local" if any path is inside local_roots, and none are inside external_roots
-        is_under_local = any(any(p.startswith(r.rstrip("/") + "/") or p == r for r in local_roots) for p in paths)
-        is_under_external = any(any(p.startswith(r.rstrip("/") + "/") or p == r for r in external_roots) for p in paths)
+    def record(self, name, module, importer):
+        path = self.local_file(name, module)
+        if path is None:
+            return
+        self.imported[name] = (path, self.index.digest_of(path))
+        if importer is not None:
+            self.depends(importer, name)
+        # Local modules it took names from, which were imported before it was.
+        for value in list(vars(module).values()):
+            if isinstance(value, types.ModuleType):
+                self.depends(name, value.__name__)
+            else:
+                owner = getattr(type(value), "__module__", None)
+                if isinstance(value, (type, types.FunctionType)):
+                    owner = value.__module__
+                self.depends(name, owner)
+        # Constants taken from them leave no trace but the import itself.
+        for top in self.index.imports_of(path):
+            for other in list(self.imported):
+                if other == top or other.startswith(top + "."):
+                    self.depends(name, other)
 
-        if is_under_local and not is_under_external:
-            to_delete.append(name)
+    def local_names(self):
+        return [
+            name
+            for name, mod in list(sys.modules.items())
+            if mod is not None and self.local_file(name, mod) is not None
+        ]
+
+    def stale(self):
+        """Changed modules, those never seen imported, and what depends on them."""
+        stale = set()
+        for name in self.local_names():
+            known = self.imported.get(name)
+            if known is None or self.index.digest_of(known[0]) != known[1]:
+                stale.add(name)
+        pending = list(stale)
+        while pending:
+            name = pending.pop()
+            dependents = set(self.importers.get(name, ()))
+            # A package imported again would not see submodules left behind.
+            dependents |= {
+                other for other in self.imported if other.startswith(name + ".")
+            }
+            for other in dependents - stale:
+                stale.add(other)
+                pending.append(other)
+        return stale
+
+    def unload(self, everything=False):
+        """Removes what is stale, or every local module, from sys.modules."""
+        names = set(self.local_names()) if everything else self.stale()
+        for name in names:
+            sys.modules.pop(name, None)
+            self.imported.pop(name, None)
+            self.importers.pop(name, None)
+            self.verdicts.pop(name, None)
+        # A package left in place would hand out the submodule it still holds.
+        for name in names:
+            parent, _, child = name.rpartition(".")
+            if parent and parent not in names and parent in sys.modules:
+                try:
+                    delattr(sys.modules[parent], child)
+                except AttributeError:
+                    pass
+        for importers in self.importers.values():
+            importers -= names
+        importlib.invalidate_caches()
+        return sorted(names)
+
+
+class _LocalFinder(importlib.abc.MetaPathFinder):
+    """
+    Finds what `PathFinder` finds, just ahead of it, and has the local modules
+    among it executed through `LocalModules.execute`.
+    """
 
-    for name in to_delete:
-        sys.modules.pop(name, None)
+    def __init__(self, modules):
+        self.modules = modules
 
-    importlib.invalidate_caches()
-    return to_delete
\ No newline at end of file
+    def find_spec(self, fullname, path=None, target=None):
+        spec = importlib.machinery.PathFinder.find_spec(fullname, path, target)
+        if spec is None or spec.loader is None or not spec.origin:
+            return spec
+        if not self.modules.is_local(str(PurePosixPath(spec.origin))):
+            return spec
+        loader, modules = spec.loader, self.modules
+        loader_exec = loader.exec_module
+        loader.exec_module = lambda module: modules.execute(loader_exec, module)
+        return spec
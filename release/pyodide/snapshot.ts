@@ -0,0 +1,81 @@
+import { version } from "pyodide";
+import { code } from "./python";
+
+/** Packages imported before the interpreter's memory is captured. */
+export const snapshotPackages = ["matplotlib"];
+
+const cacheName = "python-web-kernel-snapshots";
+
+/** Never fetched: Cache Storage only accepts http(s) requests as keys. */
+const keyURL = (digest: string) =>
+  `https://python-web-kernel.invalid/snapshots/${digest}`;
+
+/** Snapshots this worker already has in hand, by key. */
+const held = new Map<string, Uint8Array>();
+
+const hex = (buffer: ArrayBuffer) =>
+  [...new Uint8Array(buffer)]
+    .map((byte) => byte.toString(16).padStart(2, "0"))
+    .join("");
+
+const cache = () =>
+  typeof caches === "undefined" ? undefined : caches.open(cacheName);
+
+/**
+ * Interpreter memory captured once Python has started and matplotlib is
+ * patched, so later kernels restore it rather than doing that work again.
+ *
+ * Each is keyed by everything that went into it: the Pyodide version and
+ * where it came from, the packages and the patch. Kept in Cache Storage, so
+ * it outlives the page; anything that goes wrong there costs the snapshot,
+ * never the kernel.
+ */
+export const snapshots = {
+  async key(indexURL: string) {
+    const identity = JSON.stringify([
+      version,
+      indexURL,
+      snapshotPackages,
+      code.patchMatplotlib,
+    ]);
+    const digest = await crypto.subtle.digest(
+      "SHA-256",
+      new TextEncoder().encode(identity),
+    );
+    return keyURL(hex(digest));
+  },
+
+  async load(key: string) {
+    if (held.has(key)) return held.get(key);
+    try {
+      const saved = await (await cache())?.match(key);
+      if (!saved) return;
+      const bytes = new Uint8Array(await saved.arrayBuffer());
+      held.set(key, bytes);
+      return bytes;
+    } catch (error) {
+      console.warn("Could not read the interpreter snapshot", error);
+    }
+  },
+
+  /** Keeps only this one: snapshots made for other versions are stale. */
+  async save(key: string, bytes: Uint8Array) {
+    held.set(key, bytes);
+    try {
+      const store = await cache();
+      if (!store) return;
+      for (const request of await store.keys())
+        if (request.url !== key) await store.delete(request);
+      await store.put(key, new Response(bytes));
+    } catch (error) {
+      console.warn("Could not save the interpreter snapshot", error);
+    }
+  },
+
+  async forget(key: string) {
+    held.delete(key);
+    try {
+      await (await cache())?.delete(key);
+    } catch {}
+  },
+};
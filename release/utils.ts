@@ -78,6 +78,9 @@ export const awaited = {
     value: Awaitable<T>,
     then: (value: T) => Awaitable<R>,
   ): Awaitable<R> => (isPromise(value) ? value.then(then) : then(value)),
+  /** Like `Promise.all`, but only asynchronous if one of the values is. */
+  all: <T>(values: Awaitable<T>[]): Awaitable<T[]> =>
+    values.some(isPromise) ? Promise.all(values) : (values as T[]),
 };
 
 const BASE64_CHUNK = 0x8000;
@@ -11,6 +11,17 @@ const slices = (total: number, capacity: number) => ({
   end: (index: number) => Math.min(total, (index + 1) * capacity),
 });
 
+/**
+ * A payload whose size is not known up front is sent as slices each saying
+ * how long it is. Negative sizes mark slices with more to follow; the last
+ * slice's size is written as it is, as a payload sent whole would be.
+ */
+const followedBy = (length: number) => -(length + 1);
+const lengthOf = (size: number) => (size < 0 ? -size - 1 : size);
+
+/** Written in place of a size when a stream fails part way through. */
+const FAILED = -0x80000000;
+
 export type ChannelChunkMessage = {
   /** Sent by the worker to ask the host for the next slice of a payload. */
   channel_chunk: {};
@@ -21,6 +32,11 @@ export class UnansweredError extends Error {
   override name = "UnansweredError";
 }
 
+/** Thrown when the host's stream failed after part of it had been sent. */
+export class StreamFailedError extends Error {
+  override name = "StreamFailedError";
+}
+
 /** Thrown when the worker gives up waiting because Python was interrupted. */
 export class InterruptedError extends Error {
   override name = "InterruptedError";
@@ -44,6 +60,12 @@ export const DEFAULT_PATIENCE: Patience = {
  */
 export class ChannelHost {
   private pending?: { payload: Uint8Array; sent: number; request: number };
+  private streaming?: {
+    chunks: AsyncIterator<Uint8Array>;
+    /** Read from the stream but not yet sent. */
+    held: Uint8Array[];
+    request: number;
+  };
 
   constructor(readonly memory: AsyncMemory) {}
 
@@ -54,21 +76,38 @@ export class ChannelHost {
    */
   send(payload: Uint8Array, request: number) {
     if (!this.memory.isAwaiting(request)) return;
+    this.abandon();
     this.pending = { payload, sent: 0, request };
     this.memory.writeSize(payload.byteLength);
     this.flushNextSlice();
   }
 
+  /**
+   * Sends a payload as it is produced, one slice at a time, so little more
+   * than a slice of it is ever held here. The worker still receives it whole.
+   */
+  stream(chunks: AsyncIterable<Uint8Array>, request: number) {
+    const iterator = chunks[Symbol.asyncIterator]();
+    if (!this.memory.isAwaiting(request)) return void iterator.return?.();
+    this.abandon();
+    this.streaming = { chunks: iterator, held: [], request };
+    return this.flushNextStreamedSlice();
+  }
+
   /** Answers a worker's request for the next slice of the payload in flight. */
   sendNextChunk() {
-    if (!this.pending)
+    const request = this.pending?.request ?? this.streaming?.request;
+    if (request === undefined)
       return console.warn("No payload in flight to continue writing");
-    if (!this.memory.isAwaiting(this.pending.request)) return this.abandon();
-    this.flushNextSlice();
+    if (!this.memory.isAwaiting(request)) return this.abandon();
+    if (this.streaming) void this.flushNextStreamedSlice();
+    else this.flushNextSlice();
   }
 
   private abandon() {
     this.pending = undefined;
+    void this.streaming?.chunks.return?.();
+    this.streaming = undefined;
   }
 
   private flushNextSlice() {
@@ -84,6 +123,54 @@ export class ChannelHost {
     this.memory.writeAnswer(request);
     if (!this.memory.unlockSize()) this.abandon();
   }
+
+  /**
+   * Reads ahead until there is more than a slice, or the stream has ended, so
+   * that each slice can say whether another follows it.
+   */
+  private async flushNextStreamedSlice() {
+    const streaming = this.streaming!;
+    const capacity = this.memory.memory.byteLength;
+    const heldBytes = () =>
+      streaming.held.reduce((sum, chunk) => sum + chunk.length, 0);
+    let done = false;
+    try {
+      while (!done && heldBytes() <= capacity) {
+        const next = await streaming.chunks.next();
+        if (next.done) done = true;
+        else streaming.held.push(next.value);
+      }
+    } catch (error) {
+      console.error("A streamed answer failed part way through", error);
+      this.streaming = undefined;
+      return this.writeStreamed(streaming.request, FAILED);
+    }
+    if (this.streaming !== streaming) return;
+
+    const slice = new Uint8Array(Math.min(heldBytes(), capacity));
+    let filled = 0;
+    while (filled < slice.length) {
+      const chunk = streaming.held.shift()!;
+      const taken = chunk.subarray(0, slice.length - filled);
+      slice.set(taken, filled);
+      filled += taken.length;
+      if (taken.length < chunk.length)
+        streaming.held.unshift(chunk.subarray(taken.length));
+    }
+    const more = streaming.held.length > 0;
+    if (!more) this.streaming = undefined;
+    if (!this.memory.isAwaiting(streaming.request)) return this.abandon();
+    this.memory.memory.set(slice);
+    this.writeStreamed(streaming.request, more ? followedBy(filled) : filled);
+  }
+
+  private writeStreamed(request: number, size: number) {
+    if (!this.memory.isAwaiting(request)) return;
+    this.memory.writeSize(size);
+    /** The worker can stop waiting between the check and the write. */
+    this.memory.writeAnswer(request);
+    if (!this.memory.unlockSize()) this.abandon();
+  }
 }
 
 /**
@@ -141,6 +228,7 @@ export class ChannelWorker {
 
   private receive(request: number) {
     const total = this.memory.readSize();
+    if (total < 0) return this.receiveStreamed(request, total);
     const slice = slices(total, this.memory.memory.byteLength);
     const payload = new Uint8Array(total);
     for (let index = 0; index < slice.count; index++) {
@@ -151,6 +239,30 @@ export class ChannelWorker {
     return payload;
   }
 
+  /** Slices until one says it is the last, joined once they have all come. */
+  private receiveStreamed(request: number, size: number) {
+    const slices: Uint8Array[] = [];
+    for (;;) {
+      if (size === FAILED)
+        throw new StreamFailedError(
+          "The host's stream failed part way through",
+        );
+      slices.push(this.memory.memory.slice(0, lengthOf(size)));
+      if (size >= 0) break;
+      this.awaitNextChunk(request);
+      size = this.memory.readSize();
+    }
+    const payload = new Uint8Array(
+      slices.reduce((sum, slice) => sum + slice.length, 0),
+    );
+    let at = 0;
+    for (const slice of slices) {
+      payload.set(slice, at);
+      at += slice.length;
+    }
+    return payload;
+  }
+
   private awaitNextChunk(request: number) {
     this.memory.lockSize();
     this.requestNextChunk();
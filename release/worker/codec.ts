@@ -1,5 +1,4 @@
-const encoder = new TextEncoder();
-const decoder = new TextDecoder("utf-8");
+import { contents, streamed, type Streamed } from "../contents";
 
 export class CodecError extends Error {
   override name = "CodecError";
@@ -77,6 +76,7 @@ const TAG = {
   set: 14,
   error: 15,
   reference: 16,
+  streamed: 17,
 } as const;
 
 type Tag = (typeof TAG)[keyof typeof TAG];
@@ -123,7 +123,16 @@ class Writer {
   }
 
   text(value: string) {
-    this.blob(encoder.encode(value));
+    this.blob(contents.toBytes(value));
+  }
+
+  get written() {
+    return this.length;
+  }
+
+  /** Overwrites four bytes already appended, for a length known only later. */
+  patchU32(at: number, value: number) {
+    this.view.setUint32(at, value, true);
   }
 
   finish() {
@@ -170,7 +179,16 @@ class Reader {
   }
 
   text() {
-    return decoder.decode(this.blob());
+    return contents.text(this.blob());
+  }
+
+  /** Everything from an offset on, which is where a streamed tail begins. */
+  rest(from: number) {
+    if (from > this.bytes.byteLength)
+      throw new CodecError(
+        `Payload is truncated: its tail starts at ${from} of ${this.bytes.byteLength}`,
+      );
+    return this.bytes.subarray(from);
   }
 }
 
@@ -208,7 +226,12 @@ const classify = (value: unknown): Tag =>
 
 const CONTAINERS = new Set<Tag>([TAG.array, TAG.record, TAG.map, TAG.set]);
 
-type Context = { references: References; seen: Set<object> };
+type Context = {
+  references: References;
+  seen: Set<object>;
+  /** Where a stream is being encoded, the one stream and its placeholder. */
+  streaming?: { tail?: Streamed; at?: number };
+};
 
 const SYMBOL_KIND = { known: 0, registered: 1, local: 2 } as const;
 
@@ -313,6 +336,14 @@ const encoders: Record<Tag, (w: Writer, value: any, context: Context) => void> =
     [TAG.error]: (w, value: Error) => writeError(w, value),
     [TAG.reference]: (w, value: object, c) =>
       w.text(c.references.encode(value)),
+    /** Where the tail starts is only known once everything else is written. */
+    [TAG.streamed]: (w, value: Streamed, c) => {
+      if (c.streaming!.tail)
+        throw new CodecError("Cannot encode more than one stream at a time");
+      c.streaming!.tail = value;
+      c.streaming!.at = w.written;
+      w.u32(0);
+    },
   };
 
 const decoders: Record<Tag, (reader: Reader, context: Context) => unknown> = {
@@ -333,6 +364,8 @@ const decoders: Record<Tag, (reader: Reader, context: Context) => unknown> = {
   [TAG.map]: (r, c) => new Map(pairs(readValues(r, c))),
   [TAG.error]: (r) => readError(r),
   [TAG.reference]: (r, c) => c.references.decode(r.text()),
+  /** Not copied: a streamed file is most of the payload, and it is fresh. */
+  [TAG.streamed]: (r) => r.rest(r.u32()),
 };
 
 function* flatten(map: Map<unknown, unknown>) {
@@ -363,7 +396,8 @@ const write = (writer: Writer, value: unknown, context: Context) => {
     return writer.text(identifier);
   }
 
-  const tag = classify(value);
+  const tag =
+    context.streaming && streamed.is(value) ? TAG.streamed : classify(value);
   writer.u8(tag);
   if (!CONTAINERS.has(tag)) return encoders[tag](writer, value, context);
   enterContainer(context, value as object);
@@ -408,6 +442,24 @@ export const codec = {
     return writer.finish();
   },
 
+  /**
+   * Like {@link codec.encode}, except that a stream in the value is not sent as
+   * a reference: it is left to follow the encoded value, chunk by chunk, and
+   * decodes as the bytes it produced. At most one stream is allowed.
+   */
+  encodeStreaming(
+    value: unknown,
+    references: References = withoutReferences,
+  ): { head: Uint8Array; tail?: Streamed } {
+    const writer = new Writer();
+    const streaming: Context["streaming"] = {};
+    writer.u8(VERSION);
+    write(writer, value, { references, seen: new Set(), streaming });
+    if (streaming.at !== undefined)
+      writer.patchU32(streaming.at, writer.written);
+    return { head: writer.finish(), tail: streaming.tail };
+  },
+
   decode(bytes: Uint8Array, references: References = withoutReferences) {
     const reader = new Reader(rejectShared(bytes));
     readVersion(reader);
@@ -15,15 +15,63 @@ import { contents, resizeBytes, type Contents } from "../contents";
 export type Entry = {
   size: number;
   directory: boolean;
+  /**
+   * Anything that changes whenever the contents do — a hash, a revision, a
+   * modification time — for whoever wants to tell versions apart.
+   */
+  version?: string;
 };
 
+/**
+ * How long the worker trusts what it learnt about a mount's files.
+ *
+ * - `live`: until the next run starts, or the host reports a change.
+ * - `revalidate`: listings and sizes as with `live`, but contents are kept and
+ *   used again for as long as `stat` reports the same `version`.
+ * - `immutable`: for as long as the kernel lives, unless the host reports a
+ *   change. Paths found missing are remembered too.
+ */
+export type CachePolicy = "live" | "revalidate" | "immutable";
+
+export type Caching = {
+  /** @default "live" */
+  policy?: CachePolicy;
+  /**
+   * The most file contents the worker keeps, in bytes, for a policy that
+   * keeps them.
+   * @default 64 MiB
+   */
+  maxBytes?: number;
+};
+
+/** What a mount answered from what it knew, and what it asked the host. */
+export type CacheStats = {
+  /** Answered without asking the host. */
+  hits: number;
+  /** Passed on to the host. */
+  misses: number;
+  /** Read from the host, in file contents. */
+  bytes: number;
+};
+
+/** A directory entry together with what `stat` would have said about it. */
+export type Listing = Entry & { name: string };
+
+/**
+ * A path under the mount, without a leading slash, and what is known about it.
+ * The mount itself is the empty path.
+ */
+export type ManifestEntry = Entry & { path: string };
+
 /**
  * What Python's filesystem calls turn into.
  *
- * An open file is held whole in the worker and written back with a single
- * `put` when it is closed, so `get` and `put` are called once per open file
- * rather than once per read or write. Python's `flush()` does not reach the
- * host, and a run that is terminated mid-write never gets to `put` at all.
+ * An open file is held in the worker and written back when it is closed, when
+ * `os.fsync` is called on it, and every so often while it is being written.
+ * With only `put`, the host is sent the whole file each time. With `write` and
+ * `truncate` as well, it is sent only what changed, and a file opened for
+ * writing alone is never read into the worker at all. With `read`, a file
+ * opened for reading alone is fetched a window at a time as Python reads it.
  */
 export interface SyncFileSystem {
   /**
@@ -57,6 +105,54 @@ export interface SyncFileSystem {
    * List the files in a directory
    */
   listDirectory(opts: { path: string }): SyncResult<string[]>;
+
+  /**
+   * List the files in a directory and describe each of them, so that walking
+   * a tree costs one call per directory instead of one per entry.
+   *
+   * Optional: without it, each entry is looked up on its own.
+   */
+  listDirectoryWithStats?(opts: { path: string }): SyncResult<Listing[]>;
+
+  /**
+   * Describe every path under the mount at once. Directories that hold
+   * something need not be listed themselves.
+   *
+   * Optional. With it, the worker answers lookups, stats and listings itself
+   * from the one answer, and asks again at the start of each run.
+   */
+  manifest?(): SyncResult<ManifestEntry[]>;
+
+  /**
+   * Read up to `length` bytes of a file from an offset, like `pread`: fewer
+   * come back at the end of the file, and none past it.
+   *
+   * Optional: without it, a file is read whole when it is opened.
+   */
+  read?(opts: {
+    path: string;
+    offset: number;
+    length: number;
+  }): SyncResult<Uint8Array>;
+
+  /**
+   * Write bytes into an existing file at an offset, like `pwrite`: the file
+   * grows to hold them, and any gap before them reads as zeroes.
+   *
+   * Optional, and only used alongside `truncate`.
+   */
+  write?(opts: {
+    path: string;
+    offset: number;
+    value: Uint8Array;
+  }): SyncResult<undefined>;
+
+  /**
+   * Cut a file down or pad it with zeroes to a size, like `ftruncate`.
+   *
+   * Optional, and only used alongside `write`.
+   */
+  truncate?(opts: { path: string; size: number }): SyncResult<undefined>;
 }
 
 export const fileSystemMethods = [
@@ -68,6 +164,24 @@ export const fileSystemMethods = [
   "listDirectory",
 ] as const satisfies readonly (keyof SyncFileSystem)[];
 
+export const optionalFileSystemMethods = [
+  "read",
+  "write",
+  "truncate",
+  "listDirectoryWithStats",
+  "manifest",
+] as const satisfies readonly (keyof SyncFileSystem)[];
+
+/** The required methods, and whichever optional ones the filesystem has. */
+export const implementedMethods = (
+  fs: Partial<Record<keyof SyncFileSystem, unknown>>,
+): (keyof SyncFileSystem)[] => [
+  ...fileSystemMethods,
+  ...optionalFileSystemMethods.filter(
+    (method) => typeof fs[method] === "function",
+  ),
+];
+
 const failed = (thrown: unknown): SyncResult<never> => ({
   ok: false,
   status: 500,
@@ -80,7 +194,7 @@ const failed = (thrown: unknown): SyncResult<never> => ({
  */
 export const answering = (fs: SyncFileSystem): SyncFileSystem =>
   Object.fromEntries(
-    fileSystemMethods.map((method) => [
+    implementedMethods(fs).map((method) => [
       method,
       (opts: any) => {
         try {
@@ -116,21 +230,83 @@ type Opts = {
   root?: string;
 };
 
-const realPath = (node: FS.FSNode, fileName?: string) => {
+/** The names from the mount down to a node, and on to `fileName`. */
+export const namesTo = (node: FS.FSNode, fileName?: string) => {
   const parts = [];
   while (node.parent !== node) {
     parts.push(node.name);
     node = node.parent;
   }
-  parts.push((node.mount.opts as Opts).root);
   parts.reverse();
   if (fileName !== undefined && fileName !== null) {
     parts.push(fileName);
   }
-  return parts.join("/");
+  return parts;
+};
+
+const realPath = (node: FS.FSNode, fileName?: string) =>
+  [(node.mount.opts as Opts).root, ...namesTo(node, fileName)].join("/");
+
+/** Where a node is within the mount, as manifests and change notices say. */
+const mountPath = (node: FS.FSNode, fileName?: string) =>
+  namesTo(node, fileName).join("/");
+
+/**
+ * Every path a manifest described, and the names in each directory, kept up to
+ * date with what Python changes.
+ */
+export type Index = {
+  entries: Map<string, Entry>;
+  children: Map<string, Set<string>>;
+};
+
+const parentOf = (path: string) =>
+  path.slice(0, Math.max(path.lastIndexOf("/"), 0));
+
+const nameOf = (path: string) => path.slice(path.lastIndexOf("/") + 1);
+
+/** Records a path, and the directories above it if they are not yet known. */
+const addToIndex = (index: Index, path: string, entry: Entry) => {
+  index.entries.set(path, entry);
+  if (path === "") return;
+  const parent = parentOf(path);
+  if (!index.entries.has(parent))
+    addToIndex(index, parent, { size: 0, directory: true });
+  const children = index.children.get(parent) ?? new Set();
+  index.children.set(parent, children.add(nameOf(path)));
+};
+
+/** Forgets a path and everything under it, returning what was forgotten. */
+const removeFromIndex = (index: Index, path: string) => {
+  const removed: [string, Entry][] = [];
+  const remove = (path: string) => {
+    for (const child of [...(index.children.get(path) ?? [])])
+      remove(`${path}/${child}`);
+    const entry = index.entries.get(path);
+    if (entry) removed.push([path, entry]);
+    index.entries.delete(path);
+    index.children.delete(path);
+    index.children.get(parentOf(path))?.delete(nameOf(path));
+  };
+  remove(path);
+  return removed;
+};
+
+const moveInIndex = (index: Index, path: string, newPath: string) => {
+  removeFromIndex(index, newPath);
+  for (const [moved, entry] of removeFromIndex(index, path))
+    addToIndex(index, newPath + moved.slice(path.length), entry);
 };
 
-type AdvancedEmscriptenFS = {
+export const indexOf = (manifest: ManifestEntry[]) => {
+  const index: Index = { entries: new Map(), children: new Map() };
+  addToIndex(index, "", { size: 0, directory: true });
+  for (const { path, ...entry } of manifest)
+    addToIndex(index, path.replace(/^\/+|\/+$/g, ""), entry);
+  return index;
+};
+
+export type AdvancedEmscriptenFS = {
   createNode(
     parent: FS.FSNode | null,
     name: string,
@@ -139,12 +315,54 @@ type AdvancedEmscriptenFS = {
   ): FS.FSNode;
 };
 
-const DIR_MODE = 16895; // 040777
-const FILE_MODE = 33206; // 100666
-const SEEK_CUR = 1;
-const SEEK_END = 2;
+export const DIR_MODE = 16895; // 040777
+export const FILE_MODE = 33206; // 100666
+export const SEEK_CUR = 1;
+export const SEEK_END = 2;
+const O_ACCMODE = 3;
+const O_RDONLY = 0;
+const O_WRONLY = 1;
 const O_TRUNC = 512;
 
+/**
+ * How much an open file may hold, or for how long, before what changed is sent
+ * on without waiting for it to be closed. Only a host that takes ranged writes
+ * is sent anything early: for one that can only `put`, every flush would cost
+ * the whole file.
+ */
+const FLUSH_BYTES = 1024 * 1024;
+const FLUSH_INTERVAL = 1000;
+
+/**
+ * The least a file read a window at a time asks for at once. Python reads in
+ * small chunks, and each one that went to the host would block on a round
+ * trip of its own.
+ */
+const READ_AHEAD = 256 * 1024;
+
+/** The room a growing file starts with, so small files skip the doublings. */
+const MINIMUM_CAPACITY = 4096;
+
+/**
+ * Posting a view copies the whole buffer behind it, spare room and all, so a
+ * view is cut down to what it shows before it leaves the worker.
+ */
+const trimmed = (bytes: Uint8Array) =>
+  bytes.byteLength === bytes.buffer.byteLength ? bytes : bytes.slice();
+
+/** A half-open byte range, `[start, end)`. */
+type Range = [start: number, end: number];
+
+/** Adds a range to a sorted list of disjoint ones, merging what it touches. */
+const addRange = (ranges: Range[], start: number, end: number): Range[] => {
+  const merged: Range[] = [];
+  for (const range of ranges)
+    if (range[1] < start || range[0] > end) merged.push(range);
+    else [start, end] = [Math.min(start, range[0]), Math.max(end, range[1])];
+  merged.push([start, end]);
+  return merged.sort((a, b) => a[0] - b[0]);
+};
+
 const methods = (
   {
     FS,
@@ -152,6 +370,7 @@ const methods = (
   }: Pick<PyodideAPI, "FS" | "ERRNO_CODES"> & { FS: AdvancedEmscriptenFS },
   custom: SyncFileSystem,
   log: boolean = false,
+  { policy = "live", maxBytes = 64 * 1024 * 1024 }: Caching = {},
 ) => {
   let createNode: AdvancedEmscriptenFS["createNode"];
 
@@ -166,13 +385,43 @@ const methods = (
     if (log) console.log(`[emscripten-fs] ${name}`, args);
   };
 
+  const counts: CacheStats = { hits: 0, misses: 0, bytes: 0 };
+
+  /** Asks the host, counting the question and whatever bytes it answers. */
+  const ask = <T>(result: SyncResult<T>) => {
+    counts.misses++;
+    if (result.ok && result.data instanceof Uint8Array)
+      counts.bytes += result.data.byteLength;
+    return result;
+  };
+
+  const hit = <T>(answer: T) => (counts.hits++, answer);
+
   const readBytes = (path: string) => {
-    const value = syncResult(custom.get({ path }));
-    return value === null ? new Uint8Array() : contents.toBytes(value);
+    const value = syncResult(ask(custom.get({ path })));
+    const bytes = value === null ? new Uint8Array() : contents.toBytes(value);
+    if (value !== null && !(value instanceof Uint8Array))
+      counts.bytes += bytes.byteLength;
+    return bytes;
   };
 
   const writeBytes = (path: string, bytes: Uint8Array) =>
-    syncResult(custom.put({ path, value: bytes }));
+    syncResult(custom.put({ path, value: trimmed(bytes) }));
+
+  /** Whether the host can be sent what changed rather than the whole file. */
+  const ranged = custom.write !== undefined && custom.truncate !== undefined;
+
+  /** Whether a file opened for reading alone can be read a window at a time. */
+  const windowed = custom.read !== undefined;
+
+  const readAt = (path: string, offset: number, length: number) =>
+    syncResult(ask(custom.read!({ path, offset, length })));
+
+  const writeAt = (path: string, offset: number, value: Uint8Array) =>
+    syncResult(custom.write!({ path, offset, value: trimmed(value) }));
+
+  const truncateTo = (path: string, size: number) =>
+    syncResult(custom.truncate!({ path, size }));
 
   type CustomNode = FS.FSNode & {
     timestamp?: number;
@@ -180,6 +429,161 @@ const methods = (
     pendingSize?: number;
   };
 
+  /**
+   * What the last listing said about each entry, so that the lookups and stats
+   * that follow a listing need not ask the host again. A size is used once, and
+   * anything that changes a path forgets what was listed for it.
+   */
+  const listed = new Map<string, Entry>();
+
+  /** Whether what is learnt about a path is kept for the kernel's life. */
+  const immutable = policy === "immutable";
+
+  /**
+   * Under a policy that keeps them, the names in each directory, the paths
+   * found missing, and file contents with the version they were read at, least
+   * recently used first.
+   */
+  const names = new Map<string, string[]>();
+  const missing = new Set<string>();
+  const held = new Map<string, { bytes: Uint8Array; version?: string }>();
+  let heldBytes = 0;
+
+  const release = (path: string) => {
+    const kept = held.get(path);
+    if (!kept) return;
+    heldBytes -= kept.bytes.byteLength;
+    held.delete(path);
+  };
+
+  const hold = (path: string, bytes: Uint8Array, version?: string) => {
+    release(path);
+    if (bytes.byteLength > maxBytes) return;
+    held.set(path, { bytes, version });
+    heldBytes += bytes.byteLength;
+    for (const [oldest, { bytes }] of held) {
+      if (heldBytes <= maxBytes) break;
+      held.delete(oldest);
+      heldBytes -= bytes.byteLength;
+    }
+  };
+
+  const forget = (path: string) => listed.delete(path);
+
+  /** Forgets everything known about a path, because it is being changed. */
+  const forgetAll = (path: string) => {
+    forget(path);
+    names.delete(path);
+    names.delete(parentOf(path));
+    missing.delete(path);
+    release(path);
+  };
+
+  /**
+   * The paths Python made, changed or removed through the mount since they
+   * were last taken, and whether each is a directory. Nobody reports these.
+   */
+  const changes = new Map<string, boolean>();
+
+  const takeChanges = () => {
+    const taken = [...changes];
+    changes.clear();
+    return taken;
+  };
+
+  const forgetTree = (path: string) => {
+    forgetAll(path);
+    const within = (known: string) =>
+      path === "" || known.startsWith(`${path}/`);
+    for (const known of [...listed.keys()]) if (within(known)) forget(known);
+    for (const known of [...names.keys()])
+      if (within(known)) names.delete(known);
+    for (const known of [...missing]) if (within(known)) missing.delete(known);
+    for (const known of [...held.keys()]) if (within(known)) release(known);
+  };
+
+  /** A listed size is used once, unless the files are known not to change. */
+  const takeListedSize = (path: string) => {
+    const size = listed.get(path)?.size;
+    if (!immutable) forget(path);
+    return size;
+  };
+
+  /** Stats a path on the host, keeping the answer if it will not change. */
+  const statOnHost = (path: string, node: FS.FSNode, name?: string) => {
+    const result = ask(custom.stat({ path }));
+    if (immutable && result.ok) listed.set(mountPath(node, name), result.data);
+    if (immutable && !result.ok && result.status === 404)
+      missing.add(mountPath(node, name));
+    return result;
+  };
+
+  /**
+   * The host's manifest, while one is held: `undefined` until it is asked for,
+   * and `null` when the host has none to give.
+   */
+  let index: Index | null | undefined;
+
+  const indexed = () => {
+    if (index === undefined) {
+      const result = custom.manifest && ask(custom.manifest());
+      index = result?.ok ? indexOf(result.data) : null;
+    }
+    return index ?? undefined;
+  };
+
+  /** Keeps a manifest already held in step, without asking for one. */
+  const updateIndex = (change: (index: Index) => void) => {
+    if (index) change(index);
+  };
+
+  /**
+   * Drops what was learnt about paths the host has changed since, or about
+   * every path when it does not say which. A manifest cannot be patched from
+   * a path alone, as the path may have been created, changed or removed, so
+   * any change means asking for it again.
+   */
+  const invalidate = (paths?: string[]) => {
+    if (paths === undefined && immutable) return;
+    if (paths === undefined) {
+      listed.clear();
+      names.clear();
+      missing.clear();
+    } else paths.forEach(forgetTree);
+    if (paths === undefined || paths.length > 0) index = undefined;
+  };
+
+  /** The version the host gives a path now, if it gives one at all. */
+  const versionOf = (node: FS.FSNode) => {
+    const path = mountPath(node);
+    const known = indexed()?.entries.get(path) ?? listed.get(path);
+    if (known) return known.version;
+    const result = ask(custom.stat({ path: realPath(node) }));
+    return result.ok ? result.data.version : undefined;
+  };
+
+  /**
+   * The whole of a file, from what is held when the policy allows it. What is
+   * handed out is a copy, since an open stream writes into what it holds.
+   */
+  const readContents = (node: FS.FSNode) => {
+    const path = mountPath(node);
+    if (policy === "live") return readBytes(realPath(node));
+    const known = held.get(path);
+    const version = immutable ? undefined : versionOf(node);
+    const unchanged = immutable || version === known?.version;
+    if (known && unchanged) {
+      held.delete(path);
+      held.set(path, known);
+      return hit(known.bytes.slice());
+    }
+    const bytes = readBytes(realPath(node));
+    if (immutable || version !== undefined) hold(path, bytes.slice(), version);
+    return bytes;
+  };
+
+  const stats = (): CacheStats => ({ ...counts });
+
   const isCustomNode = (node: FS.FSNode): node is CustomNode =>
     (node as CustomNode).timestamp !== undefined;
 
@@ -189,17 +593,59 @@ const methods = (
    * An open file is only written back when it is closed, so what a stream holds
    * is more current than what the host would report.
    */
-  const sizeOf = (node: FS.FSNode) =>
-    (node as CustomNode).pendingSize ??
-    syncResult(custom.stat({ path: realPath(node) })).size;
+  const sizeOf = (node: FS.FSNode) => {
+    const { pendingSize } = node as CustomNode;
+    if (pendingSize !== undefined) return pendingSize;
+    const indexedSize = indexed()?.entries.get(mountPath(node))?.size;
+    if (indexedSize !== undefined) return hit(indexedSize);
+    const listedSize = takeListedSize(mountPath(node));
+    if (listedSize !== undefined) return hit(listedSize);
+    return syncResult(statOnHost(realPath(node), node)).size;
+  };
 
+  /**
+   * What streams open on the file hold is sent first and then cut to size
+   * with it, or closing one would write back past the new end.
+   */
   const truncate = (node: FS.FSNode, size: number) => {
     if (!FS.isFile(node.mode)) throw new FS.ErrnoError(ERRNO_CODES["EINVAL"]);
     const path = realPath(node);
-    writeBytes(path, resizeBytes(readBytes(path), size));
+    const streams = [...opened].filter(
+      (stream) => mountPath(stream.object) === mountPath(node),
+    );
+    for (const stream of streams) flush(stream);
+    if (streams.length > 0) forgetAll(mountPath(node));
+    const whole = ranged ? undefined : readContents(node);
+    forgetAll(mountPath(node));
+    changes.set(mountPath(node), false);
+    if (ranged) truncateTo(path, size);
+    else writeBytes(path, resizeBytes(whole!, size));
+    for (const stream of streams) clip(stream, size);
+    updateIndex((index) =>
+      addToIndex(index, mountPath(node), { size, directory: false }),
+    );
     (node as CustomNode).pendingSize = undefined;
   };
 
+  /** The names in a directory, noting what a listing says about each. */
+  const namesIn = (node: FS.FSNode) => {
+    const at = indexed();
+    if (at) return hit([...(at.children.get(mountPath(node)) ?? [])]);
+    const known = names.get(mountPath(node));
+    if (known) return hit([...known]);
+    const path = realPath(node);
+    const found = custom.listDirectoryWithStats
+      ? syncResult(ask(custom.listDirectoryWithStats({ path }))).map(
+          ({ name, ...entry }) => {
+            listed.set(mountPath(node, name), entry);
+            return name;
+          },
+        )
+      : syncResult(ask(custom.listDirectory({ path })));
+    if (immutable) names.set(mountPath(node), [...found]);
+    return found;
+  };
+
   const nodeOps: FS.NodeOps = {
     getattr: (node) => {
       logCall("nodeOps.getattr", { node: node.name, id: node.id });
@@ -235,7 +681,15 @@ const methods = (
     lookup: (parent, name) => {
       logCall("nodeOps.lookup", { parent: parent.name, name });
       const path = realPath(parent, name);
-      const result = custom.stat({ path });
+      const at = indexed();
+      const known = at
+        ? at.entries.get(mountPath(parent, name))
+        : listed.get(mountPath(parent, name));
+      if (known) return hit(createNode!(parent, name, modeOf(known), rdev));
+      /** A manifest describes every path, so what it lacks does not exist. */
+      if (at || missing.has(mountPath(parent, name)))
+        throw hit(new FS.ErrnoError(ERRNO_CODES["ENOENT"]));
+      const result = statOnHost(path, parent, name);
       if (!result.ok) throw new FS.ErrnoError(ERRNO_CODES["ENOENT"]);
       return createNode!(parent, name, modeOf(result.data), rdev);
     },
@@ -244,12 +698,20 @@ const methods = (
       logCall("nodeOps.mknod", { parent: parent.name, name, mode, dev });
       const node = createNode!(parent, name, mode, dev as number);
       const path = realPath(node);
+      forgetAll(mountPath(node));
+      changes.set(mountPath(node), FS.isDir(node.mode));
       syncResult(
         custom.put({
           path,
           value: FS.isDir(node.mode) ? null : new Uint8Array(),
         }),
       );
+      updateIndex((index) =>
+        addToIndex(index, mountPath(node), {
+          size: 0,
+          directory: FS.isDir(node.mode),
+        }),
+      );
       return node;
     },
 
@@ -261,26 +723,46 @@ const methods = (
       });
       const path = realPath(oldNode);
       const newPath = realPath(newDir, newName);
+      forgetTree(mountPath(oldNode));
+      forgetTree(mountPath(newDir, newName));
+      changes.set(mountPath(oldNode), FS.isDir(oldNode.mode));
+      changes.set(mountPath(newDir, newName), FS.isDir(oldNode.mode));
       syncResult(custom.move({ path, newPath }));
+      updateIndex((index) =>
+        moveInIndex(
+          index,
+          mountPath(oldNode),
+          mountPath(newDir, newName),
+        ),
+      );
       oldNode.name = newName;
     },
 
     unlink: (parent, name) => {
       logCall("nodeOps.unlink", { parent: parent.name, name });
       const path = realPath(parent, name);
+      forgetAll(mountPath(parent, name));
+      changes.set(mountPath(parent, name), false);
       syncResult(custom.delete({ path }));
+      updateIndex((index) =>
+        removeFromIndex(index, mountPath(parent, name)),
+      );
     },
 
     rmdir: (parent, name) => {
       logCall("nodeOps.rmdir", { parent: parent.name, name });
       const path = realPath(parent, name);
+      forgetTree(mountPath(parent, name));
+      changes.set(mountPath(parent, name), true);
       syncResult(custom.delete({ path }));
+      updateIndex((index) =>
+        removeFromIndex(index, mountPath(parent, name)),
+      );
     },
 
     readdir: (node) => {
       logCall("nodeOps.readdir", { node: node.name });
-      const path = realPath(node);
-      let result = syncResult(custom.listDirectory({ path }));
+      const result = namesIn(node);
       if (!result.includes(".")) result.push(".");
       if (!result.includes("..")) result.push("..");
       return result;
@@ -298,89 +780,298 @@ const methods = (
   };
 
   /**
-   * Open files hold their whole contents as bytes: reads and writes never touch
-   * the host, only `open` and `close` do.
+   * An open file holds what Python wrote to it until it is flushed.
+   *
+   * Usually that is the whole file, read when it is opened. A file opened for
+   * writing alone, on a host that takes ranged writes, holds only what has not
+   * been sent yet: `fileData` then starts `base` bytes into the file, and
+   * `size` says how long the file is.
+   *
+   * A file opened for reading alone, on a host that takes ranged reads, holds
+   * nothing but the last window read from it, `windowData` from
+   * `windowStart`, and never holds `fileData`.
+   *
+   * `fileData` has room to spare, so that a file written a line at a time is
+   * copied a handful of times rather than once per line: only its first
+   * `length` bytes are the file's.
    */
   type CustomStream = FS.FSStream & {
     fileData?: Uint8Array;
+    length?: number;
+    /** Set when the whole file has to be sent again with `put`. */
     dirty?: boolean;
+    /** What the host has not been sent yet, for a host that takes ranges. */
+    changed?: Range[];
+    base?: number;
+    size?: number;
+    flushedAt?: number;
+    windowData?: Uint8Array;
+    windowStart?: number;
   };
 
+  /** The files open, so that truncating one can bring its streams along. */
+  const opened = new Set<CustomStream>();
+
   const bytesOf = (stream: FS.FSStream) => {
-    const { fileData } = stream as CustomStream;
+    const { fileData, length } = stream as CustomStream;
     if (fileData === undefined) throw new FS.ErrnoError(ERRNO_CODES["EPERM"]);
-    return fileData;
+    return fileData.subarray(0, length);
   };
 
   const isTruncating = (stream: FS.FSStream) =>
     (stream.flags & O_TRUNC) === O_TRUNC;
 
+  const isWriteOnly = (stream: FS.FSStream) =>
+    (stream.flags & O_ACCMODE) === O_WRONLY;
+
+  const isReadOnly = (stream: FS.FSStream) =>
+    (stream.flags & O_ACCMODE) === O_RDONLY;
+
+  /** Whether the stream may change the file, and so outdates what is known. */
+  const isChanging = (stream: FS.FSStream) =>
+    !isReadOnly(stream) || isTruncating(stream);
+
+  /** Whether the stream holds only the part of the file not yet sent. */
+  const isPartial = (stream: CustomStream) => stream.base !== undefined;
+
+  /** Whether the stream reads the file a window at a time. */
+  const isWindowed = (stream: CustomStream) =>
+    stream.windowData !== undefined;
+
+  const streamSize = (stream: CustomStream) =>
+    isWindowed(stream)
+      ? sizeOf(stream.object)
+      : isPartial(stream)
+        ? stream.size!
+        : bytesOf(stream).length;
+
+  /**
+   * Copies what is asked for out of the window, first fetching a new window
+   * from the host when the one held does not start the read. A read that runs
+   * off the end of the window is cut short, as POSIX allows.
+   */
+  const readWindowed = (
+    stream: CustomStream,
+    buffer: Uint8Array,
+    offset: number,
+    length: number,
+    position: number,
+  ) => {
+    const start = stream.windowStart!;
+    const held = stream.windowData!;
+    if (position < start || position >= start + held.length) {
+      const path = realPath(stream.object);
+      stream.windowData = readAt(path, position, Math.max(length, READ_AHEAD));
+      stream.windowStart = position;
+    }
+    const from = position - stream.windowStart!;
+    const bytes = stream.windowData!.subarray(from, from + length);
+    buffer.set(bytes, offset);
+    return bytes.length;
+  };
+
+  /** Makes room for `size` bytes, doubling rather than growing to fit. */
   const grow = (stream: CustomStream, size: number) => {
-    if (size > bytesOf(stream).length)
-      stream.fileData = resizeBytes(stream.fileData!, size);
+    const fileData = stream.fileData!;
+    if (size > fileData.length) {
+      let capacity = Math.max(fileData.length, MINIMUM_CAPACITY);
+      while (capacity < size) capacity *= 2;
+      const held = fileData.subarray(0, stream.length);
+      stream.fileData = resizeBytes(held, capacity);
+    }
+    stream.length = Math.max(stream.length!, size);
     return stream.fileData!;
   };
 
-  const streamOps: FS.StreamOps = {
-    open: (stream) => {
-      const path = realPath(stream.object);
-      logCall("streamOps.open", { path, flags: stream.flags });
-      if (!FS.isFile(stream.object.mode)) return;
-      const truncating = isTruncating(stream);
-      Object.assign(stream as CustomStream, {
-        fileData: truncating ? new Uint8Array() : readBytes(path),
-        dirty: truncating,
-      });
-      if (truncating) (stream.object as CustomNode).pendingSize = 0;
-    },
+  /**
+   * Writes that carry on where the last one stopped are held together; one
+   * anywhere else sends what is held first, so the held bytes stay contiguous.
+   */
+  const append = (
+    stream: CustomStream,
+    bytes: Uint8Array,
+    position: number,
+  ) => {
+    if (position !== stream.base! + bytesOf(stream).length) {
+      flush(stream);
+      stream.base = position;
+    }
+    const end = stream.length!;
+    grow(stream, end + bytes.length).set(bytes, end);
+    stream.size = Math.max(stream.size!, position + bytes.length);
+  };
 
-    close: (stream) => {
-      const path = realPath(stream.object);
-      logCall("streamOps.close", { path });
-      const { fileData, dirty } = stream as CustomStream;
-      Object.assign(stream as CustomStream, {
-        fileData: undefined,
-        dirty: false,
+  /** Cuts what a stream holds, all of it sent already, to a new size. */
+  const clip = (stream: CustomStream, size: number) => {
+    if (isWindowed(stream))
+      Object.assign(stream, { windowData: new Uint8Array(), windowStart: 0 });
+    else if (isPartial(stream)) stream.size = size;
+    else if (stream.fileData !== undefined)
+      Object.assign(stream, {
+        fileData: resizeBytes(bytesOf(stream), size),
+        length: size,
       });
-      (stream.object as CustomNode).pendingSize = undefined;
-      if (dirty && fileData !== undefined) writeBytes(path, fileData);
-    },
+  };
 
-    read: (stream, buffer, offset, length, position) => {
-      logCall("streamOps.read", { offset, length, position });
-      if (length <= 0) return 0;
-      const fileData = bytesOf(stream);
-      const size = Math.min(fileData.length - position, length);
-      if (size <= 0) return 0;
-      buffer.set(fileData.subarray(position, position + size), offset);
-      return size;
-    },
+  const unsent = (stream: CustomStream) =>
+    isPartial(stream)
+      ? bytesOf(stream).length
+      : (stream.changed ?? []).reduce(
+          (sum, [start, end]) => sum + end - start,
+          0,
+        );
 
-    write: (stream, buffer, offset, length, position) => {
-      logCall("streamOps.write", { offset, length, position });
-      if (length <= 0) return 0;
-      const fileData = grow(stream as CustomStream, position + length);
-      fileData.set(buffer.subarray(offset, offset + length), position);
-      Object.assign(stream.object as CustomNode, {
-        timestamp: Date.now(),
-        pendingSize: fileData.length,
-      });
-      (stream as CustomStream).dirty = true;
-      return length;
-    },
+  const isFlushDue = (stream: CustomStream) =>
+    unsent(stream) >= FLUSH_BYTES ||
+    Date.now() - stream.flushedAt! >= FLUSH_INTERVAL;
 
-    llseek: (stream, offset, whence) => {
-      logCall("streamOps.llseek", { offset, whence });
-      const position = offset + seekOrigin(stream, whence);
-      if (position < 0) throw new FS.ErrnoError(ERRNO_CODES["EINVAL"]);
-      return position;
-    },
+  /** Tells the host whatever the stream holds that it has not been told. */
+  const flush = (stream: CustomStream) => {
+    if (stream.fileData === undefined) return;
+    const path = realPath(stream.object);
+    stream.flushedAt = Date.now();
+    if (isPartial(stream)) {
+      const held = bytesOf(stream);
+      if (held.length === 0) return;
+      writeAt(path, stream.base!, held);
+      stream.base = stream.base! + held.length;
+      stream.length = 0;
+    } else if (ranged) {
+      for (const [start, end] of stream.changed ?? [])
+        writeAt(path, start, stream.fileData.subarray(start, end));
+      stream.changed = [];
+    } else if (stream.dirty) {
+      writeBytes(path, bytesOf(stream));
+      stream.dirty = false;
+    }
+  };
+
+  /**
+   * POSIX truncates when the file is opened, which a host that takes ranges
+   * can be told straight away. One that only takes `put` hears about it when
+   * the file is first flushed.
+   */
+  const openWith = (stream: CustomStream, path: string) => {
+    const truncating = isTruncating(stream);
+    if (windowed && isReadOnly(stream) && !truncating)
+      return { windowData: new Uint8Array(), windowStart: 0 };
+    if (ranged && truncating) truncateTo(path, 0);
+    if (ranged && isWriteOnly(stream))
+      return {
+        fileData: new Uint8Array(),
+        length: 0,
+        base: 0,
+        size: truncating ? 0 : sizeOf(stream.object),
+      };
+    const fileData = truncating
+      ? new Uint8Array()
+      : readContents(stream.object);
+    const { length } = fileData;
+    return ranged
+      ? { fileData, length, changed: [] }
+      : { fileData, length, dirty: truncating };
   };
 
+  const streamOps: FS.StreamOps & { fsync: (stream: FS.FSStream) => number } =
+    {
+      open: (stream) => {
+        const path = realPath(stream.object);
+        logCall("streamOps.open", { path, flags: stream.flags });
+        if (!FS.isFile(stream.object.mode)) return;
+        if (isChanging(stream)) {
+          forgetAll(mountPath(stream.object));
+          changes.set(mountPath(stream.object), false);
+        } else if (!immutable) forget(mountPath(stream.object));
+        Object.assign(stream as CustomStream, openWith(stream, path), {
+          flushedAt: Date.now(),
+        });
+        opened.add(stream as CustomStream);
+        if (isTruncating(stream)) (stream.object as CustomNode).pendingSize = 0;
+      },
+
+      close: (stream) => {
+        logCall("streamOps.close", { path: realPath(stream.object) });
+        try {
+          flush(stream as CustomStream);
+        } finally {
+          opened.delete(stream as CustomStream);
+          if (isChanging(stream)) {
+            forgetAll(mountPath(stream.object));
+            changes.set(mountPath(stream.object), false);
+          }
+          const { pendingSize } = stream.object as CustomNode;
+          if (pendingSize !== undefined)
+            updateIndex((index) =>
+              addToIndex(index, mountPath(stream.object), {
+                size: pendingSize,
+                directory: false,
+              }),
+            );
+          Object.assign(stream as CustomStream, {
+            fileData: undefined,
+            length: undefined,
+            dirty: false,
+            changed: undefined,
+            base: undefined,
+            windowData: undefined,
+            windowStart: undefined,
+          });
+          (stream.object as CustomNode).pendingSize = undefined;
+        }
+      },
+
+      fsync: (stream) => {
+        logCall("streamOps.fsync", { path: realPath(stream.object) });
+        flush(stream as CustomStream);
+        return 0;
+      },
+
+      read: (stream, buffer, offset, length, position) => {
+        logCall("streamOps.read", { offset, length, position });
+        if (length <= 0) return 0;
+        const open = stream as CustomStream;
+        if (isWindowed(open))
+          return readWindowed(open, buffer, offset, length, position);
+        if (isPartial(open)) throw new FS.ErrnoError(ERRNO_CODES["EPERM"]);
+        const fileData = bytesOf(stream);
+        const size = Math.min(fileData.length - position, length);
+        if (size <= 0) return 0;
+        buffer.set(fileData.subarray(position, position + size), offset);
+        return size;
+      },
+
+      write: (stream, buffer, offset, length, position) => {
+        logCall("streamOps.write", { offset, length, position });
+        if (length <= 0) return 0;
+        const open = stream as CustomStream;
+        const bytes = buffer.subarray(offset, offset + length);
+        if (isPartial(open)) append(open, bytes, position);
+        else {
+          grow(open, position + length).set(bytes, position);
+          if (ranged)
+            open.changed = addRange(open.changed!, position, position + length);
+          else open.dirty = true;
+        }
+        Object.assign(stream.object as CustomNode, {
+          timestamp: Date.now(),
+          pendingSize: streamSize(open),
+        });
+        if (ranged && isFlushDue(open)) flush(open);
+        return length;
+      },
+
+      llseek: (stream, offset, whence) => {
+        logCall("streamOps.llseek", { offset, whence });
+        const position = offset + seekOrigin(stream, whence);
+        if (position < 0) throw new FS.ErrnoError(ERRNO_CODES["EINVAL"]);
+        return position;
+      },
+    };
+
   const seekOrigin = (stream: FS.FSStream, whence: number) => {
     if (whence === SEEK_CUR) return stream.position;
     if (whence === SEEK_END && FS.isFile(stream.object.mode))
-      return bytesOf(stream).length;
+      return streamSize(stream as CustomStream);
     return 0;
   };
 
@@ -409,6 +1100,9 @@ const methods = (
     nodeOps,
     streamOps,
     createNode,
+    invalidate,
+    takeChanges,
+    stats,
   };
 };
 
@@ -420,15 +1114,38 @@ export class EMFS implements Emscripten.FileSystemType {
     pyodide: PyodideAPI,
     custom: SyncFileSystem,
     log: boolean = false,
+    caching: Caching = {},
   ) {
     this.FS = pyodide.FS;
     this.methods = methods(
       pyodide as PyodideAPI & { FS: AdvancedEmscriptenFS },
       custom,
       log,
+      caching,
     );
   }
 
+  /**
+   * Drops what the worker learnt about the host's files: about the given paths,
+   * written as the mount sees them, or about all of them.
+   */
+  invalidate(paths?: string[]) {
+    this.methods.invalidate(paths);
+  }
+
+  /**
+   * The paths Python made, changed or removed through the mount since last
+   * asked, as the mount sees them, and whether each is a directory.
+   */
+  takeChanges() {
+    return this.methods.takeChanges();
+  }
+
+  /** How often the mount answered itself, and how often it asked the host. */
+  stats() {
+    return this.methods.stats();
+  }
+
   mount(_: FS.Mount) {
     return this.methods.createNode(null, "/", DIR_MODE);
   }
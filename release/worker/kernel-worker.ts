@@ -1,13 +1,16 @@
 import type { AsyncMemory } from "./async-memory";
 import {
   answering,
-  fileSystemMethods,
+  type Caching,
+  type CacheStats,
   type SyncFileSystem,
 } from "./emscripten-fs";
 import { WorkerBridge, type BridgeMessages } from "./bridge";
+import { defaultScratch, withScratch } from "./scratch-fs";
 import type { Patience } from "./channel";
 import { ObjectId, type ObjectProxyClient } from "./object-proxy";
-import { PyodideInstance } from "../pyodide/instance";
+import { PyodideInstance, defaultIndexURL } from "../pyodide/instance";
+import { cachingFetch } from "./package-cache";
 import type { Typed } from "../utils";
 import { make, type Output } from "../output";
 
@@ -37,21 +40,70 @@ export namespace Kernel {
        * @example /home/pyodide
        */
       root: string;
+      /** Which filesystem methods the host answers, optional ones included. */
+      fsMethods: (keyof SyncFileSystem)[];
+      /**
+       * Whether the host reports every change it makes to the filesystem, so
+       * what the worker knows about the files can outlive a run.
+       */
+      reportsChanges?: boolean;
+      /** An Origin Private File System directory to mount instead. */
+      opfs?: string;
+      /** Patterns for the paths kept in the worker instead of the host. */
+      scratch?: string[];
+      /** Whether Python is restored from a snapshot rather than started. */
+      snapshot?: boolean;
+      /** Packages to load while starting. */
+      preload?: string[];
+      /** Whether package files are kept in Cache Storage. */
+      packageCache?: boolean;
+      /** More filesystems, each answered on the bridge as its `target`. */
+      mounts?: {
+        root: string;
+        target: string;
+        fsMethods: (keyof SyncFileSystem)[];
+        caching: Caching;
+      }[];
     };
     run: Source & {
       unloadLocalModules?: boolean;
     };
     load: Source;
+    /** Forget what runs defined, and the local modules they imported. */
+    reset: {};
+    /** Start Python again in this worker, files and mounts as they were. */
+    restart: {};
+    changed: {
+      /** Paths within the root, or none to mean that anything may have. */
+      paths?: string[];
+      /** The root of the mount they are in, if not the main one. */
+      root?: string;
+    };
   };
 
   export type Responses = {
-    initialized: {};
+    initialized: {
+      /** When the worker began on the request, in ms since the epoch. */
+      began: number;
+      /** How long each phase of starting took, in milliseconds. */
+      timings: Record<string, number>;
+      /** Why Python could not be started, if it could not. */
+      failure?: string;
+    };
     kernel_initialized: {
       kernelId: string;
     };
-    loaded: {};
+    loaded: {
+      /** The local modules this run imports afresh, when it unloads them. */
+      reloaded?: string[];
+    };
     output: Output.Specific;
-    finished: {};
+    finished: {
+      /** How each mount's cache has fared, by the mount's root. */
+      mounts?: Record<string, CacheStats>;
+      /** Why a reset or restart failed, if it did. */
+      failure?: string;
+    };
   } & BridgeMessages;
 
   export type Request<T extends keyof Requests = keyof Requests> =
@@ -69,6 +121,9 @@ export namespace Kernel {
 
 const handler = {
   onInitialize: async (manager, data) => {
+    const began = performance.timeOrigin + performance.now();
+    if (data.packageCache ?? true)
+      self.fetch = cachingFetch({ indexURL: data.indexURL ?? defaultIndexURL });
     const bridge = new WorkerBridge(
       data.buffers,
       (message) => manager.postMessage(message),
@@ -77,25 +132,59 @@ const handler = {
 
     manager.proxy = bridge.objects;
     manager.input = (prompt) => bridge.calls.call("input", "prompt", prompt);
-    manager.syncFs = answering(
-      bridge.calls.facade<SyncFileSystem>("fs", [...fileSystemMethods]),
+    const scratch = data.scratch ?? defaultScratch;
+    const facade = (target: string, fsMethods: (keyof SyncFileSystem)[]) =>
+      withScratch(
+        answering(bridge.calls.facade<SyncFileSystem>(target, fsMethods)),
+        scratch,
+      );
+    manager.syncFs = facade("fs", data.fsMethods);
+    const mounts = (data.mounts ?? []).map(
+      ({ root, target, fsMethods, caching }) => ({
+        root,
+        caching,
+        fs: facade(target, fsMethods),
+      }),
     );
-    manager.pyodide = new PyodideInstance({
-      globalThisId: data.globalThisId,
-      interruptBuffer: bridge.memory.interrupter,
-      indexURL: data.indexURL,
-    });
+    manager.start = async () => {
+      const pyodide = new PyodideInstance({
+        globalThisId: data.globalThisId,
+        interruptBuffer: bridge.memory.interrupter,
+        indexURL: data.indexURL,
+        reportsChanges: data.reportsChanges,
+        snapshot: data.snapshot,
+        preload: data.preload,
+        mounts,
+      });
+      await pyodide.init(manager, data.root, data.opfs);
+      manager.pyodide = pyodide;
+    };
 
-    await manager.pyodide.init(manager, data.root);
-    manager.postMessage({ type: "initialized" });
+    try {
+      await manager.start();
+    } catch (e) {
+      return manager.postMessage({
+        type: "initialized",
+        began,
+        timings: {},
+        failure: (e as Error).message,
+      });
+    }
+    manager.postMessage({
+      type: "initialized",
+      began,
+      timings: manager.pyodide.timings,
+    });
   },
   onRun: async (manager, { code, file, unloadLocalModules }) => {
     let loaded = false;
     try {
       await manager.pyodide.load(code, file);
-      if (unloadLocalModules) await manager.pyodide.unloadLocalModules();
+      const reloaded = unloadLocalModules
+        ? manager.pyodide.unloadLocalModules()
+        : undefined;
       loaded = true;
-      manager.postMessage({ type: "loaded" });
+      manager.postMessage({ type: "loaded", reloaded });
       const value = await manager.pyodide.run(code, file);
       if (value) manager.output(value);
     } catch (e) {
@@ -108,7 +197,19 @@ const handler = {
       );
     } finally {
       if (!loaded) manager.postMessage({ type: "loaded" });
-      manager.postMessage({ type: "finished" });
+      await manager.pyodide.persist().catch((e: Error) =>
+        manager.output(
+          make("error", {
+            ename: "PersistError",
+            evalue: e.message,
+            traceback: e.stack ? e.stack.split("\n") : [],
+          }),
+        ),
+      );
+      manager.postMessage({
+        type: "finished",
+        mounts: manager.pyodide.mountStats(),
+      });
     }
   },
   onLoad: async (manager, { code, file }) => {
@@ -123,9 +224,55 @@ const handler = {
         }),
       );
     } finally {
+      await manager.pyodide.persist().catch((e: Error) =>
+        manager.output(
+          make("error", {
+            ename: "PersistError",
+            evalue: e.message,
+            traceback: e.stack ? e.stack.split("\n") : [],
+          }),
+        ),
+      );
       manager.postMessage({ type: "loaded" });
     }
   },
+  onReset: async (manager) => {
+    let failure: string | undefined;
+    try {
+      await manager.pyodide.reset();
+    } catch (e) {
+      failure = (e as Error).message;
+      manager.output(
+        make("error", {
+          ename: "ResetError",
+          evalue: (e as Error).message,
+          traceback: (e as Error).stack ? (e as Error).stack!.split("\n") : [],
+        }),
+      );
+    } finally {
+      manager.postMessage({ type: "finished", failure });
+    }
+  },
+  onRestart: async (manager) => {
+    let failure: string | undefined;
+    try {
+      await manager.pyodide.close();
+      await manager.start();
+    } catch (e) {
+      failure = (e as Error).message;
+      manager.output(
+        make("error", {
+          ename: "RestartError",
+          evalue: (e as Error).message,
+          traceback: (e as Error).stack ? (e as Error).stack!.split("\n") : [],
+        }),
+      );
+    } finally {
+      manager.postMessage({ type: "finished", failure });
+    }
+  },
+  onChanged: (manager, { paths, root }) =>
+    manager.pyodide.changed(paths, root),
 } satisfies Kernel.RequestHandler;
 
 const handle = (manager: Kernel, msg: Kernel.Request) => {
@@ -146,6 +293,8 @@ export class Kernel {
   input!: (prompt: string) => string;
   syncFs!: SyncFileSystem;
   pyodide!: PyodideInstance;
+  /** Starts Python as the initialize message asked, replacing what ran. */
+  start!: () => Promise<void>;
   /** END: Properties set by the initialize message */
 
   constructor() {
@@ -0,0 +1,739 @@
+/// <reference types="emscripten" />
+
+import type { PyodideAPI } from "pyodide";
+import { resizeBytes } from "../contents";
+import {
+  DIR_MODE,
+  FILE_MODE,
+  SEEK_CUR,
+  SEEK_END,
+  namesTo,
+  type AdvancedEmscriptenFS,
+} from "./emscripten-fs";
+
+/** What reading and writing a file needs, whether it is on disk yet or not. */
+type Access = Pick<
+  FileSystemSyncAccessHandle,
+  "read" | "write" | "truncate" | "getSize" | "flush" | "close"
+>;
+
+/** A file opened ahead of time, for a new file too large to hold in memory. */
+type Spare = {
+  handle: FileSystemFileHandle;
+  access: FileSystemSyncAccessHandle;
+};
+
+/**
+ * How large a new file grows in memory before it is moved to a spare file, as
+ * emscripten's mounts send an open file on once it holds this much.
+ */
+const SPILL_BYTES = 1024 * 1024;
+
+/** How many spare files are kept open, for the runs that make large files. */
+const SPARE_FILES = 2;
+
+/**
+ * A file Python created during a run. Creating one in OPFS takes a promise, so
+ * it is held in memory, or in a spare file once it grows large, until the run
+ * is over and it is put in place. A kernel terminated mid run loses it.
+ */
+class NewFileAccess implements Access {
+  private bytes = new Uint8Array();
+  private size = 0;
+  /** Where the file is written once it has grown large, if a spare was free. */
+  spare?: Spare;
+
+  constructor(private readonly takeSpare: () => Spare | undefined) {}
+
+  read(buffer: AllowSharedBufferSource, { at = 0 } = {}) {
+    if (this.spare) return this.spare.access.read(buffer, { at });
+    const target = viewOf(buffer);
+    const read = Math.max(Math.min(target.length, this.size - at), 0);
+    target.set(this.bytes.subarray(at, at + read));
+    return read;
+  }
+
+  write(buffer: AllowSharedBufferSource, { at = 0 } = {}) {
+    if (this.spare) return this.spare.access.write(buffer, { at });
+    const source = viewOf(buffer);
+    const end = at + source.length;
+    const capacity = this.bytes.length;
+    if (end > capacity)
+      this.bytes = resizeBytes(this.bytes, Math.max(end, capacity * 2));
+    this.bytes.set(source, at);
+    this.size = Math.max(this.size, end);
+    this.spill();
+    return source.length;
+  }
+
+  truncate(size: number) {
+    if (this.spare) return this.spare.access.truncate(size);
+    if (size > this.bytes.length) this.bytes = resizeBytes(this.bytes, size);
+    else this.bytes.fill(0, size);
+    this.size = size;
+    this.spill();
+  }
+
+  getSize() {
+    return this.spare ? this.spare.access.getSize() : this.size;
+  }
+
+  flush() {
+    this.spare?.access.flush();
+  }
+
+  close() {}
+
+  contents() {
+    return this.bytes.subarray(0, this.size);
+  }
+
+  /** Moves what is held to a spare file, once there is enough of it. */
+  private spill() {
+    if (this.size < SPILL_BYTES) return;
+    const spare = this.takeSpare();
+    if (!spare) return;
+    spare.access.truncate(0);
+    spare.access.write(this.contents(), { at: 0 });
+    this.spare = spare;
+    this.bytes = new Uint8Array();
+    this.size = 0;
+  }
+}
+
+const viewOf = (buffer: AllowSharedBufferSource) =>
+  ArrayBuffer.isView(buffer)
+    ? new Uint8Array(buffer.buffer, buffer.byteOffset, buffer.byteLength)
+    : new Uint8Array(buffer);
+
+/**
+ * A file or directory, shared by every node emscripten makes for it. Nodes are
+ * cached by name, so what a node refers to is updated in place rather than
+ * replaced when the tree is read again.
+ */
+type Stored = {
+  timestamp: number;
+  /** Set once the path is no longer there. */
+  gone?: boolean;
+} & (
+  | { directory: true; contents: Map<string, Stored> }
+  | {
+      directory: false;
+      /** Unset until the file is opened, or when it could not be. */
+      access?: Access;
+      /** Unset for a file made during the run, which is not in OPFS yet. */
+      handle?: FileSystemFileHandle;
+      size: number;
+    }
+);
+
+type StoredFile = Stored & { directory: false };
+type StoredDirectory = Stored & { directory: true };
+
+/**
+ * What Python did to the tree, to be done to OPFS once the run is over. Each
+ * step is replayed as it happened, so a file made, renamed and removed again
+ * ends up as Python left it.
+ */
+type Step =
+  | { kind: "mkdir"; path: string[] }
+  | { kind: "create"; path: string[]; file: StoredFile }
+  | { kind: "remove"; path: string[]; stored: Stored }
+  | { kind: "move"; from: string[]; to: string[]; stored: Stored };
+
+type OPFSNode = FS.FSNode & { stored: Stored };
+
+const O_TRUNC = 512;
+
+/** Where spare files are kept, at the top of the origin's private files. */
+const SPARE_DIRECTORY = "python-web-kernel-spare";
+
+const isMissing = (error: unknown) =>
+  error instanceof DOMException && error.name === "NotFoundError";
+
+const directoryAt = async (
+  root: FileSystemDirectoryHandle,
+  path: string[],
+  create = false,
+) => {
+  let directory = root;
+  for (const name of path)
+    directory = await directory.getDirectoryHandle(name, { create });
+  return directory;
+};
+
+const parentAndName = (
+  root: FileSystemDirectoryHandle,
+  path: string[],
+  create = false,
+) =>
+  directoryAt(root, path.slice(0, -1), create).then(
+    (parent) => [parent, path.at(-1)!] as const,
+  );
+
+/** Writes bytes to a file in OPFS, replacing what it held. */
+const writeFile = async (file: FileSystemFileHandle, bytes: Uint8Array) => {
+  const access = await file.createSyncAccessHandle();
+  try {
+    access.truncate(0);
+    access.write(bytes, { at: 0 });
+    access.flush();
+  } finally {
+    access.close();
+  }
+};
+
+/** Copies a file or directory to a new place, for browsers without `move`. */
+const copy = async (
+  from: FileSystemHandle,
+  parent: FileSystemDirectoryHandle,
+  name: string,
+): Promise<void> => {
+  if (from.kind === "file") {
+    const file = await (from as FileSystemFileHandle).getFile();
+    const target = await parent.getFileHandle(name, { create: true });
+    return writeFile(target, new Uint8Array(await file.arrayBuffer()));
+  }
+  const target = await parent.getDirectoryHandle(name, { create: true });
+  for await (const [child, handle] of (
+    from as FileSystemDirectoryHandle
+  ).entries())
+    await copy(handle, target, child);
+};
+
+const handleAt = async (root: FileSystemDirectoryHandle, path: string[]) => {
+  const parent = await directoryAt(root, path.slice(0, -1));
+  const name = path.at(-1)!;
+  return parent
+    .getFileHandle(name)
+    .catch(() => parent.getDirectoryHandle(name));
+};
+
+/** Whatever is missing was removed already, by Python or by the page. */
+const removeAt = async (root: FileSystemDirectoryHandle, path: string[]) => {
+  try {
+    const [parent, name] = await parentAndName(root, path);
+    await parent.removeEntry(name, { recursive: true });
+  } catch (error) {
+    if (!isMissing(error)) throw error;
+  }
+};
+
+type Movable = FileSystemHandle & {
+  move?: (parent: FileSystemDirectoryHandle, name: string) => Promise<void>;
+};
+
+const moveAt = async (
+  root: FileSystemDirectoryHandle,
+  from: string[],
+  to: string[],
+) => {
+  try {
+    const handle = await handleAt(root, from);
+    await removeAt(root, to);
+    const [parent, name] = await parentAndName(root, to);
+    const movable = handle as Movable;
+    if (handle.kind === "file" && movable.move)
+      return await movable.move(parent, name);
+    await copy(handle, parent, name);
+    await removeAt(root, from);
+  } catch (error) {
+    if (!isMissing(error)) throw error;
+  }
+};
+
+/**
+ * A directory of the Origin Private File System, mounted in the worker itself.
+ *
+ * Files are opened with synchronous access handles by `prepare`, all at once,
+ * before the first run that finds them closed, and kept open from one run to
+ * the next. So Python reads, writes and truncates files in place, at any
+ * offset, without the page and without holding a file in memory. Making,
+ * renaming and removing paths needs promises in OPFS, so those are done in the
+ * worker's own tree during a run and carried out by `persist` once it is over.
+ *
+ * The handles lock their files: the page can read the directory, but cannot
+ * write to a file in it until told of a change with `changed`, or until the
+ * mount is closed. A file another kernel holds open cannot be opened here, and
+ * fails with EBUSY when Python opens it.
+ */
+export class OPFS implements Emscripten.FileSystemType {
+  private readonly root: StoredDirectory = {
+    directory: true,
+    contents: new Map(),
+    timestamp: Date.now(),
+  };
+  /** Every handle open, including those of files since removed. */
+  private readonly handles = new Set<FileSystemSyncAccessHandle>();
+  private steps: Step[] = [];
+  /** Whether the directory has to be read again before the next run. */
+  private stale = false;
+  private spares: Spare[] = [];
+  /** Whether spare files left behind by closed kernels were cleared yet. */
+  private cleared = false;
+  readonly methods: ReturnType<OPFS["operations"]>;
+
+  private constructor(
+    pyodide: PyodideAPI,
+    readonly directory: FileSystemDirectoryHandle,
+    /** Where spare files are kept, outside the mounted directory. */
+    private readonly spareDirectory?: FileSystemDirectoryHandle,
+  ) {
+    this.methods = this.operations(
+      pyodide as PyodideAPI & { FS: AdvancedEmscriptenFS },
+    );
+  }
+
+  /**
+   * Reads a directory, leaving its files closed until a run starts. Without a
+   * directory for spare files, new files are held in memory however large.
+   */
+  static async open(
+    pyodide: PyodideAPI,
+    directory: FileSystemDirectoryHandle,
+    spares?: FileSystemDirectoryHandle,
+  ) {
+    const opfs = new OPFS(pyodide, directory, spares);
+    await opfs.read(directory, opfs.root);
+    return opfs;
+  }
+
+  /** The directory of that name at the top of the origin's private files. */
+  static async named(pyodide: PyodideAPI, name: string) {
+    const top = await navigator.storage.getDirectory();
+    const [directory, spares] = await Promise.all([
+      top.getDirectoryHandle(name, { create: true }),
+      top.getDirectoryHandle(SPARE_DIRECTORY, { create: true }),
+    ]);
+    return OPFS.open(pyodide, directory, spares);
+  }
+
+  mount(_: FS.Mount) {
+    return this.methods.createNode(null, "/", DIR_MODE, this.root);
+  }
+
+  syncfs(
+    mount: FS.Mount,
+    populate: () => unknown,
+    done: (err?: number | null) => unknown,
+  ): void {
+    console.warn("OPFS syncfs called, but not implemented.");
+    return;
+  }
+
+  /**
+   * Reads the directory again if told it changed, and opens the files not open
+   * yet and the spare files, for the run about to start.
+   */
+  async prepare() {
+    if (this.stale) {
+      this.stale = false;
+      await this.read(this.directory, this.root);
+    }
+    await Promise.all([this.openAll(), this.keepSpares()]);
+  }
+
+  /** Opens every closed file at once. One that cannot be opened stays shut. */
+  private async openAll() {
+    const closed: StoredFile[] = [];
+    const collect = (directory: StoredDirectory) => {
+      for (const stored of directory.contents.values())
+        if (stored.directory) collect(stored);
+        else if (!stored.access && stored.handle) closed.push(stored);
+    };
+    collect(this.root);
+    await Promise.all(
+      closed.map(async (stored) => {
+        try {
+          const access = await stored.handle!.createSyncAccessHandle();
+          this.handles.add(access);
+          stored.access = access;
+        } catch (error) {
+          console.warn("Could not open a file in OPFS", error);
+        }
+      }),
+    );
+  }
+
+  /** Keeps spare files open, clearing those of kernels since closed first. */
+  private async keepSpares() {
+    const directory = this.spareDirectory;
+    if (!directory) return;
+    try {
+      if (!this.cleared) {
+        this.cleared = true;
+        const names: string[] = [];
+        for await (const [name] of directory.entries()) names.push(name);
+        await Promise.all(
+          names.map((name) => directory.removeEntry(name).catch(() => {})),
+        );
+      }
+      const missing = SPARE_FILES - this.spares.length;
+      const made = await Promise.all(
+        Array.from({ length: missing }, async () => {
+          const name = crypto.randomUUID();
+          const handle = await directory.getFileHandle(name, { create: true });
+          return { handle, access: await handle.createSyncAccessHandle() };
+        }),
+      );
+      this.spares.push(...made);
+    } catch (error) {
+      console.warn("Could not open spare files in OPFS", error);
+    }
+  }
+
+  /**
+   * The page changed these paths, relative to the mount, or any path. The
+   * files named are closed, so that the page can write to them, and the
+   * directory is read again before the next run, reopening them.
+   */
+  changed(paths?: string[]) {
+    this.stale = true;
+    for (const path of paths ?? []) {
+      let stored: Stored | undefined = this.root;
+      for (const name of path.split("/").filter(Boolean))
+        stored = stored?.directory ? stored.contents.get(name) : undefined;
+      if (stored) this.release(stored);
+    }
+  }
+
+  /** Closes the files of a file or directory, which stay closed until found. */
+  private release(stored: Stored) {
+    if (stored.directory) {
+      for (const child of stored.contents.values()) this.release(child);
+      return;
+    }
+    const { access } = stored;
+    if (access instanceof NewFileAccess || !access) return;
+    access.close();
+    this.handles.delete(access as FileSystemSyncAccessHandle);
+    stored.access = undefined;
+  }
+
+  /**
+   * Carries out what Python made, renamed and removed. Files stay open, but
+   * for those moved, which are found again before the next run.
+   */
+  async persist() {
+    const steps = this.steps;
+    this.steps = [];
+    for (const step of steps) await this.carryOut(step);
+  }
+
+  /**
+   * Carries out what Python made, renamed and removed and closes every file,
+   * for a mount about to be replaced.
+   */
+  async close() {
+    await this.persist();
+    this.release(this.root);
+    for (const handle of this.handles) handle.close();
+    this.handles.clear();
+    const spares = this.spares.splice(0);
+    for (const { access } of spares) access.close();
+    await Promise.all(
+      spares.map(({ handle }) =>
+        this.spareDirectory?.removeEntry(handle.name).catch(() => {}),
+      ),
+    );
+  }
+
+  private async carryOut(step: Step) {
+    const root = this.directory;
+    switch (step.kind) {
+      case "mkdir":
+        return void (await directoryAt(root, step.path, true));
+      case "create": {
+        const [parent, name] = await parentAndName(root, step.path, true);
+        const { file } = step;
+        if (file.access instanceof NewFileAccess)
+          Object.assign(file, {
+            size: file.access.getSize(),
+            handle: await this.place(file.access, parent, name),
+            access: undefined,
+          });
+        return;
+      }
+      case "remove":
+        this.release(step.stored);
+        return removeAt(root, step.path);
+      case "move":
+        this.release(step.stored);
+        this.stale = true;
+        return moveAt(root, step.from, step.to);
+    }
+  }
+
+  /** Puts a new file in OPFS, moving its spare there if it had to take one. */
+  private async place(
+    access: NewFileAccess,
+    parent: FileSystemDirectoryHandle,
+    name: string,
+  ) {
+    const { spare } = access;
+    if (!spare) {
+      const file = await parent.getFileHandle(name, { create: true });
+      await writeFile(file, access.contents());
+      return file;
+    }
+    spare.access.flush();
+    spare.access.close();
+    const movable = spare.handle as Movable;
+    await removeAt(parent, [name]);
+    if (movable.move) {
+      await movable.move(parent, name);
+      return spare.handle;
+    }
+    await copy(spare.handle, parent, name);
+    await this.spareDirectory!.removeEntry(spare.handle.name);
+    return parent.getFileHandle(name);
+  }
+
+  /** Brings a directory's tree in line with OPFS, keeping what it can. */
+  private async read(
+    handle: FileSystemDirectoryHandle,
+    directory: StoredDirectory,
+  ) {
+    const found = new Set<string>();
+    for await (const [name, child] of handle.entries()) {
+      found.add(name);
+      const known = directory.contents.get(name);
+      const kept =
+        known && known.directory === (child.kind === "directory")
+          ? known
+          : undefined;
+      if (known && !kept) {
+        this.release(known);
+        known.gone = true;
+      }
+      if (child.kind === "directory") {
+        const stored: StoredDirectory = (kept as StoredDirectory) ?? {
+          directory: true,
+          contents: new Map(),
+          timestamp: Date.now(),
+        };
+        directory.contents.set(name, stored);
+        await this.read(child as FileSystemDirectoryHandle, stored);
+      } else if (!(kept as StoredFile | undefined)?.access) {
+        // An open file is locked, so cannot have changed behind the mount.
+        const file = child as FileSystemFileHandle;
+        const { size } = await file.getFile();
+        if (kept) Object.assign(kept, { handle: file, size });
+        else
+          directory.contents.set(name, {
+            directory: false,
+            handle: file,
+            size,
+            timestamp: Date.now(),
+          });
+      }
+    }
+    for (const [name, stored] of directory.contents)
+      if (!found.has(name)) {
+        this.release(stored);
+        stored.gone = true;
+        directory.contents.delete(name);
+      }
+  }
+
+  private operations({
+    FS,
+    ERRNO_CODES,
+  }: Pick<PyodideAPI, "FS" | "ERRNO_CODES"> & { FS: AdvancedEmscriptenFS }) {
+    const fail = (code: string): never => {
+      throw new FS.ErrnoError(ERRNO_CODES[code]);
+    };
+
+    const storedOf = (node: FS.FSNode) => {
+      const { stored } = node as OPFSNode;
+      if (stored.gone) fail("ENOENT");
+      return stored;
+    };
+
+    const fileOf = (node: FS.FSNode) => {
+      const stored = storedOf(node);
+      return stored.directory ? fail("EISDIR") : stored;
+    };
+
+    /** What a run reads and writes the file through. */
+    const accessOf = (node: FS.FSNode) =>
+      fileOf(node).access ?? fail("EBUSY");
+
+    const contentsOf = (node: FS.FSNode) => {
+      const stored = storedOf(node);
+      return stored.directory ? stored.contents : fail("ENOTDIR");
+    };
+
+    const createNode = (
+      parent: FS.FSNode | null,
+      name: string,
+      mode: number,
+      stored: Stored,
+    ) => {
+      const node = FS.createNode(parent, name, mode, 0) as OPFSNode & {
+        node_ops: FS.NodeOps;
+        stream_ops: FS.StreamOps;
+      };
+      node.stored = stored;
+      node.node_ops = nodeOps;
+      node.stream_ops = streamOps;
+      return node;
+    };
+
+    const nodeOps: FS.NodeOps = {
+      getattr: (node) => {
+        const stored = storedOf(node);
+        const time = new Date(stored.timestamp);
+        return {
+          dev: 1,
+          rdev: 1,
+          ino: node.id,
+          mode: node.mode,
+          nlink: 1,
+          uid: 0,
+          gid: 0,
+          size: stored.directory
+            ? 0
+            : (stored.access?.getSize() ?? stored.size),
+          atime: time,
+          mtime: time,
+          ctime: time,
+          blksize: 4096,
+          blocks: 0,
+        };
+      },
+
+      setattr: (node, attr) => {
+        if (!attr) return;
+        if (attr.mode !== undefined) node.mode = attr.mode;
+        if (attr.size !== undefined) accessOf(node).truncate(attr.size);
+        if (attr.timestamp !== undefined)
+          storedOf(node).timestamp = attr.timestamp;
+      },
+
+      lookup: (parent, name) => {
+        const stored = contentsOf(parent).get(name) ?? fail("ENOENT");
+        const mode = stored.directory ? DIR_MODE : FILE_MODE;
+        return createNode(parent, name, mode, stored);
+      },
+
+      mknod: (parent, name, mode) => {
+        const timestamp = Date.now();
+        const stored: Stored = FS.isDir(mode)
+          ? { directory: true, contents: new Map(), timestamp }
+          : {
+              directory: false,
+              access: new NewFileAccess(() => this.spares.shift()),
+              size: 0,
+              timestamp,
+            };
+        contentsOf(parent).set(name, stored);
+        const path = namesTo(parent, name);
+        this.steps.push(
+          stored.directory
+            ? { kind: "mkdir", path }
+            : { kind: "create", path, file: stored },
+        );
+        return createNode(parent, name, mode, stored);
+      },
+
+      rename: (node, newDir, newName) => {
+        const from = contentsOf(node.parent);
+        const to = contentsOf(newDir);
+        const replaced = to.get(newName);
+        if (replaced?.directory && replaced.contents.size > 0)
+          fail("ENOTEMPTY");
+        if (replaced && replaced !== node.stored) replaced.gone = true;
+        from.delete(node.name);
+        to.set(newName, storedOf(node));
+        this.steps.push({
+          kind: "move",
+          from: namesTo(node),
+          to: namesTo(newDir, newName),
+          stored: storedOf(node),
+        });
+        node.name = newName;
+      },
+
+      unlink: (parent, name) => {
+        const contents = contentsOf(parent);
+        const stored = contents.get(name) ?? fail("ENOENT");
+        stored.gone = true;
+        contents.delete(name);
+        this.steps.push({
+          kind: "remove",
+          path: namesTo(parent, name),
+          stored,
+        });
+      },
+
+      rmdir: (parent, name) => {
+        const contents = contentsOf(parent);
+        const stored = contents.get(name) ?? fail("ENOENT");
+        if (stored.directory && stored.contents.size > 0) fail("ENOTEMPTY");
+        stored.gone = true;
+        contents.delete(name);
+        this.steps.push({
+          kind: "remove",
+          path: namesTo(parent, name),
+          stored,
+        });
+      },
+
+      readdir: (node) => [".", "..", ...contentsOf(node).keys()],
+
+      symlink: () => fail("EPERM"),
+
+      readlink: () => fail("EPERM"),
+    };
+
+    const streamOps: FS.StreamOps & {
+      fsync: (stream: FS.FSStream) => number;
+    } = {
+      open: (stream) => {
+        if (FS.isFile(stream.object.mode) && stream.flags & O_TRUNC)
+          accessOf(stream.object).truncate(0);
+      },
+
+      close: (stream) => {
+        if (FS.isFile(stream.object.mode) && !storedOf(stream.object).gone)
+          fileOf(stream.object).access?.flush();
+      },
+
+      fsync: (stream) => {
+        accessOf(stream.object).flush();
+        return 0;
+      },
+
+      read: (stream, buffer, offset, length, position) =>
+        length <= 0
+          ? 0
+          : accessOf(stream.object).read(
+              buffer.subarray(offset, offset + length),
+              { at: position },
+            ),
+
+      write: (stream, buffer, offset, length, position) => {
+        if (length <= 0) return 0;
+        const access = accessOf(stream.object);
+        fileOf(stream.object).timestamp = Date.now();
+        return access.write(buffer.subarray(offset, offset + length), {
+          at: position,
+        });
+      },
+
+      llseek: (stream, offset, whence) => {
+        const origin =
+          whence === SEEK_CUR
+            ? stream.position
+            : whence === SEEK_END && FS.isFile(stream.object.mode)
+              ? accessOf(stream.object).getSize()
+              : 0;
+        const position = origin + offset;
+        return position < 0 ? fail("EINVAL") : position;
+      },
+    };
+
+    return { createNode, nodeOps, streamOps };
+  }
+}
@@ -0,0 +1,154 @@
+import { absolute, lockfileOf, type Lockfile } from "../prefetch";
+
+export namespace PackageCache {
+  export type Options = {
+    /** Where Pyodide, and the packages its lock file lists, are served. */
+    indexURL: string;
+    /** What fetches what is not cached, taken when the cache is made. */
+    fetch?: typeof fetch;
+    /** Where packages are kept; none means nothing is. */
+    caches?: CacheStorage;
+    /** Keeps workers from fetching one file at once; without, they may. */
+    locks?: LockManager;
+  };
+}
+
+const prefix = "python-web-kernel-packages/";
+
+/** Where each cache keeps when a worker last opened it. */
+const usedURL = "https://python-web-kernel.invalid/used";
+
+/** A cache of another `indexURL` unopened for this long is deleted. */
+const UNUSED_MS = 30 * 24 * 60 * 60 * 1000;
+
+const hex = (buffer: ArrayBuffer) =>
+  [...new Uint8Array(buffer)]
+    .map((byte) => byte.toString(16).padStart(2, "0"))
+    .join("");
+
+const sha256 = async (data: ArrayBuffer | string) =>
+  hex(
+    await crypto.subtle.digest(
+      "SHA-256",
+      typeof data === "string" ? new TextEncoder().encode(data) : data,
+    ),
+  );
+
+const lastUsed = async (caches: CacheStorage, name: string) => {
+  const cache = await caches.open(name);
+  const used = await cache.match(usedURL).catch(() => undefined);
+  return Number(await used?.text()) || 0;
+};
+
+/**
+ * Deletes the caches of this `indexURL`'s other lock files, and those of any
+ * other `indexURL` no worker has opened for `UNUSED_MS`. Pages of the origin
+ * served another Pyodide keep theirs while they are in use.
+ */
+const prune = async (caches: CacheStorage, name: string, ours: string) => {
+  for (const other of await caches.keys()) {
+    if (!other.startsWith(prefix) || other === name) continue;
+    const stale =
+      other.startsWith(ours) ||
+      Date.now() - (await lastUsed(caches, other)) > UNUSED_MS;
+    if (stale) await caches.delete(other);
+  }
+};
+
+const urlOf = (input: RequestInfo | URL) =>
+  input instanceof Request ? input.url : String(input);
+
+/** A wheel from anywhere, `micropip` included, never changes under its URL. */
+const isWheel = (url: string) => new URL(url).pathname.endsWith(".whl");
+
+/**
+ * A `fetch` that keeps package files in Cache Storage, shared by every kernel
+ * of the origin in every tab, so each is downloaded once per Pyodide version.
+ * Pyodide's runtime files are left to the HTTP cache, which also keeps their
+ * compiled code.
+ *
+ * The cache is named after the `indexURL` and its lock file. Those of the same
+ * `indexURL` named after another lock file are deleted, and those of another
+ * `indexURL` once no worker has opened them for a month.
+ *
+ * A file the lock file lists is checked against its `sha256` both before it
+ * is kept and when it is read back. Workers take turns at each file, so one
+ * downloads it and the others read what it kept.
+ */
+export const cachingFetch = ({
+  indexURL,
+  fetch: request = globalThis.fetch.bind(globalThis),
+  caches = globalThis.caches,
+  locks = globalThis.navigator?.locks,
+}: PackageCache.Options) => {
+  const index = absolute(indexURL).href;
+
+  let opened:
+    | Promise<{ cache?: Cache; hashes: Map<string, string | undefined> }>
+    | undefined;
+
+  /** The lock file is read the first time a package is asked for. */
+  const open = () =>
+    (opened ??= lockfileOf(indexURL, request).then(
+      async (lockfile: Lockfile) => {
+        const hashes = new Map(
+          Object.values(lockfile.packages).map(({ file_name, sha256 }) => [
+            new URL(file_name, index).href,
+            sha256,
+          ]),
+        );
+        if (!caches) return { hashes };
+        const ours = `${prefix}${await sha256(index)}/`;
+        const name = ours + (await sha256(JSON.stringify(lockfile)));
+        await prune(caches, name, ours);
+        const cache = await caches.open(name);
+        await cache
+          .put(usedURL, new Response(String(Date.now())))
+          .catch(() => undefined);
+        return { cache, hashes };
+      },
+      () => ({ hashes: new Map<string, string | undefined>() }),
+    ));
+
+  const matches = async (bytes: ArrayBuffer, expected?: string) =>
+    expected === undefined || (await sha256(bytes)) === expected;
+
+  const cachedOrFetched = async (
+    url: string,
+    input: RequestInfo | URL,
+    init: RequestInit | undefined,
+    { cache, hashes }: Awaited<ReturnType<typeof open>>,
+  ) => {
+    const expected = hashes.get(url);
+    const kept = await cache?.match(url).catch(() => undefined);
+    if (kept) {
+      const bytes = await kept.arrayBuffer();
+      if (await matches(bytes, expected))
+        return new Response(bytes, { headers: kept.headers });
+      await cache!.delete(url);
+    }
+    const response = await request(input, init);
+    if (!cache || response.status !== 200) return response;
+    const bytes = await response.arrayBuffer();
+    if (!(await matches(bytes, expected)))
+      throw new TypeError(`${url} does not match its sha256 in the lock file`);
+    const { headers, status, statusText } = response;
+    await cache
+      .put(url, new Response(bytes, { headers }))
+      .catch((error) => console.warn(`Could not keep ${url}`, error));
+    return new Response(bytes, { headers, status, statusText });
+  };
+
+  return async (
+    input: RequestInfo | URL,
+    init?: RequestInit,
+  ): Promise<Response> => {
+    const url = new URL(urlOf(input), globalThis.location?.href).href;
+    const underIndex = url.startsWith(index);
+    if (!underIndex && !isWheel(url)) return request(input, init);
+    const state = await open();
+    if (underIndex && !state.hashes.has(url)) return request(input, init);
+    const work = () => cachedOrFetched(url, input, init, state);
+    return locks ? locks.request(prefix + url, work) : work();
+  };
+};
@@ -0,0 +1,203 @@
+import { contents, resizeBytes } from "../contents";
+import { MemoryFiles } from "../memory-fs";
+import type { SyncResult } from "../utils";
+import type { Listing, SyncFileSystem } from "./emscripten-fs";
+
+/** Only compiled bytecode stays in the worker unless told otherwise. */
+export const defaultScratch = ["__pycache__"];
+
+const escaped = (text: string) => text.replace(/[.+^${}()|[\]\\]/g, "\\$&");
+
+/** `*` and `?` match within a name, and `**` across names. */
+const globToRegExp = (glob: string) =>
+  new RegExp(
+    `^${glob
+      .split(/(\*\*|\*|\?)/)
+      .map((part) =>
+        part === "**"
+          ? ".*"
+          : part === "*"
+            ? "[^/]*"
+            : part === "?"
+              ? "[^/]"
+              : escaped(part),
+      )
+      .join("")}$`,
+  );
+
+const segmentsOf = (path: string) => path.split("/").filter(Boolean);
+
+/**
+ * Whether a path is scratch. A pattern without a slash matches a name
+ * anywhere, `__pycache__` or `*.tmp`; one with a slash matches from the root,
+ * `output/*`. Everything under a match is scratch too.
+ */
+export const scratchMatcher = (patterns: string[]) => {
+  const names = patterns
+    .filter((pattern) => !pattern.includes("/"))
+    .map(globToRegExp);
+  const paths = patterns
+    .filter((pattern) => pattern.includes("/"))
+    .map((pattern) => globToRegExp(segmentsOf(pattern).join("/")));
+  return (path: string) => {
+    const segments = segmentsOf(path);
+    return segments.some(
+      (segment, index) =>
+        names.some((name) => name.test(segment)) ||
+        paths.some((pattern) =>
+          pattern.test(segments.slice(0, index + 1).join("/")),
+        ),
+    );
+  };
+};
+
+const ok = <T>(data: T): SyncResult<T> => ({ ok: true, data });
+
+const notFound = (path: string): SyncResult<never> => ({
+  ok: false,
+  status: 404,
+  error: new Error(`${path} is not in scratch`),
+});
+
+const found = <T>(data: T | undefined, path: string) =>
+  data === undefined ? notFound(path) : ok(data);
+
+/** Names from both layers, each once, the host's first. */
+const merged = (host: string[], local: string[] = []) => [
+  ...new Set([...host, ...local]),
+];
+
+const mergedListings = (host: Listing[], local: Listing[] = []) => {
+  const names = new Set(host.map(({ name }) => name));
+  return [...host, ...local.filter(({ name }) => !names.has(name))];
+};
+
+/**
+ * A filesystem whose scratch paths are kept in the worker, in memory, and
+ * never reach the host: compiled bytecode, temporary output and the like.
+ * Each would otherwise cost a blocking round trip per file made, written and
+ * removed, for something nobody reads again.
+ *
+ * Everything else is passed on to the host. Listings show both, so Python
+ * sees one tree. Scratch files last as long as the kernel does.
+ */
+export const withScratch = (
+  host: SyncFileSystem,
+  patterns: string[],
+): SyncFileSystem => {
+  if (patterns.length === 0) return host;
+  const isScratch = scratchMatcher(patterns);
+  const local = new MemoryFiles();
+
+  const bytesAt = (path: string) =>
+    contents.toBytes(local.get(path) ?? new Uint8Array());
+
+  /** Copies a file or a tree from one layer to the other. */
+  const copy = (
+    from: SyncFileSystem,
+    to: SyncFileSystem,
+    path: string,
+    newPath: string,
+  ): SyncResult<undefined> => {
+    const value = from.get({ path });
+    if (!value.ok) return value;
+    const made = to.put({ path: newPath, value: value.data });
+    if (!made.ok || value.data !== null) return made;
+    const names = from.listDirectory({ path });
+    if (!names.ok) return names;
+    for (const name of names.data) {
+      const copied = copy(from, to, `${path}/${name}`, `${newPath}/${name}`);
+      if (!copied.ok) return copied;
+    }
+    return ok(undefined);
+  };
+
+  const scratch: SyncFileSystem = {
+    get: ({ path }) =>
+      local.isDirectory(path) ? ok(null) : found(local.get(path), path),
+    stat: ({ path }) => found(local.stat(path), path),
+    put: ({ path, value }) => {
+      if (value === null) local.mkdir(path);
+      else local.set(path, value);
+      return ok(undefined);
+    },
+    delete: ({ path }) => (local.delete(path), ok(undefined)),
+    move: ({ path, newPath }) => (local.move(path, newPath), ok(undefined)),
+    listDirectory: ({ path }) => found(local.list(path), path),
+  };
+
+  const layerOf = (path: string) => (isScratch(path) ? scratch : host);
+
+  const fs: SyncFileSystem = {
+    get: (opts) => layerOf(opts.path).get(opts),
+    stat: (opts) => layerOf(opts.path).stat(opts),
+    put: (opts) => layerOf(opts.path).put(opts),
+    delete: (opts) => {
+      if (isScratch(opts.path)) return scratch.delete(opts);
+      local.delete(opts.path);
+      return host.delete(opts);
+    },
+    move: (opts) => {
+      const { path, newPath } = opts;
+      const [from, to] = [layerOf(path), layerOf(newPath)];
+      if (from === to && to === scratch) return scratch.move(opts);
+      if (from === to) {
+        if (local.has(path)) local.move(path, newPath);
+        return host.move(opts);
+      }
+      const copied = copy(from, to, path, newPath);
+      return copied.ok ? from.delete({ path }) : copied;
+    },
+    listDirectory: (opts) => {
+      if (isScratch(opts.path)) return scratch.listDirectory(opts);
+      const names = host.listDirectory(opts);
+      return names.ok ? ok(merged(names.data, local.list(opts.path))) : names;
+    },
+  };
+
+  if (host.listDirectoryWithStats)
+    fs.listDirectoryWithStats = (opts) => {
+      if (isScratch(opts.path))
+        return found(local.listWithStats(opts.path), opts.path);
+      const listings = host.listDirectoryWithStats!(opts);
+      if (!listings.ok) return listings;
+      return ok(mergedListings(listings.data, local.listWithStats(opts.path)));
+    };
+
+  if (host.manifest)
+    fs.manifest = () => {
+      const manifest = host.manifest!();
+      if (!manifest.ok) return manifest;
+      const kept = local.manifest().filter(({ path }) => isScratch(path));
+      return ok([...manifest.data, ...kept]);
+    };
+
+  if (host.read)
+    fs.read = (opts) => {
+      if (!isScratch(opts.path)) return host.read!(opts);
+      if (!local.has(opts.path)) return notFound(opts.path);
+      const { offset, length } = opts;
+      return ok(bytesAt(opts.path).slice(offset, offset + length));
+    };
+
+  if (host.write)
+    fs.write = (opts) => {
+      if (!isScratch(opts.path)) return host.write!(opts);
+      const { path, offset, value } = opts;
+      const bytes = bytesAt(path);
+      const end = Math.max(bytes.length, offset + value.length);
+      const written = resizeBytes(bytes, end);
+      written.set(value, offset);
+      local.set(path, written);
+      return ok(undefined);
+    };
+
+  if (host.truncate)
+    fs.truncate = (opts) => {
+      if (!isScratch(opts.path)) return host.truncate!(opts);
+      local.set(opts.path, resizeBytes(bytesAt(opts.path), opts.size));
+      return ok(undefined);
+    };
+
+  return fs;
+};
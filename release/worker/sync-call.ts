@@ -1,3 +1,4 @@
+import { streamed, type Streamed } from "../contents";
 import type { ChannelHost, ChannelWorker } from "./channel";
 import { codec, type References } from "./codec";
 import { settled, type Settled } from "./settled";
@@ -5,7 +6,8 @@ import { settled, type Settled } from "./settled";
 /**
  * Functions the worker may call on the host, grouped by the object they belong
  * to. Implementations may return promises: the worker stays blocked until they
- * settle.
+ * settle. An answer may hold one stream, which the worker receives as the
+ * bytes it produces; they are copied across as they arrive.
  */
 export type SyncCallTargets = Record<string, object>;
 
@@ -30,7 +32,9 @@ export class SyncCallHost {
 
   async respond(message: SyncCallMessages["sync_call"], request: number) {
     const result = await settled.captureAsync(() => this.invoke(message));
-    this.channel.send(this.encode(result), request);
+    const { head, tail } = this.encode(result);
+    if (tail) await this.channel.stream(following(head, tail), request);
+    else this.channel.send(head, request);
   }
 
   private invoke({ target, method, args }: SyncCallMessages["sync_call"]) {
@@ -44,13 +48,18 @@ export class SyncCallHost {
   /** A result that cannot be encoded still has to reach the blocked worker. */
   private encode(result: Settled) {
     try {
-      return codec.encode(result, this.references);
+      return codec.encodeStreaming(result, this.references);
     } catch (thrown) {
-      return codec.encode(settled.failure(thrown));
+      return { head: codec.encode(settled.failure(thrown)) };
     }
   }
 }
 
+async function* following(head: Uint8Array, tail: Streamed) {
+  yield head;
+  yield* streamed.chunks(tail);
+}
+
 /**
  * Calls host functions and blocks until they settle. Must run on a worker
  * thread.
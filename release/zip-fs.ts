@@ -0,0 +1,283 @@
+import { readOnly, type FileSystem, type HostFileSystem } from "./fs";
+import { indexOf, type ManifestEntry } from "./worker/emscripten-fs";
+
+export namespace ZipFileSystem {
+  export type Options = FileSystem.CreationOptions & {
+    /**
+     * The archive. A `Blob`, such as a `File` the user picked or a fetched
+     * response's `blob()`, is read a slice at a time, so only its directory
+     * and the files Python opens are ever read.
+     */
+    archive: Blob | Uint8Array | ArrayBuffer;
+    /**
+     * The most inflated contents held at once, in bytes.
+     * @default 64 MiB
+     */
+    maxBytes?: number;
+  };
+}
+
+export type ZipFileSystem = HostFileSystem & { root: string };
+
+/** A file in the archive, as its central directory describes it. */
+type Member = {
+  method: number;
+  size: number;
+  compressedSize: number;
+  /** Where the member's local header starts. */
+  offset: number;
+  encrypted: boolean;
+};
+
+type Slice = (start: number, end: number) => Promise<Uint8Array>;
+
+const END_OF_DIRECTORY = 0x06054b50;
+const ZIP64_LOCATOR = 0x07064b50;
+const ZIP64_END_OF_DIRECTORY = 0x06064b50;
+const CENTRAL_HEADER = 0x02014b50;
+const LOCAL_HEADER = 0x04034b50;
+const ZIP64_EXTRA = 0x0001;
+const STORED = 0;
+const DEFLATED = 8;
+/** What a field holds when the real value is in the zip64 extra field. */
+const OVERFLOWED = 0xffffffff;
+const LONGEST_COMMENT = 0xffff;
+
+const sliceOf = (archive: ZipFileSystem.Options["archive"]): Slice => {
+  if (archive instanceof Blob)
+    return async (start, end) =>
+      new Uint8Array(await archive.slice(start, end).arrayBuffer());
+  const bytes =
+    archive instanceof Uint8Array ? archive : new Uint8Array(archive);
+  return async (start, end) => bytes.subarray(start, end);
+};
+
+const sizeOf = (archive: ZipFileSystem.Options["archive"]) =>
+  archive instanceof Blob ? archive.size : archive.byteLength;
+
+const viewOf = (bytes: Uint8Array) =>
+  new DataView(bytes.buffer, bytes.byteOffset, bytes.byteLength);
+
+const malformed = (what: string) => new Error(`Malformed zip archive: ${what}`);
+
+const utf8 = new TextDecoder();
+
+/** Where the central directory is, and how many members it lists. */
+const locateDirectory = async (slice: Slice, size: number) => {
+  const tailStart = Math.max(size - 22 - LONGEST_COMMENT, 0);
+  const tail = await slice(tailStart, size);
+  const view = viewOf(tail);
+  let end = tail.length - 22;
+  while (end >= 0 && view.getUint32(end, true) !== END_OF_DIRECTORY) end--;
+  if (end < 0) throw malformed("no end of central directory");
+
+  const count = view.getUint16(end + 10, true);
+  const length = view.getUint32(end + 12, true);
+  const offset = view.getUint32(end + 16, true);
+  const locator = end - 20;
+  if (
+    offset !== OVERFLOWED ||
+    locator < 0 ||
+    view.getUint32(locator, true) !== ZIP64_LOCATOR
+  )
+    return { count, length, offset };
+
+  const at = Number(view.getBigUint64(locator + 8, true));
+  const record = viewOf(await slice(at, at + 56));
+  if (record.getUint32(0, true) !== ZIP64_END_OF_DIRECTORY)
+    throw malformed("no zip64 end of central directory");
+  return {
+    count: Number(record.getBigUint64(32, true)),
+    length: Number(record.getBigUint64(40, true)),
+    offset: Number(record.getBigUint64(48, true)),
+  };
+};
+
+/** Takes the sizes and offset too large for their fields from zip64 data. */
+const widened = (member: Member, extra: DataView) => {
+  for (let at = 0; at + 4 <= extra.byteLength; ) {
+    const id = extra.getUint16(at, true);
+    const length = extra.getUint16(at + 2, true);
+    if (id === ZIP64_EXTRA) {
+      let field = at + 4;
+      const next = () => {
+        const value = Number(extra.getBigUint64(field, true));
+        field += 8;
+        return value;
+      };
+      if (member.size === OVERFLOWED) member.size = next();
+      if (member.compressedSize === OVERFLOWED)
+        member.compressedSize = next();
+      if (member.offset === OVERFLOWED) member.offset = next();
+      return member;
+    }
+    at += 4 + length;
+  }
+  return member;
+};
+
+/** Reads the central directory: every path, its size, and where it is. */
+const readDirectory = async (slice: Slice, size: number) => {
+  const { count, length, offset } = await locateDirectory(slice, size);
+  const directory = await slice(offset, offset + length);
+  const view = viewOf(directory);
+  const members = new Map<string, Member>();
+  const manifest: ManifestEntry[] = [];
+
+  for (let at = 0, read = 0; read < count; read++) {
+    if (view.getUint32(at, true) !== CENTRAL_HEADER)
+      throw malformed("central directory is cut short");
+    const nameLength = view.getUint16(at + 28, true);
+    const extraLength = view.getUint16(at + 30, true);
+    const commentLength = view.getUint16(at + 32, true);
+    const nameStart = at + 46;
+    const extraStart = nameStart + nameLength;
+    const name = utf8.decode(directory.subarray(nameStart, extraStart));
+    const member = widened(
+      {
+        method: view.getUint16(at + 10, true),
+        size: view.getUint32(at + 24, true),
+        compressedSize: view.getUint32(at + 20, true),
+        offset: view.getUint32(at + 42, true),
+        encrypted: (view.getUint16(at + 8, true) & 1) === 1,
+      },
+      new DataView(
+        directory.buffer,
+        directory.byteOffset + extraStart,
+        extraLength,
+      ),
+    );
+    at = extraStart + extraLength + commentLength;
+
+    const path = name.replace(/^\/+|\/+$/g, "");
+    if (path === "") continue;
+    const isDirectory = name.endsWith("/");
+    if (!isDirectory) members.set(path, member);
+    manifest.push({
+      path,
+      size: isDirectory ? 0 : member.size,
+      directory: isDirectory,
+    });
+  }
+  return { members, manifest, index: indexOf(manifest) };
+};
+
+const inflate = async (bytes: Uint8Array) => {
+  const stream = new Blob([bytes])
+    .stream()
+    .pipeThrough(new DecompressionStream("deflate-raw"));
+  return new Uint8Array(await new Response(stream).arrayBuffer());
+};
+
+/**
+ * A read-only filesystem over a zip archive, mounted without unpacking it.
+ *
+ * The archive's central directory is read once, and answers every `stat`,
+ * listing and manifest, so mounting costs the directory alone, however large
+ * the archive. A file is inflated when Python first reads it, and what was
+ * inflated is kept within `maxBytes`, least recently used first out. Files
+ * stored without compression are read straight from the archive, in ranges as
+ * Python reads them.
+ */
+export const zip = ({
+  archive,
+  maxBytes = 64 * 1024 * 1024,
+  ...creation
+}: ZipFileSystem.Options): ZipFileSystem => {
+  const slice = sliceOf(archive);
+  const parsed = readDirectory(slice, sizeOf(archive));
+  /** Where each member's data starts, learnt from its local header. */
+  const starts = new Map<string, Promise<number>>();
+  /** In least recently used order: a hit moves contents to the end. */
+  const inflated = new Map<string, Uint8Array>();
+  const inFlight = new Map<string, Promise<Uint8Array>>();
+  let bytes = 0;
+
+  const memberAt = async (path: string) => (await parsed).members.get(path);
+
+  const startOf = (path: string, member: Member) => {
+    const known = starts.get(path);
+    if (known) return known;
+    const start = slice(member.offset, member.offset + 30).then((header) => {
+      const view = viewOf(header);
+      if (view.getUint32(0, true) !== LOCAL_HEADER)
+        throw malformed(`no local header for ${path}`);
+      const nameLength = view.getUint16(26, true);
+      const extraLength = view.getUint16(28, true);
+      return member.offset + 30 + nameLength + extraLength;
+    });
+    starts.set(path, start);
+    start.catch(() => starts.delete(path));
+    return start;
+  };
+
+  const keep = (path: string, value: Uint8Array) => {
+    if (value.byteLength > maxBytes) return;
+    inflated.set(path, value);
+    bytes += value.byteLength;
+    for (const [oldest, evicted] of inflated) {
+      if (bytes <= maxBytes) break;
+      inflated.delete(oldest);
+      bytes -= evicted.byteLength;
+    }
+  };
+
+  const unpack = async (path: string, member: Member) => {
+    if (member.encrypted) throw new Error(`${path} is encrypted`);
+    const start = await startOf(path, member);
+    const data = await slice(start, start + member.compressedSize);
+    switch (member.method) {
+      case STORED:
+        return data;
+      case DEFLATED:
+        return inflate(data);
+      default:
+        throw new Error(
+          `${path} uses compression method ${member.method}, which is not supported`,
+        );
+    }
+  };
+
+  /** The whole of a member, inflated once however many ask at the same time. */
+  const contentsOf = (path: string, member: Member) => {
+    const held = inflated.get(path);
+    if (held) {
+      inflated.delete(path);
+      inflated.set(path, held);
+      return Promise.resolve(held);
+    }
+    const pending = inFlight.get(path);
+    if (pending) return pending;
+    const unpacked = unpack(path, member).finally(() => inFlight.delete(path));
+    inFlight.set(path, unpacked);
+    return unpacked.then((value) => (keep(path, value), value));
+  };
+
+  return readOnly({
+    ...creation,
+    get: async (path) => {
+      const { members, index } = await parsed;
+      const member = members.get(path);
+      if (member) return contentsOf(path, member);
+      if (index.entries.get(path)?.directory) return { directory: true };
+      return undefined;
+    },
+    stat: async (path) => (await parsed).index.entries.get(path),
+    listDirectory: async (path) => {
+      const { entries, children } = (await parsed).index;
+      if (!entries.get(path)?.directory) return undefined;
+      return [...(children.get(path) ?? [])];
+    },
+    manifest: async () => (await parsed).manifest,
+    read: async ({ path, offset, length }) => {
+      const member = await memberAt(path);
+      if (!member) return undefined;
+      const end = Math.min(offset + length, member.size);
+      if (end <= offset) return new Uint8Array();
+      if (member.method !== STORED || member.encrypted || inflated.has(path))
+        return (await contentsOf(path, member)).subarray(offset, end);
+      const start = await startOf(path, member);
+      return slice(start + offset, start + end);
+    },
+  });
+};
@@ -1,11 +1,12 @@
 import {
   Kernel,
+  MemoryFiles,
   type Awaitable,
   type Contents,
   type Output,
 } from "../../../release";
 
-export type Files = Map<string, Contents>;
+export type Files = MemoryFiles;
 
 export type HarnessOptions = {
   /** Files the kernel starts with, keyed by their path under the mount root. */
@@ -23,6 +24,12 @@ export type HarnessOptions = {
    * packages; the CDN copy has everything and is what production uses.
    */
   pyodide?: "bundled" | "cdn";
+  /** An Origin Private File System directory to mount in place of `files`. */
+  opfs?: string;
+  /** Start Python from a memory snapshot, taking one the first time. */
+  snapshot?: boolean;
+  /** Promise the kernel that nothing but its own runs changes the files. */
+  reportsChanges?: boolean;
 };
 
 /** The copy Vite already serves, so tests need not wait on a CDN. */
@@ -31,46 +38,36 @@ const bundledPyodide = new URL("/node_modules/pyodide/", location.origin).href;
 const delay = <T>(value: T, milliseconds = 10) =>
   new Promise<T>((resolve) => setTimeout(() => resolve(value), milliseconds));
 
-const segmentsUnder = (paths: string[], directory: string) => {
-  const prefix = directory === "" ? "" : `${directory}/`;
-  return paths
-    .filter((path) => path.startsWith(prefix))
-    .map((path) => path.slice(prefix.length).split("/")[0]);
-};
-
-/** A kernel backed by a plain map, which the test can read and write directly. */
+/** A kernel backed by files in the page, which the test can read and write. */
 export const inMemoryKernel = ({
   files = {},
   delayed = false,
   input = () => "",
   refuses = () => false,
   pyodide = "bundled",
+  opfs,
+  snapshot,
+  reportsChanges,
 }: HarnessOptions = {}) => {
-  const store: Files = new Map(Object.entries(files));
+  const store: Files = new MemoryFiles(Object.entries(files));
   const answer = <T>(value: T): Awaitable<T> =>
     delayed ? delay(value) : value;
 
-  const isDirectory = (path: string) =>
-    path === "" || [...store.keys()].some((key) => key.startsWith(`${path}/`));
-
   const fs = Kernel.ReadWriteFileSystem({
     get: (path) =>
       refuses(path)
         ? Promise.reject(new Error(`the host refuses to read ${path}`))
         : answer(
             store.get(path) ??
-              (isDirectory(path) ? { directory: true } : undefined),
+              (store.isDirectory(path) ? { directory: true } : undefined),
           ),
-    listDirectory: (path) =>
-      answer(
-        isDirectory(path)
-          ? [...new Set(segmentsUnder([...store.keys()], path))]
-          : undefined,
-      ),
+    listDirectory: (path) => answer(store.list(path)),
+    stat: (path) => answer(store.stat(path)),
     put: (path, value) =>
       answer(
-        value === null ? void store.delete(path) : void store.set(path, value),
+        void (value === null ? store.mkdir(path) : store.set(path, value)),
       ),
+    move: ({ from, to }) => answer(void store.move(from, to)),
     delete: (path) => answer(void store.delete(path)),
   });
 
@@ -78,7 +75,16 @@ export const inMemoryKernel = ({
 
   return {
     store,
-    kernel: new Kernel(Kernel.Environment({ fs, input, indexURL })),
+    kernel: new Kernel(
+      Kernel.Environment({
+        fs,
+        input,
+        indexURL,
+        opfs,
+        snapshot,
+        reportsChanges,
+      }),
+    ),
   };
 };
 
@@ -489,6 +489,124 @@ describe("a filesystem answering with promises", () => {
   });
 });
 
+describe("a filesystem answering with streams", () => {
+  /** Chunks of uneven sizes, some larger than the shared memory. */
+  const SIZES = [100, 3000, 1, 1024, 5000, 77];
+  const whole = pattern(SIZES.reduce((sum, size) => sum + size, 0));
+
+  async function* chunked(bytes: Uint8Array) {
+    let at = 0;
+    for (const size of SIZES) {
+      await new Promise((resolve) => setTimeout(resolve, 1));
+      yield bytes.slice(at, (at += size));
+    }
+  }
+
+  const readable = (bytes: Uint8Array) => {
+    const chunks = chunked(bytes);
+    return new ReadableStream<Uint8Array>({
+      pull: async (controller) => {
+        const next = await chunks.next();
+        if (next.done) controller.close();
+        else controller.enqueue(next.value);
+      },
+    });
+  };
+
+  const call = (method: string, ...args: unknown[]) => ({
+    kind: "call" as const,
+    target: "fs",
+    method,
+    args,
+  });
+
+  it("reads a file a stream produced", async () => {
+    const fs = readWrite({
+      get: () => readable(whole),
+      listDirectory: () => [],
+      put: () => {},
+    });
+    const { value } = harness({ fs });
+    const result = (await value(call("get", { path: "big.bin" }))) as any;
+    expect(result.ok).toBe(true);
+    expect(digest(result.data)).toEqual(digest(whole));
+  });
+
+  it("holds no more than a slice and a chunk ahead of the worker", async () => {
+    let [pulled, written, ahead] = [0, 0, 0];
+    async function* watched() {
+      for await (const chunk of chunked(whole)) {
+        pulled += chunk.length;
+        ahead = Math.max(ahead, pulled - written);
+        yield chunk;
+      }
+    }
+    const fs = readWrite({
+      get: () => watched(),
+      listDirectory: () => [],
+      put: () => {},
+    });
+    const { bridge, value } = harness({ fs });
+    const { memory } = bridge.memory;
+    const set = memory.set.bind(memory);
+    memory.set = (slice: ArrayLike<number>, offset?: number) => {
+      written += slice.length;
+      set(slice, offset);
+    };
+    const result = (await value(call("get", { path: "big.bin" }))) as any;
+    expect(digest(result.data)).toEqual(digest(whole));
+    expect(ahead).toBeLessThanOrEqual(SMALL_CAPACITY + Math.max(...SIZES));
+  });
+
+  it("reads a range a stream produced", async () => {
+    const fs = readWrite({
+      get: () => undefined,
+      read: ({ offset, length }) =>
+        chunked(pattern(offset + length).subarray(offset)),
+      listDirectory: () => [],
+      put: () => {},
+    });
+    const { value } = harness({ fs });
+    const result = (await value(
+      call("read", { path: "big.bin", offset: 0, length: whole.length }),
+    )) as any;
+    expect(digest(result.data)).toEqual(digest(whole));
+  });
+
+  it("measures a streamed file without a stat of its own", async () => {
+    const fs = readWrite({
+      get: () => readable(whole),
+      listDirectory: () => [],
+      put: () => {},
+    });
+    const { value } = harness({ fs });
+    expect(await value(call("stat", { path: "big.bin" }))).toEqual({
+      ok: true,
+      data: { size: whole.length, directory: false },
+    });
+  });
+
+  it("raises when the stream fails part way through", async () => {
+    async function* failing() {
+      yield pattern(4000);
+      throw new Error("connection reset");
+    }
+    const fs = readWrite({
+      get: () => failing(),
+      listDirectory: () => [],
+      put: () => {},
+    });
+    const { run, value } = harness({ fs });
+    const outcome = await run(call("get", { path: "big.bin" }));
+    expect(outcome).toMatchObject({ ok: false });
+    expect(outcome.error).toContain("stream failed");
+    expect(await value(call("listDirectory", { path: "" }))).toEqual({
+      ok: true,
+      data: [],
+    });
+  });
+});
+
 /**
  * A throw on the host does not fail the worker's assertion, so the host has to
  * be watched separately or it goes by unnoticed.
@@ -0,0 +1,275 @@
+import { describe, expect, it, vi } from "vitest";
+import { cached } from "../release/cached-fs";
+import { readWrite } from "../release/fs";
+import type { Contents } from "../release/contents";
+
+const options = {
+  root: "/home/pyodide",
+  removeRoot: true,
+  removeLeadingSlash: true,
+};
+
+const later = <T>(value: T) =>
+  new Promise<T>((resolve) => setTimeout(() => resolve(value), 1));
+
+/** A slow server: every read is counted, and answers arrive in a promise. */
+const remote = (initial: Record<string, Contents> = {}) => {
+  const files = new Map<string, Contents>(Object.entries(initial));
+  const reads: string[] = [];
+  const fs = readWrite({
+    ...options,
+    get: (path) => (reads.push(`get ${path}`), later(files.get(path))),
+    stat: (path) => {
+      reads.push(`stat ${path}`);
+      return later(
+        files.has(path) ? { size: 1, directory: false } : undefined,
+      );
+    },
+    listDirectory: (path) => (
+      reads.push(`list ${path}`), later(path === "" ? [...files.keys()] : null)
+    ),
+    put: (path, value) => void files.set(path, value!),
+    delete: (path) => void files.delete(path),
+  });
+  return { files, reads, fs };
+};
+
+describe("a cached filesystem", () => {
+  it("reads a file once", async () => {
+    const { reads, fs } = remote({ "a.py": "x = 1" });
+    const cache = cached(fs);
+    const read = { ok: true, data: "x = 1" };
+    expect(await cache.get({ path: "a.py" })).toEqual(read);
+    expect(await cache.get({ path: "a.py" })).toEqual(read);
+    expect(reads).toEqual(["get a.py"]);
+  });
+
+  it("reads a file it has to read to describe only once", async () => {
+    const reads: string[] = [];
+    const fs = readWrite({
+      ...options,
+      get: (path) => (reads.push(`get ${path}`), later("x = 1")),
+      listDirectory: () => later(null),
+      put: () => {},
+    });
+    const cache = cached(fs);
+    expect(await cache.stat({ path: "a.py" })).toEqual({
+      ok: true,
+      data: { size: 5, directory: false },
+    });
+    expect(await cache.get({ path: "a.py" })).toEqual({
+      ok: true,
+      data: "x = 1",
+    });
+    expect(reads).toEqual(["get a.py"]);
+  });
+
+  it("answers from the cache without waiting", async () => {
+    const { fs } = remote({ "a.py": "" });
+    const cache = cached(fs);
+    await cache.get({ path: "a.py" });
+    expect(cache.get({ path: "a.py" })).not.toBeInstanceOf(Promise);
+  });
+
+  it("shares a read already under way", async () => {
+    const { reads, fs } = remote({ "a.py": "" });
+    const cache = cached(fs);
+    const [first, second] = await Promise.all([
+      cache.get({ path: "a.py" }),
+      cache.get({ path: "a.py" }),
+    ]);
+    expect(first).toEqual(second);
+    expect(reads).toEqual(["get a.py"]);
+    expect(cache.cache.stats()).toMatchObject({ misses: 1, shared: 1 });
+  });
+
+  it("passes streams on without keeping or sharing them", async () => {
+    const reads: string[] = [];
+    async function* stream() {
+      yield new Uint8Array([1, 2, 3]);
+    }
+    const fs = readWrite({
+      ...options,
+      get: (path) => (reads.push(`get ${path}`), later(stream())),
+      listDirectory: () => [],
+      put: () => {},
+    });
+    const cache = cached(fs);
+    const [first, second] = (
+      await Promise.all([
+        cache.get({ path: "big.bin" }),
+        cache.get({ path: "big.bin" }),
+      ])
+    ).map((result) => result.ok && result.data);
+    expect(first).not.toBe(second);
+    await cache.get({ path: "big.bin" });
+    expect(reads).toEqual(["get big.bin", "get big.bin", "get big.bin"]);
+  });
+
+  it("remembers that a path is missing", async () => {
+    const { reads, fs } = remote();
+    const cache = cached(fs);
+    await cache.stat({ path: "ghost.py" });
+    expect(await cache.stat({ path: "ghost.py" })).toMatchObject({
+      ok: false,
+      status: 404,
+    });
+    expect(reads.filter((read) => read.startsWith("stat"))).toHaveLength(1);
+  });
+
+  it("does not remember a failure", async () => {
+    const get = vi.fn(() => ({
+      ok: false as const,
+      status: 500,
+      error: new Error("down"),
+    }));
+    const cache = cached({ ...remote().fs, get });
+    cache.get({ path: "a.py" });
+    cache.get({ path: "a.py" });
+    expect(get).toHaveBeenCalledTimes(2);
+  });
+
+  it("describes a file it holds without asking", async () => {
+    const { reads, fs } = remote({ "snake.txt": "🐍" });
+    const cache = cached(fs);
+    await cache.get({ path: "snake.txt" });
+    expect(await cache.stat({ path: "snake.txt" })).toEqual({
+      ok: true,
+      data: { size: 4, directory: false },
+    });
+    expect(reads).toEqual(["get snake.txt"]);
+  });
+
+  it("caches listings", async () => {
+    const { reads, fs } = remote({ "a.py": "" });
+    const cache = cached(fs);
+    await cache.listDirectory({ path: "/home/pyodide" });
+    await cache.listDirectory({ path: "/home/pyodide" });
+    expect(reads).toEqual(["list "]);
+  });
+
+  it("forgets what a write touches", async () => {
+    const { reads, fs } = remote({ "a.py": "old" });
+    const cache = cached(fs);
+    await cache.get({ path: "/home/pyodide/a.py" });
+    await cache.listDirectory({ path: "/home/pyodide" });
+    await cache.put({ path: "/home/pyodide/a.py", value: "new" });
+    expect(await cache.get({ path: "/home/pyodide/a.py" })).toMatchObject({
+      data: "new",
+    });
+    await cache.listDirectory({ path: "/home/pyodide" });
+    expect(reads).toEqual(["get a.py", "list ", "get a.py", "list "]);
+  });
+
+  it("forgets everything under a path that was deleted", async () => {
+    const { reads, fs } = remote({ "pkg/a.py": "" });
+    const cache = cached(fs);
+    await cache.get({ path: "/home/pyodide/pkg/a.py" });
+    await cache.delete({ path: "/home/pyodide/pkg" });
+    await cache.get({ path: "/home/pyodide/pkg/a.py" });
+    expect(reads).toHaveLength(2);
+  });
+
+  it("drops a read that raced a write", async () => {
+    const { fs } = remote({ "a.py": "old" });
+    const cache = cached(fs);
+    const reading = cache.get({ path: "a.py" });
+    await cache.put({ path: "a.py", value: "new" });
+    expect(await reading).toMatchObject({ data: "old" });
+    expect(await cache.get({ path: "a.py" })).toMatchObject({ data: "new" });
+  });
+
+  it("forgets what the filesystem underneath says changed", async () => {
+    const { reads, fs } = remote({ "a.py": "old" });
+    const cache = cached(fs);
+    await cache.get({ path: "a.py" });
+    await fs.put({ path: "a.py", value: "new" });
+    expect(await cache.get({ path: "a.py" })).toMatchObject({ data: "new" });
+    expect(reads).toHaveLength(2);
+  });
+
+  it("keeps what lies beside a forgotten path", async () => {
+    const { reads, fs } = remote({ "a/b.py": "", "ab.py": "" });
+    const cache = cached(fs);
+    await cache.get({ path: "a/b.py" });
+    await cache.get({ path: "ab.py" });
+    await cache.delete({ path: "a" });
+    await cache.get({ path: "ab.py" });
+    await cache.get({ path: "a/b.py" });
+    expect(reads).toEqual(["get a/b.py", "get ab.py", "get a/b.py"]);
+  });
+
+  it("stops hearing of changes once disposed", async () => {
+    const { reads, fs } = remote({ "a.py": "old" });
+    const cache = cached(fs);
+    await cache.get({ path: "a.py" });
+    cache.cache.dispose();
+    await fs.put({ path: "a.py", value: "new" });
+    expect(await cache.get({ path: "a.py" })).toMatchObject({ data: "old" });
+    expect(reads).toHaveLength(1);
+  });
+
+  it("asks again once an answer is too old", async () => {
+    let time = 0;
+    const { reads, fs } = remote({ "a.py": "" });
+    const cache = cached(fs, { ttl: 1000, now: () => time });
+    await cache.get({ path: "a.py" });
+    time = 999;
+    await cache.get({ path: "a.py" });
+    time = 1000;
+    await cache.get({ path: "a.py" });
+    expect(reads).toHaveLength(2);
+  });
+
+  it("trusts a missing path for as long as it was told", async () => {
+    let time = 0;
+    const { reads, fs } = remote();
+    const cache = cached(fs, { negativeTtl: 10, now: () => time });
+    await cache.get({ path: "ghost" });
+    time = 10;
+    await cache.get({ path: "ghost" });
+    expect(reads).toHaveLength(2);
+  });
+
+  it("lets the least recently used contents go first", async () => {
+    const { reads, fs } = remote({ a: "aaaa", b: "bbbb", c: "cccc" });
+    const cache = cached(fs, { maxBytes: 8 });
+    await cache.get({ path: "a" });
+    await cache.get({ path: "b" });
+    await cache.get({ path: "a" });
+    await cache.get({ path: "c" });
+    await cache.get({ path: "a" });
+    await cache.get({ path: "b" });
+    expect(reads).toEqual(["get a", "get b", "get c", "get b"]);
+    expect(cache.cache.stats()).toMatchObject({ bytes: 8, evictions: 2 });
+  });
+
+  it("holds no more answers than it was allowed", async () => {
+    const { fs } = remote({ a: "", b: "", c: "" });
+    const cache = cached(fs, { maxEntries: 2 });
+    for (const path of ["a", "b", "c"]) await cache.get({ path });
+    expect(cache.cache.stats().entries).toBe(2);
+  });
+
+  it("reports how often it was hit", async () => {
+    const { fs } = remote({ "a.py": "" });
+    const cache = cached(fs);
+    expect(cache.cache.stats().hitRate).toBe(0);
+    for (let i = 0; i < 4; i++) await cache.get({ path: "a.py" });
+    expect(cache.cache.stats()).toMatchObject({
+      hits: 3,
+      misses: 1,
+      hitRate: 0.75,
+    });
+  });
+
+  it("forgets everything when cleared", async () => {
+    const { reads, fs } = remote({ "a.py": "" });
+    const cache = cached(fs);
+    await cache.get({ path: "a.py" });
+    cache.cache.clear();
+    await cache.get({ path: "a.py" });
+    expect(reads).toHaveLength(2);
+    expect(cache.cache.stats().entries).toBe(1);
+  });
+});
@@ -252,6 +252,50 @@ describe("identity", () => {
   });
 });
 
+describe("streams", () => {
+  async function* chunks() {
+    yield new Uint8Array([1, 2]);
+  }
+
+  const followed = (head: Uint8Array, tail: Uint8Array) => {
+    const payload = new Uint8Array(head.length + tail.length);
+    payload.set(head);
+    payload.set(tail, head.length);
+    return payload;
+  };
+
+  it("leaves a stream out, to follow the rest as its bytes", () => {
+    const stream = chunks();
+    const { head, tail } = codec.encodeStreaming({ ok: true, data: stream });
+    expect(tail).toBe(stream);
+    const bytes = allByteValues;
+    expect(codec.decode(followed(head, bytes))).toEqual({
+      ok: true,
+      data: bytes,
+    });
+  });
+
+  it("encodes a value without a stream as encode does", () => {
+    const value = { ok: true, data: "text" };
+    expect(codec.encodeStreaming(value)).toEqual({
+      head: codec.encode(value),
+      tail: undefined,
+    });
+  });
+
+  it("refuses a second stream", () => {
+    expect(() => codec.encodeStreaming([chunks(), chunks()])).toThrow(
+      CodecError,
+    );
+  });
+
+  it("sends a stream by reference outside of streaming", () => {
+    const references = registry();
+    const stream = chunks();
+    expect(roundTrip(stream, references)).toBe(stream);
+  });
+});
+
 describe("framing", () => {
   it("rejects decoding straight out of shared memory", () => {
     const shared = new Uint8Array(new SharedArrayBuffer(16));
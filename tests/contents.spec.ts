@@ -50,6 +50,98 @@ describe("interpreting contents", () => {
   });
 });
 
+describe("measuring and checking without converting", () => {
+  const samples = [
+    "",
+    "ascii",
+    "café",
+    "日本語",
+    "🐍🎉",
+    "a\u0000b",
+    "lone \ud800 surrogate",
+    "\udc00 backwards \ud83d",
+  ];
+
+  it("counts utf-8 bytes as the encoder would", () => {
+    for (const text of samples)
+      expect(contents.utf8Length(text)).toBe(utf8.encode(text).byteLength);
+  });
+
+  it("agrees with a strict decoder on which bytes are utf-8", () => {
+    const strict = new TextDecoder("utf-8", { fatal: true });
+    const accepts = (bytes: Uint8Array) => {
+      try {
+        strict.decode(bytes);
+        return true;
+      } catch {
+        return false;
+      }
+    };
+    const cases = [
+      ...samples.map((text) => utf8.encode(text)),
+      allByteValues,
+      new Uint8Array([0xc0, 0x80]),
+      new Uint8Array([0xe0, 0x80, 0x80]),
+      new Uint8Array([0xed, 0xa0, 0x80]),
+      new Uint8Array([0xf4, 0x90, 0x80, 0x80]),
+      new Uint8Array([0xf0, 0x9f, 0x90]),
+      new Uint8Array([0xe2, 0x82, 0xac, 0x80]),
+    ];
+    for (const bytes of cases)
+      expect(contents.isUtf8(bytes)).toBe(accepts(bytes));
+  });
+});
+
+describe("converting large contents once", () => {
+  const large = "a line of text, é\n".repeat(1000);
+
+  it("hands back the bytes text was made from", () => {
+    const bytes = utf8.encode(large);
+    const text = contents.adopt(bytes);
+    expect(text).toBe(large);
+    expect(contents.byteLength(large)).toBe(bytes.byteLength);
+    expect(contents.toBytes(large)).toBe(bytes);
+  });
+
+  it("hands them back only once, so they can be changed", () => {
+    const bytes = utf8.encode(large);
+    contents.adopt(bytes);
+    contents.toBytes(large)[0] = 0;
+    expect(contents.toBytes(large)).not.toBe(bytes);
+    expect(contents.toBytes(large)).toEqual(utf8.encode(large));
+  });
+
+  it("keeps a copy of bytes that view a larger buffer", () => {
+    const bytes = utf8.encode(large);
+    const payload = new Uint8Array(bytes.byteLength + 8);
+    payload.set(bytes, 4);
+    const view = payload.subarray(4, 4 + bytes.byteLength);
+    expect(contents.adopt(view)).toBe(large);
+    const kept = contents.toBytes(large);
+    expect(kept).toEqual(bytes);
+    expect(kept.buffer).not.toBe(payload.buffer);
+    expect(kept.buffer.byteLength).toBe(bytes.byteLength);
+  });
+
+  it("does not keep bytes it only read", () => {
+    const bytes = utf8.encode(large);
+    expect(contents.fromBytes(bytes)).toBe(large);
+    expect(contents.toBytes(large)).not.toBe(bytes);
+    expect(contents.text(bytes)).toBe(large);
+    expect(contents.toBytes(large)).not.toBe(bytes);
+  });
+
+  it("keeps a byte order mark, whether the bytes are kept or not", () => {
+    const bytes = new Uint8Array([0xef, 0xbb, 0xbf, ...utf8.encode(large)]);
+    const text = contents.adopt(bytes) as string;
+    expect(text).toBe(`\ufeff${large}`);
+    expect(contents.byteLength(text)).toBe(bytes.byteLength);
+    expect(contents.toBytes(text)).toBe(bytes);
+    expect(contents.toBytes(text)).toEqual(bytes);
+    expect(contents.byteLength(text)).toBe(bytes.byteLength);
+  });
+});
+
 describe("resizing", () => {
   it("pads with zeroes when growing", () => {
     expect(resizeBytes(new Uint8Array([1, 2]), 4)).toEqual(
@@ -0,0 +1,30 @@
+import { bench, describe } from "vitest";
+import { mounted, O_TRUNC, O_WRONLY } from "./emscripten-fs.fixture";
+
+const LINES = 1_000_000;
+const line = new TextEncoder().encode("a short line of output\n");
+
+/** What a Python loop calling `f.write(line)` turns into, unbuffered. */
+const writeLines = (ranged: boolean) => {
+  const mount = mounted([["log.txt", ""]], { ranged });
+  const stream = mount.open("log.txt", O_WRONLY | O_TRUNC);
+  for (let index = 0; index < LINES; index++)
+    mount.streamOps.write!(
+      stream,
+      line,
+      0,
+      line.length,
+      index * line.length,
+    );
+  mount.streamOps.close!(stream);
+};
+
+describe(`writing ${LINES} lines through the mount`, () => {
+  bench("to a host that takes the whole file", () => writeLines(false), {
+    iterations: 3,
+  });
+
+  bench("to a host that takes ranges", () => writeLines(true), {
+    iterations: 3,
+  });
+});
@@ -0,0 +1,228 @@
+import {
+  EMFS,
+  type Caching,
+  type Entry,
+  type SyncFileSystem,
+} from "../release/worker/emscripten-fs";
+import { contents, resizeBytes, type Contents } from "../release/contents";
+import type { SyncResult } from "../release/utils";
+
+/**
+ * The mount, run against a stand-in for emscripten and a filesystem of its
+ * own, so it can be exercised without Pyodide or a host.
+ */
+export const DIR_MODE = 16895;
+export const FILE_MODE = 33206;
+export const O_WRONLY = 1;
+export const O_RDWR = 2;
+export const O_TRUNC = 512;
+export const SEEK_SET = 0;
+export const SEEK_CUR = 1;
+export const SEEK_END = 2;
+
+export class ErrnoError extends Error {
+  constructor(readonly errno: number) {
+    super(`errno ${errno}`);
+  }
+}
+
+/**
+ * Just enough of emscripten's FS for the mount to run against: node creation,
+ * the two mode predicates, and the error type it throws.
+ */
+export const emscripten = () => ({
+  FS: {
+    ErrnoError,
+    isFile: (mode: number) => mode === FILE_MODE,
+    isDir: (mode: number) => mode === DIR_MODE,
+    createNode: (parent: any, name: string, mode: number) => {
+      const node: any = {
+        id: 1,
+        name,
+        mode,
+        rdev: 1,
+        parent,
+        mount: { opts: { root: "" } },
+      };
+      node.parent ??= node;
+      node.mount = parent?.mount ?? node.mount;
+      return node;
+    },
+  },
+  ERRNO_CODES: {
+    ENOENT: 44,
+    EINVAL: 28,
+    EPERM: 63,
+    EISDIR: 31,
+    ENOTDIR: 54,
+    ENOTEMPTY: 55,
+    EBUSY: 10,
+  } as any,
+});
+
+const ok = <T>(data: T): SyncResult<T> => ({ ok: true, data });
+const missing = (): SyncResult<never> => ({
+  ok: false,
+  status: 404,
+  error: new Error("not found"),
+});
+
+const entryOf = (value: Contents | null): Entry =>
+  value === null
+    ? { size: 0, directory: true }
+    : { size: contents.byteLength(value), directory: false };
+
+/** A filesystem of its own, so the mount can be exercised without a host. */
+export const store = (
+  initial: [string, Contents | null][] = [],
+  {
+    ranged = false,
+    withStats = false,
+    manifest = false,
+    readsRanges = false,
+    versioned = false,
+  } = {},
+) => {
+  const files = new Map<string, Contents | null>(initial);
+  const calls: string[] = [];
+  /** Bumped whenever a file changes, to be reported as its version. */
+  const revisions = new Map<string, number>();
+  const revise = (path: string) =>
+    revisions.set(path, (revisions.get(path) ?? 0) + 1);
+  const describe = (path: string): Entry => ({
+    ...entryOf(files.get(path)!),
+    ...(versioned ? { version: String(revisions.get(path) ?? 0) } : {}),
+  });
+  /** Changes a file behind the mount's back. */
+  const change = (path: string, value: Contents) => {
+    files.set(path, value);
+    revise(path);
+  };
+  const childrenOf = (path: string) =>
+    [...files.keys()]
+      .filter((key) => key.startsWith(`${path}/`))
+      .map((key) => key.slice(path.length + 1))
+      .filter((name) => !name.includes("/"));
+  const fs: SyncFileSystem = {
+    get: ({ path }) => {
+      calls.push(`get ${path}`);
+      return files.has(path) ? ok(files.get(path)!) : missing();
+    },
+    stat: ({ path }) => {
+      calls.push(`stat ${path}`);
+      return files.has(path) ? ok(describe(path)) : missing();
+    },
+    put: ({ path, value }) => {
+      calls.push(`put ${path}`);
+      files.set(path, value);
+      revise(path);
+      return ok(undefined);
+    },
+    delete: ({ path }) => {
+      files.delete(path);
+      return ok(undefined);
+    },
+    move: ({ path, newPath }) => {
+      files.set(newPath, files.get(path)!);
+      files.delete(path);
+      revise(newPath);
+      return ok(undefined);
+    },
+    listDirectory: ({ path }) => {
+      calls.push(`list ${path}`);
+      return ok(childrenOf(path));
+    },
+  };
+  if (ranged)
+    Object.assign(fs, {
+      write: ({ path, offset, value }) => {
+        calls.push(`write ${path} ${offset} ${value.length}`);
+        const bytes = contents.toBytes(files.get(path) ?? "");
+        const grown = resizeBytes(
+          bytes,
+          Math.max(bytes.length, offset + value.length),
+        );
+        grown.set(value, offset);
+        files.set(path, grown);
+        revise(path);
+        return ok(undefined);
+      },
+      truncate: ({ path, size }) => {
+        calls.push(`truncate ${path} ${size}`);
+        files.set(path, resizeBytes(contents.toBytes(files.get(path)!), size));
+        revise(path);
+        return ok(undefined);
+      },
+    } satisfies Partial<SyncFileSystem>);
+  if (readsRanges)
+    fs.read = ({ path, offset, length }) => {
+      calls.push(`read ${path} ${offset} ${length}`);
+      if (!files.has(path)) return missing();
+      const bytes = contents.toBytes(files.get(path) ?? "");
+      return ok(bytes.slice(offset, offset + length));
+    };
+  if (withStats)
+    fs.listDirectoryWithStats = ({ path }) => {
+      calls.push(`list ${path}`);
+      return ok(
+        childrenOf(path).map((name) => ({
+          name,
+          ...describe(`${path}/${name}`),
+        })),
+      );
+    };
+  if (manifest)
+    fs.manifest = () => {
+      calls.push("manifest");
+      return ok(
+        [...files.keys()].map((key) => ({
+          path: key.replace(/^\//, ""),
+          ...describe(key),
+        })),
+      );
+    };
+  return { files, calls, fs, change };
+};
+
+export const mounted = (
+  initial: [string, Contents | null][] = [],
+  options: {
+    ranged?: boolean;
+    withStats?: boolean;
+    manifest?: boolean;
+    readsRanges?: boolean;
+    versioned?: boolean;
+    caching?: Caching;
+  } = {},
+) => {
+  const { caching, ...storing } = options;
+  const backing = store(
+    initial.map(([name, value]) => [`/${name}`, value]),
+    storing,
+  );
+  const pyodide = emscripten();
+  const mount = new EMFS(pyodide as any, backing.fs, false, caching);
+  const root = mount.mount({ opts: { root: "" } } as any);
+  const { nodeOps, streamOps } = mount.methods;
+
+  const open = (name: string, flags = 0) => {
+    const node = nodeOps.lookup(root, name);
+    const stream: any = { object: node, flags, position: 0 };
+    streamOps.open!(stream);
+    return stream;
+  };
+
+  const file = (name: string) => backing.files.get(`/${name}`);
+
+  return {
+    ...backing,
+    root,
+    nodeOps,
+    streamOps,
+    open,
+    file,
+    invalidate: (paths?: string[]) => mount.invalidate(paths),
+    takeChanges: () => mount.takeChanges(),
+    stats: () => mount.stats(),
+  };
+};
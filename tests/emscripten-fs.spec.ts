@@ -1,115 +1,21 @@
 import { beforeEach, describe, expect, it } from "vitest";
 import {
   answering,
-  EMFS,
-  type Entry,
   type SyncFileSystem,
 } from "../release/worker/emscripten-fs";
-import { contents, type Contents } from "../release/contents";
-import type { SyncResult } from "../release/utils";
-
-const DIR_MODE = 16895;
-const FILE_MODE = 33206;
-const O_TRUNC = 512;
-const SEEK_SET = 0;
-const SEEK_CUR = 1;
-const SEEK_END = 2;
-
-class ErrnoError extends Error {
-  constructor(readonly errno: number) {
-    super(`errno ${errno}`);
-  }
-}
-
-/**
- * Just enough of emscripten's FS for the mount to run against: node creation,
- * the two mode predicates, and the error type it throws.
- */
-const emscripten = () => ({
-  FS: {
-    ErrnoError,
-    isFile: (mode: number) => mode === FILE_MODE,
-    isDir: (mode: number) => mode === DIR_MODE,
-    createNode: (parent: any, name: string, mode: number) => {
-      const node: any = {
-        id: 1,
-        name,
-        mode,
-        rdev: 1,
-        parent,
-        mount: { opts: { root: "" } },
-      };
-      node.parent ??= node;
-      node.mount = parent?.mount ?? node.mount;
-      return node;
-    },
-  },
-  ERRNO_CODES: { ENOENT: 44, EINVAL: 28, EPERM: 63 } as any,
-});
-
-const ok = <T>(data: T): SyncResult<T> => ({ ok: true, data });
-const missing = (): SyncResult<never> => ({
-  ok: false,
-  status: 404,
-  error: new Error("not found"),
-});
-
-const entryOf = (value: Contents | null): Entry =>
-  value === null
-    ? { size: 0, directory: true }
-    : { size: contents.byteLength(value), directory: false };
-
-/** A filesystem of its own, so the mount can be exercised without a host. */
-const store = (initial: [string, Contents | null][] = []) => {
-  const files = new Map<string, Contents | null>(initial);
-  const calls: string[] = [];
-  const fs: SyncFileSystem = {
-    get: ({ path }) => {
-      calls.push(`get ${path}`);
-      return files.has(path) ? ok(files.get(path)!) : missing();
-    },
-    stat: ({ path }) => {
-      calls.push(`stat ${path}`);
-      return files.has(path) ? ok(entryOf(files.get(path)!)) : missing();
-    },
-    put: ({ path, value }) => {
-      calls.push(`put ${path}`);
-      files.set(path, value);
-      return ok(undefined);
-    },
-    delete: ({ path }) => {
-      files.delete(path);
-      return ok(undefined);
-    },
-    move: ({ path, newPath }) => {
-      files.set(newPath, files.get(path)!);
-      files.delete(path);
-      return ok(undefined);
-    },
-    listDirectory: () =>
-      ok([...files.keys()].map((key) => key.replace(/^\//, ""))),
-  };
-  return { files, calls, fs };
-};
-
-const mounted = (initial: [string, Contents | null][] = []) => {
-  const backing = store(initial.map(([name, value]) => [`/${name}`, value]));
-  const pyodide = emscripten();
-  const mount = new EMFS(pyodide as any, backing.fs);
-  const root = mount.mount({ opts: { root: "" } } as any);
-  const { nodeOps, streamOps } = mount.methods;
-
-  const open = (name: string, flags = 0) => {
-    const node = nodeOps.lookup(root, name);
-    const stream: any = { object: node, flags, position: 0 };
-    streamOps.open!(stream);
-    return stream;
-  };
-
-  const file = (name: string) => backing.files.get(`/${name}`);
-
-  return { ...backing, root, nodeOps, streamOps, open, file };
-};
+import type { Contents } from "../release/contents";
+import {
+  DIR_MODE,
+  ErrnoError,
+  FILE_MODE,
+  mounted,
+  O_RDWR,
+  O_TRUNC,
+  O_WRONLY,
+  SEEK_CUR,
+  SEEK_END,
+  SEEK_SET,
+} from "./emscripten-fs.fixture";
 
 const readAll = (mount: ReturnType<typeof mounted>, name: string) => {
   const stream = mount.open(name);
@@ -192,6 +98,31 @@ describe("writing", () => {
     );
   });
 
+  it("keeps every line of a file written a line at a time", () => {
+    const mount = mounted([["log.txt", ""]]);
+    const stream = mount.open("log.txt", O_TRUNC);
+    const line = utf8.encode("line 🐍\n");
+    for (let index = 0; index < 2000; index++)
+      mount.streamOps.write!(
+        stream,
+        line,
+        0,
+        line.length,
+        index * line.length,
+      );
+    mount.streamOps.close!(stream);
+    expect(mount.file("log.txt")).toEqual(
+      utf8.encode("line 🐍\n".repeat(2000)),
+    );
+  });
+
+  it("sends the file without the room it was given to grow", () => {
+    const mount = mounted([["out.txt", ""]]);
+    write(mount, "out.txt", utf8.encode("short"));
+    const stored = mount.file("out.txt") as Uint8Array;
+    expect(stored.buffer.byteLength).toBe(5);
+  });
+
   it("empties a file opened for truncation even without a write", () => {
     const mount = mounted([["out.txt", "old contents"]]);
     const stream = mount.open("out.txt", O_TRUNC);
@@ -210,6 +141,353 @@ describe("writing", () => {
     mount.nodeOps.mknod!(mount.root, "pkg", DIR_MODE, 0);
     expect(mount.file("pkg")).toBeNull();
   });
+
+  it("tells once what Python changed through it, and nothing it read", () => {
+    const mount = mounted([
+      ["a.py", "x = 1"],
+      ["b.txt", ""],
+      ["c.txt", "read"],
+    ]);
+    mount.nodeOps.mknod!(mount.root, "pkg", DIR_MODE, 0);
+    write(mount, "b.txt", utf8.encode("written"));
+    mount.streamOps.close!(mount.open("c.txt"));
+    mount.nodeOps.unlink(mount.root, "a.py");
+    expect(mount.takeChanges()).toEqual([
+      ["pkg", true],
+      ["b.txt", false],
+      ["a.py", false],
+    ]);
+    expect(mount.takeChanges()).toEqual([]);
+  });
+});
+
+describe("writing to a host that takes ranges", () => {
+  const ranged = (initial: [string, Contents | null][]) =>
+    mounted(initial, { ranged: true });
+
+  const sent = (mount: ReturnType<typeof mounted>) =>
+    mount.calls.filter((call) => !call.startsWith("stat"));
+
+  it("sends only the bytes that changed", () => {
+    const mount = ranged([["log.txt", "abcdef"]]);
+    const stream = mount.open("log.txt", O_RDWR);
+    mount.calls.length = 0;
+    mount.streamOps.write!(stream, utf8.encode("XY"), 0, 2, 2);
+    mount.streamOps.close!(stream);
+    expect(sent(mount)).toEqual(["write /log.txt 2 2"]);
+    expect(mount.file("log.txt")).toEqual(utf8.encode("abXYef"));
+  });
+
+  it("sends separate changes separately", () => {
+    const mount = ranged([["log.txt", "abcdefghij"]]);
+    const stream = mount.open("log.txt", O_RDWR);
+    mount.calls.length = 0;
+    mount.streamOps.write!(stream, utf8.encode("1"), 0, 1, 0);
+    mount.streamOps.write!(stream, utf8.encode("2"), 0, 1, 9);
+    mount.streamOps.close!(stream);
+    expect(sent(mount)).toEqual(["write /log.txt 0 1", "write /log.txt 9 1"]);
+  });
+
+  it("appends to a file without reading it", () => {
+    const mount = ranged([["log.txt", "first\n"]]);
+    const stream = mount.open("log.txt", O_WRONLY);
+    const end = mount.streamOps.llseek!(stream, 0, SEEK_END);
+    mount.streamOps.write!(stream, utf8.encode("second\n"), 0, 7, end);
+    mount.streamOps.close!(stream);
+    expect(mount.calls).not.toContain("get /log.txt");
+    expect(sent(mount)).toEqual(["write /log.txt 6 7"]);
+    expect(mount.file("log.txt")).toEqual(utf8.encode("first\nsecond\n"));
+  });
+
+  it("sends consecutive writes together", () => {
+    const mount = ranged([["log.txt", ""]]);
+    const stream = mount.open("log.txt", O_WRONLY);
+    for (let line = 0; line < 3; line++)
+      mount.streamOps.write!(stream, utf8.encode("line\n"), 0, 5, line * 5);
+    mount.streamOps.close!(stream);
+    expect(sent(mount)).toEqual(["write /log.txt 0 15"]);
+  });
+
+  it("truncates when a file is opened for truncation", () => {
+    const mount = ranged([["out.txt", "old contents"]]);
+    const stream = mount.open("out.txt", O_WRONLY | O_TRUNC);
+    mount.streamOps.write!(stream, utf8.encode("new"), 0, 3, 0);
+    mount.streamOps.close!(stream);
+    expect(sent(mount)).toEqual([
+      "truncate /out.txt 0",
+      "write /out.txt 0 3",
+    ]);
+    expect(mount.file("out.txt")).toEqual(utf8.encode("new"));
+  });
+
+  it("truncates without reading or rewriting the file", () => {
+    const mount = ranged([["cut.txt", "abcdef"]]);
+    const node = mount.nodeOps.lookup(mount.root, "cut.txt");
+    mount.nodeOps.setattr(node, { size: 3 } as any);
+    expect(sent(mount)).toEqual(["truncate /cut.txt 3"]);
+    expect(mount.file("cut.txt")).toEqual(utf8.encode("abc"));
+  });
+
+  it("cuts what an open file holds when it is truncated", () => {
+    const mount = ranged([["out.txt", ""]]);
+    const stream = mount.open("out.txt", O_WRONLY | O_TRUNC);
+    mount.streamOps.write!(stream, utf8.encode("hello world"), 0, 11, 0);
+    mount.nodeOps.setattr(stream.object, { size: 5 } as any);
+    expect(mount.nodeOps.getattr(stream.object).size).toBe(5);
+    mount.streamOps.close!(stream);
+    expect(mount.file("out.txt")).toEqual(utf8.encode("hello"));
+  });
+
+  it("sends what an open file holds when it is synced", () => {
+    const mount = ranged([["log.txt", ""]]);
+    const stream = mount.open("log.txt", O_WRONLY);
+    mount.streamOps.write!(stream, utf8.encode("kept"), 0, 4, 0);
+    (mount.streamOps as any).fsync(stream);
+    expect(mount.file("log.txt")).toEqual(utf8.encode("kept"));
+  });
+
+  it("sends a large write before the file is closed", () => {
+    const mount = ranged([["big.bin", ""]]);
+    const stream = mount.open("big.bin", O_WRONLY);
+    const chunk = new Uint8Array(64 * 1024).fill(7);
+    for (let index = 0; index < 16; index++)
+      mount.streamOps.write!(
+        stream,
+        chunk,
+        0,
+        chunk.length,
+        index * chunk.length,
+      );
+    expect(sent(mount)).toEqual([`write /big.bin 0 ${16 * chunk.length}`]);
+  });
+
+  it("does not write back a file that was only read", () => {
+    const mount = ranged([["abc.txt", "abc"]]);
+    readAll(mount, "abc.txt");
+    expect(sent(mount)).toEqual(["get /abc.txt"]);
+  });
+});
+
+describe("reading from a host that takes ranges", () => {
+  const windowed = (initial: [string, Contents | null][]) =>
+    mounted(initial, { readsRanges: true });
+  const fetched = (mount: ReturnType<typeof mounted>) =>
+    mount.calls.filter((call) => /^(get|read)/.test(call));
+
+  it("reads a file without fetching all of it", () => {
+    const mount = windowed([["big.bin", new Uint8Array(1024 * 1024)]]);
+    const stream = mount.open("big.bin");
+    const buffer = new Uint8Array(8);
+    mount.streamOps.read!(stream, buffer, 0, 8, 1000);
+    expect(fetched(mount)).toEqual([`read /big.bin 1000 ${256 * 1024}`]);
+  });
+
+  it("answers reads that follow from the window it holds", () => {
+    const mount = windowed([["abc.txt", "abcdef"]]);
+    const stream = mount.open("abc.txt");
+    const buffer = new Uint8Array(3);
+    mount.streamOps.read!(stream, buffer, 0, 3, 0);
+    mount.streamOps.read!(stream, buffer, 0, 3, 3);
+    expect(buffer).toEqual(utf8.encode("def"));
+    expect(fetched(mount)).toHaveLength(1);
+  });
+
+  it("fetches a new window for a read outside the one it holds", () => {
+    const mount = windowed([["abc.txt", "abcdef"]]);
+    const stream = mount.open("abc.txt");
+    const buffer = new Uint8Array(2);
+    mount.streamOps.read!(stream, buffer, 0, 2, 4);
+    mount.streamOps.read!(stream, buffer, 0, 2, 0);
+    expect(buffer).toEqual(utf8.encode("ab"));
+    expect(fetched(mount)).toHaveLength(2);
+  });
+
+  it("reports no bytes read past the end", () => {
+    const mount = windowed([["abc.txt", "abc"]]);
+    const stream = mount.open("abc.txt");
+    expect(mount.streamOps.read!(stream, new Uint8Array(4), 0, 4, 10)).toBe(0);
+  });
+
+  it("seeks from the end without reading the file", () => {
+    const mount = windowed([["abc.txt", "abcdef"]]);
+    const stream = mount.open("abc.txt");
+    expect(mount.streamOps.llseek!(stream, -2, SEEK_END)).toBe(4);
+    expect(fetched(mount)).toEqual([]);
+  });
+
+  it("still reads a file opened for writing whole", () => {
+    const mount = windowed([["abc.txt", "abc"]]);
+    mount.streamOps.close!(mount.open("abc.txt", O_RDWR));
+    expect(fetched(mount)).toEqual(["get /abc.txt"]);
+  });
+});
+
+/** 50 directories of 100 files each. */
+const workspace = () =>
+  Array.from({ length: 50 }, (_, directory) => [
+    [`pkg${directory}`, null] as [string, Contents | null],
+    ...Array.from(
+      { length: 100 },
+      (_, file) =>
+        [`pkg${directory}/mod${file}.py`, "x = 1\n"] as [string, Contents],
+    ),
+  ]).flat();
+
+/** What `os.walk` asks of each directory, and `os.stat` of each entry. */
+const walk = (mount: ReturnType<typeof mounted>, node = mount.root) => {
+  let files = 0;
+  for (const name of mount.nodeOps.readdir!(node)) {
+    if (name === "." || name === "..") continue;
+    const child = mount.nodeOps.lookup(node, name);
+    mount.nodeOps.getattr(child);
+    files += child.mode === DIR_MODE ? walk(mount, child) : 1;
+  }
+  return files;
+};
+
+describe("listing a directory with what is in it", () => {
+  it("walks a tree with one call per directory", () => {
+    const mount = mounted(workspace(), { withStats: true });
+    expect(walk(mount)).toBe(5000);
+    expect(mount.calls).toHaveLength(51);
+    expect(mount.calls.every((call) => call.startsWith("list"))).toBe(true);
+  });
+
+  it("asks about every entry without it", () => {
+    const mount = mounted(workspace());
+    expect(walk(mount)).toBe(5000);
+    expect(mount.calls.length).toBeGreaterThan(5000);
+  });
+
+  it("uses a listed size only once", () => {
+    const mount = mounted([["a.py", "abc"]], { withStats: true });
+    mount.nodeOps.readdir!(mount.root);
+    const node = mount.nodeOps.lookup(mount.root, "a.py");
+    expect(mount.nodeOps.getattr(node).size).toBe(3);
+    mount.files.set("/a.py", "abcdef");
+    expect(mount.nodeOps.getattr(node).size).toBe(6);
+    expect(mount.calls).toEqual(["list ", "stat /a.py"]);
+  });
+
+  it("forgets what was listed for a file once it is written", () => {
+    const mount = mounted([["a.py", "abc"]], { withStats: true });
+    mount.nodeOps.readdir!(mount.root);
+    write(mount, "a.py", utf8.encode("abcdef"));
+    const node = mount.nodeOps.lookup(mount.root, "a.py");
+    expect(mount.nodeOps.getattr(node).size).toBe(6);
+  });
+
+  it("forgets what was listed for a path the host changed", () => {
+    const mount = mounted(
+      [
+        ["a.py", "abc"],
+        ["b.py", "abc"],
+      ],
+      { withStats: true },
+    );
+    mount.nodeOps.readdir!(mount.root);
+    mount.invalidate(["a.py"]);
+    mount.nodeOps.getattr(mount.nodeOps.lookup(mount.root, "a.py"));
+    mount.nodeOps.getattr(mount.nodeOps.lookup(mount.root, "b.py"));
+    expect(mount.calls).toEqual(["list ", "stat /a.py", "stat /a.py"]);
+  });
+
+  it("forgets what was listed under a directory that was removed", () => {
+    const mount = mounted(
+      [
+        ["pkg", null],
+        ["pkg/a.py", "abc"],
+      ],
+      { withStats: true },
+    );
+    const pkg = mount.nodeOps.lookup(mount.root, "pkg");
+    mount.nodeOps.readdir!(pkg);
+    mount.nodeOps.rmdir(mount.root, "pkg");
+    mount.files.delete("/pkg/a.py");
+    expect(() => mount.nodeOps.lookup(pkg, "a.py")).toThrow(ErrnoError);
+  });
+});
+
+describe("a host that gives a manifest", () => {
+  it("walks a tree with a single call", () => {
+    const mount = mounted(workspace(), { manifest: true });
+    expect(walk(mount)).toBe(5000);
+    expect(mount.calls).toEqual(["manifest"]);
+  });
+
+  it("knows a missing path is missing without asking", () => {
+    const mount = mounted([["a.py", ""]], { manifest: true });
+    expect(() => mount.nodeOps.lookup(mount.root, "ghost.py")).toThrow(
+      ErrnoError,
+    );
+    expect(mount.calls).toEqual(["manifest"]);
+  });
+
+  it("fills in directories the manifest left out", () => {
+    const mount = mounted([["pkg/a.py", "abc"]], { manifest: true });
+    const pkg = mount.nodeOps.lookup(mount.root, "pkg");
+    expect(pkg.mode).toBe(DIR_MODE);
+    expect(mount.nodeOps.readdir!(pkg)).toContain("a.py");
+  });
+
+  it("keeps track of what Python writes", () => {
+    const mount = mounted([["a.py", "abc"]], { manifest: true });
+    mount.nodeOps.readdir!(mount.root);
+    write(mount, "a.py", utf8.encode("abcdef"));
+    const node = mount.nodeOps.lookup(mount.root, "a.py");
+    expect(mount.nodeOps.getattr(node).size).toBe(6);
+    expect(mount.calls).toEqual(["manifest", "put /a.py"]);
+  });
+
+  it("keeps track of what Python creates, moves and deletes", () => {
+    const mount = mounted(
+      [
+        ["pkg", null],
+        ["pkg/a.py", "abc"],
+      ],
+      { manifest: true },
+    );
+    mount.nodeOps.readdir!(mount.root);
+    mount.nodeOps.mknod(mount.root, "new.py", FILE_MODE, 0);
+    const pkg = mount.nodeOps.lookup(mount.root, "pkg");
+    mount.nodeOps.rename(pkg, mount.root, "moved");
+    mount.nodeOps.unlink(mount.root, "new.py");
+    const moved = mount.nodeOps.lookup(mount.root, "moved");
+    expect(mount.nodeOps.readdir!(mount.root)).not.toContain("new.py");
+    expect(mount.nodeOps.readdir!(mount.root)).not.toContain("pkg");
+    expect(mount.nodeOps.readdir!(moved)).toContain("a.py");
+    expect(mount.calls.filter((call) => call === "manifest")).toHaveLength(1);
+  });
+
+  it("asks again once invalidated", () => {
+    const mount = mounted([["a.py", ""]], { manifest: true });
+    mount.nodeOps.readdir!(mount.root);
+    mount.files.set("/b.py", "");
+    mount.invalidate();
+    expect(mount.nodeOps.readdir!(mount.root)).toContain("b.py");
+    expect(mount.calls).toEqual(["manifest", "manifest"]);
+  });
+
+  it("asks again once told of a change", () => {
+    const mount = mounted([["a.py", ""]], { manifest: true });
+    mount.nodeOps.readdir!(mount.root);
+    mount.invalidate([]);
+    mount.nodeOps.readdir!(mount.root);
+    mount.invalidate(["a.py"]);
+    mount.nodeOps.readdir!(mount.root);
+    expect(mount.calls).toEqual(["manifest", "manifest"]);
+  });
+
+  it("asks about each path when the manifest fails", () => {
+    const mount = mounted([["a.py", "abc"]], { manifest: true });
+    mount.fs.manifest = () => ({
+      ok: false,
+      status: 500,
+      error: new Error("no"),
+    });
+    const node = mount.nodeOps.lookup(mount.root, "a.py");
+    expect(mount.nodeOps.getattr(node).size).toBe(3);
+  });
 });
 
 describe("metadata", () => {
@@ -271,6 +549,15 @@ describe("metadata", () => {
     expect(mount.file("cut.txt")).toEqual(utf8.encode("abc"));
   });
 
+  it("cuts what an open file holds when it is truncated", () => {
+    const mount = mounted([["out.txt", ""]]);
+    const stream = mount.open("out.txt", O_RDWR);
+    mount.streamOps.write!(stream, utf8.encode("hello world"), 0, 11, 0);
+    mount.nodeOps.setattr(stream.object, { size: 5 } as any);
+    mount.streamOps.close!(stream);
+    expect(mount.file("out.txt")).toEqual(utf8.encode("hello"));
+  });
+
   it("pads a file grown by truncation", () => {
     const mount = mounted([["grow.bin", "ab"]]);
     const node = mount.nodeOps.lookup(mount.root, "grow.bin");
@@ -353,3 +640,119 @@ describe("seeking", () => {
     );
   });
 });
+
+describe("caching policies", () => {
+  const reads = (mount: ReturnType<typeof mounted>) =>
+    mount.calls.filter((call) => call.startsWith("get"));
+
+  it("reads a live file again at every run", () => {
+    const mount = mounted([["a.txt", "abc"]]);
+    readAll(mount, "a.txt");
+    mount.invalidate();
+    readAll(mount, "a.txt");
+    expect(reads(mount)).toHaveLength(2);
+  });
+
+  it("keeps what it learnt of immutable files from one run to the next", () => {
+    const mount = mounted(
+      [
+        ["data", null],
+        ["data/a.csv", "1,2"],
+      ],
+      { caching: { policy: "immutable" } },
+    );
+    const data = mount.nodeOps.lookup(mount.root, "data");
+    mount.nodeOps.readdir(data);
+    readAll(mount, "data/a.csv");
+    const asked = mount.calls.length;
+    mount.invalidate();
+    mount.nodeOps.readdir(data);
+    expect(readAll(mount, "data/a.csv")).toEqual(utf8.encode("1,2"));
+    expect(mount.calls).toHaveLength(asked);
+  });
+
+  it("remembers that an immutable path is missing", () => {
+    const mount = mounted([], { caching: { policy: "immutable" } });
+    for (let attempt = 0; attempt < 3; attempt++)
+      expect(() => mount.nodeOps.lookup(mount.root, "ghost.py")).toThrow(
+        ErrnoError,
+      );
+    expect(mount.calls).toEqual(["stat /ghost.py"]);
+  });
+
+  it("still forgets an immutable file the host says changed", () => {
+    const mount = mounted([["a.txt", "old"]], {
+      caching: { policy: "immutable" },
+    });
+    readAll(mount, "a.txt");
+    mount.change("/a.txt", "new");
+    mount.invalidate(["a.txt"]);
+    expect(readAll(mount, "a.txt")).toEqual(utf8.encode("new"));
+  });
+
+  it("reads back what was written over an immutable file", () => {
+    const mount = mounted([["a.txt", "old"]], {
+      caching: { policy: "immutable" },
+    });
+    readAll(mount, "a.txt");
+    write(mount, "a.txt", utf8.encode("newer"));
+    expect(readAll(mount, "a.txt")).toEqual(utf8.encode("newer"));
+  });
+
+  it("reuses contents while their version is unchanged", () => {
+    const mount = mounted([["a.txt", "abc"]], {
+      versioned: true,
+      caching: { policy: "revalidate" },
+    });
+    readAll(mount, "a.txt");
+    mount.invalidate();
+    expect(readAll(mount, "a.txt")).toEqual(utf8.encode("abc"));
+    expect(reads(mount)).toHaveLength(1);
+  });
+
+  it("reads contents again once their version changes", () => {
+    const mount = mounted([["a.txt", "abc"]], {
+      versioned: true,
+      caching: { policy: "revalidate" },
+    });
+    readAll(mount, "a.txt");
+    mount.change("/a.txt", "xyz");
+    mount.invalidate();
+    expect(readAll(mount, "a.txt")).toEqual(utf8.encode("xyz"));
+    expect(reads(mount)).toHaveLength(2);
+  });
+
+  it("does not keep contents a host gives no version for", () => {
+    const mount = mounted([["a.txt", "abc"]], {
+      caching: { policy: "revalidate" },
+    });
+    readAll(mount, "a.txt");
+    readAll(mount, "a.txt");
+    expect(reads(mount)).toHaveLength(2);
+  });
+
+  it("keeps no more contents than it was allowed", () => {
+    const mount = mounted(
+      [
+        ["a.txt", "aaaa"],
+        ["b.txt", "bbbb"],
+      ],
+      { caching: { policy: "immutable", maxBytes: 6 } },
+    );
+    readAll(mount, "a.txt");
+    readAll(mount, "b.txt");
+    readAll(mount, "b.txt");
+    expect(reads(mount)).toHaveLength(2);
+    readAll(mount, "a.txt");
+    expect(reads(mount)).toHaveLength(3);
+  });
+
+  it("counts what it answered itself and what it asked the host", () => {
+    const mount = mounted([["a.txt", "abc"]], {
+      caching: { policy: "immutable" },
+    });
+    readAll(mount, "a.txt");
+    readAll(mount, "a.txt");
+    expect(mount.stats()).toEqual({ hits: 2, misses: 2, bytes: 3 });
+  });
+});
@@ -145,6 +145,71 @@ describe("reading", () => {
   });
 });
 
+describe("reading part of a file", () => {
+  const bytes = new TextEncoder().encode("abcdef");
+
+  it("hands the callback a range and a path relative to the root", async () => {
+    const read = vi.fn(() => bytes.slice(1, 3));
+    const fs = readOnly({
+      ...options,
+      get: () => undefined,
+      listDirectory: () => undefined,
+      read,
+    });
+    expect(
+      await fs.read!({ path: "/home/pyodide/a.txt", offset: 1, length: 2 }),
+    ).toEqual({ ok: true, data: bytes.slice(1, 3) });
+    expect(read).toHaveBeenCalledWith({ path: "a.txt", offset: 1, length: 2 });
+  });
+
+  it("reports a file the callback cannot read as not found", async () => {
+    const fs = readOnly({
+      ...options,
+      get: () => undefined,
+      listDirectory: () => undefined,
+      read: () => undefined,
+    });
+    expect(fs.read!({ path: "a.txt", offset: 0, length: 1 })).toMatchObject({
+      ok: false,
+      status: 404,
+    });
+  });
+
+  it("is not offered when no layer reads ranges", () => {
+    const fs = readOnly({
+      ...options,
+      get: () => "x",
+      listDirectory: () => [],
+    });
+    expect(fs.read).toBeUndefined();
+  });
+
+  it("slices what a layer above holds before asking the one below", () => {
+    const read = vi.fn(() => new Uint8Array());
+    const base = readOnly({
+      ...options,
+      get: () => undefined,
+      listDirectory: () => undefined,
+      read,
+    });
+    const fs = readOnly(
+      {
+        ...options,
+        get: (path) => (path === "top.txt" ? "abcdef" : undefined),
+        listDirectory: () => undefined,
+      },
+      base,
+    );
+    expect(fs.read!({ path: "top.txt", offset: 2, length: 3 })).toEqual({
+      ok: true,
+      data: bytes.slice(2, 5),
+    });
+    expect(read).not.toHaveBeenCalled();
+    fs.read!({ path: "below.txt", offset: 0, length: 1 });
+    expect(read).toHaveBeenCalledTimes(1);
+  });
+});
+
 describe("describing a path", () => {
   it("measures contents when no stat callback was given", async () => {
     const fs = readOnly({
@@ -221,6 +286,87 @@ describe("describing a path", () => {
   });
 });
 
+describe("listing a directory with what is in it", () => {
+  const files: Record<string, Contents | { directory: true }> = {
+    "pkg/a.py": "abc",
+    "pkg/sub": { directory: true },
+  };
+  const tree = {
+    ...options,
+    get: (path: string) => files[path],
+    listDirectory: (path: string) => (path === "pkg" ? ["a.py", "sub"] : null),
+  };
+
+  it("puts a listing together from listDirectory and stat", async () => {
+    expect(
+      await readOnly(tree).listDirectoryWithStats!({
+        path: "/home/pyodide/pkg",
+      }),
+    ).toEqual({
+      ok: true,
+      data: [
+        { name: "a.py", size: 3, directory: false },
+        { name: "sub", size: 0, directory: true },
+      ],
+    });
+  });
+
+  it("stays synchronous when the callbacks are synchronous", () => {
+    expect(
+      readOnly(tree).listDirectoryWithStats!({ path: "/home/pyodide/pkg" }),
+    ).not.toBeInstanceOf(Promise);
+  });
+
+  it("waits for callbacks that answer with promises", async () => {
+    const fs = readOnly({
+      ...tree,
+      get: (path) => later(files[path]),
+      listDirectory: (path) => later(tree.listDirectory(path)),
+    });
+    expect(
+      await fs.listDirectoryWithStats!({ path: "/home/pyodide/pkg" }),
+    ).toMatchObject({ data: [{ name: "a.py" }, { name: "sub" }] });
+  });
+
+  it("leaves out entries that cannot be described", async () => {
+    const fs = readOnly({ ...tree, listDirectory: () => ["a.py", "ghost"] });
+    expect(
+      await fs.listDirectoryWithStats!({ path: "/home/pyodide/pkg" }),
+    ).toMatchObject({ data: [{ name: "a.py" }] });
+  });
+
+  it("prefers a listing callback", async () => {
+    const listing = [{ name: "a.py", size: 4096, directory: false }];
+    const fs = readOnly({ ...tree, listDirectoryWithStats: () => listing });
+    expect(
+      await fs.listDirectoryWithStats!({ path: "/home/pyodide/pkg" }),
+    ).toEqual({ ok: true, data: listing });
+  });
+});
+
+describe("a manifest", () => {
+  const reader = {
+    ...options,
+    get: () => undefined,
+    listDirectory: () => undefined,
+  };
+
+  it("hands the callback's entries through", async () => {
+    const entries = [{ path: "a.py", size: 3, directory: false, version: "1" }];
+    const fs = readOnly({ ...reader, manifest: () => later(entries) });
+    expect(await fs.manifest!()).toEqual({ ok: true, data: entries });
+  });
+
+  it("is not offered unless it was given", () => {
+    expect(readOnly(reader).manifest).toBeUndefined();
+  });
+
+  it("fails when the callback declines", async () => {
+    const fs = readOnly({ ...reader, manifest: () => undefined });
+    expect(await fs.manifest!()).toMatchObject({ ok: false, status: 404 });
+  });
+});
+
 describe("writing", () => {
   const collect = (extra: Record<string, unknown> = {}) => {
     const written: [string, Contents | null][] = [];
@@ -286,6 +432,39 @@ describe("writing", () => {
     expect(moves).toEqual([{ from: "a.py", to: "b.py" }]);
   });
 
+  it("hands ranged writes through as bytes at a sanitized path", async () => {
+    const writes: unknown[] = [];
+    const fs = writeOnly({
+      ...options,
+      put: () => {},
+      write: (request) => void writes.push(request),
+    });
+    await fs.write!({
+      path: "/home/pyodide/log.txt",
+      offset: 6,
+      value: utf8.encode("more"),
+    });
+    expect(writes).toEqual([
+      { path: "log.txt", offset: 6, value: utf8.encode("more") },
+    ]);
+  });
+
+  it("hands a truncation through with a sanitized path", async () => {
+    const truncated: unknown[] = [];
+    const fs = writeOnly({
+      ...options,
+      put: () => {},
+      truncate: (path, size) => void truncated.push([path, size]),
+    });
+    await fs.truncate!({ path: "/home/pyodide/log.txt", size: 3 });
+    expect(truncated).toEqual([["log.txt", 3]]);
+  });
+
+  it("offers no ranged writes unless they were given", () => {
+    const fs = writeOnly({ ...options, put: () => {} });
+    expect(fs.write).toBeUndefined();
+  });
+
   it("keeps the base behaviour when no delete callback was given", async () => {
     const fs = writeOnly({ ...options, put: () => {} });
     expect(await fs.delete({ path: "a.py" })).toEqual({
@@ -295,6 +474,54 @@ describe("writing", () => {
   });
 });
 
+describe("hearing of changes", () => {
+  const writer = () =>
+    writeOnly({
+      ...options,
+      put: () => {},
+      move: () => later(undefined),
+      delete: () => {},
+    });
+
+  it("tells a subscriber which paths were written", async () => {
+    const fs = writer();
+    const heard: string[][] = [];
+    fs.subscribe!((paths) => heard.push(paths));
+    await fs.put({ path: "/home/pyodide/a.py", value: "" });
+    await fs.move({
+      path: "/home/pyodide/a.py",
+      newPath: "/home/pyodide/b.py",
+    });
+    await fs.delete({ path: "/home/pyodide/b.py" });
+    expect(heard).toEqual([
+      ["/home/pyodide/a.py"],
+      ["/home/pyodide/a.py", "/home/pyodide/b.py"],
+      ["/home/pyodide/b.py"],
+    ]);
+  });
+
+  it("tells a subscriber of writes a base handled", async () => {
+    const fs = writeOnly({ ...options, put: () => {} }, writer());
+    const listener = vi.fn();
+    fs.subscribe!(listener);
+    await fs.delete({ path: "a.py" });
+    expect(listener).toHaveBeenCalledWith(["a.py"]);
+  });
+
+  it("stops telling a subscriber that unsubscribed", async () => {
+    const fs = readWrite({
+      ...options,
+      get: () => undefined,
+      listDirectory: () => undefined,
+      put: () => {},
+    });
+    const listener = vi.fn();
+    fs.subscribe!(listener)();
+    await fs.put({ path: "a.py", value: "" });
+    expect(listener).not.toHaveBeenCalled();
+  });
+});
+
 describe("reading and writing together", () => {
   const store = () => {
     const files = new Map<string, Contents>();
@@ -0,0 +1,100 @@
+import { createServer, type IncomingMessage } from "node:http";
+import type { AddressInfo } from "node:net";
+
+/**
+ * A static file server, standing in for the one datasets are served from. It
+ * answers `Range`, `If-Range`, `If-None-Match` and `HEAD` the way such servers
+ * do, and records what it was asked.
+ */
+export const serve = async (
+  initial: Record<string, string | Uint8Array> = {},
+  { ignoresRanges = false, delay = 0 } = {},
+) => {
+  const files = new Map(
+    Object.entries(initial).map(([path, value]) => [
+      path,
+      typeof value === "string" ? new TextEncoder().encode(value) : value,
+    ]),
+  );
+  const versions = new Map<string, number>();
+  const requests: {
+    method: string;
+    path: string;
+    range?: string;
+    ifRange?: string;
+    conditional: boolean;
+  }[] = [];
+  let inFlight = 0;
+  let mostInFlight = 0;
+
+  const etagOf = (path: string) => `"${versions.get(path) ?? 0}"`;
+
+  const answer = (request: IncomingMessage) => {
+    const path = decodeURIComponent(request.url!.slice(1));
+    const { range, "if-range": ifRange } = request.headers;
+    const conditional = request.headers["if-none-match"] !== undefined;
+    requests.push({
+      method: request.method!,
+      path,
+      range,
+      ifRange,
+      conditional,
+    });
+    const body = files.get(path);
+    if (!body) return { status: 404, headers: {}, body: new Uint8Array() };
+    const etag = etagOf(path);
+    if (request.headers["if-none-match"] === etag)
+      return { status: 304, headers: { ETag: etag }, body: new Uint8Array() };
+    const match = /^bytes=(\d+)-(\d+)$/.exec(range ?? "");
+    if (!match || ignoresRanges || (ifRange !== undefined && ifRange !== etag))
+      return { status: 200, headers: { ETag: etag }, body };
+    const start = Number(match[1]);
+    if (start >= body.length)
+      return {
+        status: 416,
+        headers: { "Content-Range": `bytes */${body.length}` },
+        body: new Uint8Array(),
+      };
+    const slice = body.subarray(start, Number(match[2]) + 1);
+    return {
+      status: 206,
+      headers: {
+        ETag: etag,
+        "Content-Range": `bytes ${start}-${start + slice.length - 1}/${body.length}`,
+      },
+      body: slice,
+    };
+  };
+
+  const server = createServer(async (request, response) => {
+    mostInFlight = Math.max(mostInFlight, ++inFlight);
+    if (delay > 0) await new Promise((resolve) => setTimeout(resolve, delay));
+    const { status, headers, body } = answer(request);
+    response.writeHead(status, {
+      ...headers,
+      "Content-Length": String(body.length),
+    });
+    inFlight--;
+    response.end(request.method === "HEAD" ? undefined : body);
+  });
+  await new Promise<void>((resolve) => server.listen(0, "127.0.0.1", resolve));
+  const { port } = server.address() as AddressInfo;
+
+  return {
+    baseURL: `http://127.0.0.1:${port}/`,
+    requests,
+    get mostInFlight() {
+      return mostInFlight;
+    },
+    /** Changes a file, giving it a new `ETag`. */
+    set: (path: string, value: string) => {
+      files.set(path, new TextEncoder().encode(value));
+      versions.set(path, (versions.get(path) ?? 0) + 1);
+    },
+    close: () =>
+      new Promise<void>((resolve) => {
+        server.closeAllConnections();
+        server.close(() => resolve());
+      }),
+  };
+};
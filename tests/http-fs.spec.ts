@@ -0,0 +1,223 @@
+import { afterEach, describe, expect, it } from "vitest";
+import { http } from "../release/http-fs";
+import { serve } from "./http-fs.fixture";
+
+const text = (value: string) => new TextEncoder().encode(value);
+
+const manifest = JSON.stringify([
+  { path: "data/big.csv", size: 10 },
+  { path: "data/small.txt", size: 5 },
+  { path: "empty", size: 0, directory: true },
+]);
+
+const files = {
+  "manifest.json": manifest,
+  "data/big.csv": "0123456789",
+  "data/small.txt": "hello",
+};
+
+describe("a filesystem served over http", () => {
+  const servers: Awaited<ReturnType<typeof serve>>[] = [];
+  const server = async (...args: Parameters<typeof serve>) => {
+    const started = await serve(...args);
+    servers.push(started);
+    return started;
+  };
+  const mounted = async (
+    options: Parameters<typeof serve>[1] & {
+      concurrency?: number;
+      maxBytes?: number;
+    } = {},
+  ) => {
+    const { concurrency, maxBytes, ...serving } = options;
+    const remote = await server(files, serving);
+    const fs = http({
+      baseURL: remote.baseURL,
+      manifestURL: "manifest.json",
+      concurrency,
+      maxBytes,
+    });
+    return { remote, fs };
+  };
+
+  afterEach(async () => {
+    await Promise.all(servers.splice(0).map((started) => started.close()));
+  });
+
+  it("describes and lists paths from the manifest alone", async () => {
+    const { remote, fs } = await mounted();
+    expect(await fs.stat({ path: "/home/pyodide/data/big.csv" })).toEqual({
+      ok: true,
+      data: { size: 10, directory: false },
+    });
+    expect(await fs.listDirectory({ path: "/home/pyodide" })).toEqual({
+      ok: true,
+      data: ["data", "empty"],
+    });
+    expect(await fs.get({ path: "/home/pyodide/empty" })).toEqual({
+      ok: true,
+      data: null,
+    });
+    expect(remote.requests.map(({ path }) => path)).toEqual(["manifest.json"]);
+  });
+
+  it("lists an empty directory as empty rather than missing", async () => {
+    const { fs } = await mounted();
+    expect(await fs.listDirectory({ path: "empty" })).toEqual({
+      ok: true,
+      data: [],
+    });
+  });
+
+  it("knows a path the manifest lacks is missing without asking", async () => {
+    const { remote, fs } = await mounted();
+    expect(await fs.get({ path: "ghost.txt" })).toMatchObject({ status: 404 });
+    expect(remote.requests).toHaveLength(1);
+  });
+
+  it("hands the worker the manifest", async () => {
+    const { fs } = await mounted();
+    expect(await fs.manifest!()).toMatchObject({
+      ok: true,
+      data: [{ path: "data/big.csv" }, { path: "data/small.txt" }, {}],
+    });
+  });
+
+  it("asks whether the manifest changed rather than fetching it again", async () => {
+    const { remote, fs } = await mounted();
+    const first = await fs.manifest!();
+    expect(await fs.manifest!()).toEqual(first);
+    expect(remote.requests.map(({ conditional }) => conditional)).toEqual([
+      false,
+      true,
+    ]);
+  });
+
+  it("reads part of a file with a range request", async () => {
+    const { remote, fs } = await mounted();
+    expect(
+      await fs.read!({ path: "data/big.csv", offset: 2, length: 3 }),
+    ).toEqual({ ok: true, data: text("234") });
+    expect(remote.requests).toEqual([
+      expect.objectContaining({ path: "data/big.csv", range: "bytes=2-4" }),
+    ]);
+  });
+
+  it("reads fewer bytes at the end of a file and none past it", async () => {
+    const { fs } = await mounted();
+    const read = (offset: number) =>
+      fs.read!({ path: "data/small.txt", offset, length: 4 });
+    expect(await read(3)).toEqual({ ok: true, data: text("lo") });
+    expect(await read(10)).toEqual({ ok: true, data: new Uint8Array() });
+  });
+
+  it("cuts the range out of a server that ignores ranges", async () => {
+    const { fs } = await mounted({ ignoresRanges: true });
+    expect(
+      await fs.read!({ path: "data/big.csv", offset: 7, length: 5 }),
+    ).toEqual({ ok: true, data: text("789") });
+  });
+
+  it("reads the rest of a file from the version its first piece came from", async () => {
+    const { remote, fs } = await mounted();
+    await fs.read!({ path: "data/big.csv", offset: 0, length: 2 });
+    expect(
+      await fs.read!({ path: "data/big.csv", offset: 2, length: 2 }),
+    ).toEqual({ ok: true, data: text("23") });
+    expect(remote.requests.map(({ ifRange }) => ifRange)).toEqual([
+      undefined,
+      '"0"',
+    ]);
+  });
+
+  it("fails a read rather than mixing in a version that changed", async () => {
+    const { fs, remote } = await mounted();
+    await fs.read!({ path: "data/big.csv", offset: 0, length: 2 });
+    remote.set("data/big.csv", "abcdefghij");
+    await expect(
+      Promise.resolve(fs.read!({ path: "data/big.csv", offset: 2, length: 2 })),
+    ).rejects.toThrow("changed");
+    expect(
+      await fs.read!({ path: "data/big.csv", offset: 2, length: 2 }),
+    ).toEqual({ ok: true, data: text("cd") });
+  });
+
+  it("keeps a file the server says has not changed", async () => {
+    const { remote, fs } = await mounted();
+    await fs.get({ path: "data/small.txt" });
+    expect(await fs.get({ path: "data/small.txt" })).toEqual({
+      ok: true,
+      data: text("hello"),
+    });
+    remote.set("data/small.txt", "changed");
+    expect(await fs.get({ path: "data/small.txt" })).toEqual({
+      ok: true,
+      data: text("changed"),
+    });
+    expect(
+      remote.requests
+        .filter(({ path }) => path === "data/small.txt")
+        .map(({ conditional }) => conditional),
+    ).toEqual([false, true, true]);
+  });
+
+  it("drops the least recently used beyond what it was allowed", async () => {
+    const { remote, fs } = await mounted({ maxBytes: 12 });
+    await fs.get({ path: "data/small.txt" });
+    await fs.get({ path: "data/small.txt" });
+    await fs.get({ path: "data/big.csv" });
+    expect(await fs.get({ path: "data/small.txt" })).toEqual({
+      ok: true,
+      data: text("hello"),
+    });
+    expect(
+      remote.requests
+        .filter(({ path }) => path === "data/small.txt")
+        .map(({ conditional }) => conditional),
+    ).toEqual([false, true, false]);
+  });
+
+  it("keeps nothing larger than it was allowed", async () => {
+    const { remote, fs } = await mounted({ maxBytes: 8 });
+    await fs.get({ path: "data/big.csv" });
+    await fs.get({ path: "data/big.csv" });
+    expect(
+      remote.requests
+        .filter(({ path }) => path === "data/big.csv")
+        .map(({ conditional }) => conditional),
+    ).toEqual([false, false]);
+  });
+
+  it("keeps no more requests in flight than it was allowed", async () => {
+    const { remote, fs } = await mounted({ delay: 20, concurrency: 2 });
+    await Promise.all(
+      Array.from({ length: 8 }, (_, offset) =>
+        fs.read!({ path: "data/big.csv", offset, length: 1 }),
+      ),
+    );
+    expect(remote.requests).toHaveLength(8);
+    expect(remote.mostInFlight).toBe(2);
+  });
+
+  it("describes paths with HEAD requests without a manifest", async () => {
+    const remote = await server(files);
+    const fs = http({ baseURL: remote.baseURL });
+    expect(await fs.stat({ path: "data/small.txt" })).toEqual({
+      ok: true,
+      data: { size: 5, directory: false },
+    });
+    expect(remote.requests).toEqual([
+      expect.objectContaining({ method: "HEAD", path: "data/small.txt" }),
+    ]);
+  });
+
+  it("reports a server error as a failure rather than a missing file", async () => {
+    const fs = http({
+      baseURL: "http://localhost/",
+      fetch: async () => new Response("down", { status: 503 }),
+    });
+    await expect(
+      Promise.resolve(fs.read!({ path: "a.bin", offset: 0, length: 1 })),
+    ).rejects.toThrow("503");
+  });
+});
@@ -0,0 +1,239 @@
+import { describe, expect, it } from "vitest";
+import { indexedDBFileSystem } from "../release/indexeddb-fs";
+import { memoryIndexedDB } from "./indexeddb.fixture";
+
+const text = (value: string) => new TextEncoder().encode(value);
+
+const persistent = (options: { chunkSize?: number } = {}) => {
+  const indexedDB = memoryIndexedDB();
+  const open = () => indexedDBFileSystem({ ...options, indexedDB });
+  return { indexedDB, fs: open(), open };
+};
+
+describe("a filesystem kept in IndexedDB", () => {
+  it("reads back what was written", async () => {
+    const { fs } = persistent();
+    await fs.put({ path: "/home/pyodide/pkg/a.py", value: "x = 1" });
+    expect(await fs.get({ path: "/home/pyodide/pkg/a.py" })).toEqual({
+      ok: true,
+      data: text("x = 1"),
+    });
+    expect(await fs.get({ path: "/home/pyodide/pkg" })).toEqual({
+      ok: true,
+      data: null,
+    });
+  });
+
+  it("keeps files for the next page that opens it", async () => {
+    const { fs, open } = persistent();
+    await fs.put({ path: "a.py", value: "kept" });
+    await fs.close();
+    expect(await open().get({ path: "a.py" })).toMatchObject({
+      data: text("kept"),
+    });
+  });
+
+  it("describes files in bytes, with a version that changes", async () => {
+    const { fs } = persistent();
+    await fs.put({ path: "snake.txt", value: "🐍" });
+    const first = await fs.stat({ path: "snake.txt" });
+    expect(first).toMatchObject({ data: { size: 4, directory: false } });
+    await fs.put({ path: "snake.txt", value: "🐍" });
+    const second = await fs.stat({ path: "snake.txt" });
+    expect(second.ok && second.data.version).not.toBe(
+      first.ok && first.data.version,
+    );
+  });
+
+  it("lists directories with their entries", async () => {
+    const { fs } = persistent();
+    await fs.put({ path: "pkg/a.py", value: "abc" });
+    await fs.put({ path: "pkg/sub", value: null });
+    expect(await fs.listDirectory({ path: "" })).toEqual({
+      ok: true,
+      data: ["pkg"],
+    });
+    expect(await fs.listDirectoryWithStats!({ path: "pkg" })).toEqual({
+      ok: true,
+      data: [
+        expect.objectContaining({ name: "a.py", size: 3, directory: false }),
+        expect.objectContaining({ name: "sub", directory: true }),
+      ],
+    });
+  });
+
+  it("gives a manifest of every path", async () => {
+    const { fs } = persistent();
+    await fs.put({ path: "pkg/a.py", value: "abc" });
+    const manifest = await fs.manifest!();
+    expect(manifest.ok && manifest.data.map(({ path }) => path).sort()).toEqual(
+      ["pkg", "pkg/a.py"],
+    );
+  });
+
+  it("reports a missing path as not found", async () => {
+    const { fs } = persistent();
+    expect(await fs.stat({ path: "ghost" })).toMatchObject({ status: 404 });
+    expect(await fs.get({ path: "ghost" })).toMatchObject({ status: 404 });
+  });
+
+  it("deletes a directory with everything under it", async () => {
+    const { fs } = persistent();
+    await fs.put({ path: "pkg/sub/a.py", value: "a" });
+    await fs.delete({ path: "pkg" });
+    expect(await fs.stat({ path: "pkg/sub/a.py" })).toMatchObject({
+      status: 404,
+    });
+    expect(await fs.listDirectory({ path: "" })).toEqual({
+      ok: true,
+      data: [],
+    });
+  });
+
+  it("moves a directory with everything under it", async () => {
+    const { fs } = persistent();
+    await fs.put({ path: "pkg/sub/a.py", value: "a" });
+    await fs.move({ path: "pkg", newPath: "lib/pkg" });
+    expect(await fs.get({ path: "lib/pkg/sub/a.py" })).toMatchObject({
+      data: text("a"),
+    });
+    expect(await fs.listDirectory({ path: "" })).toEqual({
+      ok: true,
+      data: ["lib"],
+    });
+  });
+
+  it("groups calls made together into one transaction", async () => {
+    const { fs, indexedDB } = persistent();
+    await fs.put({ path: "a.py", value: "" });
+    const before = indexedDB.transactions("python-web-kernel");
+    await Promise.all(
+      Array.from({ length: 50 }, () => fs.stat({ path: "a.py" })),
+    );
+    expect(indexedDB.transactions("python-web-kernel")).toBe(before + 1);
+  });
+
+  it("adds to and removes from a directory without rewriting it", async () => {
+    const { fs, indexedDB } = persistent();
+    await Promise.all(
+      Array.from({ length: 100 }, (_, index) =>
+        fs.put({ path: `pkg/${index}.py`, value: "" }),
+      ),
+    );
+    const before = indexedDB.puts("python-web-kernel");
+    await fs.put({ path: "pkg/new.py", value: "" });
+    await fs.delete({ path: "pkg/0.py" });
+    expect(indexedDB.puts("python-web-kernel")).toBe(before + 1);
+    const listing = await fs.listDirectory({ path: "pkg" });
+    expect(listing.ok && listing.data).toHaveLength(100);
+    expect(listing.ok && listing.data).toContain("new.py");
+    expect(listing.ok && listing.data).not.toContain("0.py");
+  });
+
+  it("does what was asked together in the order it was asked", async () => {
+    const { fs } = persistent();
+    const [, read] = await Promise.all([
+      fs.put({ path: "a.py", value: "new" }),
+      fs.get({ path: "a.py" }),
+    ]);
+    expect(read).toMatchObject({ data: text("new") });
+  });
+
+  it("fails only the call that failed", async () => {
+    const { fs } = persistent();
+    await fs.put({ path: "a.py", value: "" });
+    const [failed, stat] = await Promise.all([
+      fs.truncate!({ path: "ghost", size: 0 }).then(
+        () => "resolved",
+        () => "rejected",
+      ),
+      fs.stat({ path: "a.py" }),
+    ]);
+    expect(failed).toBe("rejected");
+    expect(stat).toMatchObject({ ok: true });
+  });
+
+  it("keeps nothing of a call that failed part way", async () => {
+    const { fs } = persistent();
+    await fs.put({ path: "a.txt", value: "a" });
+    await fs.put({ path: "b.txt", value: "b" });
+    const [moved] = await Promise.all([
+      fs.move({ path: "a.txt", newPath: "b.txt/c.txt" }).then(
+        () => "resolved",
+        () => "rejected",
+      ),
+      fs.put({ path: "c.txt", value: "c" }),
+    ]);
+    expect(moved).toBe("rejected");
+    expect(await fs.get({ path: "a.txt" })).toEqual({
+      ok: true,
+      data: text("a"),
+    });
+    expect(await fs.get({ path: "c.txt" })).toEqual({
+      ok: true,
+      data: text("c"),
+    });
+    expect(await fs.listDirectory({ path: "" })).toEqual({
+      ok: true,
+      data: ["a.txt", "b.txt", "c.txt"],
+    });
+  });
+});
+
+describe("a large file kept in IndexedDB", () => {
+  const chunked = async () => {
+    const setup = persistent({ chunkSize: 4 });
+    await setup.fs.put({ path: "data.bin", value: "abcdefghij" });
+    return setup;
+  };
+
+  it("reads a range from the pieces it covers", async () => {
+    const { fs } = await chunked();
+    expect(await fs.read!({ path: "data.bin", offset: 3, length: 6 })).toEqual({
+      ok: true,
+      data: text("defghi"),
+    });
+    expect(await fs.read!({ path: "data.bin", offset: 8, length: 6 })).toEqual({
+      ok: true,
+      data: text("ij"),
+    });
+  });
+
+  it("writes into the middle of a file", async () => {
+    const { fs } = await chunked();
+    await fs.write!({ path: "data.bin", offset: 2, value: text("XYZW") });
+    expect(await fs.get({ path: "data.bin" })).toMatchObject({
+      data: text("abXYZWghij"),
+    });
+  });
+
+  it("fills a gap left by a write past the end with zeroes", async () => {
+    const { fs } = await chunked();
+    await fs.write!({ path: "data.bin", offset: 14, value: text("!") });
+    const read = await fs.get({ path: "data.bin" });
+    expect(read.ok && read.data).toEqual(
+      new Uint8Array([...text("abcdefghij"), 0, 0, 0, 0, ...text("!")]),
+    );
+  });
+
+  it("cuts a file down and pads it out again with zeroes", async () => {
+    const { fs } = await chunked();
+    await fs.truncate!({ path: "data.bin", size: 5 });
+    expect(await fs.get({ path: "data.bin" })).toMatchObject({
+      data: text("abcde"),
+    });
+    await fs.truncate!({ path: "data.bin", size: 7 });
+    const read = await fs.get({ path: "data.bin" });
+    expect(read.ok && read.data).toEqual(
+      new Uint8Array([...text("abcde"), 0, 0]),
+    );
+  });
+
+  it("keeps a moved file's contents", async () => {
+    const { fs } = await chunked();
+    await fs.move({ path: "data.bin", newPath: "moved.bin" });
+    expect(await fs.get({ path: "moved.bin" })).toMatchObject({
+      data: text("abcdefghij"),
+    });
+  });
+});
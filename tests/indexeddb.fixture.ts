@@ -0,0 +1,226 @@
+/**
+ * An in-memory stand-in for IndexedDB, with just what the filesystem uses:
+ * object stores with out-of-line keys, `get`, `getAll`, `put` and `delete`,
+ * indexes on a field to `getAll` by, and transactions that commit once
+ * nothing is left to do, or roll back when aborted.
+ *
+ * Values are cloned on the way in and out, as a real database would, and
+ * every request completes on a later task, so code that forgets to wait for
+ * one fails here as it would in a browser.
+ */
+
+type Records = Map<string, { key: IDBValidKey; value: unknown }>;
+
+const keyOf = (key: IDBValidKey) => JSON.stringify(key);
+
+class Request<T = unknown> {
+  result: T | undefined;
+  error: DOMException | null = null;
+  onsuccess: ((event: { target: Request<T> }) => void) | null = null;
+  onerror: ((event: { target: Request<T> }) => void) | null = null;
+  onupgradeneeded: ((event: { target: Request<T> }) => void) | null = null;
+}
+
+class Store {
+  constructor(
+    private readonly transaction: Transaction,
+    private readonly records: Records,
+    private readonly indexes: Map<string, string>,
+  ) {}
+
+  /** Records whose field matches come back in order of their own keys. */
+  index(name: string) {
+    const field = this.indexes.get(name);
+    if (field === undefined)
+      throw new DOMException(`${name} is not an index`, "NotFoundError");
+    return {
+      getAll: (query: IDBValidKey) =>
+        this.transaction.request(() =>
+          [...this.records.entries()]
+            .filter(
+              ([, { value }]) =>
+                keyOf((value as Record<string, IDBValidKey>)[field]) ===
+                keyOf(query),
+            )
+            .sort(([left], [right]) => (left < right ? -1 : 1))
+            .map(([, { value }]) => structuredClone(value)),
+        ),
+    };
+  }
+
+  get(key: IDBValidKey) {
+    return this.transaction.request(() =>
+      structuredClone(this.records.get(keyOf(key))?.value),
+    );
+  }
+
+  getAll() {
+    return this.transaction.request(() =>
+      [...this.records.entries()]
+        .sort(([left], [right]) => (left < right ? -1 : 1))
+        .map(([, { value }]) => structuredClone(value)),
+    );
+  }
+
+  put(value: unknown, key: IDBValidKey) {
+    return this.transaction.request(() => {
+      this.transaction.assertWritable();
+      this.transaction.database.puts++;
+      this.records.set(keyOf(key), { key, value: structuredClone(value) });
+      return key;
+    });
+  }
+
+  delete(key: IDBValidKey) {
+    return this.transaction.request(() => {
+      this.transaction.assertWritable();
+      this.records.delete(keyOf(key));
+      return undefined;
+    });
+  }
+}
+
+class Transaction {
+  oncomplete: (() => void) | null = null;
+  onerror: (() => void) | null = null;
+  onabort: (() => void) | null = null;
+  error: DOMException | null = null;
+  private pending: (() => void)[] = [];
+  private finished = false;
+  private readonly before: Map<string, Records>;
+
+  constructor(
+    readonly database: Database,
+    private readonly names: string[],
+    private readonly mode: IDBTransactionMode,
+  ) {
+    this.before = new Map(
+      names.map((name) => [name, new Map(database.stores.get(name)!)]),
+    );
+    database.transactions++;
+    setTimeout(() => this.settle());
+  }
+
+  objectStore(name: string) {
+    if (!this.names.includes(name))
+      throw new DOMException(`${name} is not in scope`, "NotFoundError");
+    return new Store(
+      this,
+      this.database.stores.get(name)!,
+      this.database.indexes.get(name)!,
+    );
+  }
+
+  assertWritable() {
+    if (this.mode === "readonly")
+      throw new DOMException("The transaction is read-only", "ReadOnlyError");
+  }
+
+  request<T>(perform: () => T) {
+    if (this.finished)
+      throw new DOMException(
+        "The transaction has finished",
+        "InvalidStateError",
+      );
+    const request = new Request<T>();
+    this.pending.push(() => {
+      try {
+        request.result = perform();
+        request.onsuccess?.({ target: request });
+      } catch (thrown) {
+        request.error = thrown as DOMException;
+        request.onerror?.({ target: request });
+        this.error = request.error;
+        this.abort();
+      }
+    });
+    if (this.pending.length === 1) setTimeout(() => this.next());
+    return request;
+  }
+
+  /** Runs requests in the order they were made, one task each. */
+  private next() {
+    const perform = this.pending[0];
+    if (!perform || this.finished) return;
+    perform();
+    this.pending.shift();
+    if (this.pending.length > 0) setTimeout(() => this.next());
+    else setTimeout(() => this.settle());
+  }
+
+  /** Commits once a task passes with nothing asked of it. */
+  private settle() {
+    if (this.finished || this.pending.length > 0) return;
+    this.finished = true;
+    this.oncomplete?.();
+  }
+
+  /** As in a browser, a transaction that has finished cannot be aborted. */
+  abort() {
+    if (this.finished)
+      throw new DOMException(
+        "The transaction has finished",
+        "InvalidStateError",
+      );
+    this.finished = true;
+    this.pending = [];
+    for (const [name, records] of this.before)
+      this.database.stores.set(name, records);
+    this.onerror?.();
+    this.onabort?.();
+  }
+}
+
+class Database {
+  readonly stores = new Map<string, Records>();
+  readonly indexes = new Map<string, Map<string, string>>();
+  transactions = 0;
+  puts = 0;
+  version = 0;
+
+  get objectStoreNames() {
+    return { contains: (name: string) => this.stores.has(name) };
+  }
+
+  createObjectStore(name: string) {
+    this.stores.set(name, new Map());
+    const indexes = new Map<string, string>();
+    this.indexes.set(name, indexes);
+    return {
+      createIndex: (index: string, field: string) =>
+        void indexes.set(index, field),
+    };
+  }
+
+  transaction(names: string | string[], mode: IDBTransactionMode = "readonly") {
+    return new Transaction(this, [names].flat(), mode);
+  }
+
+  close() {}
+}
+
+/** A fresh set of databases, shared by whatever is handed the same one. */
+export const memoryIndexedDB = () => {
+  const databases = new Map<string, Database>();
+  const factory = {
+    open: (name: string, version = 1) => {
+      const request = new Request<Database>();
+      setTimeout(() => {
+        const database = databases.get(name) ?? new Database();
+        databases.set(name, database);
+        request.result = database;
+        if (database.version < version) {
+          database.version = version;
+          request.onupgradeneeded?.({ target: request });
+        }
+        request.onsuccess?.({ target: request });
+      });
+      return request;
+    },
+    /** How many transactions a database has been asked for. */
+    transactions: (name: string) => databases.get(name)?.transactions ?? 0,
+    /** How many records have been written to a database. */
+    puts: (name: string) => databases.get(name)?.puts ?? 0,
+  };
+  return factory as typeof factory & IDBFactory;
+};
@@ -0,0 +1,149 @@
+import { describe, expect, it } from "vitest";
+import { pool } from "../release/kernel-pool";
+import { flatPromise } from "../release/utils";
+
+/** Kernels that start when the test says so, and remember what was done. */
+const kernels = () => {
+  const made: {
+    started: () => void;
+    ready: Promise<void>;
+    resets: number;
+    disposed: boolean;
+    reset: () => Promise<void>;
+    dispose: () => void;
+  }[] = [];
+  const create = () => {
+    const ready = flatPromise<void>();
+    const kernel = {
+      started: () => ready.resolve(),
+      ready: ready.promise,
+      resets: 0,
+      disposed: false,
+      reset: async () => void kernel.resets++,
+      dispose: () => void (kernel.disposed = true),
+    };
+    made.push(kernel);
+    return kernel;
+  };
+  const startAll = async () => {
+    for (const kernel of made) kernel.started();
+    await new Promise((resolve) => setTimeout(resolve));
+  };
+  return { made, create, startAll };
+};
+
+describe("a pool of kernels", () => {
+  it("starts `min` kernels ahead of the first acquire", async () => {
+    const { made, create, startAll } = kernels();
+    const kernelPool = pool(create, { min: 2 });
+    expect(made).toHaveLength(2);
+    await startAll();
+    expect(kernelPool.stats()).toMatchObject({ idle: 2, starting: 0 });
+  });
+
+  it("hands out a started kernel and starts another in its place", async () => {
+    const { made, create, startAll } = kernels();
+    const kernelPool = pool(create, { min: 1 });
+    await startAll();
+    const kernel = await kernelPool.acquire();
+    expect(kernel).toBe(made[0]);
+    expect(made).toHaveLength(2);
+    expect(kernelPool.stats()).toMatchObject({
+      acquired: 1,
+      warmHits: 1,
+      busy: 1,
+      starting: 1,
+    });
+  });
+
+  it("makes an acquire wait for a kernel still starting", async () => {
+    const { made, create, startAll } = kernels();
+    let time = 0;
+    const kernelPool = pool(create, { min: 1, now: () => time });
+    const acquired = kernelPool.acquire();
+    expect(kernelPool.stats()).toMatchObject({ starting: 2, waiting: 1 });
+    time = 250;
+    await startAll();
+    expect(await acquired).toBe(made[0]);
+    expect(kernelPool.stats()).toMatchObject({
+      warmHits: 0,
+      waited: 250,
+      longestWait: 250,
+    });
+  });
+
+  it("resets a released kernel and hands it out again", async () => {
+    const { made, create, startAll } = kernels();
+    const kernelPool = pool(create, { min: 0, max: 1 });
+    const acquired = kernelPool.acquire();
+    await startAll();
+    const kernel = await acquired;
+    await kernelPool.release(kernel);
+    expect(kernel.resets).toBe(1);
+    expect(await kernelPool.acquire()).toBe(kernel);
+    expect(made).toHaveLength(1);
+  });
+
+  it("has at most `max` kernels, and queues acquires beyond", async () => {
+    const { made, create, startAll } = kernels();
+    const kernelPool = pool(create, { min: 1, max: 1 });
+    await startAll();
+    const first = await kernelPool.acquire();
+    const second = kernelPool.acquire();
+    expect(made).toHaveLength(1);
+    expect(kernelPool.stats().waiting).toBe(1);
+    await kernelPool.release(first);
+    expect(await second).toBe(first);
+  });
+
+  it("disposes of a kernel when asked, or once it is used up", async () => {
+    const { made, create, startAll } = kernels();
+    const kernelPool = pool(create, { min: 0, max: 1, uses: 2 });
+    const acquired = kernelPool.acquire();
+    await startAll();
+    const kernel = await acquired;
+    await kernelPool.release(kernel, { recycle: true });
+    expect(kernel.disposed).toBe(true);
+
+    const replacement = kernelPool.acquire();
+    await startAll();
+    const fresh = await replacement;
+    expect(fresh).toBe(made[1]);
+    await kernelPool.release(fresh);
+    await kernelPool.release(await kernelPool.acquire());
+    expect(fresh.disposed).toBe(true);
+    expect(fresh.resets).toBe(1);
+    expect(kernelPool.stats().recycled).toBe(2);
+  });
+
+  it("disposes of a kernel that fails to reset", async () => {
+    const { create, startAll } = kernels();
+    const kernelPool = pool(create, { min: 0 });
+    const acquired = kernelPool.acquire();
+    await startAll();
+    const kernel = await acquired;
+    kernel.reset = () => Promise.reject(new Error("the worker is gone"));
+    await kernelPool.release(kernel);
+    expect(kernel.disposed).toBe(true);
+    expect(kernelPool.stats()).toMatchObject({ idle: 0, recycled: 1 });
+  });
+
+  it("refuses a kernel it did not hand out", async () => {
+    const { create } = kernels();
+    const kernelPool = pool(create);
+    await expect(kernelPool.release(create())).rejects.toThrow(
+      "Only a kernel acquired from the pool can be released",
+    );
+  });
+
+  it("disposes of everything, and turns waiting acquires away", async () => {
+    const { made, create, startAll } = kernels();
+    const kernelPool = pool(create, { min: 1, max: 1 });
+    await startAll();
+    await kernelPool.acquire();
+    const waiting = kernelPool.acquire();
+    kernelPool.dispose();
+    await expect(waiting).rejects.toThrow("disposed");
+    expect(made.every(({ disposed }) => disposed)).toBe(true);
+  });
+});
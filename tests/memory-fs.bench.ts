@@ -0,0 +1,53 @@
+import { bench, describe } from "vitest";
+import { readWrite, type HostFileSystem } from "../release/fs";
+import { memory } from "../release/memory-fs";
+import type { Contents } from "../release/contents";
+
+const FILES = 20_000;
+
+const workspace = Object.fromEntries(
+  Array.from({ length: FILES }, (_, index) => [
+    `pkg${index % 200}/mod${index}.py`,
+    "x = 1\n",
+  ]),
+);
+
+/** What building on a `Map` looks like: every question scans every key. */
+const scanned = () => {
+  const store = new Map<string, Contents>(Object.entries(workspace));
+  const isDirectory = (path: string) =>
+    path === "" || [...store.keys()].some((key) => key.startsWith(`${path}/`));
+  return readWrite({
+    get: (path) =>
+      store.get(path) ?? (isDirectory(path) ? { directory: true } : undefined),
+    listDirectory: (path) =>
+      isDirectory(path)
+        ? [
+            ...new Set(
+              [...store.keys()]
+                .filter((key) => key.startsWith(path === "" ? "" : `${path}/`))
+                .map((key) => key.slice(path === "" ? 0 : path.length + 1))
+                .map((rest) => rest.split("/")[0]),
+            ),
+          ]
+        : undefined,
+    put: (path, value) => void store.set(path, value!),
+  });
+};
+
+/** What `os.walk` asks of a filesystem that offers nothing better. */
+const walk = (fs: HostFileSystem, path = "/home/pyodide") => {
+  const listing = fs.listDirectory({ path }) as any;
+  for (const name of listing.data) {
+    const entry = (fs.stat({ path: `${path}/${name}` }) as any).data;
+    if (entry.directory) walk(fs, `${path}/${name}`);
+  }
+};
+
+describe(`walking ${FILES} files`, () => {
+  bench("kept in memory files", () => walk(memory({ files: workspace })), {
+    iterations: 3,
+  });
+
+  bench("kept in a map", () => walk(scanned()), { iterations: 1 });
+});
@@ -0,0 +1,202 @@
+import { describe, expect, it } from "vitest";
+import { MemoryFiles, memory } from "../release/memory-fs";
+
+const png = new Uint8Array([0x89, 0x50, 0x4e, 0x47]);
+
+describe("memory files", () => {
+  it("reads back what was set", () => {
+    const files = new MemoryFiles([["pkg/a.py", "x = 1"]]);
+    files.set("logo.png", png);
+    expect(files.get("pkg/a.py")).toBe("x = 1");
+    expect(files.get("logo.png")).toBe(png);
+    expect(files.get("pkg")).toBeUndefined();
+  });
+
+  it("implies the directories above a file", () => {
+    const files = new MemoryFiles([["a/b/c.py", ""]]);
+    expect(files.isDirectory("a")).toBe(true);
+    expect(files.isDirectory("a/b")).toBe(true);
+    expect(files.list("")).toEqual(["a"]);
+    expect(files.list("a/b")).toEqual(["c.py"]);
+  });
+
+  it("treats slashes at either end as the same path", () => {
+    const files = new MemoryFiles([["/a/b.py/", "x"]]);
+    expect(files.get("a/b.py")).toBe("x");
+    expect(files.get("/a//b.py")).toBe("x");
+  });
+
+  it("lists nothing for a file or a missing directory", () => {
+    const files = new MemoryFiles([["a.py", ""]]);
+    expect(files.list("a.py")).toBeUndefined();
+    expect(files.list("ghost")).toBeUndefined();
+  });
+
+  it("describes files in bytes and directories as empty", () => {
+    const files = new MemoryFiles([["pkg/snake.txt", "🐍"]]);
+    expect(files.stat("pkg/snake.txt")).toMatchObject({
+      size: 4,
+      directory: false,
+    });
+    expect(files.stat("pkg")).toMatchObject({ size: 0, directory: true });
+    expect(files.stat("ghost")).toBeUndefined();
+  });
+
+  it("gives a file a new version each time it is set", () => {
+    const files = new MemoryFiles([["a.py", "1"]]);
+    const first = files.stat("a.py")!.version;
+    files.set("a.py", "1");
+    expect(files.stat("a.py")!.version).not.toBe(first);
+  });
+
+  it("never reuses a version for a file made again", () => {
+    const files = new MemoryFiles([["a.py", "1"]]);
+    const first = files.stat("a.py")!.version;
+    files.delete("a.py");
+    files.set("a.py", "1");
+    expect(files.stat("a.py")!.version).not.toBe(first);
+  });
+
+  it("counts files and bytes as they come and go", () => {
+    const files = new MemoryFiles([
+      ["a.txt", "abc"],
+      ["pkg/b.bin", png],
+    ]);
+    expect([files.size, files.bytes]).toEqual([2, 7]);
+    files.set("a.txt", "a");
+    expect([files.size, files.bytes]).toEqual([2, 5]);
+    files.delete("pkg");
+    expect([files.size, files.bytes]).toEqual([1, 1]);
+  });
+
+  it("moves a directory with everything under it", () => {
+    const files = new MemoryFiles([
+      ["pkg/a.py", "a"],
+      ["pkg/sub/b.py", "b"],
+    ]);
+    expect(files.move("pkg", "lib/pkg")).toBe(true);
+    expect(files.has("pkg")).toBe(false);
+    expect(files.get("lib/pkg/sub/b.py")).toBe("b");
+    expect([files.size, files.bytes]).toEqual([2, 2]);
+  });
+
+  it("replaces what a move lands on", () => {
+    const files = new MemoryFiles([
+      ["a.txt", "abc"],
+      ["b.txt", "defgh"],
+    ]);
+    files.move("a.txt", "b.txt");
+    expect(files.get("b.txt")).toBe("abc");
+    expect([files.size, files.bytes]).toEqual([1, 3]);
+  });
+
+  it("refuses to move a directory into itself", () => {
+    const files = new MemoryFiles([["pkg/a.py", ""]]);
+    expect(() => files.move("pkg", "pkg/inner")).toThrow();
+    expect(files.get("pkg/a.py")).toBe("");
+  });
+
+  it("keeps what it cannot move under a file", () => {
+    const files = new MemoryFiles([
+      ["a.txt", "moved"],
+      ["b.txt", "a file"],
+    ]);
+    expect(() => files.move("a.txt", "b.txt/a.txt")).toThrow();
+    expect(files.get("a.txt")).toBe("moved");
+  });
+
+  it("reports a move of something missing", () => {
+    expect(new MemoryFiles().move("ghost", "elsewhere")).toBe(false);
+  });
+
+  it("iterates its files with their paths", () => {
+    const files = new MemoryFiles([
+      ["a.py", "a"],
+      ["pkg/b.py", "b"],
+    ]);
+    expect(new Map(files)).toEqual(
+      new Map([
+        ["a.py", "a"],
+        ["pkg/b.py", "b"],
+      ]),
+    );
+  });
+
+  it("describes every path in a manifest", () => {
+    const files = new MemoryFiles([["pkg/a.py", "abc"]]);
+    expect(files.manifest()).toEqual([
+      expect.objectContaining({ path: "pkg", directory: true }),
+      expect.objectContaining({ path: "pkg/a.py", size: 3 }),
+    ]);
+  });
+
+  it("finds a path among many without looking at the rest", () => {
+    const files = new MemoryFiles();
+    for (let index = 0; index < 50_000; index++)
+      files.set(`pkg${index % 100}/mod${index}.py`, "");
+    const started = performance.now();
+    for (let index = 0; index < 50_000; index++)
+      files.stat(`pkg${index % 100}/mod${index}.py`);
+    expect(performance.now() - started).toBeLessThan(1000);
+  });
+});
+
+describe("the memory filesystem", () => {
+  it("answers at once, without promises", () => {
+    const fs = memory({ files: { "a.py": "x" } });
+    expect(fs.get({ path: "/home/pyodide/a.py" })).toEqual({
+      ok: true,
+      data: "x",
+    });
+  });
+
+  it("reports a directory as null contents", () => {
+    const fs = memory({ files: { "pkg/a.py": "" } });
+    expect(fs.get({ path: "/home/pyodide/pkg" })).toEqual({
+      ok: true,
+      data: null,
+    });
+  });
+
+  it("describes paths without reading them", () => {
+    const fs = memory({ files: { "data.bin": png } });
+    expect(fs.stat({ path: "/home/pyodide/data.bin" })).toMatchObject({
+      data: { size: 4, directory: false },
+    });
+  });
+
+  it("lists directories with their entries", () => {
+    const fs = memory({ files: { "pkg/a.py": "abc" } });
+    expect(fs.listDirectoryWithStats!({ path: "/home/pyodide/pkg" })).toEqual({
+      ok: true,
+      data: [expect.objectContaining({ name: "a.py", size: 3 })],
+    });
+  });
+
+  it("gives a manifest", () => {
+    const fs = memory({ files: { "a.py": "" } });
+    expect(fs.manifest!()).toMatchObject({ data: [{ path: "a.py" }] });
+  });
+
+  it("keeps what Python writes where the page can see it", () => {
+    const fs = memory();
+    fs.put({ path: "/home/pyodide/out/a.txt", value: "hi" });
+    fs.put({ path: "/home/pyodide/empty", value: null });
+    fs.move({
+      path: "/home/pyodide/out",
+      newPath: "/home/pyodide/moved",
+    });
+    expect(fs.files.get("moved/a.txt")).toBe("hi");
+    expect(fs.files.isDirectory("empty")).toBe(true);
+    fs.delete({ path: "/home/pyodide/moved" });
+    expect(fs.files.has("moved")).toBe(false);
+  });
+
+  it("shares files it was given", () => {
+    const files = new MemoryFiles();
+    memory({ files }).put({ path: "a.txt", value: "shared" });
+    expect(memory({ files }).get({ path: "a.txt" })).toMatchObject({
+      data: "shared",
+    });
+  });
+});
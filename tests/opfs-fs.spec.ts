@@ -0,0 +1,204 @@
+import { describe, expect, it } from "vitest";
+import {
+  DIR_MODE,
+  ErrnoError,
+  FILE_MODE,
+  O_TRUNC,
+} from "./emscripten-fs.fixture";
+import {
+  FakeDirectory,
+  FakeFile,
+  directory,
+  mountedOPFS,
+} from "./opfs.fixture";
+
+const text = (value: string) => new TextEncoder().encode(value);
+
+const readAll = (
+  mount: Awaited<ReturnType<typeof mountedOPFS>>,
+  path: string,
+) => {
+  const stream = mount.open(path);
+  const buffer = new Uint8Array(1024);
+  const read = mount.streamOps.read!(stream, buffer, 0, buffer.length, 0);
+  mount.streamOps.close!(stream);
+  return buffer.subarray(0, read);
+};
+
+const bytesAt = (
+  mount: Awaited<ReturnType<typeof mountedOPFS>>,
+  path: string,
+) => (mount.top.at(path) as FakeFile | undefined)?.bytes;
+
+describe("a directory of the origin private file system", () => {
+  it("reads files through their access handles", async () => {
+    const mount = await mountedOPFS(directory({ "pkg/a.py": "x = 1" }));
+    expect(readAll(mount, "pkg/a.py")).toEqual(text("x = 1"));
+    expect(mount.nodeOps.readdir(mount.root)).toEqual([".", "..", "pkg"]);
+  });
+
+  it("writes into the middle of a file in place", async () => {
+    const mount = await mountedOPFS(directory({ "data.bin": "abcdef" }));
+    const stream = mount.open("data.bin");
+    mount.streamOps.write!(stream, text("XY"), 0, 2, 2);
+    expect(bytesAt(mount, "data.bin")).toEqual(text("abXYef"));
+  });
+
+  it("reads from an offset without reading the rest", async () => {
+    const mount = await mountedOPFS(directory({ "data.bin": "abcdef" }));
+    const stream = mount.open("data.bin");
+    const buffer = new Uint8Array(8);
+    expect(mount.streamOps.read!(stream, buffer, 1, 3, 4)).toBe(2);
+    expect(buffer.subarray(1, 3)).toEqual(text("ef"));
+  });
+
+  it("describes and truncates files by their handles", async () => {
+    const mount = await mountedOPFS(directory({ "data.bin": "abcdef" }));
+    const node = mount.nodeAt("data.bin");
+    expect(mount.nodeOps.getattr(node).size).toBe(6);
+    mount.nodeOps.setattr(node, { size: 2 });
+    expect(bytesAt(mount, "data.bin")).toEqual(text("ab"));
+    mount.streamOps.close!(mount.open("data.bin", O_TRUNC));
+    expect(bytesAt(mount, "data.bin")).toEqual(new Uint8Array());
+  });
+
+  it("flushes a file when it is synced and when it is closed", async () => {
+    const mount = await mountedOPFS(directory({ "a.txt": "" }));
+    const stream = mount.open("a.txt");
+    (mount.streamOps as any).fsync(stream);
+    mount.streamOps.close!(stream);
+    expect((mount.top.at("a.txt") as FakeFile).flushes).toBe(2);
+  });
+
+  it("holds every file open, so the page cannot write to one mid run", async () => {
+    const mount = await mountedOPFS(directory({ "a.txt": "" }));
+    const file = mount.top.at("a.txt") as FakeFile;
+    await expect(file.createSyncAccessHandle()).rejects.toThrow("open");
+  });
+
+  it("keeps every file open from one run to the next", async () => {
+    const mount = await mountedOPFS(directory({ "a.txt": "abc" }));
+    await mount.opfs.persist();
+    const file = mount.top.at("a.txt") as FakeFile;
+    await expect(file.createSyncAccessHandle()).rejects.toThrow("open");
+    expect(readAll(mount, "a.txt")).toEqual(text("abc"));
+  });
+
+  it("closes a file the page changed until the next run", async () => {
+    const mount = await mountedOPFS(directory({ "a.txt": "abc" }));
+    const node = mount.nodeAt("a.txt");
+    mount.opfs.changed(["a.txt"]);
+    const file = mount.top.at("a.txt") as FakeFile;
+    const access = await file.createSyncAccessHandle();
+    access.write(text("page"), { at: 0 });
+    access.close();
+    expect(() => mount.open("a.txt", O_TRUNC)).toThrow("errno 10");
+    await mount.opfs.prepare();
+    expect(mount.nodeOps.getattr(node).size).toBe(4);
+    expect(readAll(mount, "a.txt")).toEqual(text("page"));
+  });
+
+  it("fails alone on a file another kernel holds open", async () => {
+    const top = directory({ "a.txt": "a", "b.txt": "b" });
+    const other = await (top.at("b.txt") as FakeFile).createSyncAccessHandle();
+    const mount = await mountedOPFS(top);
+    expect(readAll(mount, "a.txt")).toEqual(text("a"));
+    expect(() => mount.open("b.txt")).not.toThrow();
+    expect(() => readAll(mount, "b.txt")).toThrow("errno 10");
+    other.close();
+    await mount.opfs.prepare();
+    expect(readAll(mount, "b.txt")).toEqual(text("b"));
+  });
+});
+
+describe("changing the tree of a directory", () => {
+  it("makes a new file in OPFS once the run is over", async () => {
+    const mount = await mountedOPFS();
+    const node = mount.nodeOps.mknod(mount.root, "new.txt", FILE_MODE, 0);
+    const stream: any = { object: node, flags: 0, position: 0 };
+    mount.streamOps.write!(stream, text("made"), 0, 4, 0);
+    expect(readAll(mount, "new.txt")).toEqual(text("made"));
+    expect(mount.top.at("new.txt")).toBeUndefined();
+    await mount.opfs.persist();
+    expect(bytesAt(mount, "new.txt")).toEqual(text("made"));
+  });
+
+  it("carries out what was done in the order it was done", async () => {
+    const mount = await mountedOPFS(directory({ "a.txt": "a", "b.txt": "b" }));
+    const { nodeOps, root } = mount;
+    nodeOps.mknod(root, "pkg", DIR_MODE, 0);
+    nodeOps.rename(mount.nodeAt("a.txt"), mount.nodeAt("pkg"), "moved.txt");
+    nodeOps.unlink(root, "b.txt");
+    await mount.opfs.persist();
+    expect(bytesAt(mount, "pkg/moved.txt")).toEqual(text("a"));
+    expect(mount.top.at("a.txt")).toBeUndefined();
+    expect(mount.top.at("b.txt")).toBeUndefined();
+  });
+
+  it("keeps a node usable after the directory is read again", async () => {
+    const mount = await mountedOPFS(directory({ "a.txt": "before" }));
+    const node = mount.nodeAt("a.txt");
+    await mount.opfs.persist();
+    await mount.opfs.prepare();
+    expect(mount.nodeOps.getattr(node).size).toBe(6);
+    expect(readAll(mount, "a.txt")).toEqual(text("before"));
+  });
+
+  it("closes every file for the mount that replaces it", async () => {
+    const mount = await mountedOPFS(directory({ "a.txt": "a" }));
+    mount.nodeOps.mknod(mount.root, "made", DIR_MODE, 0);
+    await mount.opfs.close();
+    expect(mount.top.at("made")).toBeDefined();
+    const next = await mountedOPFS(mount.top);
+    expect(readAll(next, "a.txt")).toEqual(text("a"));
+  });
+
+  it("picks up files the page added, once told", async () => {
+    const mount = await mountedOPFS();
+    mount.top.children.set("page.txt", new FakeFile("page.txt", text("hi")));
+    await mount.opfs.persist();
+    mount.opfs.changed();
+    await mount.opfs.prepare();
+    expect(readAll(mount, "page.txt")).toEqual(text("hi"));
+  });
+
+  it("reports a removed file as missing", async () => {
+    const mount = await mountedOPFS(directory({ "a.txt": "a" }));
+    const node = mount.nodeAt("a.txt");
+    mount.nodeOps.unlink(mount.root, "a.txt");
+    expect(() => mount.nodeOps.getattr(node)).toThrow(ErrnoError);
+  });
+
+  it("takes a path already gone as removed, without making its parent", async () => {
+    const mount = await mountedOPFS(directory({ "pkg/a.txt": "a" }));
+    const { nodeOps, root } = mount;
+    nodeOps.unlink(mount.nodeAt("pkg"), "a.txt");
+    nodeOps.rename(mount.nodeAt("pkg"), root, "moved");
+    mount.top.children.delete("pkg");
+    await mount.opfs.persist();
+    expect([...mount.top.children.keys()]).toEqual([]);
+  });
+
+  it("moves a large new file to a spare file, and that into place", async () => {
+    const spares = new FakeDirectory();
+    const mount = await mountedOPFS(directory(), spares);
+    const node = mount.nodeOps.mknod(mount.root, "big.bin", FILE_MODE, 0);
+    const stream: any = { object: node, flags: 0, position: 0 };
+    const chunk = new Uint8Array(512 * 1024).fill(7);
+    for (let at = 0; at < 4 * chunk.length; at += chunk.length)
+      mount.streamOps.write!(stream, chunk, 0, chunk.length, at);
+    const spilled = [...spares.children.values()].find(
+      (file) => (file as FakeFile).bytes.length > 0,
+    ) as FakeFile;
+    expect(spilled.bytes.length).toBe(2 * 1024 * 1024);
+    expect(mount.nodeOps.getattr(node).size).toBe(2 * 1024 * 1024);
+    await mount.opfs.persist();
+    expect(bytesAt(mount, "big.bin")?.length).toBe(2 * 1024 * 1024);
+    expect(spares.children.has(spilled.name)).toBe(false);
+  });
+
+  it("refuses to remove a directory that is not empty", async () => {
+    const mount = await mountedOPFS(directory({ "pkg/a.py": "" }));
+    expect(() => mount.nodeOps.rmdir(mount.root, "pkg")).toThrow("errno 55");
+  });
+});
@@ -0,0 +1,190 @@
+import { OPFS } from "../release/worker/opfs-fs";
+import { emscripten } from "./emscripten-fs.fixture";
+
+/**
+ * An in-memory stand-in for the Origin Private File System, with just what
+ * the mount uses. As in a browser, a file can only have one synchronous
+ * access handle open at a time, and a closed handle cannot be used again.
+ */
+
+const notFound = (name: string) =>
+  new DOMException(`${name} was not found`, "NotFoundError");
+
+const locked = (name: string) =>
+  new DOMException(`${name} is open`, "NoModificationAllowedError");
+
+class FakeAccess {
+  private closed = false;
+
+  constructor(private readonly file: FakeFile) {}
+
+  private get open() {
+    if (this.closed)
+      throw new DOMException("The handle is closed", "InvalidStateError");
+    return this.file;
+  }
+
+  read(buffer: Uint8Array, { at = 0 } = {}) {
+    const bytes = this.open.bytes.subarray(at, at + buffer.length);
+    buffer.set(bytes);
+    return bytes.length;
+  }
+
+  write(buffer: Uint8Array, { at = 0 } = {}) {
+    const file = this.open;
+    const end = at + buffer.length;
+    if (end > file.bytes.length) {
+      const grown = new Uint8Array(end);
+      grown.set(file.bytes);
+      file.bytes = grown;
+    }
+    file.bytes.set(buffer, at);
+    this.file.writes++;
+    return buffer.length;
+  }
+
+  truncate(size: number) {
+    const file = this.open;
+    const cut = new Uint8Array(size);
+    cut.set(file.bytes.subarray(0, size));
+    file.bytes = cut;
+  }
+
+  getSize() {
+    return this.open.bytes.length;
+  }
+
+  flush() {
+    this.open.flushes++;
+  }
+
+  close() {
+    if (this.closed) return;
+    this.closed = true;
+    this.file.access = undefined;
+  }
+}
+
+export class FakeFile {
+  readonly kind = "file";
+  access?: FakeAccess;
+  writes = 0;
+  flushes = 0;
+
+  constructor(
+    public name: string,
+    public bytes = new Uint8Array(),
+  ) {}
+
+  async createSyncAccessHandle() {
+    if (this.access) throw locked(this.name);
+    return (this.access = new FakeAccess(this));
+  }
+
+  async getFile() {
+    const { bytes } = this;
+    return {
+      size: bytes.length,
+      arrayBuffer: async () => bytes.slice().buffer,
+    };
+  }
+}
+
+export class FakeDirectory {
+  readonly kind = "directory";
+  readonly children = new Map<string, FakeFile | FakeDirectory>();
+
+  constructor(public name = "") {}
+
+  async getDirectoryHandle(name: string, { create = false } = {}) {
+    const child = this.children.get(name);
+    if (child instanceof FakeDirectory) return child;
+    if (child) throw new DOMException(name, "TypeMismatchError");
+    if (!create) throw notFound(name);
+    const made = new FakeDirectory(name);
+    this.children.set(name, made);
+    return made;
+  }
+
+  async getFileHandle(name: string, { create = false } = {}) {
+    const child = this.children.get(name);
+    if (child instanceof FakeFile) return child;
+    if (child) throw new DOMException(name, "TypeMismatchError");
+    if (!create) throw notFound(name);
+    const made = new FakeFile(name);
+    this.children.set(name, made);
+    return made;
+  }
+
+  async removeEntry(name: string, { recursive = false } = {}) {
+    const child = this.children.get(name);
+    if (!child) throw notFound(name);
+    if (child instanceof FakeFile && child.access) throw locked(name);
+    if (child instanceof FakeDirectory && child.children.size && !recursive)
+      throw new DOMException(name, "InvalidModificationError");
+    this.children.delete(name);
+  }
+
+  async *entries() {
+    yield* this.children.entries();
+  }
+
+  /** Where a path leads, or nothing if it leads nowhere. */
+  at(path: string) {
+    let found: FakeFile | FakeDirectory | undefined = this;
+    for (const name of path.split("/").filter(Boolean))
+      found =
+        found instanceof FakeDirectory ? found.children.get(name) : undefined;
+    return found;
+  }
+}
+
+/** A directory with files in it, named by their paths. */
+export const directory = (files: Record<string, string | null> = {}) => {
+  const top = new FakeDirectory();
+  for (const [path, value] of Object.entries(files)) {
+    const names = path.split("/");
+    let parent = top;
+    for (const name of names.slice(0, -1)) {
+      const child = parent.children.get(name) ?? new FakeDirectory(name);
+      parent.children.set(name, child);
+      parent = child as FakeDirectory;
+    }
+    const name = names.at(-1)!;
+    parent.children.set(
+      name,
+      value === null
+        ? new FakeDirectory(name)
+        : new FakeFile(name, new TextEncoder().encode(value)),
+    );
+  }
+  return top;
+};
+
+/**
+ * The mount over a directory, run against the stand-in for emscripten, with a
+ * run started, and with spare files kept in `spares` if given.
+ */
+export const mountedOPFS = async (
+  top = directory(),
+  spares?: FakeDirectory,
+) => {
+  const opfs = await OPFS.open(emscripten() as any, top as any, spares as any);
+  await opfs.prepare();
+  const root = opfs.mount({} as any);
+  const { nodeOps, streamOps } = opfs.methods;
+
+  const nodeAt = (path: string) =>
+    path
+      .split("/")
+      .reduce((node, name) => nodeOps.lookup(node, name), root as any);
+
+  const open = (path: string, flags = 0) => {
+    const node = nodeAt(path);
+    const stream: any = { object: node, flags, position: 0 };
+    streamOps.open!(stream);
+    return stream;
+  };
+
+  return { opfs, top, root, nodeOps, streamOps, nodeAt, open };
+};
@@ -0,0 +1,165 @@
+import { createHash } from "node:crypto";
+import { afterEach, describe, expect, it } from "vitest";
+import { cachingFetch } from "../release/worker/package-cache";
+import { serve } from "./http-fs.fixture";
+
+const wheel = "numpy-2.0.2-cp312-cp312-pyodide_2024_0_wasm32.whl";
+const wheelBytes = "pretend this is a wheel";
+
+const wheelHash = createHash("sha256").update(wheelBytes).digest("hex");
+
+const lockfile = (sha256 = wheelHash) =>
+  JSON.stringify({ packages: { numpy: { file_name: wheel, sha256 } } });
+
+/** Cache Storage, as shared by every worker of an origin. */
+const cacheStorage = () => {
+  const stores = new Map<string, Map<string, Response>>();
+  const storeOf = (name: string) => {
+    if (!stores.has(name)) stores.set(name, new Map());
+    return stores.get(name)!;
+  };
+  const caches = {
+    keys: async () => [...stores.keys()],
+    delete: async (name: string) => stores.delete(name),
+    open: async (name: string) => {
+      const entries = storeOf(name);
+      return {
+        match: async (url: string) => entries.get(url)?.clone(),
+        put: async (url: string, response: Response) =>
+          void entries.set(url, response),
+        delete: async (url: string) => entries.delete(url),
+      };
+    },
+  } as unknown as CacheStorage;
+  return { stores, caches };
+};
+
+/** Web Locks, as far as taking turns goes. */
+const lockManager = () => {
+  const held = new Map<string, Promise<unknown>>();
+  return {
+    request: (name: string, work: () => Promise<unknown>) => {
+      const turn = (held.get(name) ?? Promise.resolve()).then(work);
+      held.set(name, turn.catch(() => undefined));
+      return turn;
+    },
+  } as unknown as LockManager;
+};
+
+let server: Awaited<ReturnType<typeof serve>> | undefined;
+
+afterEach(async () => {
+  await server?.close();
+  server = undefined;
+});
+
+const requested = (path: string) =>
+  server!.requests.filter((request) => request.path === path).length;
+
+describe("a package cache shared by kernels", () => {
+  it("downloads a package once for every worker", async () => {
+    server = await serve({
+      "pyodide-lock.json": lockfile(),
+      [wheel]: wheelBytes,
+    });
+    const { caches } = cacheStorage();
+    const locks = lockManager();
+    const workers = [1, 2, 3].map(() =>
+      cachingFetch({ indexURL: server!.baseURL, caches, locks }),
+    );
+    const responses = await Promise.all(
+      workers.map((fetch) => fetch(server!.baseURL + wheel)),
+    );
+    for (const response of responses)
+      expect(await response.text()).toBe(wheelBytes);
+    expect(requested(wheel)).toBe(1);
+  });
+
+  it("leaves Pyodide's own files to the HTTP cache", async () => {
+    server = await serve({
+      "pyodide-lock.json": lockfile(),
+      "pyodide.asm.wasm": "wasm",
+    });
+    const { caches } = cacheStorage();
+    const fetch = cachingFetch({ indexURL: server.baseURL, caches });
+    await fetch(server.baseURL + "pyodide.asm.wasm");
+    await fetch(server.baseURL + "pyodide.asm.wasm");
+    expect(requested("pyodide.asm.wasm")).toBe(2);
+  });
+
+  it("downloads again what was kept corrupted", async () => {
+    server = await serve({
+      "pyodide-lock.json": lockfile(),
+      [wheel]: wheelBytes,
+    });
+    const { stores, caches } = cacheStorage();
+    const fetch = cachingFetch({ indexURL: server.baseURL, caches });
+    await fetch(server.baseURL + wheel);
+    const [store] = stores.values();
+    store.set(server.baseURL + wheel, new Response("bit rot"));
+    expect(await (await fetch(server.baseURL + wheel)).text()).toBe(wheelBytes);
+    expect(requested(wheel)).toBe(2);
+  });
+
+  it("refuses a download that does not match the lock file", async () => {
+    server = await serve({
+      "pyodide-lock.json": lockfile("0".repeat(64)),
+      [wheel]: wheelBytes,
+    });
+    const { stores, caches } = cacheStorage();
+    const fetch = cachingFetch({ indexURL: server.baseURL, caches });
+    await expect(fetch(server.baseURL + wheel)).rejects.toThrow("sha256");
+    const [store] = stores.values();
+    expect(store.has(server.baseURL + wheel)).toBe(false);
+  });
+
+  it("keeps wheels from elsewhere, and drops older caches", async () => {
+    server = await serve({
+      "pyodide/pyodide-lock.json": lockfile(),
+      "pypi/tqdm-4.66.1-py3-none-any.whl": "tqdm",
+    });
+    const { stores, caches } = cacheStorage();
+    await caches.open("python-web-kernel-packages/an-older-version");
+    await caches.open("something else");
+    const fetch = cachingFetch({
+      indexURL: server.baseURL + "pyodide",
+      caches,
+    });
+    const url = server.baseURL + "pypi/tqdm-4.66.1-py3-none-any.whl";
+    await fetch(url);
+    expect(await (await fetch(url)).text()).toBe("tqdm");
+    expect(requested("pypi/tqdm-4.66.1-py3-none-any.whl")).toBe(1);
+    expect([...stores.keys()]).toEqual([
+      "something else",
+      expect.stringMatching(
+        /^python-web-kernel-packages\/[0-9a-f]{64}\/[0-9a-f]{64}$/,
+      ),
+    ]);
+  });
+
+  it("keeps the caches of another Pyodide while they are used", async () => {
+    server = await serve({
+      "pyodide-lock.json": lockfile(),
+      [wheel]: wheelBytes,
+    });
+    const { stores, caches } = cacheStorage();
+    const used = (name: string, at: number) =>
+      caches
+        .open(`python-web-kernel-packages/${name}`)
+        .then((cache) =>
+          cache.put(
+            "https://python-web-kernel.invalid/used",
+            new Response(String(at)),
+          ),
+        );
+    await used("elsewhere/recent", Date.now() - 1000);
+    await used("elsewhere/forgotten", Date.now() - 90 * 24 * 60 * 60 * 1000);
+    await cachingFetch({ indexURL: server.baseURL, caches })(
+      server.baseURL + wheel,
+    );
+    expect([...stores.keys()]).toEqual([
+      "python-web-kernel-packages/elsewhere/recent",
+      expect.stringMatching(/^python-web-kernel-packages\/[0-9a-f]{64}\//),
+    ]);
+  });
+});
@@ -0,0 +1,79 @@
+import { describe, expect, it } from "vitest";
+import { resolvePackages } from "../release/pyodide/packages";
+
+const lockfile = {
+  packages: {
+    pandas: {
+      file_name: "pandas-2.2.0-cp312-cp312-pyodide_2024_0_wasm32.whl",
+      imports: ["pandas"],
+      depends: ["numpy", "python-dateutil"],
+    },
+    numpy: {
+      file_name: "numpy-2.0.2-cp312-cp312-pyodide_2024_0_wasm32.whl",
+      imports: ["numpy"],
+    },
+    "python-dateutil": {
+      file_name: "python_dateutil-2.9.0-py2.py3-none-any.whl",
+      imports: ["dateutil"],
+    },
+    "scikit-learn": {
+      file_name: "scikit_learn-1.5.2-cp312-cp312-pyodide_2024_0_wasm32.whl",
+      imports: ["sklearn"],
+      depends: ["numpy", "scipy"],
+    },
+    scipy: {
+      file_name: "scipy-1.14.1-cp312-cp312-pyodide_2024_0_wasm32.whl",
+      imports: ["scipy"],
+      depends: ["numpy"],
+    },
+    networkx: {
+      file_name: "networkx-3.4.2-py3-none-any.whl",
+      imports: ["networkx"],
+    },
+  },
+};
+
+describe("resolving the packages a run imports", () => {
+  it("finds every package up front, by the modules they provide", () => {
+    const { packages, installs } = resolvePackages(lockfile, [
+      "pandas",
+      "sklearn",
+    ]);
+    expect(packages.sort()).toEqual([
+      "numpy",
+      "pandas",
+      "python-dateutil",
+      "scikit-learn",
+      "scipy",
+    ]);
+    expect(installs).toEqual([]);
+  });
+
+  it("leaves out what is loaded already", () => {
+    const { packages } = resolvePackages(lockfile, ["pandas"], {
+      numpy: "default channel",
+    });
+    expect(packages.sort()).toEqual(["pandas", "python-dateutil"]);
+  });
+
+  it("adds what a package needs without its lock entry saying so", () => {
+    const { packages } = resolvePackages(lockfile, ["networkx"]);
+    expect(packages.sort()).toEqual(["networkx", "numpy", "scipy"]);
+  });
+
+  it("installs known PyPI packages, and leaves unknown modules alone", () => {
+    const { packages, installs } = resolvePackages(lockfile, [
+      "pymannkendall",
+      "not_a_package",
+    ]);
+    expect(packages).toEqual([]);
+    expect(installs).toEqual(["pymannkendall"]);
+  });
+
+  it("takes a module for a package of its name without a lock file", () => {
+    expect(resolvePackages(undefined, ["numpy", "sklearn"])).toEqual({
+      packages: ["numpy"],
+      installs: ["scikit-learn"],
+    });
+  });
+});
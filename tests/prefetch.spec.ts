@@ -0,0 +1,66 @@
+import { afterEach, describe, expect, it } from "vitest";
+import { packageURLs, prefetchRuntime } from "../release/prefetch";
+import { serve } from "./http-fs.fixture";
+
+const lockfile = JSON.stringify({
+  packages: {
+    matplotlib: {
+      file_name: "matplotlib-3.8.4-cp312-cp312-pyodide_2024_0_wasm32.whl",
+      depends: ["numpy", "pillow"],
+    },
+    numpy: { file_name: "numpy-2.0.2-cp312-cp312-pyodide_2024_0_wasm32.whl" },
+    pillow: {
+      file_name: "pillow-10.2.0-cp312-cp312-pyodide_2024_0_wasm32.whl",
+      depends: ["numpy"],
+    },
+    pandas: {
+      file_name: "pandas-2.2.0-cp312-cp312-pyodide_2024_0_wasm32.whl",
+    },
+  },
+});
+
+let server: Awaited<ReturnType<typeof serve>> | undefined;
+
+afterEach(async () => {
+  await server?.close();
+  server = undefined;
+});
+
+describe("fetching ahead of Pyodide", () => {
+  it("finds the files for packages and what they depend on", async () => {
+    server = await serve({ "pyodide-lock.json": lockfile });
+    const urls = await packageURLs(server.baseURL, ["Matplotlib", "missing"]);
+    expect(urls.map((url) => url.slice(server!.baseURL.length))).toEqual([
+      "matplotlib-3.8.4-cp312-cp312-pyodide_2024_0_wasm32.whl",
+      "numpy-2.0.2-cp312-cp312-pyodide_2024_0_wasm32.whl",
+      "pillow-10.2.0-cp312-cp312-pyodide_2024_0_wasm32.whl",
+    ]);
+  });
+
+  it("finds nothing when there is no lock file to read", async () => {
+    server = await serve();
+    expect(await packageURLs(server.baseURL, ["numpy"])).toEqual([]);
+  });
+
+  it("finds them in a lock file already read", async () => {
+    server = await serve();
+    const read = Promise.resolve(JSON.parse(lockfile));
+    const urls = await packageURLs(server.baseURL, ["pandas"], read);
+    expect(urls.map((url) => url.slice(server!.baseURL.length))).toEqual([
+      "pandas-2.2.0-cp312-cp312-pyodide_2024_0_wasm32.whl",
+    ]);
+    expect(server.requests).toEqual([]);
+  });
+
+  it("fetches the runtime at once, leaving packages to the worker", async () => {
+    server = await serve({ "pyodide-lock.json": lockfile }, { delay: 20 });
+    await prefetchRuntime(server.baseURL.slice(0, -1));
+    expect(server.requests.map(({ path }) => path).sort()).toEqual([
+      "pyodide-lock.json",
+      "pyodide.asm.js",
+      "pyodide.asm.wasm",
+      "python_stdlib.zip",
+    ]);
+    expect(server.mostInFlight).toBeGreaterThan(3);
+  });
+});
@@ -0,0 +1,149 @@
+import { describe, expect, it } from "vitest";
+import { scratchMatcher, withScratch } from "../release/worker/scratch-fs";
+import { store } from "./emscripten-fs.fixture";
+
+const text = (value: string) => new TextEncoder().encode(value);
+
+const layered = (
+  initial: Parameters<typeof store>[0] = [],
+  patterns = ["__pycache__"],
+) => {
+  const host = store(initial, {
+    ranged: true,
+    withStats: true,
+    manifest: true,
+    readsRanges: true,
+  });
+  return { ...host, scratch: withScratch(host.fs, patterns) };
+};
+
+describe("which paths are scratch", () => {
+  it("matches a name at any depth, and what is under it", () => {
+    const isScratch = scratchMatcher(["__pycache__", "*.tmp"]);
+    expect(isScratch("/__pycache__")).toBe(true);
+    expect(isScratch("/pkg/__pycache__/mod.cpython-312.pyc")).toBe(true);
+    expect(isScratch("/out/run.tmp")).toBe(true);
+    expect(isScratch("/pkg/mod.py")).toBe(false);
+    expect(isScratch("/pkg/tmp")).toBe(false);
+  });
+
+  it("matches a pattern with a slash from the root", () => {
+    const isScratch = scratchMatcher(["output/*", "cache/**/*.bin"]);
+    expect(isScratch("/output/figure.png")).toBe(true);
+    expect(isScratch("output/nested/figure.png")).toBe(true);
+    expect(isScratch("/output")).toBe(false);
+    expect(isScratch("/pkg/output/figure.png")).toBe(false);
+    expect(isScratch("/cache/a/b/c.bin")).toBe(true);
+    expect(isScratch("/cache/a/b/c.txt")).toBe(false);
+  });
+});
+
+describe("a filesystem with scratch kept in the worker", () => {
+  it("never sends scratch writes to the host", () => {
+    const { scratch, files, calls } = layered([["/pkg", null]]);
+    scratch.put({ path: "/pkg/__pycache__", value: null });
+    scratch.put({ path: "/pkg/__pycache__/mod.pyc", value: text("bytecode") });
+    scratch.write!({
+      path: "/pkg/__pycache__/mod.pyc",
+      offset: 8,
+      value: text("!"),
+    });
+    scratch.truncate!({ path: "/pkg/__pycache__/mod.pyc", size: 9 });
+    expect(scratch.get({ path: "/pkg/__pycache__/mod.pyc" })).toEqual({
+      ok: true,
+      data: text("bytecode!"),
+    });
+    expect(
+      scratch.read!({ path: "/pkg/__pycache__/mod.pyc", offset: 4, length: 4 }),
+    ).toEqual({ ok: true, data: text("code") });
+    expect([...files.keys()]).toEqual(["/pkg"]);
+    expect(calls).toEqual([]);
+  });
+
+  it("passes everything else on to the host", () => {
+    const { scratch, files } = layered([["/pkg", null]]);
+    scratch.put({ path: "/pkg/mod.py", value: "x = 1" });
+    scratch.write!({ path: "/pkg/mod.py", offset: 4, value: text("2") });
+    expect(files.get("/pkg/mod.py")).toEqual(text("x = 2"));
+    expect(scratch.stat({ path: "/pkg/mod.py" })).toMatchObject({
+      data: { size: 5, directory: false },
+    });
+  });
+
+  it("lists both layers as one tree", () => {
+    const { scratch } = layered([
+      ["/pkg", null],
+      ["/pkg/mod.py", "x = 1"],
+    ]);
+    scratch.put({ path: "/pkg/__pycache__/mod.pyc", value: "bytecode" });
+    expect(scratch.listDirectory({ path: "/pkg" })).toEqual({
+      ok: true,
+      data: ["mod.py", "__pycache__"],
+    });
+    expect(scratch.listDirectoryWithStats!({ path: "/pkg" })).toMatchObject({
+      ok: true,
+      data: [
+        { name: "mod.py", size: 5, directory: false },
+        { name: "__pycache__", size: 0, directory: true },
+      ],
+    });
+    expect(scratch.listDirectory({ path: "/pkg/__pycache__" })).toEqual({
+      ok: true,
+      data: ["mod.pyc"],
+    });
+    const manifest = scratch.manifest!();
+    expect(manifest.ok && manifest.data.map(({ path }) => path)).toEqual([
+      "pkg",
+      "pkg/mod.py",
+      "pkg/__pycache__",
+      "pkg/__pycache__/mod.pyc",
+    ]);
+  });
+
+  it("reports scratch that was never made as not found", () => {
+    const { scratch } = layered();
+    expect(scratch.stat({ path: "/__pycache__/mod.pyc" })).toMatchObject({
+      ok: false,
+      status: 404,
+    });
+    expect(scratch.get({ path: "/__pycache__" })).toMatchObject({
+      status: 404,
+    });
+  });
+
+  it("forgets scratch under a directory the host removes or renames", () => {
+    const { scratch } = layered([["/pkg", null]]);
+    scratch.put({ path: "/pkg/__pycache__/mod.pyc", value: "bytecode" });
+    scratch.move({ path: "/pkg", newPath: "/lib" });
+    expect(scratch.get({ path: "/lib/__pycache__/mod.pyc" })).toMatchObject({
+      data: "bytecode",
+    });
+    expect(scratch.stat({ path: "/pkg/__pycache__" })).toMatchObject({
+      status: 404,
+    });
+    scratch.delete({ path: "/lib" });
+    expect(scratch.stat({ path: "/lib/__pycache__" })).toMatchObject({
+      status: 404,
+    });
+  });
+
+  it("copies a file across when it is moved in or out of scratch", () => {
+    const { scratch, files } = layered([["/out", null]], ["*.tmp"]);
+    scratch.put({ path: "/out/result.tmp", value: "42" });
+    scratch.move({ path: "/out/result.tmp", newPath: "/out/result.txt" });
+    expect(files.get("/out/result.txt")).toBe("42");
+    expect(scratch.stat({ path: "/out/result.tmp" })).toMatchObject({
+      status: 404,
+    });
+    scratch.move({ path: "/out/result.txt", newPath: "/out/again.tmp" });
+    expect(files.has("/out/result.txt")).toBe(false);
+    expect(scratch.get({ path: "/out/again.tmp" })).toMatchObject({
+      data: "42",
+    });
+  });
+
+  it("is the host itself when there are no patterns", () => {
+    const { fs } = store();
+    expect(withScratch(fs, [])).toBe(fs);
+  });
+});
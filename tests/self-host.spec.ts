@@ -0,0 +1,42 @@
+import { describe, expect, it } from "vitest";
+import { dependencyClosure, trimmedLockfile } from "../release/config/pyodide";
+
+const lockfile = {
+  info: { version: "0.29.0" },
+  packages: {
+    matplotlib: {
+      file_name: "matplotlib-3.8.4-cp312-cp312-pyodide_2024_0_wasm32.whl",
+      depends: ["numpy", "pillow"],
+    },
+    numpy: { file_name: "numpy-2.0.2-cp312-cp312-pyodide_2024_0_wasm32.whl" },
+    pillow: {
+      file_name: "pillow-10.2.0-cp312-cp312-pyodide_2024_0_wasm32.whl",
+      depends: ["numpy"],
+    },
+    pandas: {
+      file_name: "pandas-2.2.0-cp312-cp312-pyodide_2024_0_wasm32.whl",
+    },
+  },
+};
+
+describe("self-hosting Pyodide", () => {
+  it("ships the packages named and what they depend on", () => {
+    expect(dependencyClosure(lockfile, ["Matplotlib"]).sort()).toEqual([
+      "matplotlib",
+      "numpy",
+      "pillow",
+    ]);
+  });
+
+  it("trims the lock file to what is shipped", () => {
+    const trimmed = trimmedLockfile(lockfile, ["numpy"]);
+    expect(trimmed.info).toEqual(lockfile.info);
+    expect(Object.keys(trimmed.packages)).toEqual(["numpy"]);
+  });
+
+  it("refuses a package Pyodide does not have", () => {
+    expect(() => dependencyClosure(lockfile, ["scipy"])).toThrow(
+      'Pyodide has no package named "scipy"',
+    );
+  });
+});
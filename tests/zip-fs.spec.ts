@@ -0,0 +1,149 @@
+import { describe, expect, it } from "vitest";
+import { zip } from "../release/zip-fs";
+import { archive, watched } from "./zip.fixture";
+
+const text = (value: string) => new TextEncoder().encode(value);
+
+const members = {
+  "ps1/main.py": "print('hello')",
+  "ps1/data/numbers.csv": "1,2,3\n".repeat(1000),
+  "ps1/empty": null,
+};
+
+describe("a filesystem over a zip archive", () => {
+  it("describes and lists paths from the central directory", async () => {
+    const fs = zip({ archive: archive(members) });
+    const stat = await fs.stat({ path: "/home/pyodide/ps1/data/numbers.csv" });
+    expect(stat).toEqual({
+      ok: true,
+      data: { size: 6000, directory: false },
+    });
+    expect(await fs.listDirectory({ path: "ps1" })).toEqual({
+      ok: true,
+      data: ["main.py", "data", "empty"],
+    });
+    expect(await fs.stat({ path: "ps1/empty" })).toMatchObject({
+      data: { directory: true },
+    });
+    expect(await fs.get({ path: "ps1/data" })).toEqual({
+      ok: true,
+      data: null,
+    });
+  });
+
+  it("lists an empty directory as empty rather than missing", async () => {
+    const fs = zip({ archive: archive(members) });
+    expect(await fs.listDirectory({ path: "ps1/empty" })).toEqual({
+      ok: true,
+      data: [],
+    });
+  });
+
+  it("inflates a file when it is read", async () => {
+    const fs = zip({ archive: archive(members) });
+    expect(await fs.get({ path: "ps1/data/numbers.csv" })).toEqual({
+      ok: true,
+      data: text("1,2,3\n".repeat(1000)),
+    });
+  });
+
+  it("reads a file stored without compression", async () => {
+    const fs = zip({ archive: archive(members, { stored: true }) });
+    expect(await fs.get({ path: "ps1/main.py" })).toEqual({
+      ok: true,
+      data: text("print('hello')"),
+    });
+  });
+
+  it("reports a path the archive lacks as not found", async () => {
+    const fs = zip({ archive: archive(members) });
+    expect(await fs.stat({ path: "ghost.py" })).toMatchObject({ status: 404 });
+    expect(await fs.get({ path: "ghost.py" })).toMatchObject({ status: 404 });
+  });
+
+  it("mounts by reading only the directory", async () => {
+    const padding = new Uint8Array(1_000_000).fill(7);
+    const bytes = archive({ ...members, "big.bin": padding });
+    const { blob, read } = watched(bytes);
+    const fs = zip({ archive: blob });
+    await fs.stat({ path: "big.bin" });
+    await fs.listDirectory({ path: "ps1" });
+    expect(read()).toBeLessThan(70_000);
+  });
+
+  it("reads a range of a stored file without reading the rest", async () => {
+    const padding = new Uint8Array(1_000_000).fill(7);
+    const bytes = archive({ "big.bin": padding }, { stored: true });
+    const { blob, read } = watched(bytes);
+    const fs = zip({ archive: blob });
+    await fs.stat({ path: "big.bin" });
+    const before = read();
+    expect(
+      await fs.read!({ path: "big.bin", offset: 500_000, length: 4 }),
+    ).toEqual({ ok: true, data: new Uint8Array([7, 7, 7, 7]) });
+    expect(read() - before).toBeLessThan(100);
+  });
+
+  it("reads a range of a compressed file from what it inflated", async () => {
+    const fs = zip({ archive: archive(members) });
+    expect(
+      await fs.read!({
+        path: "ps1/data/numbers.csv",
+        offset: 5998,
+        length: 10,
+      }),
+    ).toEqual({ ok: true, data: text("3\n") });
+  });
+
+  it("inflates a file once however often it is read", async () => {
+    const { blob, reads } = watched(archive(members));
+    const fs = zip({ archive: blob });
+    await Promise.all([
+      fs.get({ path: "ps1/main.py" }),
+      fs.get({ path: "ps1/main.py" }),
+    ]);
+    await fs.get({ path: "ps1/main.py" });
+    const count = reads.length;
+    await fs.get({ path: "ps1/main.py" });
+    expect(reads.length).toBe(count);
+    expect(count).toBeLessThanOrEqual(4);
+  });
+
+  it("lets go of inflated files beyond its budget", async () => {
+    const { blob, reads } = watched(archive(members));
+    const fs = zip({ archive: blob, maxBytes: 6000 });
+    await fs.get({ path: "ps1/data/numbers.csv" });
+    await fs.get({ path: "ps1/main.py" });
+    const count = reads.length;
+    await fs.get({ path: "ps1/main.py" });
+    expect(reads.length).toBe(count);
+    await fs.get({ path: "ps1/data/numbers.csv" });
+    expect(reads.length).toBeGreaterThan(count);
+  });
+
+  it("finds the directory past a comment and through zip64 records", async () => {
+    for (const options of [{ comment: "problem set 1" }, { zip64: true }]) {
+      const fs = zip({ archive: archive(members, options) });
+      expect(await fs.get({ path: "ps1/main.py" })).toMatchObject({
+        data: text("print('hello')"),
+      });
+    }
+  });
+
+  it("gives a manifest of every path", async () => {
+    const fs = zip({ archive: archive(members) });
+    const manifest = await fs.manifest!();
+    expect(manifest.ok && manifest.data.map(({ path }) => path)).toEqual([
+      "ps1/main.py",
+      "ps1/data/numbers.csv",
+      "ps1/empty",
+    ]);
+  });
+
+  it("fails on something that is not an archive", async () => {
+    const fs = zip({ archive: text("not a zip file") });
+    await expect(
+      Promise.resolve(fs.stat({ path: "main.py" })),
+    ).rejects.toThrow("Malformed zip archive");
+  });
+});
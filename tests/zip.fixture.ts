@@ -0,0 +1,157 @@
+import { crc32, deflateRawSync } from "node:zlib";
+
+/**
+ * Builds zip archives in memory, the way an archiver would: a local header
+ * before each member, then the central directory, then its end record.
+ */
+
+type Member = string | Uint8Array | null;
+
+const encoder = new TextEncoder();
+
+const bytesOf = (value: string | Uint8Array) =>
+  typeof value === "string" ? encoder.encode(value) : value;
+
+class Writer {
+  private readonly parts: Uint8Array[] = [];
+  length = 0;
+
+  bytes(bytes: Uint8Array) {
+    this.parts.push(bytes);
+    this.length += bytes.length;
+    return this;
+  }
+
+  u16(value: number) {
+    const bytes = new Uint8Array(2);
+    new DataView(bytes.buffer).setUint16(0, value, true);
+    return this.bytes(bytes);
+  }
+
+  u32(value: number) {
+    const bytes = new Uint8Array(4);
+    new DataView(bytes.buffer).setUint32(0, value, true);
+    return this.bytes(bytes);
+  }
+
+  u64(value: number) {
+    const bytes = new Uint8Array(8);
+    new DataView(bytes.buffer).setBigUint64(0, BigInt(value), true);
+    return this.bytes(bytes);
+  }
+
+  done() {
+    const joined = new Uint8Array(this.length);
+    let at = 0;
+    for (const part of this.parts) {
+      joined.set(part, at);
+      at += part.length;
+    }
+    return joined;
+  }
+}
+
+export const archive = (
+  members: Record<string, Member>,
+  {
+    /** Store members as they are instead of deflating them. */
+    stored = false,
+    /** Describe where the directory is with zip64 records. */
+    zip64 = false,
+    comment = "",
+  } = {},
+) => {
+  const out = new Writer();
+  const central = new Writer();
+  let count = 0;
+
+  for (const [path, value] of Object.entries(members)) {
+    const name = encoder.encode(value === null ? `${path}/` : path);
+    const data = value === null ? new Uint8Array() : bytesOf(value);
+    const method = stored || value === null ? 0 : 8;
+    const packed = method === 8 ? deflateRawSync(data) : data;
+    const crc = crc32(data);
+    const offset = out.length;
+
+    out
+      .u32(0x04034b50)
+      .u16(20)
+      .u16(0x0800)
+      .u16(method)
+      .u32(0)
+      .u32(crc)
+      .u32(packed.length)
+      .u32(data.length)
+      .u16(name.length)
+      .u16(0)
+      .bytes(name)
+      .bytes(packed);
+
+    central
+      .u32(0x02014b50)
+      .u16(20)
+      .u16(20)
+      .u16(0x0800)
+      .u16(method)
+      .u32(0)
+      .u32(crc)
+      .u32(packed.length)
+      .u32(data.length)
+      .u16(name.length)
+      .u16(0)
+      .u16(0)
+      .u16(0)
+      .u16(0)
+      .u32(0)
+      .u32(offset)
+      .bytes(name);
+    count++;
+  }
+
+  const directoryOffset = out.length;
+  const directory = central.done();
+  out.bytes(directory);
+
+  if (zip64) {
+    const record = out.length;
+    out
+      .u32(0x06064b50)
+      .u64(44)
+      .u16(45)
+      .u16(45)
+      .u32(0)
+      .u32(0)
+      .u64(count)
+      .u64(count)
+      .u64(directory.length)
+      .u64(directoryOffset);
+    out.u32(0x07064b50).u32(0).u64(record).u32(1);
+  }
+
+  const note = encoder.encode(comment);
+  return out
+    .u32(0x06054b50)
+    .u16(0)
+    .u16(0)
+    .u16(zip64 ? 0xffff : count)
+    .u16(zip64 ? 0xffff : count)
+    .u32(zip64 ? 0xffffffff : directory.length)
+    .u32(zip64 ? 0xffffffff : directoryOffset)
+    .u16(note.length)
+    .bytes(note)
+    .done();
+};
+
+/** A `Blob` that records which ranges of it were read. */
+export const watched = (bytes: Uint8Array) => {
+  const reads: [start: number, end: number][] = [];
+  const blob = new Blob([bytes]);
+  const slice = blob.slice.bind(blob);
+  blob.slice = (start = 0, end = blob.size) => {
+    reads.push([start, end]);
+    return slice(start, end);
+  };
+  /** How many bytes were read in all. */
+  const read = () => reads.reduce((sum, [start, end]) => sum + end - start, 0);
+  return { blob, reads, read };
+};